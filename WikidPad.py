@@ -1,6 +1,10 @@
 #!python3.4
 
+import multiprocessing
+
 import WikidPadStarter
 
 if __name__ == "__main__":
+    # Needed for worker processes of frozen executables
+    multiprocessing.freeze_support()
     WikidPadStarter.main()
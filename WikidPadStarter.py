@@ -230,6 +230,17 @@ exception = None
 
 
 def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "--headless":
+        # Rebuild, export or search without GUI. Output goes to the console
+        # only, not into the error log. This must not be handled on import
+        # like "--updtrans" because worker processes import this module
+        # with the same command line
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+
+        from pwiki import Headless
+        sys.exit(Headless.main(sys.argv[2:]))
+
     try:
         app = App(0)
         app.MainLoop()
@@ -109,7 +109,7 @@ def _buildGraphStyle(config):
 
 
 def buildRelationGraphSource(wikiDocument, currWord, config):
-    wikiData = wikiDocument.getWikiData()
+    linkGraph = wikiDocument.getLinkGraph()
 
     global_excludeRe = None
     global_includeRe = None
@@ -151,7 +151,7 @@ def buildRelationGraphSource(wikiDocument, currWord, config):
 
     # Unalias wikiwords/remove non-wikiwords in attribute values
     for p in word_relations:
-        word = wikiDocument.getWikiPageNameForLinkTerm(p[2])
+        word = linkGraph.getWikiPageNameForLinkTerm(p[2])
         if word is None:
             continue
 
@@ -170,7 +170,7 @@ def buildRelationGraphSource(wikiDocument, currWord, config):
 
 
 def buildChildGraphSource(wikiDocument, currWord, config):
-    wikiData = wikiDocument.getWikiData()
+    linkGraph = wikiDocument.getLinkGraph()
 
     graph = ['', 'digraph {', _buildGraphStyle(config)]
 
@@ -178,12 +178,12 @@ def buildChildGraphSource(wikiDocument, currWord, config):
 
     conns = set()
 
-    allWords = wikiData.getAllDefinedWikiPageNames()
+    allWords = linkGraph.getAllDefinedWikiPageNames()
 
     for word in allWords:
-        for child in wikiData.getChildRelationships(word, existingonly=True,
+        for child in linkGraph.getChildRelationships(word, existingonly=True,
                 selfreference=False):
-            child = wikiDocument.getWikiPageNameForLinkTerm(child)
+            child = linkGraph.getWikiPageNameForLinkTerm(child)
 
             conns.add((word, child))
 
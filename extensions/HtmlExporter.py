@@ -3,7 +3,7 @@
 ## profile = profilehooks.profile(filename="profile.prf", immediate=False)
 
 # from Enum import Enumeration
-import sys, os, os.path, re, traceback, locale, time, urllib.request, urllib.parse, urllib.error
+import sys, os, os.path, re, traceback, locale, time, hashlib, urllib.request, urllib.parse, urllib.error
 from os.path import join, exists
 from io import StringIO, BytesIO
 import shutil
@@ -26,9 +26,14 @@ from pwiki.WikiPyparsing import StackedCopyDict, SyntaxNode, buildSyntaxNode
 from pwiki.TempFileSet import TempFileSet
 
 from pwiki.SearchAndReplace import SearchReplaceOperation, ListWikiPagesOperation, \
-        ListItemWithSubtreeWikiPagesNode
+        ListItemWithSubtreeWikiPagesNode, AllWikiPagesNode
 
-from pwiki import SystemInfo, PluginManager, OsAbstract, DocPages
+from pwiki import SystemInfo, PluginManager, OsAbstract, DocPages, \
+        ParallelRebuild
+from pwiki.Configuration import FrozenConfiguration
+from pwiki.ExportDependencies import DependencyRecorder, \
+        ExportDependencyGraph, ANY_CHANGE, WORD_SET, TEMP_FILES, LINK_TERMS
+from pwiki.ExportFragmentCache import ExportFragmentCache
 
 
 from pwiki.Exporters import AbstractExporter
@@ -38,6 +43,13 @@ from pwiki.Exporters import AbstractExporter
 WIKIDPAD_PLUGIN = (("Exporters", 1),)
 
 
+# Wiki options (besides the global "html_..." options) which influence the
+# HTML of a page and are therefore part of the fragment cache key
+_FRAGMENT_CACHE_WIKI_OPTIONS = ("wiki_name", "wiki_wikiLanguage",
+        "wiki_linkResolve_caseInsensitive", "footnotes_as_wikiwords",
+        "headingsAsAliases_depth", "template_pageNamesRE")
+
+
 def describeExportersV01(mainControl):
     """
     Return sequence of exporter classes.
@@ -71,6 +83,11 @@ def _escapeAnchor(name):
             result.append(c)
     return "".join(result)
 
+
+# Output key of the table of contents for continuous export, other outputs
+# are identified by their wiki word
+_TOC_OUTPUT = ("table of contents",)
+
 # # Types of export destinations
 # EXPORT_DEST_TYPE_DIR = 1
 # EXPORT_DEST_TYPE_FILE = 2
@@ -87,25 +104,31 @@ class BasicLinkConverter:
 
 class LinkConverterForHtmlSingleFilesExport(BasicLinkConverter):
     def getLinkForWikiWord(self, word, default = None):
+        self.htmlExporter.recordLinkDependency(word)
         relUnAlias = self.wikiDocument.getWikiPageNameForLinkTerm(word)
         if relUnAlias is None:
             return default
         if not self.htmlExporter.shouldExport(word):
             return default
 
-        return urlFromPathname(
-                self.htmlExporter.filenameConverter.getFilenameForWikiWord(
-                relUnAlias) + ".html")
+        fileName = self.htmlExporter.filenameConverter.getFilenameForWikiWord(
+                relUnAlias)
+        self.htmlExporter.recordQuery(("filename", relUnAlias), fileName)
+
+        return urlFromPathname(fileName + ".html")
 
 class LinkConverterForHtmlMultiPageExport(BasicLinkConverter):
     def getLinkForWikiWord(self, word, default = None):
+        self.htmlExporter.recordLinkDependency(word)
         relUnAlias = self.wikiDocument.getWikiPageNameForLinkTerm(word)
         if relUnAlias is None:
             return default
         if not self.htmlExporter.shouldExport(word):
             return default
 
-        if relUnAlias not in self.htmlExporter.wordList:
+        exported = relUnAlias in self.htmlExporter.wordSet
+        self.htmlExporter.recordQuery(("exported", relUnAlias), exported)
+        if not exported:
             return default
 
         return "#%s" % _escapeAnchor(relUnAlias)
@@ -433,6 +456,7 @@ class HtmlExporter(AbstractExporter):
         """
         AbstractExporter.__init__(self, mainControl)
         self.wordList = None
+        self.wordSet = None  # Same words as wordList for fast membership tests
         self.exportDest = None
         
         # List of tuples (<source CSS path>, <dest CSS file name / url>)
@@ -448,6 +472,25 @@ class HtmlExporter(AbstractExporter):
         self.avoidDeadWikiLinks = True  # avoid links to not exported wikiwords
         self.listPagesOperation = None
 
+        # For continuous export: dependencies of the outputs ...
+        self.exportDependencies = None
+        # ... and for "html_multi" export: {output: rendered HTML fragment}
+        self.multiFileFragments = None
+        # Global attributes at last update of continuous export
+        self.continuousGlobalAttributes = None
+        # DependencyRecorder for the output currently rendered during
+        # continuous export or while the fragment cache is used
+        self.dependencyRecorder = None
+
+        # During a real export with enabled fragment cache: the
+        # ExportFragmentCache, digest of the export options and
+        # {key: fingerprint} and {query key: result} of dependencies
+        # already checked
+        self.fragmentCache = None
+        self.fragmentCacheOptionsDigest = None
+        self.exportFingerprints = None
+        self.exportQueryResults = None
+
         self.wordAnchor = None  # For multiple wiki pages in one HTML page, this contains the anchor
                 # of the current word.
         self.tempFileSet = None
@@ -626,6 +669,8 @@ class HtmlExporter(AbstractExporter):
         if len(self.wordList) == 0:
             return False
 
+        self.wordSet = set(self.wordList)
+
 #         self.wordList = wordList
         self.exportType = exportType
         self.exportDest = exportDest
@@ -679,12 +724,17 @@ class HtmlExporter(AbstractExporter):
             self.tempFileSet.setPreferredRelativeTo(self.exportDest)
 
             self.referencedStorageFiles = set()
+            self._startFragmentCache()
 
-
-        if exportType == "html_multi":
-            browserFile = self.exportHtmlMultiFile()
-        elif exportType == "html_single":
-            browserFile = self._exportHtmlSingleFiles(self.wordList)
+        try:
+            if exportType == "html_multi":
+                browserFile = self.exportHtmlMultiFile()
+            elif exportType == "html_single":
+                browserFile = self._exportHtmlSingleFiles(self.wordList)
+        finally:
+            self.fragmentCache = None
+            self.exportFingerprints = None
+            self.exportQueryResults = None
 
         # Other supported types: html_previewWX, html_previewIE, html_previewMOZ,
         #   html_previewWK
@@ -724,6 +774,13 @@ class HtmlExporter(AbstractExporter):
         # for continuous export we want to have dead links to simplify updates
         self.avoidDeadWikiLinks = False
 
+        # Record while exporting which pages, searches and attributes
+        # each output consumed to update only affected outputs later
+        self.exportDependencies = ExportDependencyGraph(
+                self.evaluateExportQuery, self.isExportQueryAffected)
+        if exportType == "html_multi":
+            self.multiFileFragments = {}
+
         wordList = wikiDocument.searchWiki(self.listPagesOperation)
         
         self.listPagesOperation.beginWikiSearch(wikiDocument)
@@ -733,6 +790,8 @@ class HtmlExporter(AbstractExporter):
             compatFilenames, addOpt, progressHandler, tempFileSetReset=False)
             
         self.progressHandler = None
+        self.continuousGlobalAttributes = self.evaluateExportQuery(
+                ("global attributes",))
 
         self.__sinkWikiDocument = wxKeyFunctionSink((
                 ("deleted wiki page", self.onDeletedWikiPage),
@@ -748,6 +807,10 @@ class HtmlExporter(AbstractExporter):
         self.avoidDeadWikiLinks = True
         self.__sinkWikiDocument.disconnect()
 
+        self.exportDependencies = None
+        self.multiFileFragments = None
+        self.continuousGlobalAttributes = None
+
         self.tempFileSet.reset()
         self.tempFileSet = None
         self.copiedTempFileCache = None
@@ -756,82 +819,562 @@ class HtmlExporter(AbstractExporter):
     def onDeletedWikiPage(self, miscEvt):
         wikiWord = miscEvt.get("wikiPage").getWikiWord()
 
-        if wikiWord not in self.wordList:
-            return
-            
-        self.wordList.remove(wikiWord)
-        
-        if self.exportType == "html_multi":
-            self.exportHtmlMultiFile()
-
-        elif self.exportType == "html_single":
-            self._exportHtmlSingleFiles([])
+        wordSetChanged = self._removeExportedWord(wikiWord)
+        self._updateContinuousExport((wikiWord,), wordSetChanged, True)
 
 
     def onRenamedWikiPage(self, miscEvt):
         oldWord = miscEvt.get("wikiPage").getWikiWord()
         newWord = miscEvt.get("newWord")
         newPage = self.wikiDocument.getWikiPage(newWord)
-        
-        oldInList = oldWord in self.wordList
-        newInList = self.listPagesOperation.testWikiPageByDocPage(newPage)
 
-        if not oldInList and not newInList:
-            return
-
-        if oldInList:
-            self.wordList.remove(oldWord)
-        
-        if newInList:
-            self.wordList.append(newWord)
-
-
-        if self.exportType == "html_multi":
-            self.exportHtmlMultiFile()
+        wordSetChanged = self._removeExportedWord(oldWord)
 
-        elif self.exportType == "html_single":
-            if newInList:
-                updList = [newWord]
-            else:
-                updList = []
+        if self.listPagesOperation.testWikiPageByDocPage(newPage):
+            wordSetChanged = self._addExportedWord(newWord) or wordSetChanged
 
-            self._exportHtmlSingleFiles(updList)
+        self._updateContinuousExport((oldWord, newWord), wordSetChanged, True)
 
 
     def onUpdatedWikiPage(self, miscEvt):
         wikiPage = miscEvt.get("wikiPage")
         wikiWord = wikiPage.getWikiWord()
 
-        oldInList = wikiWord in self.wordList
-        newInList = self.listPagesOperation.testWikiPageByDocPage(wikiPage)
-
-        if not oldInList:
-            if not newInList:
-                # Current set not affected
-                return
-            else:
-                self.wordList.append(wikiWord)
-                updList = [wikiWord]
+        if self.listPagesOperation.testWikiPageByDocPage(wikiPage):
+            wordSetChanged = self._addExportedWord(wikiWord)
         else:
-            if not newInList:
-                self.wordList.remove(wikiWord)
-                updList = []
+            wordSetChanged = self._removeExportedWord(wikiWord)
+
+        self._updateContinuousExport((wikiWord,), wordSetChanged,
+                "changed link terms" in miscEvt)
+
+
+    def _addExportedWord(self, wikiWord):
+        """
+        Add wikiWord to the exported words, returns True if it was added
+        """
+        if wikiWord in self.wordSet:
+            return False
+
+        self.wordList.append(wikiWord)
+        self.wordSet.add(wikiWord)
+        return True
+
+
+    def _removeExportedWord(self, wikiWord):
+        """
+        Remove wikiWord from the exported words, returns True if it was
+        removed
+        """
+        if wikiWord not in self.wordSet:
+            return False
+
+        self.wordList.remove(wikiWord)
+        self.wordSet.discard(wikiWord)
+        return True
+
+
+    def _updateContinuousExport(self, changedWords, wordSetChanged,
+            linkTermsChanged):
+        """
+        Render again the outputs which depend on the changed pages.
+
+        changedWords -- sequence of words of changed (also deleted or
+            renamed) pages
+        wordSetChanged -- True if words were added to or removed from the
+            exported words
+        linkTermsChanged -- True if page names or aliases were added or
+            removed
+        """
+        keys = set(("page", word) for word in changedWords)
+        keys.add(ANY_CHANGE)
+        if wordSetChanged:
+            keys.add(WORD_SET)
+        if linkTermsChanged:
+            keys.add(LINK_TERMS)
+
+        # Global attributes are cheap to compare, outputs which used them
+        # are affected by their query key
+        globalAttributes = self.evaluateExportQuery(("global attributes",))
+        if globalAttributes != self.continuousGlobalAttributes:
+            self.continuousGlobalAttributes = globalAttributes
+            keys.add(("global attributes",))
+
+        outputs = self.exportDependencies.getAffectedOutputs(keys)
+
+        for word in changedWords:
+            if word in self.wordSet:
+                # Newly exported words don't have dependencies yet
+                outputs.add(word)
             else:
-                updList = [wikiWord]
-        
-        if not wikiWord in self.wordList:
+                self.exportDependencies.removeOutput(word)
+                if self.multiFileFragments is not None:
+                    self.multiFileFragments.pop(word, None)
+                outputs.discard(word)
+
+        if not outputs and not wordSetChanged:
             return
 
         try:
             if self.exportType == "html_multi":
-                self.exportHtmlMultiFile()
-    
+                self.exportHtmlMultiFile(outputsToUpdate=outputs)
+
             elif self.exportType == "html_single":
-                self._exportHtmlSingleFiles(updList)
+                self._exportHtmlSingleFiles([word for word in self.wordList
+                        if word in outputs], _TOC_OUTPUT in outputs)
         except WikiWordNotFoundException:
             pass
 
 
+    def _renderWithDependencies(self, output, renderFunction, *args):
+        """
+        Call renderFunction(*args) and return its result. During continuous
+        export the dependencies consumed by renderFunction are recorded as
+        the dependencies of output.
+        """
+        if self.exportDependencies is None:
+            return renderFunction(*args)
+
+        self.dependencyRecorder = DependencyRecorder()
+        try:
+            return renderFunction(*args)
+        finally:
+            self.exportDependencies.setDependencies(output,
+                    self.dependencyRecorder)
+            self.dependencyRecorder = None
+
+
+    def _startFragmentCache(self):
+        """
+        Called by export() to use the fragment cache if enabled
+        """
+        fragmentCache = self.wikiDocument.getExportFragmentCache()
+        if not fragmentCache.isEnabled():
+            return
+
+        self.fragmentCache = fragmentCache
+        # Built on first use when the style sheet list is known
+        self.fragmentCacheOptionsDigest = None
+        self.exportFingerprints = {}
+        self.exportQueryResults = {}
+
+
+    def _getFragmentCacheOptionsDigest(self):
+        """
+        Return digest of everything besides the page and the recorded
+        dependencies which influences the HTML of a page.
+        """
+        if self.fragmentCacheOptionsDigest is not None:
+            return self.fragmentCacheOptionsDigest
+
+        # The HTML also changes with the code of the exporter and of the
+        # parser and language helper of the wiki language
+        app = wx.GetApp()
+        languageName = self.wikiDocument.getWikiDefaultWikiLanguage()
+        parser = app.createWikiParser(languageName)
+        langHelper = app.createWikiLanguageHelper(languageName)
+        moduleNames = {__name__, buildSyntaxNode.__module__,
+                type(parser).__module__, type(langHelper).__module__}
+        app.freeWikiParser(parser)
+        app.freeWikiLanguageHelper(langHelper)
+
+        modTimes = []
+        for moduleName in sorted(moduleNames):
+            try:
+                modTime = os.path.getmtime(sys.modules[moduleName].__file__)
+            except (KeyError, AttributeError, TypeError, OSError):
+                modTime = 0
+            modTimes.append((moduleName, modTime))
+
+        wikiConfig = self.wikiDocument.getWikiConfig()
+        wikiOptions = [wikiConfig.get("main", option)
+                for option in _FRAGMENT_CACHE_WIKI_OPTIONS]
+        globalOptions = sorted(item for item in
+                FrozenConfiguration(wx.GetApp().getGlobalConfig())\
+                .values.items() if item[0][1].startswith("html_"))
+
+        h = hashlib.sha1()
+        for part in (Consts.VERSION_STRING, modTimes, self.exportType,
+                self.compatFilenames, self.addOpt,
+                self.avoidDeadWikiLinks, self.styleSheetList, wikiOptions,
+                globalOptions):
+            h.update(repr(part).encode("utf-8", "surrogatepass"))
+            h.update(b"\0")
+
+        self.fragmentCacheOptionsDigest = h.hexdigest()
+        return self.fragmentCacheOptionsDigest
+
+
+    def _getFragmentCacheKey(self, word):
+        wikiPage = self.wikiDocument.getWikiPage(word).getNonAliasPage()
+        with wikiPage.getTextOperationLock():
+            text = wikiPage.getLiveText()
+            formatDetails = wikiPage.getFormatDetails()
+
+        pageAstKey = self.wikiDocument.getPageAstCache().buildKey(
+                wikiPage.getWikiWord(), text, formatDetails)
+
+        return ExportFragmentCache.buildKey(word, pageAstKey,
+                self._getFragmentCacheOptionsDigest())
+
+
+    def _getExportFingerprint(self, key):
+        """
+        Return value which changes if the dependency key changes.
+        Only page keys and WORD_SET can change during an export, for
+        other keys None is returned.
+        """
+        try:
+            return self.exportFingerprints[key]
+        except KeyError:
+            pass
+
+        if key[0] == "page":
+            if self.wikiDocument.isDefinedWikiPageName(key[1]):
+                text = self.wikiDocument.getWikiPage(key[1]).getLiveText()
+                fingerprint = hashlib.sha1(text.encode("utf-8",
+                        "surrogatepass")).hexdigest()
+            else:
+                fingerprint = ""
+        elif key == WORD_SET:
+            fingerprint = hashlib.sha1("\n".join(sorted(self.wordSet))
+                    .encode("utf-8", "surrogatepass")).hexdigest()
+        else:
+            fingerprint = None
+
+        self.exportFingerprints[key] = fingerprint
+        return fingerprint
+
+
+    def _getExportQueryResult(self, key):
+        """
+        Return result of evaluateExportQuery(key), each query is only
+        evaluated once per export.
+        """
+        try:
+            return self.exportQueryResults[key]
+        except KeyError:
+            pass
+
+        try:
+            result = self.evaluateExportQuery(key)
+        except Exception:
+            traceback.print_exc()
+            # Not equal to any stored result
+            result = object()
+
+        self.exportQueryResults[key] = result
+        return result
+
+
+    def _getValidFragmentCacheEntry(self, cacheKey):
+        """
+        Return entry (fragment, fingerprints, queries) of the fragment
+        cache if all its dependencies are unchanged, None otherwise.
+        """
+        entry = self.fragmentCache.get(cacheKey)
+        if entry is None:
+            return None
+
+        fragment, fingerprints, queries = entry
+        for key, fingerprint in fingerprints.items():
+            if self._getExportFingerprint(key) != fingerprint:
+                return None
+
+        for key, result in queries.items():
+            if self._getExportQueryResult(key) != result:
+                return None
+
+        return entry
+
+
+    def _putFragmentCacheEntry(self, cacheKey, fragment, recorder):
+        if cacheKey is None or not recorder.isReusable():
+            return
+
+        fingerprints = dict((key, self._getExportFingerprint(key))
+                for key in recorder.keys)
+        self.fragmentCache.put(cacheKey, fragment, fingerprints,
+                recorder.queries)
+
+
+    def _iterParsedWords(self, words):
+        """
+        Generator yielding tuples (word, wikiPage) for each word of words
+        in order. If there are enough words, the pages are parsed in worker
+        processes in advance and wikiPage holds the AST, otherwise it is
+        None and the page is parsed when needed. wikiPage must be kept
+        referenced while the page is rendered.
+        """
+        processCount = ParallelRebuild.getProcessCount("export_processCount")
+        count = 0
+
+        if processCount > 1 and len(words) >= ParallelRebuild.MIN_PAGE_COUNT:
+            try:
+                for item in ParallelRebuild.iterParsePageAsts(
+                        self.wikiDocument, words, processCount):
+                    yield item
+                    count += 1
+            except Exception:
+                # Parse the remaining pages in this process
+                traceback.print_exc()
+
+        for word in words[count:]:
+            yield word, None
+
+
+    def _iterRenderWords(self, words, renderFunction, *args):
+        """
+        Generator calling renderFunction(word, *args) for each word of
+        words and yielding tuples (word, result) in the order of words.
+        result is None if rendering failed.
+
+        If the fragment cache is used, results with unchanged dependencies
+        are taken from the cache and new results are stored in it. During
+        continuous export the dependencies are registered for each word.
+        """
+        recording = self.fragmentCache is not None or \
+                self.exportDependencies is not None
+
+        # Check the cache first so only the remaining pages are parsed
+        cacheKeys = {}
+        cachedEntries = {}
+        if self.fragmentCache is not None:
+            for word in words:
+                cacheKey = self._getFragmentCacheKey(word)
+                cacheKeys[word] = cacheKey
+                entry = self._getValidFragmentCacheEntry(cacheKey)
+                if entry is not None:
+                    cachedEntries[word] = entry
+
+        parsedWords = self._iterParsedWords([word for word in words
+                if word not in cachedEntries])
+
+        for word in words:
+            entry = cachedEntries.get(word)
+            if entry is not None:
+                result, fingerprints, queries = entry
+                recorder = DependencyRecorder()
+                recorder.keys.update(fingerprints)
+                recorder.queries.update(queries)
+
+                if self.referencedStorageFiles is not None:
+                    self.referencedStorageFiles.update(key[1]
+                            for key in recorder.keys
+                            if key[0] == "storage file")
+            else:
+                # Keep page with AST alive while rendering
+                dummy, wikiPage = next(parsedWords)
+
+                recorder = DependencyRecorder() if recording else None
+                self.dependencyRecorder = recorder
+                try:
+                    result = renderFunction(word, *args)
+                except Exception:
+                    traceback.print_exc()
+                    result = None
+                    if recorder is not None:
+                        # Try again on next change
+                        recorder.add(ANY_CHANGE)
+                finally:
+                    self.dependencyRecorder = None
+
+                if self.fragmentCache is not None and result is not None:
+                    self._putFragmentCacheEntry(cacheKeys[word], result,
+                            recorder)
+
+            if self.exportDependencies is not None:
+                self.exportDependencies.setDependencies(word, recorder)
+
+            yield word, result
+
+
+    def recordLinkDependency(self, linkTerm):
+        """
+        Record that the output currently rendered links to or inserts
+        the page linkTerm resolves to.
+        """
+        if self.dependencyRecorder is None:
+            return
+
+        word = self.wikiDocument.getWikiPageNameForLinkTerm(linkTerm)
+        if word is not None:
+            self.dependencyRecorder.add(("page", word))
+        else:
+            # Link becomes valid when a page or alias with this name is
+            # created
+            self.dependencyRecorder.addQuery(("term", linkTerm), None)
+
+
+    def recordQuery(self, key, result):
+        """
+        Record that the output currently rendered used  result  of the
+        query described by key (see evaluateExportQuery()).
+        """
+        if self.dependencyRecorder is not None:
+            self.dependencyRecorder.addQuery(key, result)
+
+
+    def evaluateExportQuery(self, key):
+        """
+        Return current result of a query recorded as dependency of an
+        output.
+        """
+        kind = key[0]
+        if kind == "term":
+            return self.wikiDocument.getWikiPageNameForLinkTerm(key[1])
+        elif kind == "parents":
+            return set(self.wikiDocument.getWikiPageNoError(key[1])
+                    .getParentRelationships())
+        elif kind == "rel":
+            return set(self._getRelatives(*key[1:]))
+        elif kind == "search":
+            searchOp = SearchReplaceOperation()
+            searchOp.setPackedSettings(key[1])
+            searchOp.replaceOp = False
+            return set(self.wikiDocument.searchWiki(searchOp))
+        elif kind == "flat tree":
+            wikiDocument = self.mainControl.getWikiDocument()
+            return wikiDocument.getWikiPage(wikiDocument.getWikiName())\
+                    .getFlatTree()
+        elif kind == "global attributes":
+            return dict(self.wikiDocument.getWikiData().getGlobalAttributes())
+        elif kind == "exported":
+            return key[1] in self.wordSet
+        elif kind == "filename":
+            return self.filenameConverter.getFilenameForWikiWord(key[1])
+        elif kind == "export destination":
+            return self.exportDest
+        elif kind == "search fragment":
+            return self._getSearchFragmentAnchor(*key[1:])
+
+        raise InternalError("Unknown export query %r" % (key,))
+
+
+    def isExportQueryAffected(self, key, result, changeKeys):
+        """
+        Return False if the  result  of the query described by key can't be
+        changed by a change with the dependency keys  changeKeys  (see
+        _updateContinuousExport()). The query isn't evaluated again then.
+        """
+        kind = key[0]
+        changedWords = [k[1] for k in changeKeys if k[0] == "page"]
+
+        if kind == "term":
+            return LINK_TERMS in changeKeys
+        elif kind == "parents":
+            if LINK_TERMS in changeKeys:
+                return True
+            # Only a changed page can have added or removed a link
+            linkGraph = self.wikiDocument.getLinkGraph()
+            for word in changedWords:
+                if word in result:
+                    return True
+                for term in linkGraph.getChildRelationships(word):
+                    if (linkGraph.getWikiPageNameForLinkTerm(term) or term) \
+                            == key[1]:
+                        return True
+            return False
+        elif kind == "rel":
+            # Evaluated by the link graph in memory
+            return True
+        elif kind == "search":
+            return self._isSearchResultAffected(key[1], result, changedWords)
+        elif kind == "flat tree":
+            if LINK_TERMS in changeKeys or \
+                    ("global attributes",) in changeKeys:
+                return True
+            # Only links, attributes or modification of the pages in the
+            # tree change it
+            getWikiPageNameForLinkTerm = self.wikiDocument.getLinkGraph()\
+                    .getWikiPageNameForLinkTerm
+            treeWords = set(getWikiPageNameForLinkTerm(word) or word
+                    for word, deepness in result)
+            return any(word in treeWords for word in changedWords)
+        elif kind == "global attributes":
+            # Compared by _updateContinuousExport() which adds the query key
+            # to the change keys
+            return False
+        elif kind in ("exported", "filename"):
+            return WORD_SET in changeKeys
+        elif kind == "export destination":
+            return False
+        elif kind == "search fragment":
+            return LINK_TERMS in changeKeys or \
+                    self.wikiDocument.getWikiPageNameForLinkTerm(key[1]) \
+                    in changedWords
+
+        return True
+
+
+    def _getSearchFragmentAnchor(self, wikiWord, searchFragment,
+            forbiddenRange):
+        """
+        Return the name of the heading anchor (without word anchor) in front
+        of the text found by the link to  wikiWord  with  searchFragment
+        or None if not found or not behind a heading. A hit inside
+        forbiddenRange (the link itself) is skipped.
+        """
+        findSearchFragment = self.wikiDocument.findSearchFragment
+        found = findSearchFragment(wikiWord, searchFragment)[0]
+        if found is not None and forbiddenRange[0] <= found < \
+                forbiddenRange[1]:
+            found = findSearchFragment(wikiWord, searchFragment,
+                    forbiddenRange[1])[0]
+
+        if found is None:
+            return None
+
+        pageAst = self.wikiDocument.getWikiPage(wikiWord).getNonAliasPage()\
+                .getLivePageAst()
+
+        headingPos = None
+        for node in pageAst.iterDeepByName("heading"):
+            if node.pos > found:
+                break
+            headingPos = node.pos
+
+        if headingPos is None:
+            return None
+
+        return ".h%i" % headingPos
+
+
+    def _isSearchResultAffected(self, packedSettings, result, changedWords):
+        """
+        Return True if the result of the search with  packedSettings  can be
+        changed by the changed pages.
+        """
+        searchOp = SearchReplaceOperation()
+        searchOp.setPackedSettings(packedSettings)
+        searchOp.replaceOp = False
+
+        if searchOp.indexSearch != "no" or not isinstance(
+                searchOp.listWikiPagesOp.getSearchOpTree(), AllWikiPagesNode):
+            # The search index is updated later and page lists can depend
+            # on other pages
+            return True
+
+        # Otherwise each page is tested for itself, so only the changed
+        # pages can enter or leave the result
+        searchOp.beginWikiSearch(self.wikiDocument)
+        try:
+            for word in changedWords:
+                found = False
+                if self.wikiDocument.isDefinedWikiPageName(word):
+                    text = self.wikiDocument.getWikiPage(word)\
+                            .getLiveTextNoTemplate()
+                    found = text is not None and \
+                            searchOp.testWikiPage(word, text) == True
+
+                if found != (word in result):
+                    return True
+        finally:
+            searchOp.endWikiSearch()
+
+        return False
+
+
 
     def getTempFileSet(self):
         return self.tempFileSet
@@ -856,9 +1399,14 @@ class HtmlExporter(AbstractExporter):
         self.linkConverter = linkConverter
 
 
-    def exportHtmlMultiFile(self, realfp=None, tocMode=None):
+    def exportHtmlMultiFile(self, realfp=None, tocMode=None,
+            outputsToUpdate=None):
         """
         Multiple wiki pages in one file.
+
+        outputsToUpdate -- During continuous export set of the outputs
+            (wiki words or _TOC_OUTPUT) to render again, the fragments of
+            the other outputs are taken from the cache. None to render all.
         """
         config = self.mainControl.getConfig()
         sepLineCount = config.getint("main",
@@ -893,79 +1441,47 @@ class HtmlExporter(AbstractExporter):
 
         filePointer.write(self.getFileHeaderMultiPage(self.mainControl.wikiName))
 
-        tocTitle = self.addOpt[self.ADDOPT_IDX_TOC_TITLE]
-        
         if tocMode is None:
             tocMode = self.addOpt[self.ADDOPT_IDX_TABLE_OF_CONTENTS]
 
-        if tocMode == 1:
-            # Write a content tree at beginning
-            rootPage = self.mainControl.getWikiDocument().getWikiPage(
-                        self.mainControl.getWikiDocument().getWikiName())
-            flatTree = rootPage.getFlatTree()
-
-            filePointer.write(('<h2 class="wikidpad">%s</h2>\n'
-                    '%s%s<hr class="wikidpad" />') %
-                    (tocTitle, # = "Table of Contents"
-                    self.getContentTreeBody(flatTree, linkAsFragments=True),
-                    '<br class="wikidpad" />\n' * sepLineCount))
-
-        elif tocMode == 2:
-            # Write a content list at beginning
-            filePointer.write(('<h2 class="wikidpad">%s</h2>\n'
-                    '%s%s<hr class="wikidpad" />') %
-                    (tocTitle, # = "Table of Contents"
-                    self.getContentListBody(linkAsFragments=True),
-                    '<br class="wikidpad" />\n' * sepLineCount))
-
+        if tocMode in (1, 2):
+            filePointer.write(self._getMultiFileFragment(_TOC_OUTPUT,
+                    outputsToUpdate, self._formatMultiFileToc, tocMode,
+                    sepLineCount))
 
         if self.progressHandler is not None:
             self.progressHandler.open(len(self.wordList))
             step = 0
 
+        if self.multiFileFragments is not None and \
+                outputsToUpdate is not None:
+            # Continuous export, render only words which need an update
+            renderWords = [word for word in self.wordList
+                    if word in outputsToUpdate or
+                    word not in self.multiFileFragments]
+        else:
+            renderWords = self.wordList
+
+        renderSet = set(renderWords)
+        rendered = self._iterRenderWords(renderWords,
+                self._formatMultiFileWord, sepLineCount)
+
         # Then create the big page word by word
         for word in self.wordList:
             if self.progressHandler is not None:
                 step += 1
                 self.progressHandler.update(step, _("Exporting %s") % word)
 
-            wikiPage = self.wikiDocument.getWikiPage(word)
-            if not self.shouldExport(word, wikiPage):
-                continue
-                
-            try:
-                content = wikiPage.getLiveText()
-#                 formatDetails = wikiPage.getFormatDetails()
-                    
-                self.wordAnchor = _escapeAnchor(word)
-                formattedContent = self.formatContent(wikiPage)
-                
-                if self.addOpt[self.ADDOPT_IDX_LIST_PARENTS] != 0:
-                    if self.avoidDeadWikiLinks:
-                        parentLinks = self.getParentLinks(wikiPage, False,
-                                self.wordList)
-                    else:
-                        parentLinks = self.getParentLinks(wikiPage, False)
-                    
-                    parentLinks = ('<span class="wikidpad parent-nodes">parent nodes: {0}'
-                            '<br class="wikidpad" /><br class="wikidpad" /></span>')\
-                            .format(parentLinks)
-                    
-                else:
-                    parentLinks = u""
-                    
-
-                filePointer.write(('<span class="wikidpad wiki-name-ref">'
-                        '[<a name="{0}" class="wikidpad">{1}</a>]<br class="wikidpad" />'
-                        '<br class="wikidpad" /></span>'
-                        '{2}{3}{4}<hr class="wikidpad" />')\
-                        .format(self.wordAnchor, word, parentLinks,
-                        formattedContent,
-                        '<br class="wikidpad" />\n' * sepLineCount))
-            except Exception as e:
-                traceback.print_exc()
+            if word in renderSet:
+                fragment = next(rendered)[1]
+                if fragment is None:
+                    fragment = ""
+                if self.multiFileFragments is not None:
+                    self.multiFileFragments[word] = fragment
+            else:
+                fragment = self.multiFileFragments[word]
 
-        self.wordAnchor = None
+            filePointer.write(fragment)
 
         filePointer.write(self.getFileFooter())
         
@@ -978,77 +1494,213 @@ class HtmlExporter(AbstractExporter):
         return outputFile
 
 
-    def _exportHtmlSingleFiles(self, wordListToUpdate):
+    def _getMultiFileFragment(self, output, outputsToUpdate, renderFunction,
+            *args):
+        """
+        Return HTML fragment of output for exportHtmlMultiFile(). During
+        continuous export it is taken from cache if it doesn't need
+        an update.
+        """
+        if self.multiFileFragments is None:
+            return renderFunction(*args)
+
+        if outputsToUpdate is not None and output not in outputsToUpdate:
+            fragment = self.multiFileFragments.get(output)
+            if fragment is not None:
+                return fragment
+
+        fragment = self._renderWithDependencies(output, renderFunction, *args)
+        self.multiFileFragments[output] = fragment
+        return fragment
+
+
+    def _formatMultiFileToc(self, tocMode, sepLineCount):
+        tocTitle = self.addOpt[self.ADDOPT_IDX_TOC_TITLE]
+
+        if tocMode == 1:
+            # Write a content tree at beginning
+            return ('<h2 class="wikidpad">%s</h2>\n'
+                    '%s%s<hr class="wikidpad" />') % \
+                    (tocTitle, # = "Table of Contents"
+                    self.getContentTreeBody(self._getRootFlatTree(),
+                    linkAsFragments=True),
+                    '<br class="wikidpad" />\n' * sepLineCount)
+
+        else:
+            # Write a content list at beginning
+            return ('<h2 class="wikidpad">%s</h2>\n'
+                    '%s%s<hr class="wikidpad" />') % \
+                    (tocTitle, # = "Table of Contents"
+                    self.getContentListBody(linkAsFragments=True),
+                    '<br class="wikidpad" />\n' * sepLineCount)
+
+
+    def _formatMultiFileWord(self, word, sepLineCount):
+        if self.dependencyRecorder is not None:
+            # Own attributes decide if page is exported
+            self.dependencyRecorder.add(("page", word))
+
+        wikiPage = self.wikiDocument.getWikiPage(word)
+        if not self.shouldExport(word, wikiPage):
+            return ""
+
+        try:
+            content = wikiPage.getLiveText()
+#             formatDetails = wikiPage.getFormatDetails()
+
+            self.wordAnchor = _escapeAnchor(word)
+            formattedContent = self.formatContent(wikiPage)
+
+            if self.addOpt[self.ADDOPT_IDX_LIST_PARENTS] != 0:
+                if self.avoidDeadWikiLinks:
+                    parentLinks = self.getParentLinks(wikiPage, False,
+                            self.wordSet)
+                else:
+                    parentLinks = self.getParentLinks(wikiPage, False)
+
+                parentLinks = ('<span class="wikidpad parent-nodes">parent nodes: {0}'
+                        '<br class="wikidpad" /><br class="wikidpad" /></span>')\
+                        .format(parentLinks)
+
+            else:
+                parentLinks = u""
+
+
+            return ('<span class="wikidpad wiki-name-ref">'
+                    '[<a name="{0}" class="wikidpad">{1}</a>]<br class="wikidpad" />'
+                    '<br class="wikidpad" /></span>'
+                    '{2}{3}{4}<hr class="wikidpad" />')\
+                    .format(self.wordAnchor, word, parentLinks,
+                    formattedContent,
+                    '<br class="wikidpad" />\n' * sepLineCount)
+        finally:
+            self.wordAnchor = None
+
+
+    def _getRootFlatTree(self):
+        """
+        Return flat tree of the wiki's root page for the table of contents
+        """
+        wikiDocument = self.mainControl.getWikiDocument()
+        rootPage = wikiDocument.getWikiPage(wikiDocument.getWikiName())
+        flatTree = rootPage.getFlatTree()
+
+        if self.dependencyRecorder is not None:
+            self.dependencyRecorder.addQuery(("flat tree",), flatTree)
+
+        return flatTree
+
+
+    def _exportHtmlSingleFiles(self, wordListToUpdate, updateIndex=True):
         self.setLinkConverter(LinkConverterForHtmlSingleFilesExport(
                 self.wikiDocument, self))
         self.buildStyleSheetList()
 
 
-        if self.addOpt[self.ADDOPT_IDX_TABLE_OF_CONTENTS] in (1, 2):
-            # TODO Configurable name
-            outputFile = join(self.exportDest, pathEnc("index.html"))
-            try:
-                if exists(pathEnc(outputFile)):
-                    os.unlink(pathEnc(outputFile))
-    
-                realfp = open(pathEnc(outputFile), "w", encoding="utf-8",
-                        errors="surrogateescape")
-                #fp = utf8Writer(realfp, "replace")
-                fp = realfp
-
-                # TODO Factor out HTML header generation                
-                fp.write(self._getGenericHtmlHeader(
-                        self.addOpt[self.ADDOPT_IDX_TOC_TITLE]) + 
-                        '    <body class="wikidpad">\n')
-                if self.addOpt[self.ADDOPT_IDX_TABLE_OF_CONTENTS] == 1:
-                    # Write a content tree
-                    rootPage = self.mainControl.getWikiDocument().getWikiPage(
-                                self.mainControl.getWikiDocument().getWikiName())
-                    flatTree = rootPage.getFlatTree()
-    
-                    fp.write(('<h2 class="wikidpad">%s</h2>\n'
-                            '%s') %
-                            (self.addOpt[self.ADDOPT_IDX_TOC_TITLE],  # = "Table of Contents"
-                            self.getContentTreeBody(flatTree, linkAsFragments=False)
-                            ))
-                elif self.addOpt[self.ADDOPT_IDX_TABLE_OF_CONTENTS] == 2:
-                    # Write a content list
-                    fp.write(('<h2 class="wikidpad">%s</h2>\n'
-                            '%s') %
-                            (self.addOpt[self.ADDOPT_IDX_TOC_TITLE],  # = "Table of Contents"
-                            self.getContentListBody(linkAsFragments=False)
-                            ))
-
-                fp.write(self.getFileFooter())
-
-                #fp.reset()        
-                realfp.close()
-            except Exception as e:
-                traceback.print_exc()
+        if updateIndex and \
+                self.addOpt[self.ADDOPT_IDX_TABLE_OF_CONTENTS] in (1, 2):
+            self._renderWithDependencies(_TOC_OUTPUT, self._exportHtmlIndexFile)
 
+        # Assign file names in order of the words, independent of the
+        # order in which pages link to each other
+        for word in self.wordList:
+            self.filenameConverter.getFilenameForWikiWord(word)
 
         if self.progressHandler is not None:
             self.progressHandler.open(len(self.wordList))
             step = 0
 
-        for word in wordListToUpdate:
+        for word, content in self._iterRenderWords(wordListToUpdate,
+                self._formatSingleFilesWord):
             if self.progressHandler is not None:
                 step += 1
                 self.progressHandler.update(step, _("Exporting %s") % word)
 
-            wikiPage = self.wikiDocument.getWikiPage(word)
-            if not self.shouldExport(word, wikiPage):
-                continue
-
-            self.exportWordToHtmlPage(self.exportDest, word, False)
+            if content:
+                self._writeSingleFilesWord(word, content)
 
         self.copyCssFiles(self.exportDest)
+
+        if len(self.wordList) == 0:
+            return None
+
         rootFile = join(self.exportDest,
                 self.filenameConverter.getFilenameForWikiWord(self.wordList[0]) +
                 ".html")
         return rootFile
 
 
+    def _exportHtmlIndexFile(self):
+        # TODO Configurable name
+        outputFile = join(self.exportDest, "index.html")
+        try:
+            if exists(pathEnc(outputFile)):
+                os.unlink(pathEnc(outputFile))
+
+            realfp = open(pathEnc(outputFile), "w", encoding="utf-8",
+                    errors="surrogateescape")
+            #fp = utf8Writer(realfp, "replace")
+            fp = realfp
+
+            # TODO Factor out HTML header generation                
+            fp.write(self._getGenericHtmlHeader(
+                    self.addOpt[self.ADDOPT_IDX_TOC_TITLE]) + 
+                    '    <body class="wikidpad">\n')
+            if self.addOpt[self.ADDOPT_IDX_TABLE_OF_CONTENTS] == 1:
+                # Write a content tree
+                fp.write(('<h2 class="wikidpad">%s</h2>\n'
+                        '%s') %
+                        (self.addOpt[self.ADDOPT_IDX_TOC_TITLE],  # = "Table of Contents"
+                        self.getContentTreeBody(self._getRootFlatTree(),
+                        linkAsFragments=False)
+                        ))
+            elif self.addOpt[self.ADDOPT_IDX_TABLE_OF_CONTENTS] == 2:
+                # Write a content list
+                fp.write(('<h2 class="wikidpad">%s</h2>\n'
+                        '%s') %
+                        (self.addOpt[self.ADDOPT_IDX_TOC_TITLE],  # = "Table of Contents"
+                        self.getContentListBody(linkAsFragments=False)
+                        ))
+
+            fp.write(self.getFileFooter())
+
+            #fp.reset()        
+            realfp.close()
+        except Exception as e:
+            traceback.print_exc()
+
+
+    def _formatSingleFilesWord(self, word):
+        """
+        Return HTML page of word or empty string if it isn't exported.
+        """
+        if self.dependencyRecorder is not None:
+            # Own attributes decide if page is exported
+            self.dependencyRecorder.add(("page", word))
+
+        wikiPage = self.wikiDocument.getWikiPage(word)
+        if not self.shouldExport(word, wikiPage):
+            return ""
+
+        return self.exportWikiPageToHtmlString(wikiPage, False)
+
+
+    def _writeSingleFilesWord(self, word, content):
+        outputFile = join(self.exportDest,
+                self.filenameConverter.getFilenameForWikiWord(word) + ".html")
+
+        try:
+            if exists(pathEnc(outputFile)):
+                os.unlink(pathEnc(outputFile))
+
+            with open(pathEnc(outputFile), "w", encoding="utf-8",
+                    errors="surrogateescape") as fp:
+                fp.write(content)
+        except Exception as e:
+            sys.stderr.write("Error while exporting word %s" % repr(word))
+            traceback.print_exc()
+
+
     def exportWordToHtmlPage(self, dir, word, startFile=True,
             onlyInclude=None):
             
@@ -1150,6 +1802,10 @@ class HtmlExporter(AbstractExporter):
         bgcol = config.get("main", "html_body_bgcolor")
         bgimg = config.get("main", "html_body_background")
 
+        if self.dependencyRecorder is not None:
+            self.dependencyRecorder.addQuery(("global attributes",),
+                    self.evaluateExportQuery(("global attributes",)))
+
         # Get attribute settings
         linkcol = wikiPage.getAttributeOrGlobal("html.linkcolor", linkcol)
         alinkcol = wikiPage.getAttributeOrGlobal("html.alinkcolor", alinkcol)
@@ -1223,9 +1879,18 @@ class HtmlExporter(AbstractExporter):
     def getParentLinks(self, wikiPage, asHref=True, wordsToInclude=None):
         parents = ""
         parentRelations = wikiPage.getParentRelationships()[:]
+
+        if self.dependencyRecorder is not None:
+            self.dependencyRecorder.addQuery(
+                    ("parents", wikiPage.getWikiWord()), set(parentRelations))
+
         self.mainControl.getCollator().sort(parentRelations)
         
         for relation in parentRelations:
+            if wordsToInclude is self.wordSet:
+                self.recordQuery(("exported", relation),
+                        relation in wordsToInclude)
+
             if wordsToInclude and relation not in wordsToInclude:
                 continue
 
@@ -1361,6 +2026,9 @@ class HtmlExporter(AbstractExporter):
 #                 # TODO Use self.convertFilename here?
 #                 return self.linkConverter.getLinkForWikiWord(relUnAlias)
 
+        if self.dependencyRecorder is not None:
+            self.dependencyRecorder.add(WORD_SET)
+
         result = []
         wordToLink = self.linkConverter.getLinkForWikiWord
         
@@ -1391,7 +2059,10 @@ class HtmlExporter(AbstractExporter):
 #                 # TODO Use self.convertFilename here?
 #                 return self.linkConverter.getLinkForWikiWord(relUnAlias)
 
-        wordSet = set(self.wordList)
+        if self.dependencyRecorder is not None:
+            self.dependencyRecorder.add(WORD_SET)
+
+        wordSet = set(self.wordSet)
         deepStack = [-1]
         result = []
         wordToLink = self.linkConverter.getLinkForWikiWord
@@ -1446,6 +2117,9 @@ class HtmlExporter(AbstractExporter):
 
     def formatContent(self, wikiPage, content=None):
         word = wikiPage.getWikiWord()
+        if self.dependencyRecorder is not None:
+            self.dependencyRecorder.add(("page", word))
+
         formatDetails = wikiPage.getFormatDetails()
         if content is None:
             content = wikiPage.getLiveText()
@@ -1911,6 +2585,7 @@ class HtmlExporter(AbstractExporter):
             except ValueError:
                 return
 
+            self.recordLinkDependency(value)
             docpage = self.wikiDocument.getWikiPageNoError(value)
             pageAst = docpage.getLivePageAst()
             
@@ -1970,19 +2645,14 @@ class HtmlExporter(AbstractExporter):
             
         elif key == "rel":
             # List relatives (children, parents)
-            if value == "parents":
-                wordList = self.wikiDocument.getWikiData().getParentRelationships(
-                        self.wikiWord)
-            elif value == "children":
-                existingonly = ("existingonly" in appendices) # or \
-                        # (u"existingonly +" in insertionAstNode.appendices)
-                wordList = self.wikiDocument.getWikiData().getChildRelationships(
-                        self.wikiWord, existingonly=existingonly,
-                        selfreference=False)
-            elif value == "parentless":
-                wordList = self.wikiDocument.getWikiData().getParentlessWikiWords()
-            elif value == "undefined":
-                wordList = self.wikiDocument.getWikiData().getUndefinedWords()
+            existingonly = ("existingonly" in appendices) # or \
+                    # (u"existingonly +" in insertionAstNode.appendices)
+            wordList = self._getRelatives(value, self.wikiWord, existingonly)
+            if wordList is not None:
+                if self.dependencyRecorder is not None:
+                    self.dependencyRecorder.addQuery(
+                            ("rel", value, self.wikiWord, existingonly),
+                            set(wordList))
             elif value == "top":
                 htmlContent = '<a href="#" class="wikidpad">Top</a>'
             elif value == "back":
@@ -2092,6 +2762,9 @@ class HtmlExporter(AbstractExporter):
 #             htmlContent = u"".join(htmlContent)
 
         elif key == "eval":
+            if self.dependencyRecorder is not None:
+                self.dependencyRecorder.add(ANY_CHANGE)
+
             if not self.mainControl.getConfig().getboolean("main",
                     "insertions_allow_eval", False):
                 # Evaluation of such insertions not allowed
@@ -2112,6 +2785,9 @@ class HtmlExporter(AbstractExporter):
                     htmlContent = '\n<pre class="wikidpad">\n' + \
                             escapeHtmlNoBreaks(s.getvalue()) + '\n</pre>\n'
         elif key == "iconimage":
+            if self.dependencyRecorder is not None:
+                self.dependencyRecorder.add(TEMP_FILES)
+
             imgName = astNode.value
             icPath = wx.GetApp().getIconCache().lookupIconPath(imgName)
             if icPath is None:
@@ -2131,6 +2807,10 @@ class HtmlExporter(AbstractExporter):
                 htmlContent = '<img src="%s" class="wikidpad" />' % url
         else:
             # Call external plugins
+            if self.dependencyRecorder is not None:
+                # No information what the plugin consumed
+                self.dependencyRecorder.add(ANY_CHANGE)
+
             exportType = self.exportType
             handler = wx.GetApp().getInsertionPluginManager().getHandler(self,
                     exportType, key)
@@ -2170,6 +2850,11 @@ class HtmlExporter(AbstractExporter):
 
         if searchOp is not None:
             wordList = self.wikiDocument.searchWiki(searchOp)
+
+            if self.dependencyRecorder is not None:
+                self.dependencyRecorder.addQuery(
+                        ("search", searchOp.getPackedSettings()),
+                        set(wordList))
             
             if ("removeself" in appendices) or ("removethis" in appendices):
                 # Because a simple search for "foo" includes the page containing
@@ -2237,6 +2922,25 @@ class HtmlExporter(AbstractExporter):
             self.outAppend(htmlContent)
 
 
+    def _getRelatives(self, value, wikiWord, existingonly):
+        """
+        Return list of relatives of wikiWord for a "rel" insertion with
+        value  or None if value doesn't denote a list of relatives.
+        """
+        linkGraph = self.wikiDocument.getLinkGraph()
+        if value == "parents":
+            return linkGraph.getParentRelationships(wikiWord)
+        elif value == "children":
+            return linkGraph.getChildRelationships(wikiWord,
+                    existingonly=existingonly, selfreference=False)
+        elif value == "parentless":
+            return linkGraph.getParentlessWikiWords()
+        elif value == "undefined":
+            return linkGraph.getUndefinedWords()
+
+        return None
+
+
     def _processWikiWord(self, astNodeOrWord, fullContent=None):
         self.astNodeStack.append(astNodeOrWord)
 
@@ -2251,6 +2955,8 @@ class HtmlExporter(AbstractExporter):
             
         if self.avoidDeadWikiLinks and not self.shouldExport(
                 self.wikiDocument.getWikiPageNameForLinkTerm(wikiWord)):
+            # Link becomes alive if the page is created or exported
+            self.recordLinkDependency(wikiWord)
             link = None
         else:
             self.linkConverter.wikiDocument = self.wikiDocument
@@ -2269,6 +2975,21 @@ class HtmlExporter(AbstractExporter):
                     # Page links to itself
                     selfLink = True
 
+            searchFragment = getattr(astNodeOrWord, "searchFragment", None)
+            if not anchorLink and searchFragment and linkTo is not None:
+                # Link to the heading in front of the found text
+                if linkTo == self.wikiDocument.getWikiPageNameForLinkTerm(
+                        self.wikiWord):
+                    forbiddenRange = (astNodeOrWord.pos,
+                            astNodeOrWord.pos + astNodeOrWord.strLength)
+                else:
+                    forbiddenRange = (0, 0)
+
+                key = ("search fragment", wikiWord, searchFragment,
+                        forbiddenRange)
+                anchorLink = self.evaluateExportQuery(key)
+                self.recordQuery(key, anchorLink)
+
             # Add anchor fragment if present
             if anchorLink:
                 if selfLink:
@@ -2340,13 +3061,17 @@ class HtmlExporter(AbstractExporter):
                     if isCont:
                         # File is in file storage -> add to
                         # referenced storage files                            
-                        self.referencedStorageFiles.add(
-                                StringOps.relativeFilePath(
-                                self.wikiDocument.getWikiPath(),
-                                absPath))
+                        storageFile = StringOps.relativeFilePath(
+                                self.wikiDocument.getWikiPath(), absPath)
+                        self.referencedStorageFiles.add(storageFile)
+                        if self.dependencyRecorder is not None:
+                            self.dependencyRecorder.add(
+                                    ("storage file", storageFile))
                         
                         relPath = StringOps.pathnameFromUrl(link[6:], False)
-                
+
+                        self.recordQuery(("export destination",),
+                                self.exportDest)
                         absUrl = "file:" + StringOps.urlFromPathname(
                                 os.path.abspath(os.path.join(self.exportDest,
                                 relPath)))
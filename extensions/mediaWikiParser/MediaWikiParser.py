@@ -23,6 +23,7 @@ sys.stderr = sys.stdout
 Localization.setLocale("")
 
 from pwiki.WikiPyparsing import *
+from pwiki.ParseUtilities import AutoLinkRelaxMatcher
 
 
 WIKIDPAD_PLUGIN = (("WikiParser", 1),)
@@ -1323,14 +1324,6 @@ ToDoREWithCapturing = re.compile(r"^([^:\s]+):[ \t]*(.+?)$",
 
 
 
-# For auto-link mode relax
-AutoLinkRelaxSplitRE = re.compile(r"[\W]+", re.IGNORECASE | re.UNICODE)
-
-AutoLinkRelaxJoinPAT = r"[\W]+"
-AutoLinkRelaxJoinFlags = re.IGNORECASE | re.UNICODE
-
-
-
 # For spell checking
 TextWordRE = re.compile(r"(?P<negative>[0-9]+|"+ UrlPAT + ")|\b[\w']+",
         re.DOTALL | re.UNICODE | re.MULTILINE)
@@ -1541,9 +1534,8 @@ class _TheParser:
         Do some cleanup after main parsing.
         Not part of public API.
         """
-        autoLinkRelaxRE = None
         if formatDetails.autoLinkMode == "relax":
-            relaxList = formatDetails.wikiDocument.getAutoLinkRelaxInfo()
+            relaxMatcher = formatDetails.wikiDocument.getAutoLinkRelaxInfo()
 
             def recursAutoLink(ast):
                 newAstNodes = []
@@ -1557,52 +1549,35 @@ class _TheParser:
                         start = node.pos
                         
                         threadstop.testValidThread()
-                        while text != "":
-                            # The foundWordText is the text as typed in the page
-                            # foundWord is the word as entered in database
-                            # These two may differ (esp. in whitespaces)
-                            foundPos = len(text)
-                            foundWord = None
-                            foundWordText = None
-                            
-                            # Search all regexes for the earliest match
-                            for regex, word in relaxList:
-                                match = regex.search(text)
-                                if match:
-                                    pos = match.start(0)
-                                    if pos < foundPos:
-                                        # Match is earlier than previous
-                                        foundPos = pos
-                                        foundWord = word
-                                        foundWordText = match.group(0)
-                                        if pos == 0:
-                                            # Can't find a better match -> stop loop
-                                            break
-
+                        textPos = 0
+                        # The foundWordText is the text as typed in the page
+                        # foundWord is the word as entered in database
+                        # These two may differ (esp. in whitespaces)
+                        for foundPos, foundEnd, foundWord in \
+                                relaxMatcher.iterMatches(text):
                             # Add token for text before found word (if any)
-                            preText = text[:foundPos]
-                            if preText != "":
-                                newAstNodes.append(buildSyntaxNode(preText,
-                                        start, "plainText"))
-                
-                                start += len(preText)
-                                text = text[len(preText):]
-                            
-                            if foundWord is not None:
-                                wwNode = buildSyntaxNode(
-                                        [buildSyntaxNode(foundWordText, start, "word")],
-                                        start, "wikiWord")
-                                        
-                                wwNode.searchFragment = None
-                                wwNode.anchorLink = None
-                                wwNode.wikiWord = foundWord
-                                wwNode.titleNode = buildSyntaxNode(foundWordText, start, "plainText") # None
-
-                                newAstNodes.append(wwNode)
-
-                                inc = max(len(foundWordText), 1)
-                                start += inc
-                                text = text[inc:]
+                            if foundPos > textPos:
+                                newAstNodes.append(buildSyntaxNode(
+                                        text[textPos:foundPos],
+                                        start + textPos, "plainText"))
+
+                            foundWordText = text[foundPos:foundEnd]
+                            wwStart = start + foundPos
+                            wwNode = buildSyntaxNode(
+                                    [buildSyntaxNode(foundWordText, wwStart, "word")],
+                                    wwStart, "wikiWord")
+
+                            wwNode.searchFragment = None
+                            wwNode.anchorLink = None
+                            wwNode.wikiWord = foundWord
+                            wwNode.titleNode = buildSyntaxNode(foundWordText, wwStart, "plainText") # None
+
+                            newAstNodes.append(wwNode)
+                            textPos = foundEnd
+
+                        if textPos < len(text):
+                            newAstNodes.append(buildSyntaxNode(text[textPos:],
+                                    start + textPos, "plainText"))
 
                         continue
 
@@ -1684,6 +1659,13 @@ class WikiLanguageDetails:
         return self.getWikiLanguageName() == details.getWikiLanguageName() and \
                 self.footnotesAsWws == details.footnotesAsWws
 
+    def getCacheKey(self):
+        """
+        Return a string which is equal for equivalent details objects.
+        Used as part of the key of the persistent page AST cache.
+        """
+        return "%s|%s" % (self.getWikiLanguageName(), self.footnotesAsWws)
+
 
 class _WikiLinkPath:
     __slots__ = ("upwardCount", "components")
@@ -2086,45 +2068,35 @@ class _TheHelper:
             return None
 
 
-    @staticmethod
-    def _createAutoLinkRelaxWordEntryRE(word):
-        """
-        Get compiled regular expression for one word in autoLink "relax"
-        mode.
-
-        Not part of public API.
-        """
-        # Split into parts of contiguous alphanumeric characters
-        parts = AutoLinkRelaxSplitRE.split(word)
-        # Filter empty parts
-        parts = [p for p in parts if p != ""]
-
-        # Instead of original non-alphanum characters allow arbitrary
-        # non-alphanum characters
-        pat = r"\b" + (AutoLinkRelaxJoinPAT.join(parts)) + r"\b"
-        regex = re.compile(pat, AutoLinkRelaxJoinFlags)
-
-        return regex
-
-
     @staticmethod
     def buildAutoLinkRelaxInfo(wikiDocument):
         """
         Build some cache info needed to process auto-links in "relax" mode.
         This info will be given back in the formatDetails when calling
         _TheParser.parse().
-        The implementation for this plugin creates a list of regular
-        expressions and the related wiki words, but this is not mandatory.
+        The implementation for this plugin creates an AutoLinkRelaxMatcher
+        containing all wiki words, but this is not mandatory.
         """
-        # Build up regular expression
-        # First fetch all wiki words
-        words = wikiDocument.getWikiData().getAllProducedWikiLinks()
+        return AutoLinkRelaxMatcher(
+                wikiDocument.getWikiData().getAllProducedWikiLinks())
 
-        # Sort longest words first
-        words.sort(key=lambda w: len(w), reverse=True)
-        
-        return [(_TheHelper._createAutoLinkRelaxWordEntryRE(w), w)
-                for w in words if w != ""]
+
+    @staticmethod
+    def updateAutoLinkRelaxInfo(wikiDocument, autoLinkRelaxInfo,
+            changedLinkTerms=None):
+        """
+        Update info created by buildAutoLinkRelaxInfo() after wiki words
+        were added, renamed or deleted and return it.
+        changedLinkTerms -- set of the link terms which may have changed
+                or None if all must be checked
+        """
+        if changedLinkTerms is None:
+            autoLinkRelaxInfo.setWords(
+                    wikiDocument.getWikiData().getAllProducedWikiLinks())
+        else:
+            autoLinkRelaxInfo.updateWords(changedLinkTerms,
+                    wikiDocument.getLinkGraph().isLinkTerm)
+        return autoLinkRelaxInfo
 
 
     @staticmethod
@@ -5,7 +5,7 @@
 # Last modified (format YYYY-MM-DD): 2017-10-18
 from collections import Counter
 
-import sys, string, traceback
+import sys, string, traceback, pickle, bisect
 
 from textwrap import fill
 
@@ -23,6 +23,7 @@ sys.stderr = sys.stdout
 Localization.setLocale("")
 
 from pwiki.WikiPyparsing import *
+from pwiki.ParseUtilities import AutoLinkRelaxMatcher
 
 
 WIKIDPAD_PLUGIN = (("WikiParser", 1),)
@@ -1209,14 +1210,6 @@ ToDoREWithCapturing = re.compile(r"^([^:\s]+):[ \t]*(.+?)$",
 
 
 
-# For auto-link mode relax
-AutoLinkRelaxSplitRE = re.compile(r"[\W]+", re.IGNORECASE | re.UNICODE)
-
-AutoLinkRelaxJoinPAT = r"[\W]+"
-AutoLinkRelaxJoinFlags = re.IGNORECASE | re.UNICODE
-
-
-
 # For spell checking
 TextWordRE = re.compile(r"(?P<negative>[0-9]+|"+ UrlPAT + "|\b(?<!~)" +
         WikiWordCcPAT + r"\b)|\b[\w']+",
@@ -1394,6 +1387,87 @@ def _buildBaseDict(wikiDocument=None, formatDetails=None):
         }
 
 
+# -------------------- Incremental parsing --------------------
+
+# One top-level item of "content", content is ZeroOrMore(NotAny(endToken) +
+# findMarkup). The (optimized) element is taken out of "text" because
+# optimizing creates copies of the elements
+_contentItem = text.exprs[0].expr.expr
+_textEnd = text.exprs[1]
+
+# Markup which may span multiple lines and starts with these strings is
+# plain text (or an HTML tag) if its end isn't found. Text inserted after it
+# may therefore change the AST before the insertion point. Bold and italics
+# are stopped by headings, the others aren't.
+_INCR_RISKY_INLINE_RE = re.compile(r"\*|\b_", RE_FLAGS)
+_INCR_RISKY_BLOCK_RE = re.compile(r"<%|<<|\[|<pre|<body", RE_FLAGS)
+
+_INCR_NON_SPACE_RE = re.compile(r"[^ \t\n]", RE_FLAGS)
+
+
+def _hasRiskyMarkup(content, node, riskyRe):
+    """
+    Returns True if a plain text or HTML tag terminal node in  node  contains
+    a match of  riskyRe .
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if not node.isTerminal():
+            stack += node.sub
+        elif node.name in ("plainText", "htmlTag") and riskyRe.search(content,
+                node.pos, node.pos + node.strLength) is not None:
+            return True
+
+    return False
+
+
+def _findIncrementalRestart(oldContent, oldNodes, itemStarts, changeStart):
+    """
+    Returns index into top-level nodes  oldNodes  of the node where parsing
+    of the changed text must be restarted. All nodes before this index are
+    unaffected by a change beginning at  changeStart . Parsing is only
+    restarted at a node starting at one of the  itemStarts  (a set).
+    """
+    restartIdx = 0
+    blockRisk = False
+    inlineRisk = False
+
+    for i, node in enumerate(oldNodes):
+        if node.pos + node.strLength > changeStart:
+            break
+
+        if node.name == "heading":
+            inlineRisk = False
+        elif not inlineRisk:
+            inlineRisk = _hasRiskyMarkup(oldContent, node,
+                    _INCR_RISKY_INLINE_RE)
+
+        if not blockRisk:
+            blockRisk = _hasRiskyMarkup(oldContent, node, _INCR_RISKY_BLOCK_RE)
+
+        if blockRisk:
+            break
+
+        if inlineRisk or node.name not in ("lineBreak", "newParagraph"):
+            continue
+
+        # A newline node may look ahead over the following line(s)
+        # which therefore must be unchanged
+        restartPos = node.pos + node.strLength
+        lineEnd = oldContent.find("\n", restartPos)
+        if lineEnd == -1 or lineEnd >= changeStart:
+            break
+
+        match = _INCR_NON_SPACE_RE.search(oldContent, restartPos)
+        if match is None or match.start() >= changeStart:
+            break
+
+        if restartPos in itemStarts:
+            restartIdx = i + 1
+
+    return restartIdx
+
 
 # -------------------- API for plugin WikiParser --------------------
 # During beta state of the WikidPad version, this API isn't stable yet, 
@@ -1426,9 +1500,8 @@ class _TheParser:
         Do some cleanup after main parsing.
         Not part of public API.
         """
-        autoLinkRelaxRE = None
         if formatDetails.autoLinkMode == "relax":
-            relaxList = formatDetails.wikiDocument.getAutoLinkRelaxInfo()
+            relaxMatcher = formatDetails.wikiDocument.getAutoLinkRelaxInfo()
 
             def recursAutoLink(ast):
                 newAstNodes = []
@@ -1442,52 +1515,35 @@ class _TheParser:
                         start = node.pos
                         
                         threadstop.testValidThread()
-                        while text != "":
-                            # The foundWordText is the text as typed in the page
-                            # foundWord is the word as entered in database
-                            # These two may differ (esp. in whitespaces)
-                            foundPos = len(text)
-                            foundWord = None
-                            foundWordText = None
-                            
-                            # Search all regexes for the earliest match
-                            for regex, word in relaxList:
-                                match = regex.search(text)
-                                if match:
-                                    pos = match.start(0)
-                                    if pos < foundPos:
-                                        # Match is earlier than previous
-                                        foundPos = pos
-                                        foundWord = word
-                                        foundWordText = match.group(0)
-                                        if pos == 0:
-                                            # Can't find a better match -> stop loop
-                                            break
-
+                        textPos = 0
+                        # The foundWordText is the text as typed in the page
+                        # foundWord is the word as entered in database
+                        # These two may differ (esp. in whitespaces)
+                        for foundPos, foundEnd, foundWord in \
+                                relaxMatcher.iterMatches(text):
                             # Add token for text before found word (if any)
-                            preText = text[:foundPos]
-                            if preText != "":
-                                newAstNodes.append(buildSyntaxNode(preText,
-                                        start, "plainText"))
-                
-                                start += len(preText)
-                                text = text[len(preText):]
-                            
-                            if foundWord is not None:
-                                wwNode = buildSyntaxNode(
-                                        [buildSyntaxNode(foundWordText, start, "word")],
-                                        start, "wikiWord")
-                                        
-                                wwNode.searchFragment = None
-                                wwNode.anchorLink = None
-                                wwNode.wikiWord = foundWord
-                                wwNode.titleNode = buildSyntaxNode(foundWordText, start, "plainText") # None
-
-                                newAstNodes.append(wwNode)
-
-                                inc = max(len(foundWordText), 1)
-                                start += inc
-                                text = text[inc:]
+                            if foundPos > textPos:
+                                newAstNodes.append(buildSyntaxNode(
+                                        text[textPos:foundPos],
+                                        start + textPos, "plainText"))
+
+                            foundWordText = text[foundPos:foundEnd]
+                            wwStart = start + foundPos
+                            wwNode = buildSyntaxNode(
+                                    [buildSyntaxNode(foundWordText, wwStart, "word")],
+                                    wwStart, "wikiWord")
+
+                            wwNode.searchFragment = None
+                            wwNode.anchorLink = None
+                            wwNode.wikiWord = foundWord
+                            wwNode.titleNode = buildSyntaxNode(foundWordText, wwStart, "plainText") # None
+
+                            newAstNodes.append(wwNode)
+                            textPos = foundEnd
+
+                        if textPos < len(text):
+                            newAstNodes.append(buildSyntaxNode(text[textPos:],
+                                    start + textPos, "plainText"))
 
                         continue
 
@@ -1512,7 +1568,9 @@ class _TheParser:
         """
 
         if len(content) == 0:
-            return buildSyntaxNode([], 0, "text")
+            t = buildSyntaxNode([], 0, "text")
+            t.itemStarts = []
+            return t
 
         if formatDetails.noFormat:
             return buildSyntaxNode([buildSyntaxNode(content, 0, "plainText")],
@@ -1522,12 +1580,24 @@ class _TheParser:
 
 ##         _prof.start()
         try:
-            t = text.parseString(content, parseAll=True, baseDict=baseDict,
-                    threadstop=threadstop)
-            t = buildSyntaxNode(t, 0, "text")
+            # Parse item by item like text.parseString() would do to record
+            # where the top-level items start (needed by parseIncremental())
+            if not text.streamlined:
+                text.streamline()
+            state = text.buildStartState(content, baseDict, threadstop)
+            itemStarts = []
+
+            loc, tokens, synced = parseRepetitionFrom(_contentItem, content, 0,
+                    state, (), itemStarts)
+            loc, endTokens = _textEnd._parse(content, loc, state)
+            if loc == -1:
+                raise endTokens
+
+            t = buildSyntaxNode(tokens + list(endTokens), 0, "text")
 
             t = _TheParser._postProcessing(intLanguageName, content, formatDetails,
                     t, threadstop)
+            t.itemStarts = itemStarts
 
         finally:
 ##             _prof.stop()
@@ -1535,6 +1605,103 @@ class _TheParser:
 
         return t
 
+    @staticmethod
+    def parseIncremental(intLanguageName, content, formatDetails, threadstop,
+            oldContent, oldPageAst):
+        """
+        Same as parse() but uses  oldPageAst  which was created by parsing
+        oldContent  with equivalent format details. Only the changed part
+        of  content  is parsed again, the result is the same as with parse().
+        """
+        # Start locations of the top-level items (see parse()), missing
+        # in ASTs from older versions
+        oldItemStarts = getattr(oldPageAst, "itemStarts", None)
+
+        if len(content) == 0 or len(oldContent) == 0 or \
+                formatDetails.noFormat or formatDetails.autoLinkMode == "relax" \
+                or oldItemStarts is None:
+            return _TheParser.parse(intLanguageName, content, formatDetails,
+                    threadstop)
+
+        changeStart = StringOps.commonPrefixLength(oldContent, content)
+        if changeStart == len(oldContent) == len(content):
+            return oldPageAst
+
+        suffixLength = StringOps.commonSuffixLength(oldContent, content,
+                min(len(oldContent), len(content)) - changeStart)
+        newChangeEnd = len(content) - suffixLength
+        delta = len(content) - len(oldContent)
+
+        oldNodes = oldPageAst.getChildren()
+        oldItemStartSet = frozenset(oldItemStarts)
+        restartIdx = _findIncrementalRestart(oldContent, oldNodes,
+                oldItemStartSet, changeStart)
+        if restartIdx == 0:
+            restartLoc = 0
+        else:
+            restartLoc = oldNodes[restartIdx].pos
+
+        # Top-level nodes of the unchanged end of the text which can be reused
+        # if reparsing reaches their (shifted) position. The node must have
+        # started a top-level item (and not be e.g. part of a multi-line
+        # block) and the character before it must be an unchanged newline so
+        # nothing before the node influences it
+        syncLocs = {}
+        for i in range(len(oldNodes) - 1, restartIdx, -1):
+            pos = oldNodes[i].pos
+            if pos + delta <= newChangeEnd:
+                break
+            if oldContent[pos - 1] == "\n" and pos in oldItemStartSet:
+                syncLocs[pos + delta] = i
+
+        baseDict = _buildBaseDict(formatDetails=formatDetails)
+        itemStarts = oldItemStarts[:bisect.bisect_left(oldItemStarts,
+                restartLoc)]
+
+        try:
+            if not text.streamlined:
+                text.streamline()
+            state = text.buildStartState(content, baseDict, threadstop)
+
+            loc, tokens, synced = parseRepetitionFrom(_contentItem, content,
+                    restartLoc, state, syncLocs, itemStarts)
+
+            if not synced:
+                loc, endTokens = _textEnd._parse(content, loc, state)
+                if loc == -1:
+                    raise endTokens
+        except ParseException:
+            # Let full parsing handle the problem
+            return _TheParser.parse(intLanguageName, content, formatDetails,
+                    threadstop)
+
+        if synced:
+            tailNodes = oldNodes[syncLocs[loc]:]
+            tailStarts = oldItemStarts[bisect.bisect_left(oldItemStarts,
+                    loc - delta):]
+            if delta != 0:
+                try:
+                    tailNodes = cloneShiftedSyntaxNodes(tailNodes, delta)
+                except (pickle.PicklingError, TypeError):
+                    # A node refers to something which can't be copied
+                    traceback.print_exc()
+                    return _TheParser.parse(intLanguageName, content,
+                            formatDetails, threadstop)
+
+                tailStarts = [pos + delta for pos in tailStarts]
+            itemStarts += tailStarts
+        else:
+            tailNodes = list(endTokens)
+
+        t = buildSyntaxNode(oldNodes[:restartIdx] + tokens + tailNodes, 0,
+                "text")
+
+        t = _TheParser._postProcessing(intLanguageName, content,
+                formatDetails, t, threadstop)
+        t.itemStarts = itemStarts
+
+        return t
+
 THE_PARSER = _TheParser()
 
 
@@ -1569,6 +1736,13 @@ class WikiLanguageDetails:
         return self.getWikiLanguageName() == details.getWikiLanguageName() and \
                 self.footnotesAsWws == details.footnotesAsWws
 
+    def getCacheKey(self):
+        """
+        Return a string which is equal for equivalent details objects.
+        Used as part of the key of the persistent page AST cache.
+        """
+        return "%s|%s" % (self.getWikiLanguageName(), self.footnotesAsWws)
+
 
 class _WikiLinkPath:
     __slots__ = ("upwardCount", "components")
@@ -1965,45 +2139,35 @@ class _TheHelper:
             return None
 
 
-    @staticmethod
-    def _createAutoLinkRelaxWordEntryRE(word):
-        """
-        Get compiled regular expression for one word in autoLink "relax"
-        mode.
-
-        Not part of public API.
-        """
-        # Split into parts of contiguous alphanumeric characters
-        parts = AutoLinkRelaxSplitRE.split(word)
-        # Filter empty parts
-        parts = [p for p in parts if p != ""]
-
-        # Instead of original non-alphanum characters allow arbitrary
-        # non-alphanum characters
-        pat = r"\b" + (AutoLinkRelaxJoinPAT.join(parts)) + r"\b"
-        regex = re.compile(pat, AutoLinkRelaxJoinFlags)
-
-        return regex
-
-
     @staticmethod
     def buildAutoLinkRelaxInfo(wikiDocument):
         """
         Build some cache info needed to process auto-links in "relax" mode.
         This info will be given back in the formatDetails when calling
         _TheParser.parse().
-        The implementation for this plugin creates a list of regular
-        expressions and the related wiki words, but this is not mandatory.
+        The implementation for this plugin creates an AutoLinkRelaxMatcher
+        containing all wiki words, but this is not mandatory.
         """
-        # Build up regular expression
-        # First fetch all wiki words
-        words = wikiDocument.getWikiData().getAllProducedWikiLinks()
+        return AutoLinkRelaxMatcher(
+                wikiDocument.getWikiData().getAllProducedWikiLinks())
 
-        # Sort longest words first
-        words.sort(key=lambda w: len(w), reverse=True)
-        
-        return [(_TheHelper._createAutoLinkRelaxWordEntryRE(w), w)
-                for w in words if w != ""]
+
+    @staticmethod
+    def updateAutoLinkRelaxInfo(wikiDocument, autoLinkRelaxInfo,
+            changedLinkTerms=None):
+        """
+        Update info created by buildAutoLinkRelaxInfo() after wiki words
+        were added, renamed or deleted and return it.
+        changedLinkTerms -- set of the link terms which may have changed
+                or None if all must be checked
+        """
+        if changedLinkTerms is None:
+            autoLinkRelaxInfo.setWords(
+                    wikiDocument.getWikiData().getAllProducedWikiLinks())
+        else:
+            autoLinkRelaxInfo.updateWords(changedLinkTerms,
+                    wikiDocument.getLinkGraph().isLinkTerm)
+        return autoLinkRelaxInfo
 
 
     @staticmethod
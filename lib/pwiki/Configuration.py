@@ -99,6 +99,25 @@ class _AbstractConfiguration:
 
 
 
+class FrozenConfiguration(_AbstractConfiguration):
+    """
+    Read-only copy of all option values of a SingleConfiguration. It
+    can be pickled, e.g. to hand the configuration to worker processes.
+    """
+
+    def __init__(self, config):
+        self.values = dict(((section, option), config.get(section, option))
+                for section, option in config.configDefaults)
+
+    def get(self, section, option, default=None):
+        result = self.values.get((section, option))
+        if result is None:
+            return default
+
+        return result
+
+
+
 class SingleConfiguration(_AbstractConfiguration, MiscEventSourceMixin):
     """
     Wraps a single ConfigParser object
@@ -861,6 +880,10 @@ GLOBALDEFAULTS = {
             # than base and shift level
     ("main", "zombieCheck"): "True", # Check for already running processes? Only active if "single_process" is True
     ("main", "cpu_affinity"): "-1", # Assign process to a single CPU? -1: Use CPU affinity on startup; greater numbers denote a particular CPU
+    ("main", "rebuild_processCount"): "0", # Number of worker processes parsing pages when rebuilding a wiki.
+            # 0: Number of CPUs; 1: No worker processes, parse in main process
+    ("main", "export_processCount"): "0", # Number of worker processes parsing pages for an HTML export.
+            # 0: Number of CPUs; 1: No worker processes, parse in main process
 
     ("main", "tempHandling_preferMemory"): "False", # Prefer to store temporary data in memory where this is possible?
     ("main", "tempHandling_tempMode"): "system", # Mode for storing of temporary data.
@@ -897,6 +920,23 @@ WIKIDEFAULTS = {
     ("main", "indexSearch_enabled"): "False", # should the index search be enabled?
     ("main", "indexSearch_formatNo"): "1", # internal: Number of format of search index (only valid if index enabled)
             # if it doesn't match format number of this WikidPad version, index rebuild is needed
+    ("main", "indexSearch_batchCommit_docCount"): "200", # Number of pending documents after which the background
+            # updater commits them to the search index
+    ("main", "indexSearch_batchCommit_maxDelay"): "10", # Maximum time in seconds a document waits in the background
+            # updater before it is committed to the search index
+    ("main", "fullTextIndex_enabled"): "False", # Maintain a full text index in the database to find candidate
+            # pages for wiki-wide searches faster (only "compact_sqlite" with FTS5 support)
+    ("main", "trigramIndex_enabled"): "False", # Maintain a trigram index in the database to find candidate
+            # pages for wiki-wide regex and substring searches faster (only "compact_sqlite")
+    ("main", "concurrentReads_connectionCount"): "0", # Number of additional read-only database connections so
+            # reading doesn't wait for the background updater writing. Needs the WAL journal mode which is switched
+            # on while the wiki is open if greater than 0 (only "compact_sqlite")
+    ("main", "pageAstCache_enabled"): "True", # Store page ASTs in the "astcache" directory of the wiki
+            # so unchanged pages don't have to be parsed again
+    ("main", "pageAstCache_maxSize"): "50", # Maximum size of the page AST cache in megabytes
+    ("main", "exportFragmentCache_enabled"): "True", # Store the HTML of exported pages in the "exportcache"
+            # directory of the wiki so unchanged pages don't have to be rendered again by the next export
+    ("main", "exportFragmentCache_maxSize"): "50", # Maximum size of the export fragment cache in megabytes
     ("main", "tabs_maxCharacters"): "0", # Maximum number of characters to show on a tab (0: inifinite)
     ("main", "template_pageNamesRE"): "^template/",  # Regular expression pattern for pages which should be seen as templates
             # Especially they will be listed in text editor context menu on new pages
@@ -956,6 +996,8 @@ WIKIDEFAULTS = {
     ("main", "wikiPageFiles_writeFileMode"): "0", # How wiki page files are modified on saving?
             # 0: Safe: create temp file, delete target file, rename temp to target
             # 1: Just overwrite in place (useful if files are hardlinked).
+    ("main", "wikiPageFiles_watchDataDir"): "False", # Watch the data directory and update pages whose files
+            # were changed outside of WikidPad (needs the "watchdog" package)
 
     ("main", "headingsAsAliases_depth"): "0",  # Maximum heading depth for which aliases should be generated for
             # each heading up to and including this depth.
@@ -966,6 +1008,9 @@ WIKIDEFAULTS = {
     ("main", "versioning_completeSteps"): "10",  # How many versions before next version is saved completely
             # instead of reverse differential? 0: Always revdiff, 1: Always complete, 2: Every second v. is complete ...
 
+    ("main", "versioning_diffEngine"): "lines",  # How to find the differences between versions
+            # "lines": by lines, then by bytes in short changed blocks; "difflib": by bytes (slow for large pages)
+
     ("main", "tabHistory_maxEntries"): "25",  # Maximum number of entries in the history for each tab
     ("main", "wikiWideHistory_maxEntries"): "100",  # Maximum number of entries in the wiki-wide history
 
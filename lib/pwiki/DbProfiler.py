@@ -0,0 +1,228 @@
+"""
+Optional instrumentation of the database layer.
+
+While profiling is enabled
+
+- the connection wrappers of the sqlite based WikiData backends record
+  each executed SQL statement with its duration and the number of rows
+  returned,
+- sqlite3api records hits and misses of the prepared statement cache,
+- the synchronized WikiData proxy records each WikiData call with its
+  duration and the time spent waiting for the access lock.
+
+Statistics are collected per SQL template (the statement with whitespace
+and placeholder lists collapsed) and per WikiData method name.
+getReportLines() formats them, most expensive entries first.
+
+Profiling is off by default. Instrumented code calls startTimer() which
+only returns a time if profiling is enabled, so the costs while disabled
+are a function call per statement.
+"""
+
+import re, threading, time
+from collections import deque
+
+
+# Durations of the most recent calls kept for each entry to compute the p99
+SAMPLE_COUNT = 1000
+
+# Number of entries per table in the report
+REPORT_LIMIT = 25
+
+
+_enabled = False
+
+
+def isEnabled():
+    return _enabled
+
+
+def enable():
+    """
+    Reset statistics and start profiling.
+    """
+    global _enabled
+    profiler.reset()
+    _enabled = True
+
+
+def disable():
+    """
+    Stop profiling. Collected statistics are kept.
+    """
+    global _enabled
+    _enabled = False
+
+
+def startTimer():
+    """
+    Return current time to pass to profiler.add*() later or None if
+    profiling is disabled.
+    """
+    if _enabled:
+        return time.perf_counter()
+
+    return None
+
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PLACEHOLDER_LIST_RE = re.compile(r"\?(?: ?, ?\?)+")
+
+def getSqlTemplate(sql):
+    """
+    Return normalized sql so statements which only differ in formatting
+    or the length of a parameter list are counted together.
+    """
+    sql = _WHITESPACE_RE.sub(" ", sql).strip()
+    return _PLACEHOLDER_LIST_RE.sub("?, ...", sql)
+
+
+
+class ProfileEntry:
+    __slots__ = ("count", "totalTime", "rows", "lockWait", "readerCalls",
+            "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.totalTime = 0.0
+        self.rows = 0
+        self.lockWait = 0.0
+        # Calls answered by a reader without waiting for the lock
+        self.readerCalls = 0
+        self.samples = deque(maxlen=SAMPLE_COUNT)
+
+    def add(self, duration):
+        self.count += 1
+        self.totalTime += duration
+        self.samples.append(duration)
+
+    def getP99(self):
+        """
+        99th percentile of durations of the recent calls
+        """
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+
+class QueryProfiler:
+    def __init__(self):
+        self.statLock = threading.Lock()
+        # {sql string: template} to avoid normalizing the same sql again
+        self.templateCache = {}
+        self.reset()
+
+
+    def reset(self):
+        with self.statLock:
+            self.startTime = time.time()
+            # {sql template: ProfileEntry}
+            self.sqlEntries = {}
+            # {WikiData method name: ProfileEntry}
+            self.callEntries = {}
+            self.stmtCacheHits = 0
+            self.stmtCacheMisses = 0
+
+
+    def addSql(self, sql, startTime, rows=0):
+        """
+        Record an executed statement.
+
+        startTime -- value returned by startTimer() before execution
+        rows -- number of rows returned
+        """
+        duration = time.perf_counter() - startTime
+
+        template = self.templateCache.get(sql)
+        if template is None:
+            template = getSqlTemplate(sql)
+            if len(self.templateCache) >= 10000:
+                # Probably sql with inlined values
+                self.templateCache.clear()
+            self.templateCache[sql] = template
+
+        with self.statLock:
+            entry = self.sqlEntries.get(template)
+            if entry is None:
+                entry = ProfileEntry()
+                self.sqlEntries[template] = entry
+
+            entry.add(duration)
+            entry.rows += rows
+
+
+    def addWikiDataCall(self, name, startTime, lockTime=None):
+        """
+        Record a call of a WikiData method through the synchronized proxy.
+
+        startTime -- value returned by startTimer() before acquiring the lock
+        lockTime -- time when the lock was acquired or None if the call
+            was answered by a reader
+        """
+        duration = time.perf_counter() - startTime
+
+        with self.statLock:
+            entry = self.callEntries.get(name)
+            if entry is None:
+                entry = ProfileEntry()
+                self.callEntries[name] = entry
+
+            entry.add(duration)
+            if lockTime is None:
+                entry.readerCalls += 1
+            else:
+                entry.lockWait += lockTime - startTime
+
+
+    def addStmtCacheAccess(self, hit):
+        with self.statLock:
+            if hit:
+                self.stmtCacheHits += 1
+            else:
+                self.stmtCacheMisses += 1
+
+
+    def getReportLines(self, limit=REPORT_LIMIT):
+        """
+        Return list of lines describing the statistics collected since the
+        last reset. Times are in milliseconds.
+        """
+        with self.statLock:
+            callEntries = sorted(self.callEntries.items(),
+                    key=lambda item: item[1].totalTime, reverse=True)
+            sqlEntries = sorted(self.sqlEntries.items(),
+                    key=lambda item: item[1].totalTime, reverse=True)
+            stmtCacheAccesses = self.stmtCacheHits + self.stmtCacheMisses
+            hitRate = 100.0 * self.stmtCacheHits / max(stmtCacheAccesses, 1)
+
+            result = ["Database profile of %.1f s, statement cache hit rate "
+                    "%.1f%% (%i of %i)" % (time.time() - self.startTime,
+                    hitRate, self.stmtCacheHits, stmtCacheAccesses)]
+
+            result.append("WikiData calls: count, total, p99, lock wait, "
+                    "reader calls, method")
+            for name, entry in callEntries[:limit]:
+                result.append("%7i %10.1f %8.2f %10.1f %7i  %s" % (
+                        entry.count, entry.totalTime * 1000,
+                        entry.getP99() * 1000, entry.lockWait * 1000,
+                        entry.readerCalls, name))
+
+            result.append("SQL statements: count, total, p99, rows, template")
+            for template, entry in sqlEntries[:limit]:
+                result.append("%7i %10.1f %8.2f %10i  %s" % (entry.count,
+                        entry.totalTime * 1000, entry.getP99() * 1000,
+                        entry.rows, template))
+
+            return result
+
+
+    def dump(self, limit=REPORT_LIMIT):
+        return "\n".join(self.getReportLines(limit)) + "\n"
+
+
+
+profiler = QueryProfiler()
@@ -456,11 +456,11 @@ class DataCarryingPage(DocPage):
                     self.editorText isn't valid anymore
                     """
                     self.saveDirtySince = None
-                    self.liveTextPlaceHold = object()
+                    self._renewLiveTextPlaceHold()
             else:
                 if dirty:
                     self.setDirty(True)
-                    self.liveTextPlaceHold = object()
+                    self._renewLiveTextPlaceHold()
 
     def checkFileSignatureAndMarkDirty(self, fireEvent=True):
         return True
@@ -471,6 +471,13 @@ class DataCarryingPage(DocPage):
         Mark text as changed and cached pageAst as invalid.
         Mainly called when an external file change is detected.
         """
+        self._renewLiveTextPlaceHold()
+
+
+    def _renewLiveTextPlaceHold(self):
+        """
+        Called each time the live text may have changed.
+        """
         self.liveTextPlaceHold = object()
         
         
@@ -499,6 +506,11 @@ class AbstractWikiPage(DataCarryingPage):
         self.livePageBaseFormatDetails = None   # Cached format details on which the
                 # page-ast bases
 
+        # Tuple (pageAst, text, formatDetails, ccBlacklist, nccBlacklist) of
+        # the last built page AST. In contrast to livePageAst it is kept if
+        # the text changes so the next AST can be built incrementally
+        self.lastPageAstInfo = None
+
         # List of words unknown to spellchecker
         self.liveSpellCheckerUnknownWords = None
 
@@ -513,6 +525,9 @@ class AbstractWikiPage(DataCarryingPage):
         self.childRelations = None
         self.childRelationSet = set()
         self.todos = None
+        # Frozenset of the link terms (aliases) last written to the database
+        # or None if not known
+        self.linkTerms = None
         self.attrs = None
         self.modified, self.created, self.visited = None, None, None
         self.suggNewPageTitle = None  # Title to use for page if it is
@@ -621,7 +636,8 @@ class AbstractWikiPage(DataCarryingPage):
         self.suggNewPageTitle = suggNewPageTitle
 
     def getParentRelationships(self):
-        return self.getWikiData().getParentRelationships(self.wikiPageName)
+        return self.getWikiDocument().getLinkGraph().getParentRelationships(
+                self.wikiPageName)
 
 
     def getChildRelationships(self, existingonly=False, selfreference=True,
@@ -853,6 +869,79 @@ class AbstractWikiPage(DataCarryingPage):
         return pageAst.iterDeepByName("todoEntry")
 
 
+    @staticmethod
+    def extractAttributesFromPageAst(pageAst, threadstop=DUMBTHREADSTOP):
+        """
+        Return dictionary {key: [values]} of the attributes in pageAst
+        (without those in todo entries).
+        """
+        attrs = {}
+
+        for node in AbstractWikiPage.extractAttributeNodesFromPageAst(pageAst):
+            for attrKey, attrValue in \
+                    (getattr(node, "attrs", []) + getattr(node, "props", [])):  # TODO remove "property"-compatibility
+                threadstop.testValidThread()
+                attrs.setdefault(attrKey, []).append(attrValue)
+
+        return attrs
+
+
+    @staticmethod
+    def extractTodosFromPageAst(pageAst, threadstop=DUMBTHREADSTOP):
+        """
+        Return list of unique (todoKey, todoValue) tuples in pageAst.
+        """
+        todos = []
+        todoSet = set()
+
+        for node in AbstractWikiPage.extractTodoNodesFromPageAst(pageAst):
+            for todoKey, todoValueNode in node.todos:
+                threadstop.testValidThread()
+                todo = (todoKey, todoValueNode.getString())
+                if todo not in todoSet:
+                    todos.append(todo)
+                    todoSet.add(todo)
+
+        return todos
+
+
+    @staticmethod
+    def extractChildRelationsFromPageAst(pageAst, threadstop=DUMBTHREADSTOP):
+        """
+        Return list of (toWord, pos) tuples for the first link to each
+        wiki word in pageAst.
+        """
+        childRelations = []
+        childRelationSet = set()
+
+        for node in pageAst.iterDeepByName("wikiWord"):
+            threadstop.testValidThread()
+            if node.wikiWord not in childRelationSet:
+                childRelations.append((node.wikiWord, node.pos))
+                childRelationSet.add(node.wikiWord)
+
+        return childRelations
+
+
+    @staticmethod
+    def extractHeadingsFromPageAst(pageAst, threadstop=DUMBTHREADSTOP):
+        """
+        Return list of (level, title, endPos) tuples for the top-level
+        headings in pageAst.
+        """
+        headings = []
+
+        for node in pageAst.iterFlatByName("heading"):
+            threadstop.testValidThread()
+            title = node.getString()
+            if title.endswith("\n"):
+                title = title[:-1]
+
+            headings.append((node.level, title, node.pos + node.strLength))
+
+        return headings
+
+
     def _save(self, text, fireEvent=True):
         """
         Saves the content of current doc page.
@@ -902,6 +991,24 @@ class AbstractWikiPage(DataCarryingPage):
             return None
 
 
+    def setLivePageAstIfCurrent(self, text, formatDetails, pageAst):
+        """
+        Set pageAst, built elsewhere (e.g. in a worker process) from  text
+        with  formatDetails, as AST of the live text if text and format
+        details are still current. Returns True if it was set.
+        """
+        with self.textOperationLock:
+            currentFormatDetails = self.getFormatDetails()
+            if self.getLiveText() != text or \
+                    not currentFormatDetails.isEquivTo(formatDetails):
+                return False
+
+            self.livePageAst = pageAst
+            self.livePageBasePlaceHold = self.liveTextPlaceHold
+            self.livePageBaseFormatDetails = currentFormatDetails
+            return True
+
+
 
     def getLivePageAst(self, fireEvent=True, dieOnChange=False,
             threadstop=DUMBTHREADSTOP, allowMetaDataUpdate=False):
@@ -921,6 +1028,8 @@ class AbstractWikiPage(DataCarryingPage):
                 text = self.getLiveText()
                 liveTextPlaceHold = self.liveTextPlaceHold
                 formatDetails = self.getFormatDetails()
+                lastPageAstInfo = self.lastPageAstInfo
+                textSaved = self.saveDirtySince is None
 
                 pageAst = self.getLivePageAstIfAvailable()
 
@@ -940,8 +1049,32 @@ class AbstractWikiPage(DataCarryingPage):
             if len(text) == 0:
                 pageAst = buildSyntaxNode([], 0)
             else:
-                pageAst = self.parseTextInContext(text, formatDetails=formatDetails,
-                        threadstop=threadstop)
+                astCache = self.getWikiDocument().getPageAstCache()
+                # Text being edited changes with each keystroke, storing
+                # its ASTs would only push useful entries out of the cache
+                if textSaved and astCache.isEnabled():
+                    cacheKey = astCache.buildKey(self.getWikiWord(), text,
+                            formatDetails)
+                else:
+                    cacheKey = None
+
+                pageAst = astCache.get(cacheKey)
+                if pageAst is None:
+                    wikiDocument = self.getWikiDocument()
+                    if lastPageAstInfo is not None and \
+                            formatDetails.isEquivTo(lastPageAstInfo[2]) and \
+                            lastPageAstInfo[3] is \
+                            wikiDocument.getCcWordBlacklist() and \
+                            lastPageAstInfo[4] is \
+                            wikiDocument.getNccWordBlacklist():
+                        prevPageAst, prevText = lastPageAstInfo[:2]
+                    else:
+                        prevPageAst = prevText = None
+
+                    pageAst = self.parseTextInContext(text,
+                            formatDetails=formatDetails, threadstop=threadstop,
+                            prevText=prevText, prevPageAst=prevPageAst)
+                    astCache.put(cacheKey, pageAst)
 
             with self.textOperationLock:
                 threadstop.testValidThread()
@@ -949,6 +1082,9 @@ class AbstractWikiPage(DataCarryingPage):
                 self.livePageAst = pageAst
                 self.livePageBasePlaceHold = liveTextPlaceHold
                 self.livePageBaseFormatDetails = formatDetails
+                self.lastPageAstInfo = (pageAst, text, formatDetails,
+                        self.getWikiDocument().getCcWordBlacklist(),
+                        self.getWikiDocument().getNccWordBlacklist())
 
 
         if self.isReadOnlyEffect():
@@ -1063,12 +1199,15 @@ class AbstractWikiPage(DataCarryingPage):
 
 ##     @profile
     def parseTextInContext(self, text, formatDetails=None,
-            threadstop=DUMBTHREADSTOP):
+            threadstop=DUMBTHREADSTOP, prevText=None, prevPageAst=None):
         """
         Return PageAst of text in the context of this page (wiki language and
         format details).
 
         text: unistring with text
+        prevText, prevPageAst: If given, prevPageAst is the AST of prevText
+            parsed with equivalent format details. Parsers supporting it
+            then only parse the changed part of the text again.
         """
         parser = wx.GetApp().createWikiParser(self.getWikiLanguageName()) # TODO debug mode  , True
 
@@ -1076,8 +1215,12 @@ class AbstractWikiPage(DataCarryingPage):
             formatDetails = self.getFormatDetails()
 
         try:
-            pageAst = parser.parse(self.getWikiLanguageName(), text,
-                    formatDetails, threadstop=threadstop)
+            if prevPageAst is not None and hasattr(parser, "parseIncremental"):
+                pageAst = parser.parseIncremental(self.getWikiLanguageName(),
+                        text, formatDetails, threadstop, prevText, prevPageAst)
+            else:
+                pageAst = parser.parse(self.getWikiLanguageName(), text,
+                        formatDetails, threadstop=threadstop)
         finally:
             wx.GetApp().freeWikiParser(parser)
 
@@ -1149,6 +1292,11 @@ class WikiPage(AbstractWikiPage):
         self.pageReadOnly = None
 
 
+    def _renewLiveTextPlaceHold(self):
+        super(WikiPage, self)._renewLiveTextPlaceHold()
+        self.getWikiDocument().dropSearchFragmentResults(self.wikiPageName)
+
+
     def getVersionOverview(self):
         """
         Return Versioning.VersionOverview object. If necessary create one.
@@ -1456,6 +1604,8 @@ class WikiPage(AbstractWikiPage):
     
             if self.isDefined():
                 self.getWikiData().deleteWord(self.getWikiWord())
+                self.getWikiDocument().getLinkGraph().deleteWikiPage(
+                        self.getWikiWord())
 
             vo = self.getExistingVersionOverview()
             if vo is not None:
@@ -1620,6 +1770,34 @@ class WikiPage(AbstractWikiPage):
         matchTerms = [(self.wikiPageName, WORD_TYPE, self.wikiPageName, -1, 0)]
         self.getWikiData().updateWikiWordMatchTerms(self.wikiPageName, matchTerms,
                 syncUpdate=True)
+        self.getWikiDocument().getLinkGraph().updateWikiPageLinkTerms(
+                self.wikiPageName, matchTerms, syncUpdate=True)
+
+
+    def _isPageAstCurrent(self, pageAst):
+        """
+        Called inside of textOperationLock. Returns True if database content
+        is identical to live text, live text is basis of current
+        livePageAst, format details are the ones used for livePageAst
+        and livePageAst is identical to pageAst.
+        """
+        return self.saveDirtySince is None and \
+                self.livePageBasePlaceHold is self.liveTextPlaceHold and \
+                self.livePageBaseFormatDetails is not None and \
+                self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails) and \
+                pageAst is self.livePageAst
+
+
+    def _isParseDataCurrent(self, parseData):
+        """
+        Called inside of textOperationLock. Returns True if database content
+        is identical to live text and parseData (a
+        ParallelRebuild.PageParseData) was created from this text with
+        the current format details.
+        """
+        return self.saveDirtySince is None and \
+                hash(self.getLiveText()) == parseData.textHash and \
+                self.getFormatDetails().isEquivTo(parseData.formatDetails)
 
 
     def refreshAttributesFromPageAst(self, pageAst, threadstop=DUMBTHREADSTOP):
@@ -1630,26 +1808,31 @@ class WikiPage(AbstractWikiPage):
         if self.wikiDocument.isReadOnlyEffect():
             return True  # TODO Error?
 
-        langHelper = wx.GetApp().createWikiLanguageHelper(
-                self.getWikiLanguageName())
+        attrs = self.extractAttributesFromPageAst(pageAst, threadstop=threadstop)
 
-        attrs = {}
+        return self._storeAttributes(attrs,
+                lambda: self._isPageAstCurrent(pageAst), threadstop=threadstop)
 
-        def addAttribute(key, value):
-            threadstop.testValidThread()
-            values = attrs.get(key)
-            if not values:
-                values = []
-                attrs[key] = values
-            values.append(value)
 
+    def refreshAttributesFromParseData(self, parseData,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Same as refreshAttributesFromPageAst() but uses data extracted
+        by a parser worker process during rebuild.
+        """
+        if self.wikiDocument.isReadOnlyEffect():
+            return True  # TODO Error?
+
+        return self._storeAttributes(parseData.attrs,
+                lambda: self._isParseDataCurrent(parseData),
+                threadstop=threadstop)
 
-        attrNodes = self.extractAttributeNodesFromPageAst(pageAst)
-        for node in attrNodes:
-            for attrKey, attrValue in \
-                    (getattr(node, "attrs", []) + getattr(node, "props", [])):  # TODO remove "property"-compatibility
-                addAttribute(attrKey, attrValue)
 
+    def _storeAttributes(self, attrs, isCurrent, threadstop=DUMBTHREADSTOP):
+        """
+        Write attributes to database and set meta-data state if
+        function  isCurrent()  returns True inside of textOperationLock.
+        """
         with self.textOperationLock:
             threadstop.testValidThread()
 
@@ -1663,12 +1846,7 @@ class WikiPage(AbstractWikiPage):
         valid = False
 
         with self.textOperationLock:
-            if self.saveDirtySince is None and \
-                    self.livePageBasePlaceHold is self.liveTextPlaceHold and \
-                    self.livePageBaseFormatDetails is not None and \
-                    self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails) and \
-                    pageAst is self.livePageAst:
-
+            if isCurrent():
                 threadstop.testValidThread()
                 # clear the dirty flag
 
@@ -1690,37 +1868,43 @@ class WikiPage(AbstractWikiPage):
         if self.wikiDocument.isReadOnlyEffect():
             return True   # return True or False?
 
-        todos = []
-        childRelations = []
-        childRelationSet = set()
+        todos = self.extractTodosFromPageAst(pageAst, threadstop=threadstop)
+        threadstop.testValidThread()
 
-        def addTodo(todoKey, todoValue):
-            threadstop.testValidThread()
-            todo = (todoKey, todoValue)
-            if todo not in todos:
-                todos.append(todo)
+        childRelations = self.extractChildRelationsFromPageAst(pageAst,
+                threadstop=threadstop)
+        threadstop.testValidThread()
 
-        def addChildRelationship(toWord, pos):
-            threadstop.testValidThread()
-            if toWord not in childRelationSet:
-                childRelations.append((toWord, pos))
-                childRelationSet.add(toWord)
+        headings = self.extractHeadingsFromPageAst(pageAst,
+                threadstop=threadstop)
 
-        # Add todo entries
-        todoNodes = pageAst.iterDeepByName("todoEntry")
-        for node in todoNodes:
-            for todoKey, todoValueNode in node.todos:
-                addTodo(todoKey, todoValueNode.getString())
+        return self._storeMainDbCache(todos, childRelations, headings,
+                lambda: self._isPageAstCurrent(pageAst), fireEvent=fireEvent,
+                threadstop=threadstop)
 
-        threadstop.testValidThread()
 
-        # Add child relations
-        wwTokens = pageAst.iterDeepByName("wikiWord")
-        for t in wwTokens:
-            addChildRelationship(t.wikiWord, t.pos)
+    def refreshMainDbCacheFromParseData(self, parseData, fireEvent=True,
+            threadstop=DUMBTHREADSTOP):
+        """
+        Same as refreshMainDbCacheFromPageAst() but uses data extracted
+        by a parser worker process during rebuild.
+        """
+        if self.wikiDocument.isReadOnlyEffect():
+            return True   # return True or False?
+
+        return self._storeMainDbCache(parseData.todos,
+                parseData.childRelations, parseData.headings,
+                lambda: self._isParseDataCurrent(parseData),
+                fireEvent=fireEvent, threadstop=threadstop)
 
-        threadstop.testValidThread()
-        
+
+    def _storeMainDbCache(self, todos, childRelations, headings, isCurrent,
+            fireEvent=True, threadstop=DUMBTHREADSTOP):
+        """
+        Write todos, relations and match terms to database and set meta-data
+        state if function  isCurrent()  returns True inside of
+        textOperationLock.
+        """
         # Add aliases to match terms
         matchTerms = []
 
@@ -1746,17 +1930,16 @@ class WikiPage(AbstractWikiPage):
 
         if depth > 0:
             HEADALIAS_TYPE = Consts.WIKIWORDMATCHTERMS_TYPE_FROM_CONTENT
-            for node in pageAst.iterFlatByName("heading"):
+            for level, title, endPos in headings:
                 threadstop.testValidThread()
-                if node.level > depth:
+                if level > depth:
                     continue
 
-                title = node.getString()
-                if title.endswith("\n"):
-                    title = title[:-1]
-                
                 matchTerms.append((title, HEADALIAS_TYPE, self.wikiPageName,
-                        node.pos + node.strLength, 0))
+                        endPos, 0))
+
+        linkTerms = frozenset(mt[0] for mt in matchTerms
+                if mt[1] & Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK)
 
         with self.textOperationLock:
             threadstop.testValidThread()
@@ -1765,16 +1948,26 @@ class WikiPage(AbstractWikiPage):
             self.childRelations = None
             self.childRelationSet = set()
         try:
-            self.getWikiData().updateTodos(self.wikiPageName, todos)
-            threadstop.testValidThread()
-            self.getWikiData().updateChildRelations(self.wikiPageName,
-                    childRelations)
-            threadstop.testValidThread()
-            self.getWikiData().updateWikiWordMatchTerms(self.wikiPageName,
-                    matchTerms)
-            threadstop.testValidThread()
+            # Write all rows of the page in one transaction
+            with self.getWikiDocument().wikiDataTransaction():
+                linkGraph = self.getWikiDocument().getLinkGraph()
+                self.getWikiData().updateTodos(self.wikiPageName, todos)
+                threadstop.testValidThread()
+                self.getWikiData().updateChildRelations(self.wikiPageName,
+                        childRelations)
+                linkGraph.updateChildRelations(self.wikiPageName,
+                        childRelations)
+                threadstop.testValidThread()
+                self.getWikiData().updateWikiWordMatchTerms(self.wikiPageName,
+                        matchTerms)
+                linkGraph.updateWikiPageLinkTerms(self.wikiPageName,
+                        matchTerms)
+                threadstop.testValidThread()
         except WikiWordNotFoundException:
             return False
+
+        linkTermsChanged = linkTerms != self.linkTerms
+        self.linkTerms = linkTerms
 #             self.modified = None   # ?
 #             self.created = None
 
@@ -1787,17 +1980,7 @@ class WikiPage(AbstractWikiPage):
 
         valid = False
         with self.textOperationLock:
-#             print "--refreshMainDbCacheFromPageAst43", repr((self.wikiPageName, self.saveDirtySince,
-#                     self.livePageBasePlaceHold is self.liveTextPlaceHold,
-#                     self.livePageBaseFormatDetails is not None,
-# #                     self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails),
-#                     pageAst is self.livePageAst))
-            if self.saveDirtySince is None and \
-                    self.livePageBasePlaceHold is self.liveTextPlaceHold and \
-                    self.livePageBaseFormatDetails is not None and \
-                    self.getFormatDetails().isEquivTo(self.livePageBaseFormatDetails) and \
-                    pageAst is self.livePageAst:
-
+            if isCurrent():
                 threadstop.testValidThread()
                 # clear the dirty flag
                 self.updateDirtySince = None
@@ -1807,15 +1990,23 @@ class WikiPage(AbstractWikiPage):
                 valid = True
 
         if fireEvent:
-            callInMainThreadAsync(self.fireMiscEventKeys,
-                    ("updated wiki page", "updated page"))
+            if linkTermsChanged:
+                callInMainThreadAsync(self.fireMiscEventKeys,
+                        ("updated wiki page", "updated page",
+                        "changed link terms"))
+            else:
+                callInMainThreadAsync(self.fireMiscEventKeys,
+                        ("updated wiki page", "updated page"))
 
         return valid
 
 
     def putIntoSearchIndex(self, threadstop=DUMBTHREADSTOP):
         """
-        Add or update the index for the given docPage
+        Add or update the index for the given docPage. The document is
+        handed to the search index batch writer of the wiki document and
+        committed later together with other pages.
+        Returns False if the page was already invalid or stale.
         """
         with self.textOperationLock:
             threadstop.testValidThread()
@@ -1826,40 +2017,57 @@ class WikiPage(AbstractWikiPage):
             liveTextPlaceHold = self.liveTextPlaceHold
             content = self.getLiveText()
 
-        writer = None
-        try:
-            searchIdx = self.getWikiDocument().getSearchIndex()
-            writer = searchIdx.writer(timeout=Consts.DEADBLOCKTIMEOUT)
+        assert isinstance(content, str)
 
-            unifName = self.getUnifiedPageName()
+        threadstop.testValidThread()
 
-            writer.delete_by_term("unifName", unifName)
-            
-            assert isinstance(content, str)
-                                    
-            writer.add_document(unifName=unifName,
-                    modTimestamp=self.getTimestamps()[0],
-                    content=content)
-        except:
-            if writer is not None:
-                writer.cancel()
-            raise
+        self.getWikiDocument().getSearchIndexBatchWriter().addDocument(self,
+                liveTextPlaceHold, content, self.getTimestamps()[0])
 
-        # Check within lock if data is current yet
+        return True
+
+
+    def writeIntoSearchIndexWriter(self, writer, liveTextPlaceHold, content,
+            modTimestamp):
+        """
+        Called by the search index batch writer when flushing. Writes content
+        into  writer  if  liveTextPlaceHold  is still current.
+        Returns True if the document was written, False if it is stale and
+        must be queued again.
+        """
         with self.textOperationLock:
-            if self.isInvalid(): 
-                writer.cancel()
-                return True  # Or false?
+            if self.isInvalid():
+                return True
 
             if not liveTextPlaceHold is self.liveTextPlaceHold:
-                writer.cancel()
                 return False
-            else:
-                writer.commit()
-                self.getWikiData().setMetaDataState(self.wikiPageName,
-                        Consts.WIKIWORDMETADATA_STATE_INDEXED)
+
+        unifName = self.getUnifiedPageName()
+
+        writer.delete_by_term("unifName", unifName)
+        writer.add_document(unifName=unifName, modTimestamp=modTimestamp,
+                content=content)
+
+        return True
+
+
+    def markSearchIndexCommitted(self, liveTextPlaceHold):
+        """
+        Called by the search index batch writer after the writer containing
+        the document based on  liveTextPlaceHold  was committed.
+        Returns False if the live text changed meanwhile.
+        """
+        with self.textOperationLock:
+            if self.isInvalid():
                 return True
 
+            if not liveTextPlaceHold is self.liveTextPlaceHold:
+                return False
+
+            self.getWikiData().setMetaDataState(self.wikiPageName,
+                    Consts.WIKIWORDMETADATA_STATE_INDEXED)
+            return True
+
 
     def putIntoSearchIndexExtWriter(self, writer, threadstop=DUMBTHREADSTOP):
         """
@@ -1897,21 +2105,8 @@ class WikiPage(AbstractWikiPage):
         if not self.getWikiDocument().isSearchIndexEnabled() or self.isInvalid():
             return
 
-        unifName = self.getUnifiedPageName()
-        
-        writer = None
-        
-        with self.textOperationLock:
-            try:
-                searchIdx = self.getWikiDocument().getSearchIndex()
-                writer = searchIdx.writer(timeout=Consts.DEADBLOCKTIMEOUT)
-                writer.delete_by_term("unifName", unifName)
-            except:
-                if writer is not None:
-                    writer.cancel()
-                raise
-    
-            writer.commit()
+        self.getWikiDocument().getSearchIndexBatchWriter().removeDocument(
+                self.getUnifiedPageName())
 
 
     def queueRemoveFromSearchIndex(self):
@@ -2018,18 +2213,22 @@ class WikiPage(AbstractWikiPage):
             return
         
         with self.textOperationLock:
-            if not self.getWikiDocument().isDefinedWikiPageName(
-                    self.wikiPageName):
+            newPage = not self.getWikiDocument().isDefinedWikiPageName(
+                    self.wikiPageName)
+            if newPage:
                 # Pages isn't yet in database  -> fire event
                 # The event may be needed to invalidate a cache
                 self.fireMiscEventKeys(("saving new wiki page",))
 
             self.getWikiData().setContent(self.wikiPageName, text)
+            if newPage:
+                self.getWikiDocument().getLinkGraph().addWikiPage(
+                        self.wikiPageName)
             self.refreshSyncUpdateMatchTerms()
             self.saveDirtySince = None
 #             self.dbContentPlaceHold = object()
             if self.getEditorText() is None:
-                self.liveTextPlaceHold = object()
+                self._renewLiveTextPlaceHold()
 
 
             # Clear timestamp cache
@@ -2080,7 +2279,8 @@ class WikiPage(AbstractWikiPage):
     # ----- Advanced functions -----
 
     def getChildRelationshipsTreeOrder(self, existingonly=False,
-            excludeSet=frozenset(), includeSet=frozenset()):
+            excludeSet=frozenset(), includeSet=frozenset(),
+            relationsWithFields=None):
         """
         Return a list of children wiki words of the page, ordered as they would
         appear in tree. Some children may be missing if they e.g.
@@ -2088,11 +2288,30 @@ class WikiPage(AbstractWikiPage):
         existingonly -- true iff non-existing words should be hidden
         excludeSet -- set of words which should be excluded from the list
         includeSet -- wikiWords to include in the result
+        relationsWithFields -- if not None, the already retrieved relations
+                of the page as list of tuples (relation, firstcharpos,
+                modified) in order of insertion. They are used instead of calling
+                getChildRelationships(), excludeSet and includeSet are
+                ignored then
         """
         from functools import cmp_to_key
         
         wikiDocument = self.wikiDocument
-        
+
+        def getRelations(withFields):
+            if relationsWithFields is None:
+                return self.getChildRelationships(existingonly,
+                        selfreference=False, withFields=withFields,
+                        excludeSet=excludeSet, includeSet=includeSet)
+
+            # Same order as returned by getChildRelationships()
+            if withFields == ("firstcharpos",):
+                return [(r[0], r[1]) for r in relationsWithFields]
+            elif withFields == ("modified",):
+                return sorted((r[0], r[2]) for r in relationsWithFields)
+            else:
+                return sorted(r[0] for r in relationsWithFields)
+
         # get the sort order for the children
         childSortOrder = self.getAttributeOrGlobal('child_sort_order',
                 "ascending")
@@ -2101,34 +2320,26 @@ class WikiPage(AbstractWikiPage):
         if childSortOrder == "natural":
             # TODO: Do it right 
             # Retrieve relations as list of tuples (child, firstcharpos)
-            relations = self.getChildRelationships(existingonly,
-                    selfreference=False, withFields=("firstcharpos",),
-                    excludeSet=excludeSet, includeSet=includeSet)
+            relations = getRelations(("firstcharpos",))
 
             relations.sort(key=cmp_to_key(_cmpNumbersItem1))
             # Remove firstcharpos
             relations = [r[0] for r in relations]
         elif childSortOrder == "mod_oldest":
             # Retrieve relations as list of tuples (child, modifTime)
-            relations = self.getChildRelationships(existingonly,
-                    selfreference=False, withFields=("modified",),
-                    excludeSet=excludeSet, includeSet=includeSet)
+            relations = getRelations(("modified",))
             relations.sort(key=cmp_to_key(_cmpNumbersItem1))
             # Remove firstcharpos
             relations = [r[0] for r in relations]
         elif childSortOrder == "mod_newest":
             # Retrieve relations as list of tuples (child, modifTime)
-            relations = self.getChildRelationships(existingonly,
-                    selfreference=False, withFields=("modified",),
-                    excludeSet=excludeSet, includeSet=includeSet)
+            relations = getRelations(("modified",))
             relations.sort(key=cmp_to_key(_cmpNumbersItem1Rev))
             # Remove firstcharpos
             relations = [r[0] for r in relations]            
         else:
             # Retrieve relations as list of children words
-            relations = self.getChildRelationships(existingonly, 
-                    selfreference=False, withFields=(),
-                    excludeSet=excludeSet, includeSet=includeSet)
+            relations = getRelations(())
             if childSortOrder.startswith("desc"):
                 coll = wikiDocument.getCollator()
 
@@ -2288,6 +2499,20 @@ class WikiPage(AbstractWikiPage):
         checkList = [(self.getWikiWord(), self.getNonAliasPage().getWikiWord(),
                 0)]
 
+        if includeSet is None:
+            # Retrieve the relations of the whole tree at once. The search
+            # for includeSet usually stops early so it fetches them per page
+            if maxdepth > -1 and resetdepth == -1:
+                level = maxdepth + 1
+            else:
+                level = -1
+
+            subTree = self.getWikiData().getSubTreeChildRelationships(
+                    [checkList[0][1]], level,
+                    withFields=("firstcharpos", "modified"))
+        else:
+            subTree = None
+
         mixins = collections.deque()
         resultSet = set()
         result = []
@@ -2334,10 +2559,21 @@ class WikiPage(AbstractWikiPage):
 
 
             page = self.getWikiDocument().getWikiPage(nonAliasWord)
-            children = page.getChildRelationshipsTreeOrder(existingonly=True)
+            if subTree is not None:
+                relations = subTree.get(nonAliasWord, ())
+                pageNames = dict((r[0], r[1]) for r in relations)
+                children = page.getChildRelationshipsTreeOrder(
+                        existingonly=True, relationsWithFields=[
+                        (r[0], r[2], r[3]) for r in relations])
+
+                children = [(c, pageNames[c], chLevel + 1)
+                        for c in children]
+            else:
+                children = page.getChildRelationshipsTreeOrder(
+                        existingonly=True)
 
-            children = [(c, getWikiPageNameForLinkTerm(c), chLevel + 1)
-                    for c in children]
+                children = [(c, getWikiPageNameForLinkTerm(c), chLevel + 1)
+                        for c in children]
             children.reverse()
             checkList += children
 
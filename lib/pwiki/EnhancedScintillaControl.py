@@ -3,7 +3,8 @@
 ## import hotshot
 ## _prof = hotshot.Profile("hotshot.prf")
 
-import traceback, codecs
+import traceback, codecs, itertools
+from array import array
 
 import wx, wx.stc
 
@@ -22,46 +23,86 @@ def bytelenSct(us):
     return len(StringOps.utf8Enc(us)[0])
 
 
+if hasattr(str, "isascii"):
+    _isAscii = str.isascii
+else:
+    # str.isascii() is available since Python 3.7
+    def _isAscii(text):
+        return len(StringOps.utf8Enc(text)[0]) == len(text)
 
-class StyleCollector(StringOps.SnippetCollector):
+
+
+class ByteOffsetTable:
+    """
+    Maps character positions of a unicode string to byte positions in
+    Scintilla (UTF-8). The table is built once for a text so positions
+    can be converted without encoding parts of the text again.
+    """
+    # Maps UTF-8 lead bytes (and ASCII) to 1, continuation bytes to 0
+    _LEAD_BYTE_TABLE = bytes(0 if 0x80 <= b < 0xc0 else 1 for b in range(256))
+
+    def __init__(self, text):
+        self.charLength = len(text)
+        if _isAscii(text):
+            # Byte positions are the same as character positions
+            self.offsets = None
+            self.byteLength = len(text)
+        else:
+            encoded = StringOps.utf8Enc(text)[0]
+            self.byteLength = len(encoded)
+            self.offsets = array("l", itertools.compress(range(len(encoded)),
+                    encoded.translate(self._LEAD_BYTE_TABLE)))
+            self.offsets.append(len(encoded))
+
+    def getBytePos(self, charPos):
+        """
+        Returns byte position of character position  charPos . Positions
+        behind the end of the text are mapped to the end.
+        """
+        charPos = min(charPos, self.charLength)
+        if self.offsets is None:
+            return charPos
+
+        return self.offsets[charPos]
+
+
+
+class StyleCollector:
     """
     Helps to collect the style bytes needed to set the syntax coloring in
     Scintilla editor component
     """
-    def __init__(self, defaultStyleNo, text, bytelenSct, startCharPos=0):   
-        super(StyleCollector, self).__init__(b"")
-        self.defaultStyleNo = defaultStyleNo
-        self.text = text
-        self.bytelenSct = bytelenSct
-        self.charPos = startCharPos
+    def __init__(self, defaultStyleNo, byteOffsets, startCharPos=0,
+            endCharPos=None):
+        """
+        byteOffsets -- ByteOffsetTable of the text to style
+        startCharPos, endCharPos -- Range of the text to collect styles for
+        """
+        if endCharPos is None:
+            endCharPos = byteOffsets.charLength
+
+        self.byteOffsets = byteOffsets
+        self.startBytePos = byteOffsets.getBytePos(startCharPos)
+        self.endBytePos = byteOffsets.getBytePos(endCharPos)
+        self.buffer = bytearray((defaultStyleNo,)) * \
+                (self.endBytePos - self.startBytePos)
 
 
     def bindStyle(self, targetCharPos, targetLength, styleNo):
         if targetCharPos < 0:
             return
-        
-        if targetCharPos < self.charPos:
-            # Due to some unknown reason we had overlapping styles and
-            # must remove some bytes
-            bytestylelen = self.bytelenSct(self.text[targetCharPos:self.charPos])
-            self.drop(bytestylelen)
-        else:
-            # There is possibly a gap between end of last style and current one
-            # -> fill it with default style
-            bytestylelen = self.bytelenSct(self.text[self.charPos:targetCharPos])
-            self.append(bytes((self.defaultStyleNo,)) * bytestylelen)
 
-        self.charPos = targetCharPos + targetLength
-            
-        bytestylelen = self.bytelenSct(self.text[targetCharPos:self.charPos])
-        self.append(bytes((styleNo,)) * bytestylelen)
+        start = max(self.byteOffsets.getBytePos(targetCharPos),
+                self.startBytePos)
+        end = min(self.byteOffsets.getBytePos(targetCharPos + targetLength),
+                self.endBytePos)
 
-    def value(self):
-        if self.charPos < len(self.text):
-            bytestylelen = self.bytelenSct(self.text[self.charPos:len(self.text)])
-            self.append(bytes((self.defaultStyleNo,)) * bytestylelen)
+        if start < end:
+            self.buffer[start - self.startBytePos:end - self.startBytePos] = \
+                    bytes((styleNo,)) * (end - start)
 
-        return super(StyleCollector, self).value()
+    def value(self):
+        return bytes(self.buffer)
 
 
 
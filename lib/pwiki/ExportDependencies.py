@@ -0,0 +1,174 @@
+"""
+Dependency tracking for continuous exports.
+
+While an exporter renders an output (e.g. the HTML file of a wiki word or
+the table of contents) it records in a DependencyRecorder what the output
+consumed. There are two kinds of dependencies:
+
+- Keys, e.g. ("page", wikiWord) if the output contains content, attributes
+  or a link of that page. When a page changes, the exporter asks the
+  ExportDependencyGraph for the outputs depending on the keys it knows to
+  be affected by the change.
+- Queries, e.g. the result of a search or the list of parents of a page.
+  A query key describes the query completely, the exporter provides a
+  function to evaluate a query key. The result seen while rendering is
+  stored with the key. On a change the queries are evaluated again and the
+  outputs depending on queries with a different result are affected as
+  well. The exporter can also provide a function which tells from the
+  kind of a query and the keys of the change if a query can be affected at
+  all, the other queries aren't evaluated again.
+
+Keys and query results only consist of builtin types, so they can be
+stored with a rendered output in a cache and compared later.
+"""
+
+
+# Key for outputs which must be rendered again on any change, e.g. because
+# they contain the result of an insertion plugin or an evaluated expression
+ANY_CHANGE = ("any change",)
+
+# Key for outputs depending on the set of exported words
+WORD_SET = ("word set",)
+
+# Key for outputs referring to temporary files created during export,
+# e.g. copied icons. Such outputs can't be reused by a later export.
+TEMP_FILES = ("temporary files",)
+
+# Key for changes of link terms (page names or aliases), after them a link
+# term may resolve to another page or to none at all
+LINK_TERMS = ("link terms",)
+
+
+
+class DependencyRecorder:
+    """
+    Collects the dependencies of one output while it is rendered.
+    """
+    def __init__(self):
+        self.keys = set()
+        # {query key: result}
+        self.queries = {}
+
+
+    def add(self, key):
+        self.keys.add(key)
+
+
+    def addQuery(self, key, result):
+        """
+        key -- hashable key describing the query
+        result -- result of the query used while rendering, must be
+            comparable by "=="
+        """
+        if key not in self.queries:
+            self.queries[key] = result
+
+
+    def isReusable(self):
+        """
+        Returns True if the output can be reused by a later export as long
+        as its dependencies are unchanged.
+        """
+        return ANY_CHANGE not in self.keys and TEMP_FILES not in self.keys
+
+
+
+class ExportDependencyGraph:
+    """
+    Maps dependencies to the outputs which consumed them.
+    Outputs are arbitrary hashable values chosen by the exporter.
+    """
+    def __init__(self, evaluateQuery, isQueryAffected=None):
+        """
+        evaluateQuery -- function taking a query key and returning the
+            current result of the query
+        isQueryAffected -- function taking a query key, its stored result
+            and the set of keys of a change. Returns False if the result
+            can't be changed by it, the query isn't evaluated then.
+            None to evaluate all queries on each change.
+        """
+        self.evaluateQuery = evaluateQuery
+        self.isQueryAffected = isQueryAffected
+        # {key or query key: set of outputs}
+        self.dependents = {}
+        # {output: set of keys and query keys}
+        self.dependencies = {}
+        # {query key: result}
+        self.queries = {}
+
+
+    def setDependencies(self, output, recorder):
+        """
+        Replace the dependencies of output by the ones collected by recorder.
+        """
+        self.removeOutput(output)
+
+        deps = recorder.keys | set(recorder.queries)
+        self.dependencies[output] = deps
+
+        for key in deps:
+            self.dependents.setdefault(key, set()).add(output)
+
+        for key, result in recorder.queries.items():
+            if key not in self.queries:
+                self.queries[key] = result
+
+
+    def removeOutput(self, output):
+        deps = self.dependencies.pop(output, None)
+        if deps is None:
+            return
+
+        for key in deps:
+            outputs = self.dependents[key]
+            outputs.discard(output)
+            if not outputs:
+                del self.dependents[key]
+                self.queries.pop(key, None)
+
+
+    def getOutputs(self):
+        return set(self.dependencies)
+
+
+    def evaluateQueries(self, changeKeys=None):
+        """
+        Evaluate queries again and return set of keys of the queries
+        with changed results.
+
+        changeKeys -- set of keys of the change. If given, only queries
+            which can be affected by them (see isQueryAffected) are
+            evaluated, otherwise all.
+        """
+        changed = set()
+        for key, oldResult in list(self.queries.items()):
+            try:
+                if changeKeys is not None and \
+                        self.isQueryAffected is not None and \
+                        not self.isQueryAffected(key, oldResult, changeKeys):
+                    continue
+
+                result = self.evaluateQuery(key)
+            except Exception:
+                # Render dependent outputs again, they will show the problem
+                changed.add(key)
+                continue
+
+            if result != oldResult:
+                self.queries[key] = result
+                changed.add(key)
+
+        return changed
+
+
+    def getAffectedOutputs(self, keys):
+        """
+        Return set of outputs depending on one of the keys or on a query
+        with a changed result.
+        """
+        keys = set(keys)
+        result = set()
+        for key in keys | self.evaluateQueries(keys):
+            result |= self.dependents.get(key, set())
+
+        return result
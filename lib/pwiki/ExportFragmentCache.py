@@ -0,0 +1,103 @@
+"""
+Persistent cache of HTML fragments stored in the "exportcache" directory
+of a wiki.
+
+The HTML exporter stores the rendered HTML of a page together with the
+dependencies recorded while rendering it (see ExportDependencies). The
+key of an entry is built from the page name, the page AST cache key of
+the page and a digest of the export options. Before a stored fragment is
+used, the exporter checks that the recorded dependencies are unchanged,
+so a fragment is reused only if rendering the page again would give the
+same result.
+
+Entries only consist of builtin types and are loaded by an unpickler
+which refuses to load any class.
+"""
+
+import io, hashlib, pickle, zlib, traceback
+
+from .FileCache import FileCache
+
+
+# Must be increased if the stored format changes
+_CACHE_FORMAT_NO = 1
+
+_FILE_SUFFIX = ".frag"
+
+
+
+class _BuiltinsUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError("Class %s.%s not allowed in export cache" %
+                (module, name))
+
+
+
+class ExportFragmentCache(FileCache):
+    def __init__(self, wikiDocument):
+        FileCache.__init__(self, wikiDocument, "exportcache", _FILE_SUFFIX)
+
+
+    def isEnabled(self):
+        return self.wikiDocument.getWikiConfig().getboolean("main",
+                "exportFragmentCache_enabled", True)
+
+
+    def _getMaxSize(self):
+        return self.wikiDocument.getWikiConfig().getint("main",
+                "exportFragmentCache_maxSize", 50) * 1024 * 1024
+
+
+    @staticmethod
+    def buildKey(wikiWord, pageAstKey, optionsDigest):
+        """
+        Return key for the fragment of  wikiWord  whose page has the AST
+        cache key  pageAstKey  (see PageAstCache.buildKey()) rendered with
+        export options described by  optionsDigest  or None if the fragment
+        can't be cached.
+        """
+        if pageAstKey is None:
+            return None
+
+        h = hashlib.sha1()
+        for part in (str(_CACHE_FORMAT_NO), wikiWord, pageAstKey,
+                optionsDigest):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+
+        return h.hexdigest()
+
+
+    def get(self, key):
+        """
+        Return tuple (fragment, fingerprints, queries) stored for key or
+        None if not found. fingerprints is a dictionary {dependency key:
+        fingerprint or None}, queries a dictionary {query key: result}.
+        """
+        data = self.getData(key)
+        if data is None:
+            return None
+
+        try:
+            return _BuiltinsUnpickler(io.BytesIO(zlib.decompress(data))).load()
+        except Exception:
+            traceback.print_exc()
+            self.remove(key)
+            return None
+
+
+    def put(self, key, fragment, fingerprints, queries):
+        """
+        Store entry under key. Errors are ignored.
+        """
+        if key is None or self.wikiDocument.isReadOnlyEffect():
+            return
+
+        try:
+            data = zlib.compress(pickle.dumps((fragment, fingerprints, queries),
+                    4), 1)
+        except Exception:
+            traceback.print_exc()
+            return
+
+        self.putData(key, data)
@@ -445,28 +445,59 @@ class MultiPageTextAddOptPanel(wx.Panel):
 class _SeparatorFoundException(Exception): pass
 
 class _SeparatorWatchUtf8Writer(utf8Writer):
+    """
+    Watches the written content for the separator line while writing it
+    through. Instead of buffering the content written since the last
+    separator only its last characters are kept to find a separator line
+    spanning multiple write() calls, so memory consumption doesn't depend
+    on the size of the written content.
+    """
     def __init__(self, stream, separator, errors="strict"):
         utf8Writer.__init__(self, stream, errors)
         self.separator = separator
 #         self.separatorRe = re.compile(u"^" + re.escape(separator) + u"$",
 #                 re.MULTILINE | re.UNICODE)
-        self.buffer = []
+        self.separatorLine = "\n%s\n" % separator
+        # End of content written since last clearBuffer() call, shorter
+        # than separatorLine
+        self.tail = ""
+        self.separatorFound = False
         self.firstSeparatorCallDone = False
 
+    def _watch(self, obj):
+        if self.separatorFound:
+            return
+
+        keep = len(self.separatorLine) - 1
+        if obj.find(self.separatorLine) > -1 or \
+                (self.tail + obj[:keep]).find(self.separatorLine) > -1:
+            self.separatorFound = True
+            return
+
+        self.tail = (self.tail + obj[-keep:])[-keep:]
+
     def write(self, obj):
-        self.buffer.append(obj)
+        self._watch(obj)
         utf8Writer.write(self, obj)
 
     def writelines(self, list):
-        self.buffer += list
-        utf8Writer.writelines(self, list)
+        for obj in list:
+            self.write(obj)
+
+    def writeBase64Block(self, data):
+        """
+        Write bytes  data  base64 encoded in lines (see base64BlockEncode())
+        chunk by chunk.
+        """
+        for part in iterBase64BlockEncode(data):
+            self.write(part)
 
     def clearBuffer(self):
-        self.buffer = []
+        self.tail = ""
+        self.separatorFound = False
     
     def checkAndClearBuffer(self):
-#         if self.separatorRe.search(u"".join(self.buffer)):
-        if "".join(self.buffer).find("\n%s\n" % self.separator) > -1:
+        if self.separatorFound:
             raise _SeparatorFoundException()
 
         self.clearBuffer()
@@ -508,7 +539,7 @@ class MultiPageTextWikiPageWriter:
 
             self.exportFile.write("important/encoding/base64  storeHint/%s\n" %
                     shText)
-            self.exportFile.write(base64BlockEncode(datablock))
+            self.exportFile.writeBase64Block(datablock)
         else:
             content = self.wikiDocument.retrieveDataBlockAsText(unifName)
 
@@ -721,7 +752,7 @@ class MultiPageTextExporter(AbstractExporter):
 
             self.exportFile.write("important/encoding/base64  storeHint/%s\n" %
                     shText)
-            self.exportFile.write(base64BlockEncode(datablock))
+            self.exportFile.writeBase64Block(datablock)
         else:
             content = self.wikiDocument.retrieveDataBlockAsText(unifName)
 
@@ -833,7 +864,7 @@ class MultiPageTextExporter(AbstractExporter):
                             self.exportFile.write(un + "\n")
                             datablock = wikiData.retrieveDataBlock(un)
     
-                            self.exportFile.write(base64BlockEncode(datablock))
+                            self.exportFile.writeBase64Block(datablock)
                         
                         # Page searches
                         unifNames = wikiData.getDataBlockUnifNamesStartingWith(
@@ -939,7 +970,7 @@ class MultiPageTextExporter(AbstractExporter):
 
             else:
                 # as binary
-                self.exportFile.write(base64BlockEncode(datablock))
+                self.exportFile.writeBase64Block(datablock)
 
 
         found = set()
@@ -0,0 +1,166 @@
+"""
+Base of the persistent caches stored in a directory of a wiki.
+
+Each entry is a file named after its key. Keys are built from everything
+the cached data depends on, so entries are never outdated and need no
+invalidation. The least recently used entries are deleted if the cache
+grows beyond the configured size.
+"""
+
+import os, os.path, collections, traceback
+
+import Consts
+from .Utilities import TimeoutRLock
+
+
+
+class FileCache:
+    def __init__(self, wikiDocument, dirName, fileSuffix):
+        """
+        dirName -- name of the cache directory inside the wiki directory
+        fileSuffix -- suffix of the cache files, e.g. ".ast"
+        """
+        self.wikiDocument = wikiDocument
+        self.dirName = dirName
+        self.fileSuffix = fileSuffix
+        self.cacheLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
+
+        # OrderedDict {file name: file size} from least to most recently used.
+        # Created on first access
+        self.entries = None
+        self.totalSize = 0
+
+
+    def isEnabled(self):
+        raise NotImplementedError   # abstract
+
+
+    def _getMaxSize(self):
+        """
+        Return maximum total size of the cache files in bytes.
+        """
+        raise NotImplementedError   # abstract
+
+
+    def getCacheDir(self):
+        return os.path.join(self.wikiDocument.getWikiPath(), self.dirName)
+
+
+    def _ensureEntries(self):
+        """
+        Create the list of entries from the cache directory if not done yet.
+        Must be called with cacheLock acquired.
+        """
+        if self.entries is not None:
+            return
+
+        found = []
+        try:
+            for dirEntry in os.scandir(self.getCacheDir()):
+                if not dirEntry.name.endswith(self.fileSuffix):
+                    continue
+                st = dirEntry.stat()
+                found.append((st.st_mtime, dirEntry.name, st.st_size))
+        except FileNotFoundError:
+            pass
+
+        found.sort()
+        self.entries = collections.OrderedDict(
+                (name, size) for mtime, name, size in found)
+        self.totalSize = sum(self.entries.values())
+
+
+    def contains(self, key):
+        """
+        Return True if an entry for key exists.
+        """
+        if key is None:
+            return False
+
+        with self.cacheLock:
+            self._ensureEntries()
+            return key + self.fileSuffix in self.entries
+
+
+    def getData(self, key):
+        """
+        Return bytes stored for key or None if not found.
+        """
+        if key is None:
+            return None
+
+        fileName = key + self.fileSuffix
+        path = os.path.join(self.getCacheDir(), fileName)
+
+        with self.cacheLock:
+            self._ensureEntries()
+            if fileName not in self.entries:
+                return None
+
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                self._removeEntry(fileName)
+                return None
+
+            self.entries.move_to_end(fileName)
+
+        return data
+
+
+    def putData(self, key, data):
+        """
+        Store bytes data under key. Errors are ignored.
+        """
+        if key is None or self.wikiDocument.isReadOnlyEffect():
+            return
+
+        maxSize = self._getMaxSize()
+        if len(data) > maxSize:
+            return
+
+        fileName = key + self.fileSuffix
+        cacheDir = self.getCacheDir()
+        path = os.path.join(cacheDir, fileName)
+
+        with self.cacheLock:
+            self._ensureEntries()
+            try:
+                if not os.path.exists(cacheDir):
+                    os.mkdir(cacheDir)
+
+                tempPath = path + ".tmp"
+                with open(tempPath, "wb") as f:
+                    f.write(data)
+                os.replace(tempPath, path)
+            except OSError:
+                traceback.print_exc()
+                return
+
+            self.totalSize += len(data) - self.entries.pop(fileName, 0)
+            self.entries[fileName] = len(data)
+
+            while self.totalSize > maxSize:
+                self._removeEntry(next(iter(self.entries)))
+
+
+    def remove(self, key):
+        """
+        Delete entry for key if present.
+        """
+        with self.cacheLock:
+            self._ensureEntries()
+            self._removeEntry(key + self.fileSuffix)
+
+
+    def _removeEntry(self, fileName):
+        """
+        Delete cache file. Must be called with cacheLock acquired.
+        """
+        self.totalSize -= self.entries.pop(fileName, 0)
+        try:
+            os.unlink(os.path.join(self.getCacheDir(), fileName))
+        except OSError:
+            pass
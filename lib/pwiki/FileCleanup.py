@@ -193,7 +193,7 @@ class InfoDatabase:
 
 
     def _scanLinks(self, progresshandler):
-        wikiWords = self.wikiDocument.getWikiData().getAllDefinedWikiPageNames()
+        wikiWords = self.wikiDocument.getLinkGraph().getAllDefinedWikiPageNames()
 
         progresshandler.open(len(wikiWords) + 1)
         try:
@@ -0,0 +1,582 @@
+"""
+Headless engine to rebuild, export and search a wiki without a running
+wx application and without PersonalWikiFrame, e.g. for batch jobs on
+servers without display. It is started by::
+
+    WikidPad.py --headless -w <wiki path> <options>
+
+HeadlessApp replaces MainApp.App: it reads the same global configuration
+and loads the same plugins (wiki languages, exporters, insertions) but
+creates no windows. HeadlessMainControl replaces PersonalWikiFrame for
+the exporters.
+"""
+
+import sys, os, os.path, getopt, traceback
+
+import wx
+
+from .WikiExceptions import *
+
+from .MiscEvent import MiscEventSourceMixin
+from .StringOps import mbcsDec, pathEnc
+from . import Configuration, Localization, DbProfiler
+from .MainApp import App, findDirs, findGlobalConfigSubDir, \
+        findGlobalConfigFile
+
+
+USAGE = \
+N_("""Usage: WikidPad.py --headless -w <wiki path> <options>
+
+Options:
+
+    -h, --help: Show this message
+    -w, --wiki  <wiki path>: path of the wiki configuration file (.wiki)
+    -p, --page  <page name>: page to export (can be given multiple times)
+    --update-db: update the database format if the wiki was created
+                 with an older version of WikidPad
+    --rebuild: rebuild the wiki database
+    --rebuild-dirty: only rebuild pages which weren't fully processed yet
+    --update-ext: update externally modified wiki files
+    --verify-file-index: compare the index of the file storage with the
+                         files, print problems found. Exit code is 1 if
+                         a file content doesn't match its indexed hash
+    --rebuild-file-index: recreate the index of the file storage
+    --export-what <what>: choose if you want to export page (or word),
+                          subtree or wiki
+    --export-type <type>: tag of the export type
+    --export-dest <destination path>: path of destination directory for export
+    --export-compfn: Use compatible filenames on export
+    --list-export-types: print the available export types
+    --search <text>: print names of all pages matching the search text
+    --search-regex: search text is a regular expression
+    --search-boolean: search text can contain boolean operators
+    --search-case: search case sensitive
+    --search-whole-word: search whole words only
+    --search-index: use the search index of the wiki (if enabled)
+    --profile-db: print statistics of database calls and SQL statements
+                  to stderr at the end
+
+Rebuild, file index operations, export and search are executed in this
+order.
+""")
+
+
+
+class HeadlessIconCache:
+    """
+    Replaces wxHelper.IconCache which needs a wx application to load the
+    bitmaps. Only the paths of the icons are known.
+    """
+    def __init__(self, iconDir):
+        self.iconDir = iconDir
+        # Same structure as in wxHelper.IconCache but without image list
+        # index and bitmap
+        self.iconLookupCache = {}
+
+        for fn in os.listdir(iconDir):
+            if fn.endswith(".gif"):
+                self.iconLookupCache[fn[:-4]] = (-1,
+                        os.path.join(iconDir, fn), None)
+
+    def lookupIconPath(self, iconname):
+        """
+        Returns the path to icon file of the requested icon.
+        If icon is unknown, None is returned.
+        """
+        try:
+            return self.iconLookupCache[iconname][1]
+        except KeyError:
+            return None
+
+
+
+class HeadlessApp(MiscEventSourceMixin):
+    """
+    Application context for WikiDocument, wiki language plugins and
+    exporters. All methods not needing the GUI are taken from MainApp.App.
+    The global configuration is never saved.
+    """
+    def __init__(self):
+        MiscEventSourceMixin.__init__(self)
+
+        self.sqliteInitFlag = False   # Read and modified only by WikiData classes
+
+        self.wikiAppDir, self.globalConfigDir = findDirs()
+
+        if not self.globalConfigDir or \
+                not os.path.exists(pathEnc(self.globalConfigDir)):
+            raise Exception(_("Error initializing environment, couldn't locate "
+                    "global config directory"))
+
+        self.globalConfigSubDir = findGlobalConfigSubDir(self.globalConfigDir)
+
+        self.defaultGlobalConfigDict = Configuration.GLOBALDEFAULTS.copy()
+        self.defaultWikiConfigDict = Configuration.WIKIDEFAULTS.copy()
+        self.wikiConfigFallthroughDict = Configuration.WIKIFALLTHROUGH.copy()
+        self.pageSearchHistory = []
+        self.wikiSearchHistory = []
+
+        self.globalConfig = self.createGlobalConfiguration()
+
+        globalConfigLoc = findGlobalConfigFile(self.globalConfigDir)
+        if os.path.exists(pathEnc(globalConfigLoc)):
+            try:
+                self.globalConfig.loadConfig(globalConfigLoc)
+            except Configuration.Error:
+                self.createDefaultGlobalConfig(globalConfigLoc)
+        else:
+            self.createDefaultGlobalConfig(globalConfigLoc)
+
+        self.globalConfig.setWriteAccessDenied(True)
+        # There is nobody to look at the export
+        self.globalConfig.set("main", "start_browser_after_export", "False")
+
+        Localization.loadLangList(self.wikiAppDir)
+        Localization.loadI18nDict(self.wikiAppDir, self.globalConfig.get(
+                "main", "gui_language", ""))
+
+        self.iconCache = HeadlessIconCache(os.path.join(self.wikiAppDir,
+                "icons"))
+
+        self.reloadPlugins()
+
+        self.collator = None
+        self._rereadCollator()
+
+
+    reloadPlugins = App.reloadPlugins
+    _rereadCollator = App._rereadCollator
+    createDefaultGlobalConfig = App.createDefaultGlobalConfig
+
+    getWikiLanguageDescription = App.getWikiLanguageDescription
+    listWikiLanguageDescriptions = App.listWikiLanguageDescriptions
+    getModifyMenuDispatcher = App.getModifyMenuDispatcher
+    getProvideMenuItemDispatcher = App.getProvideMenuItemDispatcher
+    createWikiParser = App.createWikiParser
+    freeWikiParser = App.freeWikiParser
+    getUserDefaultWikiLanguage = App.getUserDefaultWikiLanguage
+    createWikiLanguageHelper = App.createWikiLanguageHelper
+    freeWikiLanguageHelper = App.freeWikiLanguageHelper
+    pauseBackgroundThreads = App.pauseBackgroundThreads
+    resumeBackgroundThreads = App.resumeBackgroundThreads
+    describeExporters = App.describeExporters
+    describePrints = App.describePrints
+
+    getGlobalConfigSubDir = App.getGlobalConfigSubDir
+    getGlobalConfigDir = App.getGlobalConfigDir
+    getGlobalConfig = App.getGlobalConfig
+    getWikiAppDir = App.getWikiAppDir
+    isInPortableMode = App.isInPortableMode
+    getIconCache = App.getIconCache
+    getCollator = App.getCollator
+    getInsertionPluginManager = App.getInsertionPluginManager
+    getPageSearchHistory = App.getPageSearchHistory
+    setPageSearchHistory = App.setPageSearchHistory
+    getWikiSearchHistory = App.getWikiSearchHistory
+    setWikiSearchHistory = App.setWikiSearchHistory
+
+    createGlobalConfiguration = App.createGlobalConfiguration
+    createWikiConfiguration = App.createWikiConfiguration
+    createCombinedConfiguration = App.createCombinedConfiguration
+    getDefaultGlobalConfigDict = App.getDefaultGlobalConfigDict
+    getDefaultWikiConfigDict = App.getDefaultWikiConfigDict
+    getWikiConfigFallthroughDict = App.getWikiConfigFallthroughDict
+
+    def addGlobalPluginOptionsDlgPanel(self, factory, title):
+        """
+        Plugins register their options panels while loading. There is no
+        options dialog, so they are ignored.
+        """
+        pass
+
+    addOptionsDlgPanel = addGlobalPluginOptionsDlgPanel
+    addWikiWikiLangOptionsDlgPanel = addGlobalPluginOptionsDlgPanel
+    addWikiPluginOptionsDlgPanel = addGlobalPluginOptionsDlgPanel
+
+    def getMainFrameSet(self):
+        return frozenset()
+
+    def IsMainLoopRunning(self):
+        """
+        There is no main loop, so Utilities.callInMainThread() calls
+        functions directly in the calling thread.
+        """
+        return False
+
+
+
+class HeadlessMainControl:
+    """
+    Replaces PersonalWikiFrame for exporters. Provides only the
+    non-GUI methods exporters call.
+    """
+    def __init__(self, app, wikiDocument):
+        self.wikiDocument = wikiDocument
+        self.wikiAppDir = app.getWikiAppDir()
+        self.wikiName = wikiDocument.getWikiName()
+        self.configuration = Configuration.CombinedConfiguration(
+                app.getGlobalConfig(), wikiDocument.getWikiConfig())
+
+    def getConfig(self):
+        return self.configuration
+
+    def getWikiDocument(self):
+        return self.wikiDocument
+
+    def getWikiData(self):
+        return self.wikiDocument.getWikiData()
+
+    def getWikiConfig(self):
+        return self.wikiDocument.getWikiConfig()
+
+    def getWikiConfigPath(self):
+        return self.wikiDocument.getWikiConfigPath()
+
+    def getWikiDefaultWikiLanguage(self):
+        return self.wikiDocument.getWikiDefaultWikiLanguage()
+
+    def getCollator(self):
+        return self.wikiDocument.getCollator()
+
+    def isReadOnlyWiki(self):
+        return self.wikiDocument.isReadOnlyEffect()
+
+    def displayErrorMessage(self, errorStr, e=""):
+        sys.stderr.write("%s. %s\n" % (errorStr, e))
+
+    def displayMessage(self, title, str):
+        sys.stderr.write("%s: %s\n" % (title, str))
+
+
+
+class StreamProgressHandler:
+    """
+    Progress handler (see wxHelper.ProgressHandler) writing a line
+    per percent of progress into a stream.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.sum = 1
+        self.lastPercent = -1
+
+    def open(self, sum):
+        self.sum = max(sum, 1)
+        self.lastPercent = -1
+
+    def update(self, step, msg):
+        percent = step * 100 // self.sum
+        if percent != self.lastPercent:
+            self.lastPercent = percent
+            self.stream.write("%3i%% %s\n" % (percent, msg))
+            self.stream.flush()
+
+        return True
+
+    def close(self):
+        pass
+
+
+
+def _installApp(app):
+    """
+    Let wx.GetApp() return  app, also in modules which imported the
+    function already by "from wx import GetApp".
+    """
+    wxGetApp = wx.GetApp
+    getApp = lambda: app
+
+    wx.GetApp = getApp
+    for module in list(sys.modules.values()):
+        if getattr(module, "__dict__", {}).get("GetApp") is wxGetApp:
+            module.GetApp = getApp
+
+
+class HeadlessCmdLine:
+    """
+    Parses the command line options of the headless engine and
+    performs the actions
+    """
+    def __init__(self, sargs):
+        """
+        sargs -- stripped args (without "--headless")
+        """
+        self.wikiToOpen = None
+        self.wikiWordsToOpen = []
+        self.showHelp = False
+        self.cmdLineError = None  # Error message if command line is invalid
+        self.updateDb = False
+        self.rebuild = None  # None, "full", "dirty" or "ext"
+        self.fileIndex = None  # None, "verify" or "rebuild"
+        self.exportWhat = None
+        self.exportType = None
+        self.exportDest = None
+        self.exportCompFn = False
+        self.listExportTypes = False
+        self.searchStr = None
+        self.searchRegex = False
+        self.searchBoolean = False
+        self.searchCase = False
+        self.searchWholeWord = False
+        self.searchIndex = False
+        self.profileDb = False
+
+        try:
+            opts, rargs = getopt.getopt(sargs, "hw:p:",
+                    ["help", "wiki=", "page=", "update-db", "rebuild",
+                    "rebuild-dirty", "update-ext", "verify-file-index",
+                    "rebuild-file-index", "export-what=",
+                    "export-type=", "export-dest=", "export-compfn",
+                    "list-export-types", "search=", "search-regex",
+                    "search-boolean", "search-case", "search-whole-word",
+                    "search-index", "profile-db"])
+        except getopt.GetoptError as e:
+            self.cmdLineError = str(e)
+            return
+
+        if rargs:
+            self.cmdLineError = _("Unexpected argument '%s'") % rargs[0]
+            return
+
+        for o, a in opts:
+            if o in ("-h", "--help"):
+                self.showHelp = True
+            elif o in ("-w", "--wiki"):
+                self.wikiToOpen = mbcsDec(a, "replace")[0]
+            elif o in ("-p", "--page"):
+                self.wikiWordsToOpen.append(mbcsDec(a, "replace")[0])
+            elif o == "--update-db":
+                self.updateDb = True
+            elif o == "--rebuild":
+                self.rebuild = "full"
+            elif o == "--rebuild-dirty":
+                self.rebuild = "dirty"
+            elif o == "--update-ext":
+                self.rebuild = "ext"
+            elif o == "--verify-file-index":
+                self.fileIndex = "verify"
+            elif o == "--rebuild-file-index":
+                self.fileIndex = "rebuild"
+            elif o == "--export-what":
+                self.exportWhat = mbcsDec(a, "replace")[0]
+            elif o == "--export-type":
+                self.exportType = mbcsDec(a, "replace")[0]
+            elif o == "--export-dest":
+                self.exportDest = mbcsDec(a, "replace")[0]
+            elif o == "--export-compfn":
+                self.exportCompFn = True
+            elif o == "--list-export-types":
+                self.listExportTypes = True
+            elif o == "--search":
+                self.searchStr = mbcsDec(a, "replace")[0]
+            elif o == "--search-regex":
+                self.searchRegex = True
+            elif o == "--search-boolean":
+                self.searchBoolean = True
+            elif o == "--search-case":
+                self.searchCase = True
+            elif o == "--search-whole-word":
+                self.searchWholeWord = True
+            elif o == "--search-index":
+                self.searchIndex = True
+            elif o == "--profile-db":
+                self.profileDb = True
+
+        if self.showHelp:
+            return
+
+        if not self.wikiToOpen:
+            self.cmdLineError = _("No wiki given")
+        elif (self.exportWhat or self.exportType or self.exportDest) and \
+                not (self.exportWhat and self.exportType and self.exportDest):
+            self.cmdLineError = _("To export, all three export options "
+                    "('what', 'type' and 'dest') must be set.")
+        elif self.exportWhat not in (None, "page", "word", "subtree", "wiki"):
+            self.cmdLineError = _("Value for --export-what can be 'page', "
+                    "'word', 'subtree' or 'wiki'.")
+
+
+    def openWikiDocument(self, out):
+        """
+        Open and connect the wiki. Returns the WikiDocument or None if
+        it couldn't be opened.
+        """
+        from . import WikiDocument
+
+        wikiDocument = WikiDocument.openWikiDocument(
+                os.path.abspath(self.wikiToOpen))
+        try:
+            frmcode, frmtext = wikiDocument.checkDatabaseFormat()
+            if frmcode == 2:
+                out.write(_("Error connecting to database in '%s'") %
+                        self.wikiToOpen + "\n" + frmtext + "\n")
+                wikiDocument.release()
+                return None
+            elif frmcode == 1 and not self.updateDb:
+                out.write(_("The wiki needs an update to work with this "
+                        "version of WikidPad, use option --update-db.\n"))
+                wikiDocument.release()
+                return None
+
+            wikiDocument.connect()
+        except:
+            wikiDocument.release()
+            raise
+
+        return wikiDocument
+
+
+    def rebuildAction(self, wikiDocument, err):
+        if self.rebuild in ("full", "dirty"):
+            wikiDocument.rebuildWiki(StreamProgressHandler(err),
+                    self.rebuild == "dirty")
+        elif self.rebuild == "ext":
+            # Only marks the changed pages dirty, update them now so
+            # following export or search see them
+            wikiDocument.initiateExtWikiFileUpdate()
+            wikiDocument.rebuildWiki(StreamProgressHandler(err), True)
+
+
+    def fileIndexAction(self, wikiDocument, out, err):
+        """
+        Returns False if verification found a file not matching its
+        indexed hash
+        """
+        index = wikiDocument.getFileStorage().getIndex()
+        if self.fileIndex == "rebuild":
+            index.rebuild(StreamProgressHandler(err))
+        elif self.fileIndex == "verify":
+            problems = index.verify(StreamProgressHandler(err))
+            for name, problem in problems:
+                out.write("%s\t%s\n" % (problem, name))
+
+            return all(problem != "hash mismatch" for name, problem in problems)
+
+        return True
+
+
+    def listExportTypesAction(self, mainControl, out):
+        from . import PluginManager
+
+        exportTypes = sorted(PluginManager.getSupportedExportTypes(
+                mainControl, None).values(), key=lambda obtp: obtp[1])
+
+        for obtp in exportTypes:
+            out.write("%s\t%s\n" % (obtp[1], obtp[2]))
+
+
+    def exportAction(self, mainControl, err):
+        """
+        Returns True if export was done
+        """
+        from . import PluginManager
+
+        wikiDocument = mainControl.getWikiDocument()
+
+        if self.exportWhat in ("page", "word"):
+            wordList = list(self.wikiWordsToOpen)
+        elif self.exportWhat == "subtree":
+            wordList = wikiDocument.getLinkGraph().getAllSubWords(
+                    list(self.wikiWordsToOpen))
+        else:
+            wordList = wikiDocument.getAllDefinedWikiPageNames()
+
+        obtp = PluginManager.getSupportedExportTypes(mainControl,
+                None).get(self.exportType)
+
+        if obtp is None:
+            err.write(_("Unknown export type '%s', use option "
+                    "--list-export-types") % self.exportType + "\n")
+            return False
+
+        exporter = obtp[0]
+        exporter.export(wikiDocument, wordList, self.exportType,
+                self.exportDest, self.exportCompFn, exporter.getAddOpt(None),
+                StreamProgressHandler(err))
+
+        return True
+
+
+    def searchAction(self, wikiDocument, out):
+        from .SearchAndReplace import SearchReplaceOperation
+
+        sarOp = SearchReplaceOperation()
+        sarOp.searchStr = self.searchStr
+        sarOp.booleanOp = self.searchBoolean
+        sarOp.caseSensitive = self.searchCase
+        sarOp.wholeWord = self.searchWholeWord
+        sarOp.wikiWide = True
+        if self.searchRegex:
+            sarOp.wildCard = "regex"
+        else:
+            sarOp.wildCard = "no"
+        if self.searchIndex:
+            sarOp.indexSearch = "default"
+        sarOp.listWikiPagesOp.ordering = "ascending"
+
+        for wikiWord in wikiDocument.searchWiki(sarOp):
+            out.write(wikiWord + "\n")
+
+
+
+def main(sargs):
+    """
+    Run the headless engine with command line arguments  sargs  and
+    return exit code for sys.exit().
+    """
+    out = sys.stdout
+    err = sys.stderr
+
+    cmdLine = HeadlessCmdLine(sargs)
+    if cmdLine.showHelp or cmdLine.cmdLineError:
+        if cmdLine.cmdLineError:
+            err.write(cmdLine.cmdLineError + "\n\n")
+        err.write(_(USAGE))
+        return 2 if cmdLine.cmdLineError else 0
+
+    app = HeadlessApp()
+    _installApp(app)
+
+    if cmdLine.profileDb:
+        DbProfiler.enable()
+
+    try:
+        wikiDocument = cmdLine.openWikiDocument(err)
+    except (AppBaseException, IOError, OSError) as e:
+        traceback.print_exc()
+        err.write(_("Error opening wiki '%s': %s") % (cmdLine.wikiToOpen, e)
+                + "\n")
+        return 1
+
+    if wikiDocument is None:
+        return 1
+
+    try:
+        mainControl = HeadlessMainControl(app, wikiDocument)
+
+        cmdLine.rebuildAction(wikiDocument, err)
+
+        result = 0
+        if cmdLine.fileIndex is not None:
+            if not cmdLine.fileIndexAction(wikiDocument, out, err):
+                result = 1
+
+        if cmdLine.listExportTypes:
+            cmdLine.listExportTypesAction(mainControl, out)
+
+        if cmdLine.exportType is not None:
+            if not cmdLine.exportAction(mainControl, err):
+                return 1
+
+        if cmdLine.searchStr is not None:
+            cmdLine.searchAction(wikiDocument, out)
+
+        return result
+    except (AppBaseException, IOError, OSError) as e:
+        traceback.print_exc()
+        err.write(str(e) + "\n")
+        return 1
+    finally:
+        if cmdLine.profileDb:
+            err.write(DbProfiler.profiler.dump())
+        wikiDocument.release()
+        app.getInsertionPluginManager().taskEnd()
@@ -26,6 +26,10 @@ from .MptImporterGui import MultiPageTextImporterDialog
 from .timeView import Versioning
 
 
+# Number of imported entries whose database changes are committed together
+IMPORT_ENTRIES_PER_COMMIT = 100
+
+
 
 class MultiPageTextImporter:
     def __init__(self, mainControl):
@@ -108,34 +112,72 @@ class MultiPageTextImporter:
             return (showImportTableAlways,)
 
 
-    def _collectContent(self):
+    def _iterContent(self):
         """
-        Collect lines from current position of importFile up to separator
-        or file end collect all lines and return them as list of lines.
+        Iterate over lines from current position of importFile up to
+        separator or file end. The iterator must be exhausted to reach
+        the next entry.
         """
-        content = []                    
+        prevLine = None
         while True:
             # Read lines of wikiword
             line = self.importFile.readline()
             if line == "":
                 # The last page in mpt file without separator
                 # ends as the real wiki page
-#                 content = u"".join(content)
                 break
             
             if line == self.separator:
-                if len(content) > 0:
+                if prevLine is not None:
                     # Iff last line of mpt page is empty, the original
                     # page ended with a newline, so remove last
                     # character (=newline)
-
-                    content[-1] = content[-1][:-1]
-#                     content = u"".join(content)
+                    prevLine = prevLine[:-1]
                 break
 
-            content.append(line)
-            
-        return "".join(content)
+            if prevLine is not None:
+                yield prevLine
+            prevLine = line
+
+        if prevLine is not None:
+            yield prevLine
+
+
+    def _collectContent(self):
+        """
+        Collect lines from current position of importFile up to separator
+        or file end and return them joined as string.
+        """
+        return "".join(self._iterContent())
+
+
+    def _collectB64Content(self):
+        """
+        Collect base64 encoded content from current position of importFile
+        up to separator or file end. The content is decoded line by line
+        so the encoded text is never held in memory as a whole.
+        Returns decoded bytes or None if decoding failed.
+        """
+        result = BytesIO()
+        decoder = Base64BlockDecoder(result)
+        for line in self._iterContent():
+            if decoder is None:
+                continue
+            try:
+                decoder.feed(line)
+            except ValueError:
+                # base64 decoding failed, skip rest of content
+                decoder = None
+
+        if decoder is None:
+            return None
+
+        try:
+            decoder.close()
+        except ValueError:
+            return None
+
+        return result.getvalue()
 
 
     def _skipContent(self):
@@ -469,23 +511,26 @@ class MultiPageTextImporter:
         langHelper = wx.GetApp().createWikiLanguageHelper(
                 self.wikiDocument.getWikiDefaultWikiLanguage())
 
-        while True:
-            # Read next wikiword
-            line = self.importFile.readline()
-            if line == "":
-                break
+        with self.wikiDocument.wikiDataTransaction(
+                IMPORT_ENTRIES_PER_COMMIT) as transaction:
+            while True:
+                # Read next wikiword
+                line = self.importFile.readline()
+                if line == "":
+                    break
 
-            wikiWord = line[:-1]
-            errMsg = langHelper.checkForInvalidWikiWord(wikiWord,
-                    self.wikiDocument)
-            if errMsg:
-                raise ImportException(_("Bad wiki word: %s, %s") %
-                        (wikiWord, errMsg))
+                wikiWord = line[:-1]
+                errMsg = langHelper.checkForInvalidWikiWord(wikiWord,
+                        self.wikiDocument)
+                if errMsg:
+                    raise ImportException(_("Bad wiki word: %s, %s") %
+                            (wikiWord, errMsg))
 
-            content = self._collectContent()
-            page = self.wikiDocument.getWikiPageNoError(wikiWord)
+                content = self._collectContent()
+                page = self.wikiDocument.getWikiPageNoError(wikiWord)
 
-            page.replaceLiveText(content)
+                page.replaceLiveText(content)
+                transaction.checkpoint()
 
 
     def _doImportVer1Pass1(self):
@@ -555,15 +600,13 @@ class MultiPageTextImporter:
             else:
                 resultHintStrings.append(hint)
 
-        content = self._collectContent()
-
         if useB64:
-            try:
-                content = base64BlockDecode(content)
-            except TypeError:
+            content = self._collectB64Content()
+            if content is None:
                 # base64 decoding failed
-                self._skipContent()
                 return None, None
+        else:
+            content = self._collectContent()
         
         return (resultHintStrings, content)
 
@@ -655,44 +698,17 @@ class MultiPageTextImporter:
                 versionOverview.delete()
 
 
-        while True:
-            tag = self.importFile.readline()
-            if tag == "":
-                # End of file
-                break
-            tag = tag[:-1]  # Remove line end
-            
-            try:
-                dontImport, renameImportTo = \
-                        self.tempDb.execSqlQuery(
-                        "select dontImport, renameImportTo from "
-                        "entries where unifName = ?", (tag,))[0]
-            except IndexError:
-                # Maybe dangerous
-                traceback.print_exc()
-                self._skipContent()
-                continue
-
-            if dontImport:
-                self._skipContent()
-                continue
-            
-            if renameImportTo == "":
-                renameImportTo = tag
-
-            if tag.startswith("wikipage/"):
-                self._importItemWikiPageVer1Pass2(renameImportTo[9:])
-            elif tag.startswith("funcpage/"):
-                self._importItemFuncPageVer1Pass2(tag[9:])
-            elif tag.startswith("savedsearch/"):
-                self._importB64DatablockVer1Pass2(renameImportTo)
-            elif tag.startswith("savedpagesearch/"):
-                self._importHintedDatablockVer1Pass2(renameImportTo)
-            elif tag.startswith("versioning/"):
-                self._importHintedDatablockVer1Pass2(renameImportTo)
-            else:
-                # Unknown tag -> Ignore until separator
-                self._skipContent()
+        # Group the database changes of many entries into one commit
+        with wikiDoc.wikiDataTransaction(IMPORT_ENTRIES_PER_COMMIT) as \
+                transaction:
+            while True:
+                tag = self.importFile.readline()
+                if tag == "":
+                    # End of file
+                    break
+                tag = tag[:-1]  # Remove line end
+                self._importEntryVer1Pass2(tag)
+                transaction.checkpoint()
 
         
         for wikiWord in self.tempDb.execSqlQuerySingleColumn(
@@ -717,6 +733,43 @@ class MultiPageTextImporter:
 
 
 
+    def _importEntryVer1Pass2(self, tag):
+        """
+        Import entry with  tag  up to the next separator
+        """
+        try:
+            dontImport, renameImportTo = \
+                    self.tempDb.execSqlQuery(
+                    "select dontImport, renameImportTo from "
+                    "entries where unifName = ?", (tag,))[0]
+        except IndexError:
+            # Maybe dangerous
+            traceback.print_exc()
+            self._skipContent()
+            return
+
+        if dontImport:
+            self._skipContent()
+            return
+    
+        if renameImportTo == "":
+            renameImportTo = tag
+
+        if tag.startswith("wikipage/"):
+            self._importItemWikiPageVer1Pass2(renameImportTo[9:])
+        elif tag.startswith("funcpage/"):
+            self._importItemFuncPageVer1Pass2(tag[9:])
+        elif tag.startswith("savedsearch/"):
+            self._importB64DatablockVer1Pass2(renameImportTo)
+        elif tag.startswith("savedpagesearch/"):
+            self._importHintedDatablockVer1Pass2(renameImportTo)
+        elif tag.startswith("versioning/"):
+            self._importHintedDatablockVer1Pass2(renameImportTo)
+        else:
+            # Unknown tag -> Ignore until separator
+            self._skipContent()
+
+
     def _importItemWikiPageVer1Pass2(self, wikiWord):
         timeStampLine = self.importFile.readline()[:-1]
         timeStrings = timeStampLine.split("  ")
@@ -775,15 +828,16 @@ class MultiPageTextImporter:
 
     def _importB64DatablockVer1Pass2(self, unifName):
         # Content is base64 encoded
-        b64Content = self._collectContent()
-        
+        datablock = self._collectB64Content()
+        if datablock is None:
+            # base64 decoding failed
+            return  # TODO Report error
+
         try:
-            datablock = base64BlockDecode(b64Content)
             self.wikiDocument.getWikiData().storeDataBlock(unifName, datablock,
                     storeHint=Consts.DATABLOCK_STOREHINT_INTERN)
 
         except TypeError:
-            # base64 decoding failed
             return  # TODO Report error
 
 
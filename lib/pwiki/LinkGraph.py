@@ -0,0 +1,586 @@
+"""
+In-memory graph of the links between the pages of a wiki.
+
+It holds the same information as the "wikirelations" table and the link
+terms ("wikiwordmatchterms" with type ASLINK) of the database, so parent,
+child, parentless and undefined queries can be answered without SQL.
+
+Each link term (page name, alias or undefined word) gets an integer id.
+The children of a term (its relations) and the parents of a term (pages
+linking to it) are stored as arrays in compressed sparse row (CSR) format:
+The ids of the children of term id i are
+childIds[childStarts[i]:childStarts[i + 1]], the same for parents.
+
+The graph is loaded on first use and then patched by WikiDocument and
+DocPages whenever they change relations, link terms or pages. Patched
+adjacencies are held in dictionaries overriding the arrays until there are
+so many of them that the arrays are rebuilt.
+"""
+
+from array import array
+
+import Consts
+from .Utilities import TimeoutRLock
+
+
+# Rebuild the arrays if the number of patched adjacencies reaches
+# this minimum and a quarter of the number of terms
+_MIN_PATCHES_FOR_COMPACTION = 1024
+
+# Default value for missing adjacencies
+_EMPTY = ()
+
+
+
+class LinkGraph:
+    def __init__(self, wikiDocument):
+        self.wikiDocument = wikiDocument
+        # Protects the following fields. WikiData must not be called while
+        # holding it because the lock is acquired while holding the
+        # WikiData access lock when the graph is patched
+        self.graphLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
+        self._clear()
+
+
+    def _clear(self):
+        self.loaded = False
+
+        # Id of each link term
+        self.termIds = {}
+        # Link term of each id
+        self.terms = []
+        # 1 for each id which is the name of an existing page, 0 otherwise
+        self.pageFlags = bytearray()
+        # {term id: list of ids of the pages which have term as link term}
+        self.linkTermOwners = {}
+        # {(page id, syncUpdate): tuple of link term ids} as written by
+        # WikiData.updateWikiWordMatchTerms()
+        self.pageLinkTerms = {}
+
+        # Arrays, see module docstring
+        self.childStarts = array("l", [0])
+        self.childIds = array("l")
+        self.parentStarts = array("l", [0])
+        self.parentIds = array("l")
+
+        # {term id: tuple of child resp. parent ids} overriding the arrays
+        self.childPatches = {}
+        self.parentPatches = {}
+
+        # Set of terms which may have become or stopped being link terms
+        # since the last takeChangedLinkTerms() or None if not known
+        self.changedLinkTerms = None
+
+
+    def invalidate(self):
+        """
+        Drop all data, it is loaded again on next use. Called after bulk
+        changes of the database, e.g. by a rebuild.
+        """
+        with self.graphLock:
+            self._clear()
+
+
+    def _ensureLoaded(self):
+        if self.loaded:
+            return
+
+        wikiDocument = self.wikiDocument
+        # The WikiData access lock is held while reading so no patch can
+        # come between reading and setting the loaded flag
+        with wikiDocument.wikiDataTransaction():
+            with self.graphLock:
+                if self.loaded:
+                    return
+
+                wikiData = wikiDocument.getWikiData()
+                self._load(wikiData.getAllDefinedWikiPageNames(),
+                        wikiData.getAllWikiPageLinkTerms(),
+                        wikiData.getAllRelations())
+
+
+    def _load(self, pageNames, linkTerms, relations):
+        """
+        pageNames -- sequence of all page names
+        linkTerms -- sequence of tuples (linkTerm, pageName, syncUpdate)
+        relations -- sequence of tuples (pageName, relation), ordered
+        """
+        self._clear()
+        getId = self._getId
+
+        for pageName in sorted(pageNames):
+            self.pageFlags[getId(pageName)] = 1
+
+        pageLinkTerms = {}
+        for linkTerm, pageName, syncUpdate in linkTerms:
+            pageLinkTerms.setdefault((getId(pageName), syncUpdate), []) \
+                    .append(getId(linkTerm))
+
+        for key, termIds in pageLinkTerms.items():
+            self._setPageLinkTerms(key, termIds)
+
+        children = {}
+        for pageName, relation in relations:
+            children.setdefault(getId(pageName), []).append(getId(relation))
+
+        self._buildArrays(children.get, None)
+        self.loaded = True
+
+
+    def _buildArrays(self, getChildIds, getParentIds):
+        """
+        Build the arrays for all terms. getChildIds is a function returning
+        the child ids of a term id or None. If getParentIds is None, the
+        parents are derived from the children.
+        """
+        count = len(self.terms)
+        childStarts = array("l", [0])
+        childIds = array("l")
+        parents = [None] * count
+
+        for i in range(count):
+            ids = getChildIds(i)
+            if ids:
+                childIds.extend(ids)
+                if getParentIds is None:
+                    for c in ids:
+                        if parents[c] is None:
+                            parents[c] = [i]
+                        else:
+                            parents[c].append(i)
+
+            childStarts.append(len(childIds))
+
+        if getParentIds is not None:
+            parents = [getParentIds(i) for i in range(count)]
+
+        parentStarts = array("l", [0])
+        parentIds = array("l")
+        for ids in parents:
+            if ids:
+                parentIds.extend(ids)
+            parentStarts.append(len(parentIds))
+
+        self.childStarts = childStarts
+        self.childIds = childIds
+        self.parentStarts = parentStarts
+        self.parentIds = parentIds
+        self.childPatches = {}
+        self.parentPatches = {}
+
+
+    def _compactIfNeeded(self):
+        patchCount = len(self.childPatches) + len(self.parentPatches)
+        if patchCount >= _MIN_PATCHES_FOR_COMPACTION and \
+                patchCount * 4 >= len(self.terms):
+            self._buildArrays(self._getChildIds, self._getParentIds)
+
+
+    def _getId(self, term):
+        """
+        Return id of term, create a new one if necessary.
+        """
+        result = self.termIds.get(term)
+        if result is None:
+            result = len(self.terms)
+            self.termIds[term] = result
+            self.terms.append(term)
+            self.pageFlags.append(0)
+
+        return result
+
+
+    def _getChildIds(self, termId):
+        result = self.childPatches.get(termId)
+        if result is not None:
+            return result
+
+        if termId + 1 < len(self.childStarts):
+            return self.childIds[self.childStarts[termId]:
+                    self.childStarts[termId + 1]]
+
+        return _EMPTY
+
+
+    def _getParentIds(self, termId):
+        result = self.parentPatches.get(termId)
+        if result is not None:
+            return result
+
+        if termId + 1 < len(self.parentStarts):
+            return self.parentIds[self.parentStarts[termId]:
+                    self.parentStarts[termId + 1]]
+
+        return _EMPTY
+
+
+    def _setChildIds(self, pageId, childIds):
+        """
+        Replace the children of pageId and update the parents of the old
+        and new children.
+        """
+        oldChildIds = self._getChildIds(pageId)
+        self.childPatches[pageId] = childIds
+
+        oldSet = set(oldChildIds)
+        newSet = set(childIds)
+
+        for c in oldSet - newSet:
+            self.parentPatches[c] = tuple(p for p in self._getParentIds(c)
+                    if p != pageId)
+
+        for c in newSet - oldSet:
+            self.parentPatches[c] = tuple(self._getParentIds(c)) + (pageId,)
+
+
+    def _setPageLinkTerms(self, key, termIds):
+        """
+        Replace the link terms of a page.
+        key -- tuple (page id, syncUpdate)
+        termIds -- sequence of term ids
+        """
+        pageId = key[0]
+        oldTermIds = self.pageLinkTerms.pop(key, _EMPTY)
+        self._noteChangedTermIds(oldTermIds)
+        self._noteChangedTermIds(termIds)
+
+        for t in oldTermIds:
+            owners = self.linkTermOwners[t]
+            owners.remove(pageId)
+            if not owners:
+                del self.linkTermOwners[t]
+
+        if not termIds:
+            return
+
+        self.pageLinkTerms[key] = tuple(termIds)
+        for t in termIds:
+            self.linkTermOwners.setdefault(t, []).append(pageId)
+
+
+    def _noteChangedTermIds(self, termIds):
+        if self.changedLinkTerms is not None:
+            self.changedLinkTerms.update(self.terms[t] for t in termIds)
+
+
+    def _isLinkTerm(self, termId):
+        """
+        True if term is the name of an existing page or a link term
+        """
+        return self.pageFlags[termId] or termId in self.linkTermOwners
+
+
+    def _resolveId(self, termId):
+        """
+        Return the id of the page the term links to or -1.
+        """
+        if self.pageFlags[termId]:
+            return termId
+
+        owners = self.linkTermOwners.get(termId)
+        if owners:
+            return owners[0]
+
+        return -1
+
+
+    # ---------- Patching ----------
+
+    def updateChildRelations(self, word, childRelations):
+        """
+        Called after WikiData.updateChildRelations() with the same
+        parameters.
+        """
+        with self.graphLock:
+            if not self.loaded:
+                return
+
+            childIds = tuple(self._getId(r) for r in
+                    sorted(set(r[0] for r in childRelations)))
+            self._setChildIds(self._getId(word), childIds)
+            self._compactIfNeeded()
+
+
+    def updateWikiPageLinkTerms(self, word, matchTerms, syncUpdate=False):
+        """
+        Called after WikiData.updateWikiWordMatchTerms() with the same
+        parameters.
+        """
+        with self.graphLock:
+            if not self.loaded:
+                return
+
+            termIds = [self._getId(mt[0]) for mt in matchTerms
+                    if mt[1] & Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK]
+            self._setPageLinkTerms((self._getId(word), syncUpdate), termIds)
+
+
+    def addWikiPage(self, word):
+        """
+        Called after a new page was written to the database
+        """
+        with self.graphLock:
+            if not self.loaded:
+                return
+
+            pageId = self._getId(word)
+            self.pageFlags[pageId] = 1
+            self._noteChangedTermIds((pageId,))
+
+
+    def deleteWikiPage(self, word):
+        """
+        Called after WikiData.deleteWord()
+        """
+        with self.graphLock:
+            if not self.loaded:
+                return
+
+            pageId = self.termIds.get(word)
+            if pageId is None:
+                return
+
+            self._setChildIds(pageId, _EMPTY)
+            self._setPageLinkTerms((pageId, False), _EMPTY)
+            self._setPageLinkTerms((pageId, True), _EMPTY)
+            self.pageFlags[pageId] = 0
+            self._noteChangedTermIds((pageId,))
+            self._compactIfNeeded()
+
+
+    def renameWikiPage(self, word, toWord):
+        """
+        Called after WikiData.renameWord(). Relations and link terms of
+        word move to toWord, relations of other pages to word stay.
+        """
+        with self.graphLock:
+            if not self.loaded:
+                return
+
+            pageId = self.termIds.get(word)
+            if pageId is None or not self.pageFlags[pageId]:
+                # Graph was loaded after renaming
+                return
+
+            toPageId = self._getId(toWord)
+
+            childIds = self._getChildIds(pageId)
+            self._setChildIds(pageId, _EMPTY)
+            self._setChildIds(toPageId, tuple(childIds))
+
+            for syncUpdate in (False, True):
+                termIds = self.pageLinkTerms.get((pageId, syncUpdate), _EMPTY)
+                self._setPageLinkTerms((pageId, syncUpdate), _EMPTY)
+                self._setPageLinkTerms((toPageId, syncUpdate), termIds)
+
+            self.pageFlags[pageId] = 0
+            self.pageFlags[toPageId] = 1
+            self._noteChangedTermIds((pageId, toPageId))
+            self._compactIfNeeded()
+
+
+    def takeChangedLinkTerms(self):
+        """
+        Return set of the terms which may have become or stopped being
+        link terms (page names or aliases) since the last call or None
+        if not known, e.g. because the graph was invalidated in between.
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            result = self.changedLinkTerms
+            self.changedLinkTerms = set() if self.loaded else None
+            return result
+
+
+    # ---------- Queries ----------
+
+    def getWikiPageNameForLinkTerm(self, linkTerm):
+        """
+        Return real page name for link term which may be a real page name
+        or an alias. Returns None if term not found.
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            termId = self.termIds.get(linkTerm)
+            if termId is None:
+                return None
+
+            pageId = self._resolveId(termId)
+            if pageId == -1:
+                return None
+
+            return self.terms[pageId]
+
+
+    def isLinkTerm(self, term):
+        """
+        True if term is the name of an existing page or an alias
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            termId = self.termIds.get(term)
+            return termId is not None and bool(self._isLinkTerm(termId))
+
+
+    def getAllDefinedWikiPageNames(self):
+        self._ensureLoaded()
+        with self.graphLock:
+            terms = self.terms
+            return [terms[i] for i, f in enumerate(self.pageFlags) if f]
+
+
+    def getChildRelationships(self, wikiWord, existingonly=False,
+            selfreference=True):
+        """
+        Return the child relations of wikiWord ordered by name.
+        Same as WikiData.getChildRelationships() without fields.
+        existingonly -- List only existing wiki words
+        selfreference -- List also wikiWord if it references itself
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            pageId = self.termIds.get(wikiWord)
+            if pageId is None:
+                return []
+
+            terms = self.terms
+            return [terms[c] for c in self._getChildIds(pageId)
+                    if (selfreference or c != pageId) and
+                    (not existingonly or self._isLinkTerm(c))]
+
+
+    def getParentRelationships(self, wikiWord):
+        """
+        Return the pages linking to a link term which resolves to the real
+        page of wikiWord or, if wikiWord is undefined, to wikiWord itself.
+        Same as WikiData.getParentRelationships().
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            termId = self.termIds.get(wikiWord)
+            if termId is None:
+                return []
+
+            pageId = self._resolveId(termId)
+            if pageId == -1:
+                termIds = (termId,)
+            else:
+                termIds = set(t for syncUpdate in (False, True)
+                        for t in self.pageLinkTerms.get((pageId, syncUpdate),
+                        _EMPTY) if self._resolveId(t) == pageId)
+                termIds.add(pageId)
+
+            terms = self.terms
+            return [terms[p] for t in termIds for p in self._getParentIds(t)]
+
+
+    def getParentlessWikiWords(self):
+        """
+        Return the pages no other page links to.
+        Same as WikiData.getParentlessWikiWords().
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            withParents = set()
+            for t in range(len(self.terms)):
+                pageId = self._resolveId(t)
+                if pageId == -1 or pageId in withParents:
+                    continue
+                if any(p != pageId for p in self._getParentIds(t)):
+                    withParents.add(pageId)
+
+            terms = self.terms
+            return sorted(terms[i] for i, f in enumerate(self.pageFlags)
+                    if f and i not in withParents)
+
+
+    def getUndefinedWords(self):
+        """
+        Return the words which are linked to but are neither a page nor a
+        link term. Same as WikiData.getUndefinedWords().
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            terms = self.terms
+            return sorted(terms[t] for t in range(len(terms))
+                    if not self._isLinkTerm(t) and self._getParentIds(t))
+
+
+    def getAllSubWords(self, words, level=-1):
+        """
+        Return all words which are children, grandchildren, etc.
+        of words and the words itself. Same as WikiData.getAllSubWords().
+        """
+        self._ensureLoaded()
+        with self.graphLock:
+            termIds = self.termIds
+            checkList = []
+            for w in words:
+                termId = termIds.get(w)
+                if termId is not None:
+                    termId = self._resolveId(termId)
+                    if termId != -1:
+                        checkList.append((termId, 0))
+            checkList.reverse()
+
+            resultSet = set()
+            result = []
+
+            while len(checkList) > 0:
+                toCheck, chLevel = checkList.pop()
+                if toCheck in resultSet:
+                    continue
+
+                result.append(self.terms[toCheck])
+                resultSet.add(toCheck)
+
+                if level > -1 and chLevel >= level:
+                    continue  # Don't go deeper
+
+                children = [(self._resolveId(c), chLevel + 1)
+                        for c in self._getChildIds(toCheck)
+                        if c != toCheck and self._isLinkTerm(c)]
+                children.reverse()
+                checkList += children
+
+            return result
+
+
+    def findBestPathFromWordToWord(self, word, toWord):
+        """
+        Find the shortest path from word to toWord going through the
+        parents. Same as WikiData.findBestPathFromWordToWord().
+        """
+        if word == toWord:
+            return [word]
+
+        self._ensureLoaded()
+        with self.graphLock:
+            startId = self.termIds.get(word)
+            targetId = self.termIds.get(toWord)
+            if startId is None or targetId is None:
+                return []
+
+            # Breadth-first search, children maps each reached id to the
+            # id it was reached from
+            children = {startId: None}
+            layer = [startId]
+            while layer and targetId not in children:
+                nextLayer = []
+                for t in layer:
+                    for p in self._getParentIds(t):
+                        if p not in children:
+                            children[p] = t
+                            nextLayer.append(p)
+                layer = nextLayer
+
+            if targetId not in children:
+                return []
+
+            result = []
+            crumb = targetId
+            while crumb is not None:
+                result.append(self.terms[crumb])
+                crumb = children[crumb]
+
+            return result
@@ -0,0 +1,185 @@
+"""
+Immutable snapshot of the link terms (page names and aliases) of a wiki.
+
+A snapshot maps each link term to the name of the page it links to and
+holds the terms in sorted lists, so resolving a link is a dictionary lookup
+and finding the terms starting with a prefix (autocompletion) a binary
+search.
+
+A snapshot is never changed after creation, so any thread can use the
+snapshot last published by the WikiData without holding a lock. Changes
+create a new snapshot by patched(). It shares the (large) base of the old
+snapshot and only copies the overlay holding the changed terms. If the
+overlay becomes too large, the new snapshot gets a new base instead.
+
+Case-normalized lookups use str.lower() like the sqlite function
+"utf8Normcase" which fills the "matchtermnormcase" column.
+"""
+
+from bisect import bisect_left
+
+
+# Build a new base if the overlay would have more entries than this
+_MAX_OVERLAY_SIZE = 512
+
+
+
+class _LinkTermBase:
+    def __init__(self, linkTerms):
+        # {link term: page name}
+        self.linkTerms = linkTerms
+        self.sortedTerms = sorted(linkTerms)
+        # Tuples (lowercase term, term)
+        self.sortedNormTerms = sorted((term.lower(), term)
+                for term in self.sortedTerms)
+
+        # {lowercase term: tuple of terms}, page names first
+        normTerms = {}
+        for normTerm, term in self.sortedNormTerms:
+            normTerms.setdefault(normTerm, []).append(term)
+
+        self.normTerms = dict((normTerm, tuple(sorted(terms,
+                key=lambda term: linkTerms[term] != term)))
+                for normTerm, terms in normTerms.items())
+
+
+
+class LinkTermSnapshot:
+    def __init__(self, linkTerms, resolveCaseNormed=False):
+        """
+        linkTerms -- dictionary {link term: page name}, page names must
+            be included as link terms to themselves. It is owned by
+            the snapshot afterwards.
+        resolveCaseNormed -- if True, getWikiPageNameForLinkTerm() resolves
+            unknown terms to a term which only differs in case
+        """
+        self.base = _LinkTermBase(linkTerms)
+        self._setOverlay({})
+        self.resolveCaseNormed = resolveCaseNormed
+
+
+    def _setOverlay(self, overlay):
+        # {link term: page name or None if term was deleted}
+        self.overlay = overlay
+        # {lowercase term: tuple of terms} of the terms in overlay
+        normTerms = {}
+        for term, word in overlay.items():
+            if word is not None:
+                normTerms.setdefault(term.lower(), []).append(term)
+
+        self.overlayNormTerms = dict((normTerm, tuple(terms))
+                for normTerm, terms in normTerms.items())
+
+
+    def _derive(self, overlay, resolveCaseNormed):
+        result = LinkTermSnapshot.__new__(LinkTermSnapshot)
+        result.base = self.base
+        result._setOverlay(overlay)
+        result.resolveCaseNormed = resolveCaseNormed
+        return result
+
+
+    def patched(self, changes):
+        """
+        Return new snapshot with the changes applied.
+
+        changes -- dictionary {link term: page name or None to delete term}
+        """
+        overlay = dict(self.overlay)
+        overlay.update(changes)
+
+        if len(overlay) <= _MAX_OVERLAY_SIZE:
+            return self._derive(overlay, self.resolveCaseNormed)
+
+        linkTerms = dict(self.base.linkTerms)
+        for term, word in overlay.items():
+            if word is None:
+                linkTerms.pop(term, None)
+            else:
+                linkTerms[term] = word
+
+        return LinkTermSnapshot(linkTerms, self.resolveCaseNormed)
+
+
+    def withResolveCaseNormed(self, resolveCaseNormed):
+        """
+        Return snapshot with same link terms but different
+        resolveCaseNormed setting.
+        """
+        return self._derive(self.overlay, resolveCaseNormed)
+
+
+    def getPageNameForTerm(self, term):
+        """
+        Return page name for term without case-normalized resolution
+        or None.
+        """
+        try:
+            return self.overlay[term]
+        except KeyError:
+            return self.base.linkTerms.get(term)
+
+
+    # The following have the same signature as the WikiData methods
+    # they answer
+
+    def getWikiPageNameForLinkTerm(self, linkTerm):
+        word = self.getPageNameForTerm(linkTerm)
+        if word is not None or not self.resolveCaseNormed:
+            return word
+
+        normTerm = linkTerm.lower()
+        for term in self.base.normTerms.get(normTerm, ()) + \
+                self.overlayNormTerms.get(normTerm, ()):
+            word = self.getPageNameForTerm(term)
+            if word is not None:
+                return word
+
+        return None
+
+
+    def isDefinedWikiLinkTerm(self, word):
+        return bool(self.getWikiPageNameForLinkTerm(word))
+
+
+    def getWikiPageLinkTermsStartingWith(self, thisStr, caseNormed=None):
+        if caseNormed is None:
+            caseNormed = self.resolveCaseNormed
+
+        if caseNormed:
+            thisStr = thisStr.lower()
+            sortedTerms = self.base.sortedNormTerms
+            i = bisect_left(sortedTerms, (thisStr,))
+        else:
+            sortedTerms = self.base.sortedTerms
+            i = bisect_left(sortedTerms, thisStr)
+
+        result = []
+        overlay = self.overlay
+        while i < len(sortedTerms):
+            if caseNormed:
+                normTerm, term = sortedTerms[i]
+            else:
+                normTerm = term = sortedTerms[i]
+
+            if not normTerm.startswith(thisStr):
+                break
+            if term not in overlay:
+                result.append(term)
+            i += 1
+
+        for term, word in overlay.items():
+            if word is None:
+                continue
+            if (term.lower() if caseNormed else term).startswith(thisStr):
+                result.append(term)
+
+        result.sort()
+        return result
+
+
+    def getAllProducedWikiLinks(self):
+        overlay = self.overlay
+        return [term for term in self.base.sortedTerms
+                if term not in overlay] + \
+                [term for term, word in overlay.items() if word is not None]
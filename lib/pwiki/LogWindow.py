@@ -68,6 +68,21 @@ class LogMessage:
 
 
 
+class InfoLogMessage(LogMessage):
+    """
+    Message not related to a wiki page, e.g. a line of the database profile.
+    Messages with the same key replace each other in updateForWikiWord()
+    of the log window.
+    """
+    def __init__(self, mainControl, title, key):
+        LogMessage.__init__(self, mainControl, LogMessage.SEVERITY_HINT, title,
+                key, None, None)
+
+    def getTitle(self):
+        return self.title
+
+
+
 class LogWindow(wx.Panel):
     def __init__(self, parent, id, mainControl):
         wx.Panel.__init__(self)
@@ -96,6 +96,44 @@ def findDirs():
     return (wikiAppDir, globalConfigDir)
 
 
+def findGlobalConfigSubDir(globalConfigDir):
+    """
+    Returns path of the global config subdirectory "WikidPadGlobals"
+    in globalConfigDir. The directory is created if it doesn't exist.
+    """
+    for dirName in (CONFIG_GLOBALS_DIRNAME, "." + CONFIG_GLOBALS_DIRNAME):
+        globalConfigSubDir = os.path.join(globalConfigDir, dirName)
+        if os.path.exists(pathEnc(globalConfigSubDir)):
+            return globalConfigSubDir
+
+    if SystemInfo.isWindows():
+        globalConfigSubDir = os.path.join(globalConfigDir,
+                CONFIG_GLOBALS_DIRNAME)
+    else:
+        globalConfigSubDir = os.path.join(globalConfigDir,
+                "." + CONFIG_GLOBALS_DIRNAME)
+
+    os.mkdir(globalConfigSubDir)
+    return globalConfigSubDir
+
+
+def findGlobalConfigFile(globalConfigDir):
+    """
+    Returns path of the global configuration file "WikidPad.config"
+    in globalConfigDir. If it doesn't exist, the path where it should
+    be created is returned.
+    """
+    for fileName in (CONFIG_FILENAME, "." + CONFIG_FILENAME):
+        globalConfigLoc = os.path.join(globalConfigDir, fileName)
+        if os.path.exists(pathEnc(globalConfigLoc)):
+            return globalConfigLoc
+
+    if SystemInfo.isWindows():
+        return os.path.join(globalConfigDir, CONFIG_FILENAME)
+    else:
+        return os.path.join(globalConfigDir, "." + CONFIG_FILENAME)
+
+
 _defRedirect = (wx.Platform == '__WXMSW__' or wx.Platform == '__WXMAC__')
 
 
@@ -144,21 +182,7 @@ class App(wx.App, MiscEventSourceMixin):
         self.globalConfigDir = globalConfigDir
 
         # Find/create global config subdirectory "WikidPadGlobals"
-        if SystemInfo.isWindows():
-            defaultGlobalConfigSubDir = os.path.join(self.globalConfigDir,
-                    CONFIG_GLOBALS_DIRNAME)
-        else:
-            defaultGlobalConfigSubDir = os.path.join(self.globalConfigDir,
-                    "." + CONFIG_GLOBALS_DIRNAME)
-
-        self.globalConfigSubDir = os.path.join(self.globalConfigDir,
-                CONFIG_GLOBALS_DIRNAME)
-        if not os.path.exists(pathEnc(self.globalConfigSubDir)):
-            self.globalConfigSubDir = os.path.join(self.globalConfigDir,
-                    "." + CONFIG_GLOBALS_DIRNAME)
-            if not os.path.exists(pathEnc(self.globalConfigSubDir)):
-                self.globalConfigSubDir = defaultGlobalConfigSubDir
-                os.mkdir(self.globalConfigSubDir)
+        self.globalConfigSubDir = findGlobalConfigSubDir(self.globalConfigDir)
 
 #         pCssLoc = os.path.join(self.globalConfigSubDir, "wikipreview.css")
 #         if not os.path.exists(pathEnc(pCssLoc)):
@@ -177,29 +201,14 @@ class App(wx.App, MiscEventSourceMixin):
         self.globalConfig = self.createGlobalConfiguration()
 
         # Find/create global config file "WikidPad.config"
-        if SystemInfo.isWindows():
-            defaultGlobalConfigLoc = os.path.join(self.globalConfigDir,
-                    CONFIG_FILENAME)
-        else:
-            defaultGlobalConfigLoc = os.path.join(self.globalConfigDir,
-                    "." + CONFIG_FILENAME)
-
-        globalConfigLoc = os.path.join(self.globalConfigDir, CONFIG_FILENAME)
+        globalConfigLoc = findGlobalConfigFile(self.globalConfigDir)
         if os.path.exists(pathEnc(globalConfigLoc)):
             try:
                 self.globalConfig.loadConfig(globalConfigLoc)
             except Configuration.Error as MissingConfigurationFileException:
                 self.createDefaultGlobalConfig(globalConfigLoc)
         else:
-            globalConfigLoc = os.path.join(self.globalConfigDir,
-                    "." + CONFIG_FILENAME)
-            if os.path.exists(pathEnc(globalConfigLoc)):
-                try:
-                    self.globalConfig.loadConfig(globalConfigLoc)
-                except Configuration.Error as MissingConfigurationFileException:
-                    self.createDefaultGlobalConfig(globalConfigLoc)
-            else:
-                self.createDefaultGlobalConfig(defaultGlobalConfigLoc)
+            self.createDefaultGlobalConfig(globalConfigLoc)
 
         splash = None
         
@@ -632,9 +641,32 @@ class App(wx.App, MiscEventSourceMixin):
         """
         Realize settings from global config which are changeable during session
         """
-        from . import Localization
         from . import OsAbstract
+
+        self._rereadCollator()
+
+        if self.globalConfig.getboolean("main", "mouse_scrollUnderPointer"):
+            self.FilterEvent = self._FilterEvent_scrollUnder
+        else:
+            self.FilterEvent = self._FilterEvent_nothing
+
+        # Set CPU affinity
         
+        if OsAbstract.getCpuCount() > 1:
+            aff = self.globalConfig.getint("main", "cpu_affinity", -1)
+            
+            if aff == -1:
+                OsAbstract.setCpuAffinity(OsAbstract.INITIAL_CPU_AFFINITY)
+            else:
+                OsAbstract.setCpuAffinity((aff,))
+
+
+    def _rereadCollator(self):
+        """
+        Create collator according to global config
+        """
+        from . import Localization
+
         collationOrder = self.globalConfig.get("main", "collation_order")
         collationUppercaseFirst = self.globalConfig.getboolean("main",
                 "collation_uppercaseFirst")
@@ -655,21 +687,6 @@ class App(wx.App, MiscEventSourceMixin):
                 self.collator = Localization.getCollatorByString("C",
                         collationCaseMode)
 
-        if self.globalConfig.getboolean("main", "mouse_scrollUnderPointer"):
-            self.FilterEvent = self._FilterEvent_scrollUnder
-        else:
-            self.FilterEvent = self._FilterEvent_nothing
-
-        # Set CPU affinity
-        
-        if OsAbstract.getCpuCount() > 1:
-            aff = self.globalConfig.getint("main", "cpu_affinity", -1)
-            
-            if aff == -1:
-                OsAbstract.setCpuAffinity(OsAbstract.INITIAL_CPU_AFFINITY)
-            else:
-                OsAbstract.setCpuAffinity((aff,))
-
 
 
     def OnEndSession(self, evt):
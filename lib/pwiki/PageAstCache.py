@@ -0,0 +1,212 @@
+"""
+Persistent cache of page ASTs stored in the "astcache" directory of a wiki.
+
+An AST is stored under a key built from the page name, the text and the
+format details it was parsed with, so a stored AST is never outdated.
+"""
+
+import os.path, sys, io, hashlib, pickle, zlib, traceback
+
+import wx
+
+import Consts
+from .FileCache import FileCache
+from . import WikiPyparsing, StringOps
+
+
+# Must be increased if the stored format changes
+_CACHE_FORMAT_NO = 1
+
+_FILE_SUFFIX = ".ast"
+
+# Classes of StringOps which can be part of an AST (created by the
+# MediaWiki parser)
+_STRINGOPS_AST_CLASSES = ("HtmlStartTag", "HtmlEmptyTag", "HtmlEndTag")
+
+
+
+class _AstUnpickler(pickle.Unpickler):
+    """
+    Only allows to load syntax node classes defined in the parser module or
+    in WikiPyparsing and the few other classes found in ASTs, so a
+    manipulated cache file can't execute arbitrary code.
+    """
+    def __init__(self, file, nodeModules, otherClasses):
+        """
+        nodeModules -- names of the modules whose syntax node classes
+            are allowed
+        otherClasses -- set of tuples (module name, class name) of further
+            allowed classes
+        """
+        pickle.Unpickler.__init__(self, file)
+        self.nodeModules = nodeModules
+        self.otherClasses = otherClasses
+
+    def find_class(self, module, name):
+        # A dotted name would be resolved attribute by attribute, reaching
+        # everything imported by an allowed module
+        if "." not in name and (module in self.nodeModules or
+                (module, name) in self.otherClasses):
+            # Allowed modules are already imported by the application
+            mod = sys.modules.get(module)
+            cls = getattr(mod, name, None) if mod is not None else None
+
+            if isinstance(cls, type) and cls.__module__ == module and \
+                    ((module, name) in self.otherClasses or
+                    issubclass(cls, WikiPyparsing.SyntaxNode)):
+                return cls
+
+        raise pickle.UnpicklingError("Class %s.%s not allowed in AST cache" %
+                (module, name))
+
+
+
+class PageAstCache(FileCache):
+    def __init__(self, wikiDocument):
+        FileCache.__init__(self, wikiDocument, "astcache", _FILE_SUFFIX)
+
+        # Tuple (ccBlacklist, nccBlacklist, digest) to avoid recalculating
+        # the digest of the blacklists for each key
+        self.blacklistDigest = None
+
+        # Tuple (intLanguageName, parser description, node modules,
+        # other classes)
+        self.parserInfo = None
+
+
+    def isEnabled(self):
+        return self.wikiDocument.getWikiConfig().getboolean("main",
+                "pageAstCache_enabled", True)
+
+
+    def _getMaxSize(self):
+        return self.wikiDocument.getWikiConfig().getint("main",
+                "pageAstCache_maxSize", 50) * 1024 * 1024
+
+
+    def _getBlacklistDigest(self):
+        wikiDocument = self.wikiDocument
+        ccBlacklist = wikiDocument.getCcWordBlacklist()
+        nccBlacklist = wikiDocument.getNccWordBlacklist()
+
+        bd = self.blacklistDigest
+        if bd is not None and bd[0] is ccBlacklist and bd[1] is nccBlacklist:
+            return bd[2]
+
+        h = hashlib.sha1()
+        for bl in (ccBlacklist, nccBlacklist):
+            h.update("\n".join(sorted(bl or ())).encode("utf-8"))
+            h.update(b"\0")
+
+        digest = h.hexdigest()
+        self.blacklistDigest = (ccBlacklist, nccBlacklist, digest)
+
+        return digest
+
+
+    def _getParserInfo(self):
+        """
+        Returns tuple (parser description, node modules, other classes) for
+        the default wiki language of the wiki (see _AstUnpickler). The description contains the modification
+        time of the parser module so changes of the parser invalidate the
+        cache.
+        """
+        intLanguageName = self.wikiDocument.getWikiDefaultWikiLanguage()
+        pi = self.parserInfo
+        if pi is not None and pi[0] == intLanguageName:
+            return pi[1:]
+
+        parser = wx.GetApp().createWikiParser(intLanguageName)
+        try:
+            if parser is None:
+                return None
+
+            moduleName = type(parser).__module__
+        finally:
+            wx.GetApp().freeWikiParser(parser)
+
+        try:
+            modTime = os.path.getmtime(sys.modules[moduleName].__file__)
+        except (KeyError, AttributeError, TypeError, OSError):
+            modTime = 0
+
+        desc = "%s|%s|%s|%s" % (intLanguageName, moduleName, modTime,
+                Consts.VERSION_STRING)
+        nodeModules = frozenset((moduleName, WikiPyparsing.__name__))
+        otherClasses = frozenset([(moduleName, "_WikiLinkPath")] +
+                [(StringOps.__name__, className)
+                for className in _STRINGOPS_AST_CLASSES])
+
+        self.parserInfo = (intLanguageName, desc, nodeModules, otherClasses)
+
+        return self.parserInfo[1:]
+
+
+    def buildKey(self, wikiPageName, text, formatDetails):
+        """
+        Return key for the AST of  text  of page  wikiPageName  parsed with
+        formatDetails  or None if the AST can't be cached.
+        """
+        if formatDetails.autoLinkMode == "relax" and not formatDetails.noFormat:
+            # AST depends on the names of all pages
+            return None
+
+        langDetailsKey = formatDetails.wikiLanguageDetails.getCacheKey() \
+                if hasattr(formatDetails.wikiLanguageDetails, "getCacheKey") \
+                else None
+        if langDetailsKey is None:
+            return None
+
+        parserInfo = self._getParserInfo()
+        if parserInfo is None:
+            return None
+
+        if formatDetails.noFormat:
+            fdDesc = "noFormat"
+        else:
+            fdDesc = "%s|%s|%s|%s" % (formatDetails.withCamelCase,
+                    formatDetails.autoLinkMode, formatDetails.paragraphMode,
+                    langDetailsKey)
+
+        h = hashlib.sha1()
+        for part in (str(_CACHE_FORMAT_NO), parserInfo[0],
+                self._getBlacklistDigest(), fdDesc, wikiPageName, text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+
+        return h.hexdigest()
+
+
+    def get(self, key):
+        """
+        Return cached AST for key or None if not found.
+        """
+        data = self.getData(key)
+        if data is None:
+            return None
+
+        try:
+            parserInfo = self._getParserInfo()
+            return _AstUnpickler(io.BytesIO(zlib.decompress(data)),
+                    parserInfo[1], parserInfo[2]).load()
+        except Exception:
+            traceback.print_exc()
+            self.remove(key)
+            return None
+
+
+    def put(self, key, pageAst):
+        """
+        Store pageAst under key. Errors are ignored.
+        """
+        if key is None or self.wikiDocument.isReadOnlyEffect():
+            return
+
+        try:
+            data = zlib.compress(pickle.dumps(pageAst,
+                    pickle.HIGHEST_PROTOCOL), 1)
+        except Exception:
+            traceback.print_exc()
+            return
+
+        self.putData(key, data)
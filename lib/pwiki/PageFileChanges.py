@@ -0,0 +1,233 @@
+"""
+Detection of changes of wiki page files made outside of WikidPad (by an
+external editor, a file synchronization tool, ...) for WikiData
+implementations storing each page in its own file.
+
+findChangedFileSignatures() compares the file signatures stored in the
+database (see StringOps.getFileSignatureBlock()) with the files in the data
+directory. The directory is listed once and the files are stat'ed by a few
+threads as a stat on a network share mainly waits for the server.
+
+A PageFileWatcher reports changed page files as soon as they change if the
+optional "watchdog" package is installed.
+"""
+
+import os, os.path, stat, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .StringOps import longPathEnc, pathDec
+
+try:
+    from watchdog.observers import Observer as _WatchdogObserver
+except ImportError:
+    _WatchdogObserver = None
+
+
+# Number of threads to stat files
+STAT_THREAD_COUNT = 8
+
+# Files are only stat'ed by multiple threads if there are at least this many
+_MIN_FILES_PER_THREAD = 64
+
+# Seconds to collect file change events before they are reported
+WATCH_DELAY = 2.0
+
+# Only events of these types can mean that the content or existence of a
+# file changed
+_WATCHED_EVENT_TYPES = frozenset(("created", "deleted", "modified", "moved",
+        "closed"))
+
+
+
+def _statFile(dataDir, dirEntries, filePath):
+    """
+    Return the stat result for the file  filePath  (relative to  dataDir)
+    or None if it doesn't exist or isn't a regular file.
+    """
+    dirEntry = dirEntries.get(filePath)
+    try:
+        if dirEntry is not None:
+            # On Windows the listing of the directory already contained
+            # the stat information so no further access is needed
+            statinfo = dirEntry.stat()
+        else:
+            # File in a subdirectory or with different case of its name
+            statinfo = os.stat(longPathEnc(os.path.join(dataDir, filePath)))
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+    if not stat.S_ISREG(statinfo.st_mode):
+        return None
+
+    return statinfo
+
+
+def _statFiles(dataDir, dirEntries, filePaths):
+    return [_statFile(dataDir, dirEntries, filePath) for filePath in filePaths]
+
+
+def findChangedFileSignatures(dataDir, entries, signatureFunc,
+        threadCount=STAT_THREAD_COUNT):
+    """
+    Compare the stored file signatures of wiki pages with the signatures of
+    the files in  dataDir.
+
+    entries -- Sequence of tuples (word, filepath, file signature) as
+        returned by WikiData.getFileSignaturesForAllWikiPageNames().
+        filepath is relative to dataDir
+    signatureFunc -- Function taking the stat result of a file and returning
+        its file signature block
+    threadCount -- Maximum number of threads to stat files
+
+    Returns tuple (changed, missing) where changed is a list of tuples
+    (word, stored signature, current signature) for the pages with changed
+    files and missing is a list of words for which no file exists.
+    """
+    dirEntries = {}
+    try:
+        for dirEntry in os.scandir(longPathEnc(dataDir)):
+            dirEntries[pathDec(dirEntry.name)] = dirEntry
+    except FileNotFoundError:
+        pass
+
+    filePaths = [entry[1] for entry in entries]
+
+    threadCount = min(threadCount, len(filePaths) // _MIN_FILES_PER_THREAD)
+    if threadCount > 1:
+        chunkSize = (len(filePaths) + threadCount - 1) // threadCount
+        with ThreadPoolExecutor(threadCount) as pool:
+            futures = [pool.submit(_statFiles, dataDir, dirEntries,
+                    filePaths[i:i + chunkSize])
+                    for i in range(0, len(filePaths), chunkSize)]
+            statinfos = []
+            for future in futures:
+                statinfos += future.result()
+    else:
+        statinfos = _statFiles(dataDir, dirEntries, filePaths)
+
+    changed = []
+    missing = []
+    for (word, filePath, storedSig), statinfo in zip(entries, statinfos):
+        if statinfo is None:
+            missing.append(word)
+            continue
+
+        fileSig = signatureFunc(statinfo)
+        if fileSig != storedSig:
+            changed.append((word, storedSig, fileSig))
+
+    return changed, missing
+
+
+
+def isWatchingSupported():
+    """
+    Returns True if the "watchdog" package needed by PageFileWatcher is
+    available.
+    """
+    return _WatchdogObserver is not None
+
+
+
+class PageFileWatcher:
+    """
+    Watches the data directory for changes of files with the page file
+    suffix. After the first change, further changes are collected for
+    WATCH_DELAY seconds, then  callback  is called in another thread with
+    the set of the names of the changed files (relative to the data
+    directory).
+
+    Changes made by WikidPad itself are reported as well, the callback must
+    check the file signatures to see if there is something to do.
+    """
+    def __init__(self, dataDir, pagefileSuffix, callback):
+        self.dataDir = os.path.abspath(dataDir)
+        self.pagefileSuffix = os.path.normcase(pagefileSuffix)
+        self.callback = callback
+
+        self.lock = threading.Lock()
+        self.changedNames = set()
+        self.timer = None
+        self.observer = None
+
+
+    def start(self):
+        """
+        Start watching. Returns False if watching isn't supported.
+        """
+        if _WatchdogObserver is None:
+            return False
+
+        self.observer = _WatchdogObserver()
+        self.observer.daemon = True
+        self.observer.schedule(self, self.dataDir, recursive=False)
+        self.observer.start()
+        return True
+
+
+    def stop(self):
+        """
+        Stop watching. Changes not yet reported are discarded.
+        """
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(10)
+            self.observer = None
+
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.changedNames = set()
+
+
+    def _addPath(self, path):
+        if not path:
+            return
+
+        if isinstance(path, bytes):
+            path = pathDec(path)
+
+        if os.path.dirname(os.path.abspath(path)) != self.dataDir:
+            return
+
+        name = os.path.basename(path)
+        if not os.path.normcase(name).endswith(self.pagefileSuffix):
+            return
+
+        self.changedNames.add(name)
+
+
+    def dispatch(self, event):
+        """
+        Called by the watchdog observer thread for each event.
+        """
+        if event.is_directory or event.event_type not in _WATCHED_EVENT_TYPES:
+            return
+
+        with self.lock:
+            if self.observer is None:
+                return
+
+            self._addPath(event.src_path)
+            self._addPath(getattr(event, "dest_path", None))
+
+            if self.changedNames and self.timer is None:
+                self.timer = threading.Timer(WATCH_DELAY, self._report)
+                self.timer.daemon = True
+                self.timer.start()
+
+
+    def _report(self):
+        with self.lock:
+            changedNames = self.changedNames
+            self.changedNames = set()
+            self.timer = None
+
+        if not changedNames:
+            return
+
+        try:
+            self.callback(changedNames)
+        except Exception:
+            traceback.print_exc()
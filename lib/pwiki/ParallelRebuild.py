@@ -0,0 +1,523 @@
+"""
+Parsing of wiki pages in worker processes for WikiDocument.rebuildWiki()
+and the HTML export.
+
+The parser of a wiki language only needs the page text and the format
+details to build the page AST. For a rebuild, worker processes parse the
+pages, extract attributes, todos, relations and headings from the AST and
+send only these back to the main process which writes them to the database.
+For an export, the workers send back the ASTs which the main process
+installs in the pages before rendering them.
+"""
+
+import sys, builtins, types, collections, importlib.util, traceback
+import multiprocessing
+
+import wx
+
+from .Utilities import DUMBTHREADSTOP
+from .ParseUtilities import WikiPageFormatDetails
+from .Configuration import FrozenConfiguration
+
+
+# Minimum number of pages to parse before worker processes are used
+MIN_PAGE_COUNT = 50
+
+# Number of pages per worker process which are handed to the pool in advance
+_PREFETCH_PER_PROCESS = 4
+
+# Seconds to wait for the worker processes to start
+_STARTUP_TIMEOUT = 60
+
+# Seconds to wait for the result of a single page
+_PAGE_TIMEOUT = 600
+
+
+
+class PageParseData:
+    """
+    Data extracted from the page AST by a worker process, see
+    DocPages.WikiPage.refreshAttributesFromParseData() and
+    refreshMainDbCacheFromParseData()
+    """
+    __slots__ = ("wikiPageName", "attrs", "todos", "childRelations",
+            "headings", "textHash", "formatDetails")
+
+    def __init__(self, wikiPageName, extracted, textHash, formatDetails):
+        self.wikiPageName = wikiPageName
+        self.attrs, self.todos, self.childRelations, self.headings = extracted
+        # hash() of the parsed text
+        self.textHash = textHash
+        # Format details the text was parsed with
+        self.formatDetails = formatDetails
+
+
+
+# ---------- Worker process side ----------
+
+class _WikiDocumentStandIn:
+    """
+    Replaces the WikiDocument inside of a worker process. It provides
+    the methods parsers call while parsing.
+    """
+    def __init__(self, wikiConfig, wikiLanguageName, ccWordBlacklist,
+            nccWordBlacklist, autoLinkRelaxInfo):
+        self.wikiConfig = wikiConfig
+        self.wikiLanguageName = wikiLanguageName
+        self.ccWordBlacklist = ccWordBlacklist
+        self.nccWordBlacklist = nccWordBlacklist
+        self.autoLinkRelaxInfo = autoLinkRelaxInfo
+
+    def getWikiConfig(self):
+        return self.wikiConfig
+
+    def getWikiDefaultWikiLanguage(self):
+        return self.wikiLanguageName
+
+    def getCcWordBlacklist(self):
+        return self.ccWordBlacklist
+
+    def getNccWordBlacklist(self):
+        return self.nccWordBlacklist
+
+    def getAutoLinkRelaxInfo(self):
+        return self.autoLinkRelaxInfo
+
+
+class _WikiPageStandIn:
+    """
+    Replaces the base page of the format details inside of a worker process.
+    """
+    def __init__(self, wikiDocument, wikiPageName):
+        self.wikiDocument = wikiDocument
+        self.wikiPageName = wikiPageName
+
+    def getWikiDocument(self):
+        return self.wikiDocument
+
+    def getWikiWord(self):
+        return self.wikiPageName
+
+    def getWikiPageName(self):
+        return self.wikiPageName
+
+    def getWikiLanguageName(self):
+        return self.wikiDocument.getWikiDefaultWikiLanguage()
+
+
+
+_workerParser = None
+_workerLangHelper = None
+_workerWikiDocument = None
+
+
+def _initWorker(parserModuleName, parserModulePath, wikiDocument):
+    """
+    Initializer of the worker processes. Loads the parser module
+    directly from its file as plugin packages don't exist in a new process.
+    The module gets the name it has in the main process so returned ASTs
+    can be unpickled there.
+    """
+    global _workerParser, _workerLangHelper, _workerWikiDocument
+
+    if not hasattr(builtins, "_"):
+        builtins._ = builtins.N_ = lambda s: s
+
+    # Pickle imports the parent packages of a module to find its classes
+    nameParts = parserModuleName.split(".")
+    for i in range(1, len(nameParts)):
+        packageName = ".".join(nameParts[:i])
+        if packageName not in sys.modules:
+            sys.modules[packageName] = types.ModuleType(packageName)
+
+    spec = importlib.util.spec_from_file_location(parserModuleName,
+            parserModulePath)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    intLanguageName = wikiDocument.getWikiDefaultWikiLanguage()
+
+    _workerParser = module.parserFactory(intLanguageName, False)
+    _workerLangHelper = module.languageHelperFactory(intLanguageName, False)
+    _workerWikiDocument = wikiDocument
+
+
+def _probeWorker():
+    """
+    Returns True as soon as a worker process was initialized successfully.
+    """
+    return True
+
+
+def _parseInWorker(wikiPageName, text, formatSettings):
+    """
+    Parse  text  of page  wikiPageName  and return the page AST.
+    """
+    withCamelCase, autoLinkMode, noFormat, paragraphMode = formatSettings
+    basePage = _WikiPageStandIn(_workerWikiDocument, wikiPageName)
+
+    formatDetails = WikiPageFormatDetails(withCamelCase=withCamelCase,
+            wikiDocument=_workerWikiDocument, basePage=basePage,
+            autoLinkMode=autoLinkMode, noFormat=noFormat,
+            paragraphMode=paragraphMode,
+            wikiLanguageDetails=_workerLangHelper.createWikiLanguageDetails(
+            _workerWikiDocument, basePage))
+
+    return _workerParser.parse(
+            _workerWikiDocument.getWikiDefaultWikiLanguage(), text,
+            formatDetails, DUMBTHREADSTOP)
+
+
+def _parsePageInWorker(wikiPageName, text, formatSettings):
+    """
+    Parse  text  of page  wikiPageName  and return tuple
+    (attrs, todos, childRelations, headings) or None if parsing failed.
+    """
+    try:
+        return _extractFromPageAst(_parseInWorker(wikiPageName, text,
+                formatSettings))
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def _parsePageAstInWorker(wikiPageName, text, formatSettings):
+    """
+    Parse  text  of page  wikiPageName  and return the page AST or None
+    if parsing failed.
+    """
+    try:
+        return _parseInWorker(wikiPageName, text, formatSettings)
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def _extractFromPageAst(pageAst):
+    """
+    Return tuple (attrs, todos, childRelations, headings) of pageAst.
+    """
+    from .DocPages import AbstractWikiPage
+
+    return (AbstractWikiPage.extractAttributesFromPageAst(pageAst),
+            AbstractWikiPage.extractTodosFromPageAst(pageAst),
+            AbstractWikiPage.extractChildRelationsFromPageAst(pageAst),
+            AbstractWikiPage.extractHeadingsFromPageAst(pageAst))
+
+
+
+# ---------- Main process side ----------
+
+class _ReadyResult:
+    """
+    Replaces the AsyncResult of the pool for pages not sent to a worker.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, timeout=None):
+        return self.value
+
+
+def getProcessCount(optionName="rebuild_processCount"):
+    """
+    Return number of worker processes to use according to global
+    configuration option  optionName. A number below 2 means no worker
+    processes.
+    """
+    processCount = wx.GetApp().getGlobalConfig().getint("main",
+            optionName, 0)
+
+    if processCount <= 0:
+        try:
+            processCount = multiprocessing.cpu_count()
+        except NotImplementedError:
+            processCount = 1
+
+    return processCount
+
+
+def _getParserModule(wikiDocument):
+    """
+    Return tuple (name, path) of the module containing the parser of the
+    wiki language or None if not available.
+    """
+    intLanguageName = wikiDocument.getWikiDefaultWikiLanguage()
+
+    parser = wx.GetApp().createWikiParser(intLanguageName)
+    try:
+        if parser is None:
+            return None
+
+        module = sys.modules.get(type(parser).__module__)
+        if module is None or not hasattr(module, "parserFactory") or \
+                not hasattr(module, "languageHelperFactory"):
+            return None
+
+        path = getattr(module, "__file__", None)
+        if path is None:
+            return None
+
+        return module.__name__, path
+    finally:
+        wx.GetApp().freeWikiParser(parser)
+
+
+def _buildWikiDocumentStandIn(wikiDocument):
+    autoLinkModes = [v.lower() for v in
+            wikiDocument.getDistinctAttributeValuesByKey("auto_link")]
+    autoLinkModes.append(wikiDocument.getGlobalAttributeValue("auto_link",
+            "off").lower())
+
+    if "relax" in autoLinkModes:
+        autoLinkRelaxInfo = wikiDocument.getAutoLinkRelaxInfo()
+    else:
+        autoLinkRelaxInfo = None
+
+    return _WikiDocumentStandIn(
+            FrozenConfiguration(wikiDocument.getWikiConfig()),
+            wikiDocument.getWikiDefaultWikiLanguage(),
+            wikiDocument.getCcWordBlacklist(),
+            wikiDocument.getNccWordBlacklist(),
+            autoLinkRelaxInfo)
+
+
+def _readPageForParsing(wikiDocument, wikiWord):
+    """
+    Returns tuple (text, formatDetails) for wikiWord. The format details
+    don't refer to the page to avoid that it is kept alive.
+    """
+    wikiPage = wikiDocument.getWikiPageForRebuild(wikiWord)
+
+    with wikiPage.getTextOperationLock():
+        text = wikiPage.getLiveText()
+        fd = wikiPage.getFormatDetails()
+
+    return text, WikiPageFormatDetails(withCamelCase=fd.withCamelCase,
+            wikiDocument=wikiDocument, basePage=None,
+            autoLinkMode=fd.autoLinkMode, noFormat=fd.noFormat,
+            paragraphMode=fd.paragraphMode,
+            wikiLanguageDetails=fd.wikiLanguageDetails)
+
+
+def _iterWorkerResults(wikiDocument, wikiWords, processCount,
+        workerFunction, getLocalResult):
+    """
+    Generator which reads the pages of wikiWords, calls
+    workerFunction(wikiWord, text, formatSettings) in processCount worker
+    processes and yields tuples (wikiWord, result, text, formatDetails)
+    in the order of wikiWords. result is None if the page couldn't be
+    read or the worker failed.
+    Only a limited number of pages is read in advance.
+
+    getLocalResult -- function (wikiWord, text, formatDetails) returning
+        a _ReadyResult if the page needn't be sent to a worker or None
+    """
+    parserModule = _getParserModule(wikiDocument)
+    if parserModule is None:
+        raise NotImplementedError("Parser can't be loaded in worker process")
+
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(processCount, _initWorker,
+            parserModule + (_buildWikiDocumentStandIn(wikiDocument),))
+
+    try:
+        # If the initializer fails, the pool restarts workers endlessly
+        # and never delivers a result, so test startup first
+        pool.apply_async(_probeWorker).get(_STARTUP_TIMEOUT)
+
+        pending = collections.deque()
+        wordIter = iter(wikiWords)
+        prefetch = processCount * _PREFETCH_PER_PROCESS
+
+        while True:
+            while len(pending) < prefetch:
+                wikiWord = next(wordIter, None)
+                if wikiWord is None:
+                    break
+
+                try:
+                    text, formatDetails = _readPageForParsing(wikiDocument,
+                            wikiWord)
+                except Exception:
+                    traceback.print_exc()
+                    pending.append((wikiWord, None, None, None))
+                    continue
+
+                asyncResult = getLocalResult(wikiWord, text, formatDetails)
+                if asyncResult is None:
+                    formatSettings = (formatDetails.withCamelCase,
+                            formatDetails.autoLinkMode, formatDetails.noFormat,
+                            formatDetails.paragraphMode)
+
+                    asyncResult = pool.apply_async(workerFunction,
+                            (wikiWord, text, formatSettings))
+                pending.append((wikiWord, asyncResult, text, formatDetails))
+
+            if len(pending) == 0:
+                break
+
+            wikiWord, asyncResult, text, formatDetails = pending.popleft()
+            result = None
+            if asyncResult is not None:
+                try:
+                    result = asyncResult.get(_PAGE_TIMEOUT)
+                except multiprocessing.TimeoutError:
+                    # Probably a worker died, give up
+                    raise
+                except Exception:
+                    traceback.print_exc()
+
+            yield wikiWord, result, text, formatDetails
+
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+
+def _getPageAstCacheIfEnabled(wikiDocument):
+    astCache = wikiDocument.getPageAstCache()
+    if not astCache.isEnabled():
+        return None
+
+    return astCache
+
+
+def iterParsePages(wikiDocument, wikiWords, processCount):
+    """
+    Generator which parses the pages of wikiWords in processCount worker
+    processes and yields a PageParseData object (or None if worker failed)
+    for each word in the order of wikiWords.
+    Pages with an AST in the page AST cache are not sent to the worker
+    processes.
+    """
+    astCache = _getPageAstCacheIfEnabled(wikiDocument)
+
+    def getLocalResult(wikiWord, text, formatDetails):
+        if astCache is None:
+            return None
+
+        pageAst = astCache.get(astCache.buildKey(wikiWord, text,
+                formatDetails))
+        if pageAst is None:
+            return None
+
+        return _ReadyResult(_extractFromPageAst(pageAst))
+
+    for wikiWord, extracted, text, formatDetails in _iterWorkerResults(
+            wikiDocument, wikiWords, processCount, _parsePageInWorker,
+            getLocalResult):
+        if extracted is None:
+            yield wikiWord, None
+        else:
+            yield wikiWord, PageParseData(wikiWord, extracted, hash(text),
+                    formatDetails)
+
+
+def iterParsePageAsts(wikiDocument, wikiWords, processCount):
+    """
+    Generator which parses the pages of wikiWords in processCount worker
+    processes and yields tuples (wikiWord, wikiPage) in the order of
+    wikiWords. The AST built by the worker is installed as live AST of
+    wikiPage and stored in the page AST cache. wikiPage is None if the page
+    wasn't parsed by a worker, e.g. because its AST is already available.
+    The caller must keep wikiPage referenced while using the AST as
+    otherwise the page may be garbage collected.
+    """
+    astCache = _getPageAstCacheIfEnabled(wikiDocument)
+    ready = _ReadyResult(None)
+
+    def getLocalResult(wikiWord, text, formatDetails):
+        if wikiDocument.getWikiPageNoError(wikiWord)\
+                .getLivePageAstIfAvailable() is not None:
+            return ready
+
+        if astCache is not None and astCache.contains(astCache.buildKey(
+                wikiWord, text, formatDetails)):
+            return ready
+
+        return None
+
+    for wikiWord, pageAst, text, formatDetails in _iterWorkerResults(
+            wikiDocument, wikiWords, processCount, _parsePageAstInWorker,
+            getLocalResult):
+        if pageAst is None:
+            yield wikiWord, None
+            continue
+
+        wikiPage = wikiDocument.getWikiPageNoError(wikiWord)\
+                .getNonAliasPage()
+        if not wikiPage.setLivePageAstIfCurrent(text, formatDetails, pageAst):
+            yield wikiWord, None
+            continue
+
+        if astCache is not None:
+            astCache.put(astCache.buildKey(wikiWord, text, formatDetails),
+                    pageAst)
+
+        yield wikiWord, wikiPage
+
+
+def rebuildMetaData(wikiDocument, wikiWords, progresshandler, step,
+        processCount, transaction=None):
+    """
+    Replaces step two (attributes) and three (todos, relations) of
+    WikiDocument.rebuildWiki(). Pages are parsed only once in worker processes.
+    Pages whose data couldn't be created by a worker or whose format details
+    changed through the new attributes are processed in the main process.
+
+    transaction -- WikiDataTransaction of the rebuild or None. Its
+        checkpoint() is called after each page.
+
+    Returns the new step for the progress handler.
+    """
+    wikiData = wikiDocument.getWikiData()
+    parseDataDict = {}
+
+    # Step two: update attributes
+    for wikiWord, parseData in iterParsePages(wikiDocument, wikiWords,
+            processCount):
+        progresshandler.update(step, _("Update attributes of %s") % wikiWord)
+        try:
+            wikiPage = wikiDocument.getWikiPageForRebuild(wikiWord)
+
+            wikiPage.refreshSyncUpdateMatchTerms()
+            wikiData.refreshFileSignatureForWikiPageName(wikiWord)
+
+            if parseData is None:
+                wikiPage.refreshAttributesFromPageAst(
+                        wikiPage.getLivePageAst())
+            else:
+                wikiPage.refreshAttributesFromParseData(parseData)
+
+            parseDataDict[wikiWord] = parseData
+        except:
+            traceback.print_exc()
+
+        step += 1
+        if transaction is not None:
+            transaction.checkpoint()
+
+    # Step three: update the rest of the syntax (todos, relations)
+    for wikiWord in wikiWords:
+        progresshandler.update(step, _("Update syntax of %s") % wikiWord)
+        try:
+            wikiPage = wikiDocument.getWikiPageForRebuild(wikiWord)
+            parseData = parseDataDict.pop(wikiWord, None)
+
+            if parseData is None or not wikiPage.getFormatDetails().isEquivTo(
+                    parseData.formatDetails):
+                wikiPage.refreshMainDbCacheFromPageAst(
+                        wikiPage.getLivePageAst())
+            else:
+                wikiPage.refreshMainDbCacheFromParseData(parseData)
+        except:
+            traceback.print_exc()
+
+        step += 1
+        if transaction is not None:
+            transaction.checkpoint()
+
+    return step
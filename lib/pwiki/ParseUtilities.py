@@ -92,6 +92,140 @@ def getFootnoteAnchorDict(pageAst):
 
 
 
+class AutoLinkRelaxMatcher:
+    """
+    Finds wiki words in plain text for auto-link mode "relax". A word
+    matches if its parts of alphanumeric characters appear as complete
+    words in the text (case-insensitive), separated by arbitrary
+    non-alphanumeric characters.
+
+    The words are stored in a trie over their lowercased parts so a text
+    is scanned once, independent of the number of words. Words can be
+    added and removed without rebuilding the trie.
+    """
+    _WORD_PART_RE = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, words=()):
+        # Nested dicts {lowercased part: child node}. Key None holds list of
+        # words ending at the node, best one (longest word) first
+        self.root = {}
+        self.words = set()
+        for word in words:
+            self.addWord(word)
+
+    @staticmethod
+    def _getParts(word):
+        return [p.lower() for p in AutoLinkRelaxMatcher._WORD_PART_RE.findall(
+                word)]
+
+    @staticmethod
+    def _rankKey(word):
+        # If several words match at the same position, the longest one wins
+        return (-len(word), word)
+
+    def addWord(self, word):
+        if word in self.words:
+            return
+
+        parts = self._getParts(word)
+        if len(parts) == 0:
+            # Word without alphanumeric characters can't be auto-linked
+            return
+
+        self.words.add(word)
+        node = self.root
+        for part in parts:
+            node = node.setdefault(part, {})
+
+        # Replace the list instead of modifying it as other threads may
+        # read it concurrently in iterMatches()
+        node[None] = sorted(node.get(None, []) + [word], key=self._rankKey)
+
+    def removeWord(self, word):
+        if word not in self.words:
+            return
+
+        self.words.discard(word)
+        path = []
+        node = self.root
+        for part in self._getParts(word):
+            path.append((node, part))
+            node = node[part]
+
+        entries = [w for w in node[None] if w != word]
+        if len(entries) == 0:
+            del node[None]
+        else:
+            node[None] = entries
+
+        # Remove nodes which became empty
+        for parent, part in reversed(path):
+            if len(parent[part]) > 0:
+                break
+            del parent[part]
+
+    def getWords(self):
+        return frozenset(self.words)
+
+    def setWords(self, words):
+        """
+        Update to the set of  words  by adding and removing only the
+        differences.
+        """
+        words = set(words)
+        for word in self.words - words:
+            self.removeWord(word)
+        for word in words - self.words:
+            self.addWord(word)
+
+    def updateWords(self, changedWords, isWord):
+        """
+        Add or remove each of  changedWords  according to the function
+        isWord(word) which returns True if word should be contained.
+        """
+        for word in changedWords:
+            if isWord(word):
+                self.addWord(word)
+            else:
+                self.removeWord(word)
+
+    def iterMatches(self, text):
+        """
+        Iterate over non-overlapping matches in  text  from left to right.
+        Yields tuples (start, end, word) where text[start:end] is the
+        matched text and  word  the matching wiki word.
+        """
+        tokens = [(m.start(), m.end(), m.group(0).lower())
+                for m in self._WORD_PART_RE.finditer(text)]
+
+        root = self.root
+        rankKey = self._rankKey
+        i = 0
+        while i < len(tokens):
+            node = root
+            foundWord = None
+            foundEndIdx = None
+            j = i
+            while j < len(tokens):
+                node = node.get(tokens[j][2])
+                if node is None:
+                    break
+                entries = node.get(None)
+                if entries is not None and (foundWord is None or
+                        rankKey(entries[0]) < rankKey(foundWord)):
+                    foundWord = entries[0]
+                    foundEndIdx = j
+                j += 1
+
+            if foundWord is None:
+                i += 1
+                continue
+
+            yield (tokens[i][0], tokens[foundEndIdx][1], foundWord)
+            i = foundEndIdx + 1
+
+
+
 # def coalesceTokens(tokens):
 #     """
 #     Coalesce neighboured "Default" tokens.
@@ -56,6 +56,7 @@ from . import AttributeHandling, SpellChecker
 
 
 from . import AdditionalDialogs
+from . import DbProfiler
 
 
 from . import StringOps
@@ -893,6 +894,17 @@ camelCaseWordsEnabled: false;a=[camelCaseWordsEnabled: false]\\n
                         """
                         )
 
+            self.addMenuItem(maintenanceMenu, _('Verify file storage index'),
+                    _('Compare the index of the file storage with the '
+                    'stored files'),
+                    self.OnCmdVerifyFileStorageIndex)
+
+            self.addMenuItem(maintenanceMenu, _('Rebuild file storage index'),
+                    _('Recreate the index used to find identical files in '
+                    'the file storage'),
+                    self.OnCmdRebuildFileStorageIndex,
+                    updatefct=(self.OnUpdateDisReadOnlyWiki,))
+
             # TODO: Test for wikiDocument.isSearchIndexEnabled()
 #             self.addMenuItem(maintenanceMenu, _(u'Re&index Wiki...'),
 #                     _(u'Rebuild the reverse index for fulltext search'),
@@ -904,6 +916,16 @@ camelCaseWordsEnabled: false;a=[camelCaseWordsEnabled: false]\\n
             self.addMenuItem(maintenanceMenu, _('Show job count...'),
                     _('Show how many update jobs are waiting in background'),
                     self.OnCmdShowWikiJobDialog)
+
+            self.addMenuItem(maintenanceMenu, _('Profile database access'),
+                    _('Record statistics of WikiData calls and SQL statements'),
+                    self.OnCmdCheckDbProfiling,
+                    updatefct=self.OnUpdateDbProfiling,
+                    kind=wx.ITEM_CHECK)
+
+            self.addMenuItem(maintenanceMenu, _('Show database profile'),
+                    _('Show recorded database statistics in log window'),
+                    self.OnCmdShowDbProfile)
                     
             maintenanceMenu.AppendSeparator()
 
@@ -5101,6 +5123,48 @@ camelCaseWordsEnabled: false;a=[camelCaseWordsEnabled: false]\\n
             raise
 
 
+    def OnCmdVerifyFileStorageIndex(self, evt):
+        from .LogWindow import InfoLogMessage
+
+        index = self.getWikiDocument().getFileStorage().getIndex()
+        progresshandler = ProgressHandler(
+                _("     Verifying file storage index     "),
+                _("     Verifying file storage index     "), 0, self)
+        try:
+            problems = index.verify(progresshandler)
+        except Exception as e:
+            self.displayErrorMessage(_("Error verifying file storage index"),
+                    e)
+            traceback.print_exc()
+            return
+
+        # Key can't be equal to a wiki word
+        key = ("file storage index",)
+        if problems:
+            msgs = [InfoLogMessage(self, "%s: %s" % (problem, name), key)
+                    for name, problem in problems]
+        else:
+            msgs = [InfoLogMessage(self, _("No problems found"), key)]
+        self.getLogWindow().updateForWikiWord(key, msgs)
+        self.showLogWindow()
+
+
+    def OnCmdRebuildFileStorageIndex(self, evt):
+        if self.isReadOnlyWiki():
+            return
+
+        index = self.getWikiDocument().getFileStorage().getIndex()
+        progresshandler = ProgressHandler(
+                _("     Rebuilding file storage index     "),
+                _("     Rebuilding file storage index     "), 0, self)
+        try:
+            index.rebuild(progresshandler)
+        except Exception as e:
+            self.displayErrorMessage(_("Error rebuilding file storage index"),
+                    e)
+            traceback.print_exc()
+
+
     def OnCmdCloneWindow(self, evt):
         wd = self.getWikiDocument()
         if wd is None:
@@ -5423,6 +5487,27 @@ camelCaseWordsEnabled: false;a=[camelCaseWordsEnabled: false]\\n
         dlg.Destroy()
 
 
+    def OnCmdCheckDbProfiling(self, evt):
+        if evt.IsChecked():
+            DbProfiler.enable()
+        else:
+            DbProfiler.disable()
+
+    def OnUpdateDbProfiling(self, evt):
+        evt.Check(DbProfiler.isEnabled())
+
+
+    def OnCmdShowDbProfile(self, evt):
+        from .LogWindow import InfoLogMessage
+
+        # Key can't be equal to a wiki word
+        key = ("database profile",)
+        msgs = [InfoLogMessage(self, line, key)
+                for line in DbProfiler.profiler.getReportLines()]
+        self.getLogWindow().updateForWikiWord(key, msgs)
+        self.showLogWindow()
+
+
     # ----------------------------------------------------------------------------------------
     # Event handlers from here on out.
     # ----------------------------------------------------------------------------------------
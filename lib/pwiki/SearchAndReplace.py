@@ -1,4 +1,4 @@
-import re, traceback
+import re, traceback, unicodedata, itertools
 
 import wx
 
@@ -9,12 +9,100 @@ from .Serialization import SerializeStream, findXmlElementFlat, \
         serToXmlBoolean, serFromXmlBoolean, serToXmlInt, serFromXmlInt
 
 from . import SearchAndReplaceBoolLang
+from . import TrigramIndex
 
 
 
 Unknown = object()  # Abstract third truth value constant
 
 
+# Regex pattern of a word boundary, see _getWordBoundaryPattern()
+_wordBoundaryPattern = None
+
+
+def _getWordBoundaryPattern():
+    """
+    Return regex pattern for a word boundary like r"\b" but with combining
+    marks as word characters as well, like the tokenizer of the full text
+    index. Otherwise a whole word search would e.g. find "cole" in "Ecole"
+    with an acute accent as combining mark (NFD normalization form).
+    """
+    global _wordBoundaryPattern
+
+    if _wordBoundaryPattern is None:
+        # Combining marks exist only in these planes
+        ranges = []
+        for code in itertools.chain(range(0x20000), range(0xE0000, 0xE0200)):
+            if unicodedata.category(chr(code))[0] != "M":
+                continue
+            if ranges and ranges[-1][1] == code - 1:
+                ranges[-1][1] = code
+            else:
+                ranges.append([code, code])
+
+        wordChar = "[\\w%s]" % "".join("%s-%s" % (re.escape(chr(first)),
+                re.escape(chr(last))) for first, last in ranges)
+        _wordBoundaryPattern = "(?:(?<!%s)(?=%s)|(?<=%s)(?!%s))" % \
+                ((wordChar,) * 4)
+
+    return _wordBoundaryPattern
+
+
+def _iterFullTextTokens(text):
+    """
+    Iterate over tuples (start, end) of the tokens of text as the tokenizer
+    of the full text index (DbStructure.FULLTEXTINDEX_TOKENIZE) finds them:
+    runs of letters, digits and combining marks (Unicode categories L*, N*
+    and M*).
+    """
+    start = None
+    for pos, c in enumerate(text):
+        if unicodedata.category(c)[0] in "LNM":
+            if start is None:
+                start = pos
+        elif start is not None:
+            yield (start, pos)
+            start = None
+
+    if start is not None:
+        yield (start, len(text))
+
+
+def buildFullTextIndexQuery(literal, wholeWord=False):
+    """
+    Return an FTS5 query for the full text index of the database which
+    matches at least all pages containing the string literal (case
+    insensitive) or None if no such query can be built.
+
+    Inside of the literal, a token must appear as complete token in the page
+    as well. A token at the start of the literal may be the end of a longer
+    token in the page, a token at the end may be its beginning (then
+    queried as prefix). If a token is both, it can't be queried.
+
+    If wholeWord is True, the literal is found between word boundaries (see
+    _getWordBoundaryPattern()), so a token at the start begins a token in
+    the page as well. The token at the end is still queried as prefix.
+    """
+    terms = []
+    for start, end in _iterFullTextTokens(literal):
+        token = literal[start:end]
+        startsToken = start > 0 or wholeWord
+        endsToken = end < len(literal)
+
+        if not startsToken:
+            continue
+
+        if endsToken:
+            terms.append('"%s"' % token)
+        else:
+            terms.append('"%s"*' % token)
+
+    if len(terms) == 0:
+        return None
+
+    return " AND ".join(terms)
+
+
 class AbstractSearchNode:
     """
     Base class for all search nodes of the search tree
@@ -60,6 +148,22 @@ class AbstractSearchNode:
         Should return True in case of doubt.
         """
         return True
+
+    def getFullTextIndexQuery(self):
+        """
+        Return an FTS5 query for the full text index which matches at least
+        all pages for which testWikiPage() returns True or None if all
+        pages must be tested.
+        """
+        return None
+
+    def getTrigramQuery(self):
+        """
+        Return a trigram query (see TrigramIndex) for the trigram index
+        which matches at least all pages for which testWikiPage() returns
+        True or None if all pages must be tested.
+        """
+        return None
         
 
 #     def testText(self, text):
@@ -767,6 +871,21 @@ class AndSearchNode(AbstractAndOrSearchNode):
             
         return Unknown
 
+    def getFullTextIndexQuery(self):
+        leftQuery = self.left.getFullTextIndexQuery()
+        rightQuery = self.right.getFullTextIndexQuery()
+
+        if leftQuery is None:
+            return rightQuery
+        if rightQuery is None:
+            return leftQuery
+
+        return "(%s) AND (%s)" % (leftQuery, rightQuery)
+
+    def getTrigramQuery(self):
+        return TrigramIndex.andQueries([self.left.getTrigramQuery(),
+                self.right.getTrigramQuery()])
+
 
 class OrSearchNode(AbstractAndOrSearchNode):
     """
@@ -790,6 +909,21 @@ class OrSearchNode(AbstractAndOrSearchNode):
 
         return Unknown
 
+    def getFullTextIndexQuery(self):
+        leftQuery = self.left.getFullTextIndexQuery()
+        if leftQuery is None:
+            return None
+
+        rightQuery = self.right.getFullTextIndexQuery()
+        if rightQuery is None:
+            return None
+
+        return "(%s) OR (%s)" % (leftQuery, rightQuery)
+
+    def getTrigramQuery(self):
+        return TrigramIndex.orQueries([self.left.getTrigramQuery(),
+                self.right.getTrigramQuery()])
+
 
 
 class RegexTextNode(AbstractContentSearchNode):
@@ -798,12 +932,17 @@ class RegexTextNode(AbstractContentSearchNode):
     """
     CLASS_PERSID = "RegexText"  # Class id for persistence storage
 
-    def __init__(self, sarOp, rePattern):
+    def __init__(self, sarOp, rePattern, literal=None, wholeWord=False):
         """
         regex -- precompiled regex pattern
+        literal -- string if rePattern only searches for it literally
+                (case insensitive or as whole word) or None
+        wholeWord -- True if literal must be found as whole word
         """
         AbstractContentSearchNode.__init__(self, sarOp)
         self.rePattern = rePattern
+        self.literal = literal
+        self.wholeWord = wholeWord
 
 
     def searchText(self, text, searchCharStartPos=0, cycleToStart=False):
@@ -825,6 +964,15 @@ class RegexTextNode(AbstractContentSearchNode):
     def testWikiPage(self, word, text):
         return bool(self.rePattern.search(text))
 
+    def getFullTextIndexQuery(self):
+        if self.literal is None:
+            return None
+
+        return buildFullTextIndexQuery(self.literal, self.wholeWord)
+
+    def getTrigramQuery(self):
+        return TrigramIndex.buildRegexTrigramQuery(self.rePattern)
+
 #     def testText(self, text):
 #         return bool(self.rePattern.search(text))
 
@@ -878,6 +1026,12 @@ class SimpleStrNode(AbstractContentSearchNode):
     def testWikiPage(self, word, text):
         return text.find(self.subStr) != -1
 
+    def getFullTextIndexQuery(self):
+        return buildFullTextIndexQuery(self.subStr)
+
+    def getTrigramQuery(self):
+        return TrigramIndex.buildLiteralTrigramQuery(self.subStr)
+
 
 #     def testText(self, text):
 #         return text.find(self.subStr) != -1
@@ -1674,18 +1828,22 @@ class SearchReplaceOperation:
             # TODO: Test if really faster than REs
             return SimpleStrNode(self, searchStr)
         else:
+            literal = None
             if self.wildCard == 'no':
+                literal = searchStr
                 searchStr = re.escape(searchStr)
 
             if self.wholeWord:
-                searchStr = r"\b%s\b" % searchStr
+                boundary = _getWordBoundaryPattern()
+                searchStr = boundary + searchStr + boundary
 
             if self.caseSensitive:
                 reFlags = re.MULTILINE | re.UNICODE
             else:
                 reFlags = re.IGNORECASE | re.MULTILINE | re.UNICODE
 
-            return RegexTextNode(self, re.compile(searchStr, reFlags))
+            return RegexTextNode(self, re.compile(searchStr, reFlags),
+                    literal, self.wholeWord)
 
 
 
@@ -1833,6 +1991,36 @@ class SearchReplaceOperation:
                      fragmenter, formatter, top=1)
 
 
+    def getFullTextIndexQuery(self):
+        """
+        Return an FTS5 query for the full text index which matches at least
+        all pages fulfilling the search criteria or None if the index
+        can't be used for this search.
+        """
+        if self.indexSearch != "no":
+            return None
+
+        if self.searchOpTree is None:
+            self.rebuildSearchOpTree()
+
+        return self.searchOpTree.getFullTextIndexQuery()
+
+
+    def getTrigramQuery(self):
+        """
+        Return a trigram query (see TrigramIndex) for the trigram index
+        which matches at least all pages fulfilling the search criteria
+        or None if the index can't be used for this search.
+        """
+        if self.indexSearch != "no":
+            return None
+
+        if self.searchOpTree is None:
+            self.rebuildSearchOpTree()
+
+        return self.searchOpTree.getTrigramQuery()
+
+
     def hasParticularTextPosition(self):
         if self.indexSearch != "no":
             return False   # TODO!
@@ -283,7 +283,7 @@ def column_blob(stmt, col):
     """
     length = _dll.sqlite3_column_bytes(stmt._stmtpointer, col)
     if length == 0:
-        return ""
+        return b""
 
     _dll.sqlite3_column_blob.restype = POINTER(c_char * length)  # TODO: Thread safety
     
@@ -10,7 +10,7 @@ import os, traceback
 from struct import pack, unpack
 
 import difflib, codecs, os.path, random, base64, locale, hashlib, tempfile, \
-        math, time
+        math, time, bisect
 
 # import urllib_red as urllib
 import urllib.request, urllib.parse, urllib.error, urllib.parse, cgi
@@ -453,8 +453,15 @@ def getFileSignatureBlock(filename, timeCoarsening=None):
     (e.g. NTFS uses 100ns, FAT uses 2s for mod. time) the file would be seen as
     dirty and cache data would be rebuild without need without coarsening.
     """
-    statinfo = os.stat(pathEnc(filename))
-    
+    return getFileSignatureBlockFromStat(os.stat(pathEnc(filename)),
+            timeCoarsening)
+
+
+def getFileSignatureBlockFromStat(statinfo, timeCoarsening=None):
+    """
+    Returns the file signature block for the result  statinfo  of os.stat()
+    (or os.DirEntry.stat()), see getFileSignatureBlock().
+    """
     if timeCoarsening is None or timeCoarsening <= 0:
         return pack(">BQd", 0, statinfo.st_size, statinfo.st_mtime)
     
@@ -599,6 +606,41 @@ def styleSelection(text, start, afterEnd, startChars, endChars=None):
 
     
 
+def commonPrefixLength(s1, s2):
+    """
+    Returns length of the longest common prefix of strings s1 and s2.
+    """
+    lo = 0
+    hi = min(len(s1), len(s2))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if s1[lo:mid] == s2[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return lo
+
+
+def commonSuffixLength(s1, s2, maxLength):
+    """
+    Returns length of the longest common suffix of strings s1 and s2 but
+    not more than  maxLength .
+    """
+    lo = 0
+    hi = maxLength
+    len1 = len(s1)
+    len2 = len(s2)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if s1[len1 - mid:len1 - lo] == s2[len2 - mid:len2 - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    return lo
+
+
 def splitFill(text, delim, count, fill=""):
     """
     Split text by delim into up to count pieces. If less
@@ -922,6 +964,28 @@ def rgbToHtmlColor(r, g, b):
     return "#%02X%02X%02X" % (r, g, b)
 
 
+# Number of bytes encoded at once by iterBase64BlockEncode(). Must be a
+# multiple of 105 so each chunk gives complete lines of 70 characters
+_BASE64_BLOCK_CHUNK_SIZE = 105 * 1024
+
+
+def iterBase64BlockEncode(data):
+    """
+    Like base64BlockEncode() but returns an iterator over strings which
+    concatenated give the encoded block. Only the encoding of one chunk
+    of data is held in memory at a time.
+    data -- bytes or other bytes-like object to encode
+    """
+    data = memoryview(data)
+    for start in range(0, len(data), _BASE64_BLOCK_CHUNK_SIZE):
+        b64 = base64.b64encode(data[start:start + _BASE64_BLOCK_CHUNK_SIZE])
+        if start > 0:
+            yield "\n"
+
+        yield b"\n".join([b64[i:i + 70] for i in range(0, len(b64), 70)])\
+                .decode("ascii")
+
+
 def base64BlockEncode(data):
     """
     Cut a sequence of base64 characters into chunks of 70 characters
@@ -930,21 +994,62 @@ def base64BlockEncode(data):
     
     returns string
     """
-    b64 = base64.b64encode(data)
+    return "".join(iterBase64BlockEncode(data))
 
-    result = []
-    while len(b64) > 70:
-        result.append(b64[:70])
-        b64 = b64[70:]
 
-    if len(b64) > 0:
-        result.append(b64)
+# Just for completeness
+base64BlockDecode = base64.b64decode
 
-    return b"\n".join(result).decode("ascii")
 
+class Base64BlockDecoder:
+    """
+    Decodes base64 text (e.g. created by base64BlockEncode()) given in
+    pieces, e.g. line by line. Characters outside of the base64 alphabet
+    (especially line ends) are ignored as by base64BlockDecode().
+    """
+    _NON_ALPHABET_RE = _re.compile(r"[^A-Za-z0-9+/=]+")
+
+    # Number of pending characters after which they are decoded
+    _DECODE_SIZE = 64 * 1024
+
+    def __init__(self, stream):
+        """
+        stream -- binary stream to write decoded bytes to
+        """
+        self.stream = stream
+        self.pending = []
+        self.pendingLen = 0
+
+    def feed(self, text):
+        """
+        Decode text. Raises binascii.Error (a ValueError) if the base64
+        data is malformed.
+        """
+        self.pending.append(text)
+        self.pendingLen += len(text)
+
+        if self.pendingLen >= self._DECODE_SIZE:
+            self._decodePending(False)
+
+    def close(self):
+        """
+        Decode remaining characters.
+        """
+        self._decodePending(True)
+
+    def _decodePending(self, final):
+        b64 = self._NON_ALPHABET_RE.sub("", "".join(self.pending))
+        if final:
+            cut = len(b64)
+        else:
+            # Only decode complete groups of four characters
+            cut = len(b64) - len(b64) % 4
+
+        self.pending = [b64[cut:]]
+        self.pendingLen = len(b64) - cut
+        if cut > 0:
+            self.stream.write(base64.b64decode(b64[:cut]))
 
-# Just for completeness
-base64BlockDecode = base64.b64decode
 
 
 
@@ -1987,16 +2092,194 @@ def applyBinCompact(a, bops):
     return applyCompact(a, binCompactToCompact(bops))
 
 
-def getBinCompactForDiff(a, b):
+def getCompactForDiffDifflib(a, b):
+    """
+    Return compact ops to change bytes a to b, found by difflib on the
+    single bytes. Needs quadratic time in the worst case.
+    """
+    sm = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return difflibToCompact(sm.get_opcodes(), b)
+
+
+# Changed line blocks where both sides are at most this number of bytes long
+# are compared byte by byte
+_DIFF_REFINE_MAX_BYTES = 4000
+
+# Regions without lines unique in both sides are compared line by line
+# with difflib if the product of their line counts is at most this number
+_DIFF_FALLBACK_MAX_LINES_PRODUCT = 250000
+
+
+def _getPatienceAnchors(a, a1, a2, b, b1, b2):
+    """
+    Return list of index pairs (i, j) of lines with a[i] == b[j] which
+    occur exactly once in a[a1:a2] and in b[b1:b2]. The pairs are the
+    longest sequence ascending in i and j.
+    """
+    uniqueA = {}
+    for i in range(a1, a2):
+        line = a[i]
+        if line in uniqueA:
+            uniqueA[line] = -1
+        else:
+            uniqueA[line] = i
+
+    uniqueB = {}
+    for j in range(b1, b2):
+        line = b[j]
+        if uniqueA.get(line, -1) == -1:
+            continue
+        if line in uniqueB:
+            uniqueB[line] = -1
+        else:
+            uniqueB[line] = j
+
+    pairs = [(uniqueA[line], j) for line, j in uniqueB.items() if j != -1]
+    if len(pairs) == 0:
+        return pairs
+
+    pairs.sort(key=lambda p: p[1])
+
+    # Longest increasing subsequence of the i values (patience sorting)
+    tailIs = []      # Smallest i ending an increasing sequence of length k + 1
+    tailIdxs = []    # Index in pairs of that i
+    predecessors = [None] * len(pairs)
+    for idx, (i, j) in enumerate(pairs):
+        k = bisect.bisect_left(tailIs, i)
+        if k > 0:
+            predecessors[idx] = tailIdxs[k - 1]
+        if k == len(tailIs):
+            tailIs.append(i)
+            tailIdxs.append(idx)
+        else:
+            tailIs[k] = i
+            tailIdxs[k] = idx
+
+    result = []
+    idx = tailIdxs[-1]
+    while idx is not None:
+        result.append(pairs[idx])
+        idx = predecessors[idx]
+
+    result.reverse()
+    return result
+
+
+def _getLineDiffHunks(a, b):
+    """
+    Compare sequences a and b of hashable line ids by patience diff and
+    return ordered list of tuples (i1, i2, j1, j2) meaning that a[i1:i2]
+    must be replaced by b[j1:j2]. Lines outside of hunks are equal.
+    """
+    hunks = []
+    stack = [(0, len(a), 0, len(b))]
+
+    while stack:
+        a1, a2, b1, b2 = stack.pop()
+
+        # Strip common beginning and end
+        while a1 < a2 and b1 < b2 and a[a1] == b[b1]:
+            a1 += 1
+            b1 += 1
+        while a1 < a2 and b1 < b2 and a[a2 - 1] == b[b2 - 1]:
+            a2 -= 1
+            b2 -= 1
+
+        if a1 == a2 or b1 == b2:
+            if a1 < a2 or b1 < b2:
+                hunks.append((a1, a2, b1, b2))
+            continue
+
+        anchors = _getPatienceAnchors(a, a1, a2, b, b1, b2)
+        if len(anchors) > 0:
+            # Gaps between anchors are processed in order as the stack
+            # is last in, first out
+            anchors.append((a2, b2))
+            prevI, prevJ = a1, b1
+            gaps = []
+            for i, j in anchors:
+                gaps.append((prevI, i, prevJ, j))
+                prevI, prevJ = i + 1, j + 1
+            stack += reversed(gaps)
+            continue
+
+        if (a2 - a1) * (b2 - b1) <= _DIFF_FALLBACK_MAX_LINES_PRODUCT:
+            sm = difflib.SequenceMatcher(None, a[a1:a2], b[b1:b2],
+                    autojunk=False)
+            for tag, i1, i2, j1, j2 in sm.get_opcodes():
+                if tag != "equal":
+                    hunks.append((a1 + i1, a1 + i2, b1 + j1, b1 + j2))
+        else:
+            hunks.append((a1, a2, b1, b2))
+
+    return hunks
+
+
+def getCompactForDiffLines(a, b):
+    """
+    Return compact ops to change bytes a to b. Lines are compared first
+    (by patience diff, needs about linear time for usual texts), changed
+    blocks of lines are then compared byte by byte if they are short.
+    """
+    aLines = a.splitlines(True)
+    bLines = b.splitlines(True)
+
+    lineIds = {}
+    aIds = [lineIds.setdefault(line, len(lineIds)) for line in aLines]
+    bIds = [lineIds.setdefault(line, len(lineIds)) for line in bLines]
+
+    aOffsets = [0]
+    for line in aLines:
+        aOffsets.append(aOffsets[-1] + len(line))
+    bOffsets = [0]
+    for line in bLines:
+        bOffsets.append(bOffsets[-1] + len(line))
+
+    result = []
+    for i1, i2, j1, j2 in _getLineDiffHunks(aIds, bIds):
+        aStart = aOffsets[i1]
+        aEnd = aOffsets[i2]
+        bStart = bOffsets[j1]
+        bEnd = bOffsets[j2]
+
+        if aStart == aEnd:
+            result.append((2, aStart, b[bStart:bEnd]))
+        elif bStart == bEnd:
+            result.append((1, aStart, aEnd))
+        elif aEnd - aStart <= _DIFF_REFINE_MAX_BYTES and \
+                bEnd - bStart <= _DIFF_REFINE_MAX_BYTES:
+            for op in getCompactForDiffDifflib(a[aStart:aEnd], b[bStart:bEnd]):
+                if op[0] == 0:
+                    result.append((0, aStart + op[1], aStart + op[2], op[3]))
+                elif op[0] == 1:
+                    result.append((1, aStart + op[1], aStart + op[2]))
+                else:
+                    result.append((2, aStart + op[1], op[2]))
+        else:
+            result.append((0, aStart, aEnd, b[bStart:bEnd]))
+
+    return result
+
+
+# Functions to create compact ops for bytes a and b by name, the name is
+# set in option "versioning_diffEngine"
+DIFF_ENGINES = {
+        "difflib": getCompactForDiffDifflib,
+        "lines": getCompactForDiffLines
+    }
+
+
+def getBinCompactForDiff(a, b, engine="lines"):
     """
     Return the binary compact codes to change bytes a to b.
     For bytes a and b (NOT strings) it is always true that
         applyBinCompact(a, getBinCompactForDiff(a, b)) == b
-    """
 
-    sm = difflib.SequenceMatcher(None, a, b, autojunk=False)
-    ops = sm.get_opcodes()
-    return compactToBinCompact(difflibToCompact(ops, b))
+    engine -- name of the diff engine in DIFF_ENGINES, unknown names
+        use the default
+    """
+    getCompact = DIFF_ENGINES.get(engine, getCompactForDiffLines)
+    return compactToBinCompact(getCompact(a, b))
 
 
 # ---------- Unicode constants ----------
@@ -0,0 +1,313 @@
+"""
+Trigrams for the optional trigram index of the wiki database and a planner
+which builds trigram queries for search terms.
+
+A trigram query describes which trigrams a page must contain so that a
+search term can match it. It is either None (no restriction, all pages must
+be tested), a trigram string of length 3, or a tuple ("and", subqueries)
+or ("or", subqueries) with a tuple of (non-None) subqueries.
+
+Text and queries are case folded character by character so a query built
+for a case sensitive search finds also all pages a case insensitive
+search would find. Pages returned by the index must therefore still be
+tested by the search itself.
+"""
+
+try:
+    from re import _parser as _reParser, _constants as _reConstants
+except ImportError:
+    import sre_parse as _reParser, sre_constants as _reConstants
+
+
+# Maximum number of alternative strings handled as such by the planner,
+# more alternatives are queried by their trigrams only
+_MAX_EXACT_SET = 16
+
+# Maximum number of trigrams combined by "and" in a query
+_MAX_AND_TRIGRAMS = 24
+
+# Maximum number of alternatives combined by "or" in a query
+_MAX_OR_QUERIES = 64
+
+
+# Characters which are equal for a case insensitive regex but wouldn't get
+# the same key by _foldChar() otherwise
+_FOLD_FIXES = {
+    "\u0130": "i",  # Capital I with dot above
+    "\u1fd3": "\u0390",  # Greek iota with dialytika and oxia/tonos
+    "\u1fe3": "\u03b0",  # Greek upsilon with dialytika and oxia/tonos
+    "\ufb05": "\ufb06",  # Ligatures long s t and s t
+    }
+
+
+def _foldChar(c):
+    """
+    Return the case folded key of the single character c.
+    """
+    result = _FOLD_FIXES.get(c)
+    if result is not None:
+        return result
+
+    result = c.lower()
+    if len(result) != 1:
+        result = c
+
+    # Maps e.g. long s to s, final sigma to sigma
+    upper = result.upper()
+    if len(upper) == 1:
+        lower = upper.lower()
+        if len(lower) == 1:
+            result = lower
+
+    return result
+
+
+class _FoldTable(dict):
+    """
+    Translation table for str.translate() which computes and remembers
+    the folded key of a character on first use.
+    """
+    def __missing__(self, code):
+        result = _foldChar(chr(code))
+        self[code] = result
+        return result
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def foldText(text):
+    """
+    Return text case folded for trigrams. The result has the same length
+    as text.
+    """
+    return text.translate(_FOLD_TABLE)
+
+
+def getTrigrams(text):
+    """
+    Return the set of trigrams (strings of length 3) of the case folded text.
+    """
+    text = foldText(text)
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def trigramToInt(trigram):
+    """
+    Return the integer representation of a trigram as stored in the database.
+    It fits into a signed 64 bit integer.
+    """
+    return (ord(trigram[0]) << 42) | (ord(trigram[1]) << 21) | ord(trigram[2])
+
+
+def getTrigramInts(text):
+    """
+    Return the set of trigrams of text in integer representation
+    """
+    return set(trigramToInt(t) for t in getTrigrams(text))
+
+
+
+# ---------- Combining queries ----------
+
+def andQueries(queries):
+    """
+    Return query which matches if all of the given queries match.
+    """
+    subs = []
+    for q in queries:
+        if q is None:
+            continue
+        if isinstance(q, tuple) and q[0] == "and":
+            subs += [s for s in q[1] if s not in subs]
+        elif q not in subs:
+            subs.append(q)
+
+    if len(subs) == 0:
+        return None
+
+    trigrams = [s for s in subs if not isinstance(s, tuple)]
+    if len(trigrams) > _MAX_AND_TRIGRAMS:
+        # Fewer trigrams only enlarge the set of candidates, take them evenly
+        # distributed over the text
+        step = len(trigrams) / _MAX_AND_TRIGRAMS
+        keep = set(trigrams[int(i * step)] for i in range(_MAX_AND_TRIGRAMS))
+        subs = [s for s in subs if isinstance(s, tuple) or s in keep]
+
+    if len(subs) == 1:
+        return subs[0]
+
+    return ("and", tuple(subs))
+
+
+def orQueries(queries):
+    """
+    Return query which matches if any of the given queries matches.
+    """
+    subs = []
+    for q in queries:
+        if q is None:
+            return None
+        if isinstance(q, tuple) and q[0] == "or":
+            subs += [s for s in q[1] if s not in subs]
+        elif q not in subs:
+            subs.append(q)
+
+    if len(subs) == 0 or len(subs) > _MAX_OR_QUERIES:
+        return None
+
+    if len(subs) == 1:
+        return subs[0]
+
+    return ("or", tuple(subs))
+
+
+def buildLiteralTrigramQuery(literal):
+    """
+    Return query for pages containing the string literal.
+    """
+    literal = foldText(literal)
+    return andQueries([literal[i:i + 3] for i in range(len(literal) - 2)])
+
+
+def _buildStringsQuery(strings):
+    """
+    Return query for pages containing at least one of the folded strings.
+    """
+    return orQueries([buildLiteralTrigramQuery(s) for s in sorted(strings)])
+
+
+
+# ---------- Regular expressions ----------
+
+_OP_LITERAL = _reConstants.LITERAL
+_OP_IN = _reConstants.IN
+_OP_BRANCH = _reConstants.BRANCH
+_OP_SUBPATTERN = _reConstants.SUBPATTERN
+_OPS_REPEAT = tuple(op for op in (_reConstants.MAX_REPEAT,
+        _reConstants.MIN_REPEAT,
+        getattr(_reConstants, "POSSESSIVE_REPEAT", None)) if op is not None)
+_OP_ATOMIC_GROUP = getattr(_reConstants, "ATOMIC_GROUP", None)
+# Zero-width items which don't interrupt a sequence of literals
+_OPS_ZERO_WIDTH = (_reConstants.AT, _reConstants.ASSERT,
+        _reConstants.ASSERT_NOT)
+
+
+def _infoToQuery(info):
+    """
+    Convert the (exactSet, query) info of a subpattern to a query.
+    """
+    exactSet, query = info
+    if exactSet is None:
+        return query
+
+    return andQueries([query, _buildStringsQuery(exactSet)])
+
+
+def _analyzeSetItems(items):
+    """
+    Return set of folded characters matched by the items of an IN opcode
+    (a character class) or None if there are too many or unknown ones.
+    """
+    result = set()
+    for op, av in items:
+        if op is _OP_LITERAL:
+            result.add(_foldChar(chr(av)))
+        elif op is _reConstants.RANGE:
+            if av[1] - av[0] >= _MAX_EXACT_SET:
+                return None
+            for code in range(av[0], av[1] + 1):
+                result.add(_foldChar(chr(code)))
+        else:
+            # NEGATE, CATEGORY, ...
+            return None
+
+        if len(result) > _MAX_EXACT_SET:
+            return None
+
+    return result
+
+
+def _analyzeItem(op, av):
+    """
+    Return tuple (exactSet, query) for a single regex parse item where
+    exactSet is the set of all folded strings the item can match or None if
+    unknown and query is the trigram query for the item.
+    """
+    if op is _OP_LITERAL:
+        return ({_foldChar(chr(av))}, None)
+
+    if op is _OP_IN:
+        return (_analyzeSetItems(av), None)
+
+    if op in _OPS_ZERO_WIDTH:
+        return ({""}, None)
+
+    if op is _OP_SUBPATTERN:
+        # av is (group, addFlags, delFlags, subpattern), older Pythons
+        # only have (group, subpattern)
+        return _analyzeSequence(av[-1])
+
+    if op is _OP_ATOMIC_GROUP:
+        return _analyzeSequence(av)
+
+    if op is _OP_BRANCH:
+        infos = [_analyzeSequence(alt) for alt in av[1]]
+        if all(info[0] is not None for info in infos):
+            exactSet = set()
+            for info in infos:
+                exactSet |= info[0]
+            if len(exactSet) <= _MAX_EXACT_SET:
+                return (exactSet, orQueries([info[1] for info in infos]))
+
+        return (None, orQueries([_infoToQuery(info) for info in infos]))
+
+    if op in _OPS_REPEAT:
+        minCount, maxCount, sub = av
+        if minCount == 0:
+            return (None, None)
+
+        info = _analyzeSequence(sub)
+        if minCount == 1 and maxCount == 1:
+            return info
+
+        return (None, _infoToQuery(info))
+
+    # ANY, NOT_LITERAL, CATEGORY, GROUPREF, ...
+    return (None, None)
+
+
+def _analyzeSequence(items):
+    """
+    Return tuple (exactSet, query) for a sequence of regex parse items.
+    """
+    exactSet = {""}
+    queries = []
+
+    for op, av in items:
+        itemExactSet, itemQuery = _analyzeItem(op, av)
+        queries.append(itemQuery)
+
+        if exactSet is not None and itemExactSet is not None and \
+                len(exactSet) * len(itemExactSet) <= _MAX_EXACT_SET:
+            exactSet = set(a + b for a in exactSet for b in itemExactSet)
+        else:
+            # Sequence of known strings ends here, start new one
+            if exactSet is not None:
+                queries.append(_buildStringsQuery(exactSet))
+            exactSet = itemExactSet
+
+    return (exactSet, andQueries(queries))
+
+
+def buildRegexTrigramQuery(rePattern):
+    """
+    Return query for pages which may contain a match of the compiled
+    regular expression rePattern or None if all pages must be tested.
+    """
+    try:
+        parsed = _reParser.parse(rePattern.pattern, rePattern.flags)
+    except Exception:
+        return None
+
+    return _infoToQuery(_analyzeSequence(parsed))
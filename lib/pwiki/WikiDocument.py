@@ -7,6 +7,7 @@
 from weakref import WeakValueDictionary
 import os, os.path, time, shutil, traceback, configparser
 # from collections import deque
+from collections import OrderedDict
 
 import re
 
@@ -24,7 +25,7 @@ from . import ParseUtilities
 from . import StringOps
 from .StringOps import mbcsDec, re_sub_escape, pathEnc, pathDec, \
         unescapeWithRe, strToBool, pathnameFromUrl, urlFromPathname, \
-        relativeFilePath, getFileSignatureBlock
+        relativeFilePath, getFileSignatureBlock, getFileSignatureBlockFromStat
 from .DocPages import DocPage, WikiPage, FunctionalPage, AliasWikiPage
 # from ..timeView.Versioning import VersionOverview
 
@@ -37,12 +38,27 @@ from .SearchAndReplace import SearchReplaceOperation
 
 from . import SpellChecker
 from . import Trashcan
+from . import ParallelRebuild
+from . import DbProfiler
+from . import PageFileChanges
+from .PageAstCache import PageAstCache
+from .ExportFragmentCache import ExportFragmentCache
+from .LinkGraph import LinkGraph
 
 from .wikidata import DbBackendUtils, FileStorage
 
 # Some functions import parts of the whoosh library
 
 
+# Number of pages processed by rebuildWiki() per database commit
+REBUILD_PAGES_PER_COMMIT = 100
+
+# Name of the database file of the file storage index in the data directory
+FILE_STORAGE_INDEX_NAME = "filestorage_index.sli"
+
+# Maximum number of results kept by findSearchFragment()
+SEARCH_FRAGMENT_CACHE_SIZE = 1000
+
 
 _openDocuments = {}  # Dictionary {<path to data dir>: <WikiDocument>}
 
@@ -254,30 +270,466 @@ class WikiDataSynchronizedFunction:
 #             print traceback.print_stack()
 #             print 
 
+        profStart = DbProfiler.startTimer()
         with self.proxyAccessLock:
 #         self.proxy.accessLockStackTrace = traceback.extract_stack()
+            if profStart is not None:
+                profLocked = time.perf_counter()
+            try:
+                return self.callFunction(*args, **kwargs)
+            finally:
+                if self.proxy.transactionDepth == 0:
+                    self.proxy.updateReadersUsable()
+                if profStart is not None:
+                    DbProfiler.profiler.addWikiDataCall(
+                            self.callFunction.__name__, profStart, profLocked)
+
+
+class WikiDataReaderFunction:
+    """
+    Synchronized function for a method of WikiData.READER_METHODS. If another
+    thread holds the lock (e.g. the background updater while writing),
+    the method is called on a reader of the WikiData instead of waiting.
+    """
+    def __init__(self, proxy, lock, function):
+        self.proxy = proxy
+        self.proxyAccessLock = lock
+        self.callFunction = function
+        self.name = function.__name__
+
+    def __call__(self, *args, **kwargs):
+        profStart = DbProfiler.startTimer()
+        if not self.proxyAccessLock.acquire(False):
+            wikiData = self.proxy.wikiData
+            reader = None
+            if self.proxy.readersUsable:
+                reader = wikiData.acquireReader()
+
+            if reader is not None:
+                try:
+                    result = getattr(reader, self.name)(*args, **kwargs)
+                    if profStart is not None:
+                        DbProfiler.profiler.addWikiDataCall(self.name,
+                                profStart)
+                    return result
+                except DbReadAccessError:
+                    # E.g. prepared statements of the reader are outdated
+                    # by a schema change, retry with the main connection
+                    wikiData.releaseReader(reader, discard=True)
+                    reader = None
+                finally:
+                    if reader is not None:
+                        wikiData.releaseReader(reader)
+
+            self.proxyAccessLock.acquire()
+
+        if profStart is not None:
+            profLocked = time.perf_counter()
+        try:
             return self.callFunction(*args, **kwargs)
+        finally:
+            self.proxyAccessLock.release()
+            if profStart is not None:
+                DbProfiler.profiler.addWikiDataCall(self.name, profStart,
+                        profLocked)
+
+
+class WikiDataSnapshotFunction:
+    """
+    Synchronized function for a method of WikiData.SNAPSHOT_METHODS. If
+    another thread holds the lock, the method is called on the link term
+    snapshot published last by the WikiData instead of waiting.
+    """
+    def __init__(self, proxy, lock, function):
+        self.proxy = proxy
+        self.proxyAccessLock = lock
+        self.callFunction = function
+        self.name = function.__name__
+
+    def __call__(self, *args, **kwargs):
+        profStart = DbProfiler.startTimer()
+        if not self.proxyAccessLock.acquire(False):
+            snapshot = self.proxy.wikiData.getLinkTermSnapshot()
+            if snapshot is not None:
+                result = getattr(snapshot, self.name)(*args, **kwargs)
+                if profStart is not None:
+                    DbProfiler.profiler.addWikiDataCall(self.name, profStart)
+                return result
+
+            self.proxyAccessLock.acquire()
+
+        if profStart is not None:
+            profLocked = time.perf_counter()
+        try:
+            return self.callFunction(*args, **kwargs)
+        finally:
+            self.proxyAccessLock.release()
+            if profStart is not None:
+                DbProfiler.profiler.addWikiDataCall(self.name, profStart,
+                        profLocked)
+
 
 
 class WikiDataSynchronizedProxy:
     """
     Proxy class for synchronized access to a WikiData instance
+
+    If the WikiData supports readers (see compact_sqlite WikiData),
+    its READER_METHODS don't wait for a lock held by another thread but
+    read committed data through a reader. This is only done as long as
+    there are no uncommitted changes other than those of the transaction
+    currently running, so a thread always sees the changes it made before.
+    Similarly its SNAPSHOT_METHODS use the last published link term snapshot
+    while another thread holds the lock.
     """
     def __init__(self, wikiData):
         self.wikiData = wikiData
         self.proxyAccessLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
+        # Nesting depth of WikiDataTransaction objects of the thread holding
+        # the proxyAccessLock
+        self.transactionDepth = 0
+        self.readerMethods = getattr(wikiData, "READER_METHODS", frozenset())
+        self.snapshotMethods = getattr(wikiData, "SNAPSHOT_METHODS",
+                frozenset())
+        # True if readers can be used, see updateReadersUsable()
+        self.readersUsable = False
 #         self.accessLockStackTrace = None
 
 
     def __getattr__(self, attr):
-        result = WikiDataSynchronizedFunction(self, self.proxyAccessLock,
-                getattr(self.wikiData, attr))
+        if attr in self.readerMethods:
+            result = WikiDataReaderFunction(self, self.proxyAccessLock,
+                    getattr(self.wikiData, attr))
+        elif attr in self.snapshotMethods:
+            result = WikiDataSnapshotFunction(self, self.proxyAccessLock,
+                    getattr(self.wikiData, attr))
+        else:
+            result = WikiDataSynchronizedFunction(self, self.proxyAccessLock,
+                    getattr(self.wikiData, attr))
                 
         self.__dict__[attr] = result
 
         return result
 
 
+    def updateReadersUsable(self):
+        """
+        Readers can be used if there are no uncommitted changes. Must be
+        called with proxyAccessLock held when no transaction is running.
+        """
+        if self.readerMethods:
+            self.readersUsable = not self.wikiData.hasUncommittedChanges()
+
+
+
+class WikiDataTransaction:
+    """
+    Groups write operations on the WikiData of a wiki document into one
+    transaction which is committed at its end. The access lock of the
+    synchronized WikiData proxy is held meanwhile so other threads can't
+    interleave their operations or see intermediate states.
+
+    Transactions can be nested in the same thread, only the outermost one
+    commits. A long running outermost transaction (e.g. a rebuild) can call
+    checkpoint() after each processed page to commit after pagesPerCommit
+    pages and to let other threads access the WikiData in between.
+
+    The outermost transaction commits pending changes of earlier operations
+    when it begins. If it is left by an exception, its changes since the
+    last commit are rolled back and the pages they touched stay dirty (see
+    WikiDocument._afterWikiDataRollback()).
+
+    Can be used as context manager or by calling begin() and end().
+    """
+    def __init__(self, wikiDocument, pagesPerCommit=0):
+        self.wikiDocument = wikiDocument
+        self.pagesPerCommit = pagesPerCommit
+        self.pendingPages = 0
+        self.wikiData = None
+
+
+    def begin(self):
+        wikiData = self.wikiDocument.getWikiData()
+        wikiData.proxyAccessLock.acquire()
+        wikiData.transactionDepth += 1
+
+        if wikiData.transactionDepth == 1:
+            # Commit changes of finished operations so a rollback only
+            # discards changes of this transaction and other threads can
+            # read through readers while it is running
+            try:
+                wikiData.commit()
+                wikiData.updateReadersUsable()
+            except:
+                wikiData.transactionDepth -= 1
+                wikiData.proxyAccessLock.release()
+                raise
+
+        self.wikiData = wikiData
+        self.pendingPages = 0
+
+
+    def checkpoint(self):
+        """
+        Called after a page was processed. Commits if pagesPerCommit pages
+        are pending and this is the outermost transaction.
+        """
+        wikiData = self.wikiData
+        if wikiData is None or self.pagesPerCommit <= 0:
+            return
+
+        self.pendingPages += 1
+        if self.pendingPages < self.pagesPerCommit or \
+                wikiData.transactionDepth != 1:
+            return
+
+        self.pendingPages = 0
+        wikiData.commit()
+
+        # Give other threads the chance to access the WikiData
+        self.wikiData = None
+        wikiData.transactionDepth = 0
+        wikiData.proxyAccessLock.release()
+
+        wikiData.proxyAccessLock.acquire()
+        wikiData.transactionDepth = 1
+        self.wikiData = wikiData
+
+
+    def end(self, commit=True):
+        wikiData = self.wikiData
+        if wikiData is None:
+            return
+
+        self.wikiData = None
+        try:
+            wikiData.transactionDepth -= 1
+            if wikiData.transactionDepth == 0:
+                if commit:
+                    wikiData.commit()
+                else:
+                    try:
+                        wikiData.rollback()
+                    finally:
+                        self.wikiDocument._afterWikiDataRollback()
+        finally:
+            if wikiData.transactionDepth == 0:
+                wikiData.updateReadersUsable()
+            wikiData.proxyAccessLock.release()
+
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.end(commit=excType is None)
+
+
+
+class SearchIndexBatchWriter:
+    """
+    Collects updates of the whoosh search index and writes them in batches.
+    Opening a writer and committing for each single page creates a new
+    index segment (and maybe a merge) per page which is very slow for
+    large wikis.
+
+    Documents are buffered together with the liveTextPlaceHold of their page
+    and written by flush() into one writer with one commit. Flushing happens
+    when the configured number of documents is pending, when the oldest
+    pending document is older than the configured delay or when the
+    index queue of the update executor reached a queued flush job.
+
+    Documents whose page text changed in between are not written but
+    queued again.
+    """
+    def __init__(self, wikiDocument):
+        self.wikiDocument = wikiDocument
+        self.bufferLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
+        # Serializes flushes against each other
+        self.flushLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
+
+        # Dictionary {unifName: (docPage, liveTextPlaceHold, content, modTimestamp)}
+        self.pendingDocs = {}
+        # Set of unified names to delete from index
+        self.pendingDeletes = set()
+        self.firstPendingTime = None
+        self.flushQueued = False
+
+
+    def getPendingCount(self):
+        with self.bufferLock:
+            return len(self.pendingDocs) + len(self.pendingDeletes)
+
+
+    def _isBudgetExceeded(self):
+        """
+        Called inside of bufferLock. Returns True if pending documents
+        should be flushed now.
+        """
+        if self.firstPendingTime is None:
+            return False
+
+        wikiConfig = self.wikiDocument.getWikiConfig()
+
+        maxDocs = wikiConfig.getint("main", "indexSearch_batchCommit_docCount",
+                200)
+        if self.getPendingCount() >= maxDocs:
+            return True
+
+        maxDelay = wikiConfig.getfloat("main",
+                "indexSearch_batchCommit_maxDelay", 10.0)
+
+        return time.time() - self.firstPendingTime >= maxDelay
+
+
+    def _afterAdded(self):
+        """
+        Called after a document was added or removed.
+        Either flushes directly or ensures that a flush job is queued.
+        """
+        with self.bufferLock:
+            if self.firstPendingTime is None:
+                self.firstPendingTime = time.time()
+
+            if self._isBudgetExceeded():
+                doFlush = True
+            else:
+                doFlush = False
+                self._queueFlush()
+
+        if doFlush:
+            self.flush()
+
+
+    def _queueFlush(self):
+        """
+        Called inside of bufferLock. Queue a flush job into the index queue
+        of the update executor if none is queued yet.
+        """
+        if self.flushQueued:
+            return
+
+        updateExecutor = self.wikiDocument.getUpdateExecutor()
+        if updateExecutor.getDeque(self.wikiDocument.UEQUEUE_INDEX) is None:
+            # Executor was ended, requeueFlush() is called when it starts again
+            return
+
+        self.flushQueued = True
+        updateExecutor.executeAsync(self.wikiDocument.UEQUEUE_INDEX,
+                self._queuedFlush)
+
+
+    def requeueFlush(self):
+        """
+        Must be called after the index queue of the update executor was
+        cleared or the executor was ended, as this drops the queued flush
+        job. Queues a new one if documents are pending.
+        """
+        with self.bufferLock:
+            self.flushQueued = False
+            if self.firstPendingTime is not None:
+                self._queueFlush()
+
+
+    def addDocument(self, docPage, liveTextPlaceHold, content, modTimestamp):
+        """
+        Queue content of docPage (based on liveTextPlaceHold) for indexing.
+        A previously queued document for the same page is replaced.
+        """
+        unifName = docPage.getUnifiedPageName()
+
+        with self.bufferLock:
+            self.pendingDeletes.discard(unifName)
+            self.pendingDocs[unifName] = (docPage, liveTextPlaceHold, content,
+                    modTimestamp)
+
+        self._afterAdded()
+
+
+    def removeDocument(self, unifName):
+        """
+        Queue removal of the document with unified name  unifName
+        from index. A pending document for the same name is dropped.
+        """
+        with self.bufferLock:
+            self.pendingDocs.pop(unifName, None)
+            self.pendingDeletes.add(unifName)
+
+        self._afterAdded()
+
+
+    def discard(self):
+        """
+        Drop all pending documents without writing them (e.g. because the
+        index is removed).
+        """
+        with self.bufferLock:
+            self.pendingDocs = {}
+            self.pendingDeletes = set()
+            self.firstPendingTime = None
+            # A queued flush job may have been dropped with the documents
+            self.flushQueued = False
+
+
+    def _queuedFlush(self):
+        with self.bufferLock:
+            self.flushQueued = False
+
+        self.flush()
+
+
+    def flush(self):
+        """
+        Write all pending documents with one writer and commit.
+        Stale documents are queued again for indexing.
+        """
+        with self.flushLock:
+            with self.bufferLock:
+                pendingDocs = self.pendingDocs
+                pendingDeletes = self.pendingDeletes
+                self.pendingDocs = {}
+                self.pendingDeletes = set()
+                self.firstPendingTime = None
+
+            if len(pendingDocs) == 0 and len(pendingDeletes) == 0:
+                return
+
+            searchIdx = self.wikiDocument.getSearchIndex()
+            if searchIdx is None:
+                # Index was disabled meanwhile
+                return
+
+            written = []
+            stalePages = []
+
+            writer = searchIdx.writer(timeout=Consts.DEADBLOCKTIMEOUT)
+            try:
+                for unifName in pendingDeletes:
+                    writer.delete_by_term("unifName", unifName)
+
+                for docPage, liveTextPlaceHold, content, modTimestamp in \
+                        pendingDocs.values():
+                    if docPage.writeIntoSearchIndexWriter(writer,
+                            liveTextPlaceHold, content, modTimestamp):
+                        written.append((docPage, liveTextPlaceHold))
+                    else:
+                        stalePages.append(docPage)
+            except:
+                writer.cancel()
+                raise
+
+            writer.commit()
+
+            for docPage, liveTextPlaceHold in written:
+                if not docPage.markSearchIndexCommitted(liveTextPlaceHold):
+                    stalePages.append(docPage)
+
+        for docPage in stalePages:
+            self.wikiDocument.getUpdateExecutor().executeAsyncWithThreadStop(
+                    self.wikiDocument.UEQUEUE_INDEX, docPage.putIntoSearchIndex)
+
+
 class WikiDocument(MiscEventSourceMixin):
     """
     Wraps a WikiData object and provides services independent
@@ -405,6 +857,21 @@ class WikiDocument(MiscEventSourceMixin):
 
         self.baseWikiData = wikiData
         self.autoLinkRelaxInfo = None
+        # True if wiki words changed since autoLinkRelaxInfo was built
+        self.autoLinkRelaxInfoOutdated = False
+        self.autoLinkRelaxInfoLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
+        # Incremented each time wiki words may have been added or removed
+        self.wikiWordsChangeCount = 0
+
+        # OrderedDict {(unaliased wiki word, search fragment, start pos):
+        # found tuple} from least to most recently used,
+        # see findSearchFragment()
+        self.searchFragmentCache = OrderedDict()
+        # Dictionary {unaliased wiki word: set of keys of searchFragmentCache}
+        self.searchFragmentCacheKeys = {}
+        # Incremented each time cached results are dropped
+        self.searchFragmentCacheDropCount = 0
+        self.searchFragmentCacheLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
 
         # Set of camelcase words not to see as wiki words
         self.ccWordBlacklist = None
@@ -436,6 +903,15 @@ class WikiDocument(MiscEventSourceMixin):
         self.dbtype = wikidhName
 
         self.whooshIndex = None
+        self.searchIndexBatchWriter = SearchIndexBatchWriter(self)
+        self.pageAstCache = PageAstCache(self)
+        self.exportFragmentCache = ExportFragmentCache(self)
+        self.linkGraph = LinkGraph(self)
+        # Created by connect()
+        self.fileStorage = None
+        # PageFileWatcher if the data directory is watched for changed
+        # page files, created by connect()
+        self.pageFileWatcher = None
 
         self.refCount = 1
 
@@ -464,6 +940,9 @@ class WikiDocument(MiscEventSourceMixin):
             traceback.print_exc()
             writeException = e
 
+        if not self.recoveryMode:
+            self._updateReaderCountMax()
+
         # TODO: Only initialize on demand
         self.onlineSpellCheckerSession = None
         
@@ -477,7 +956,8 @@ class WikiDocument(MiscEventSourceMixin):
         fileStorDir = os.path.join(os.path.dirname(self.getWikiConfigPath()),
                 "files")
 
-        self.fileStorage = FileStorage.FileStorage(self, fileStorDir)
+        self.fileStorage = FileStorage.FileStorage(self, fileStorDir,
+                os.path.join(self.getDataDir(), FILE_STORAGE_INDEX_NAME))
 
         # Set file storage according to configuration
         fs = self.fileStorage
@@ -543,6 +1023,9 @@ class WikiDocument(MiscEventSourceMixin):
 
         self.updateExecutor.start()
 
+        if not self.recoveryMode:
+            self._updatePageFileWatcher()
+
 
 #         if not self.isReadOnlyEffect():
 #             words = self.getWikiData().getWikiPageNamesForMetaDataState(0)
@@ -608,8 +1091,14 @@ class WikiDocument(MiscEventSourceMixin):
 
         if self.refCount <= 0:
             self.refCount = 0
+            self.stopPageFileWatcher()
             self.updateExecutor.end(hardEnd=True)  # TODO Inform user as this may take some time
 
+            try:
+                self.searchIndexBatchWriter.flush()
+            except:
+                traceback.print_exc()
+
             if self.trashcan is not None:
                 self.trashcan.writeOverview()
                 self.trashcan.close()
@@ -631,6 +1120,11 @@ class WikiDocument(MiscEventSourceMixin):
                 self.wikiData.close()
                 self.wikiData = None
                 self.baseWikiData = None
+
+            self.linkGraph.invalidate()
+
+            if self.fileStorage is not None:
+                self.fileStorage.close()
             
             if self.whooshIndex is not None:
                 self.whooshIndex.close()
@@ -655,6 +1149,30 @@ class WikiDocument(MiscEventSourceMixin):
     def getWikiData(self):
         return self.wikiData
 
+    def wikiDataTransaction(self, pagesPerCommit=0):
+        """
+        Return a new WikiDataTransaction to group write operations on the
+        WikiData into one transaction.
+        """
+        return WikiDataTransaction(self, pagesPerCommit)
+
+    def _afterWikiDataRollback(self):
+        """
+        Called by WikiDataTransaction after a rollback. The link graph was
+        patched with the discarded changes and pages may have cleared their
+        dirty flag for them.
+        """
+        self.linkGraph.invalidate()
+
+        wikiData = self.getWikiData()
+        finalState = self.getFinalMetaDataState()
+        for wikiPage in list(self.wikiPageDict.values()):
+            if not isinstance(wikiPage, WikiPage) or \
+                    wikiPage.updateDirtySince is not None:
+                continue
+            if wikiData.getMetaDataState(wikiPage.getWikiWord()) < finalState:
+                wikiPage.updateDirtySince = time.time()
+
     def getFileStorage(self):
         return self.fileStorage
 
@@ -915,6 +1433,22 @@ class WikiDocument(MiscEventSourceMixin):
 
     def getUpdateExecutor(self):
         return self.updateExecutor
+
+    def getSearchIndexBatchWriter(self):
+        return self.searchIndexBatchWriter
+
+    def getPageAstCache(self):
+        return self.pageAstCache
+
+    def getExportFragmentCache(self):
+        return self.exportFragmentCache
+
+    def getLinkGraph(self):
+        """
+        Return the in-memory LinkGraph which answers parent and child
+        queries without accessing the database.
+        """
+        return self.linkGraph
         
         
     def pushDirtyMetaDataUpdate(self):
@@ -929,6 +1463,7 @@ class WikiDocument(MiscEventSourceMixin):
             self.updateExecutor.prepare()
             self.updateExecutor.clearDeque(1)
             self.updateExecutor.clearDeque(self.UEQUEUE_INDEX)
+            self.searchIndexBatchWriter.requeueFlush()
             if not strToBool(self.getWikiData().getDbSettingsValue(
                     "syncWikiWordMatchtermsUpToDate", "0")):
 
@@ -1318,11 +1853,24 @@ class WikiDocument(MiscEventSourceMixin):
 
 
     def checkFileSignatureForAllWikiPageNamesAndMarkDirty(self):
+        """
+        Checks file signatures of all pages and marks meta-data of pages
+        with changed files as dirty.
+        
+        If the WikiData supports it, all signatures are read at once and the
+        files are checked without holding the lock of the WikiData, only the
+        changes are written in one transaction.
+        """
         if self.isReadOnlyEffect():
             return True  # TODO Error message?
 
         wikiData = self.getWikiData()
-        
+
+        if wikiData.checkCapability("bulkFileSignatures") is not None:
+            self._checkFileSignaturesAndMarkDirty(
+                    wikiData.getFileSignaturesForAllWikiPageNames())
+            return
+
         proxyAccessLock = getattr(wikiData, "proxyAccessLock", None)
         if proxyAccessLock is not None:
             proxyAccessLock.acquire()
@@ -1341,10 +1889,138 @@ class WikiDocument(MiscEventSourceMixin):
                 proxyAccessLock.release()
 
 
+    def _checkFileSignaturesAndMarkDirty(self, entries):
+        """
+        Checks file signatures for  entries  as returned by
+        WikiData.getFileSignaturesForAllWikiPageNames() and marks meta-data
+        of pages with changed files as dirty.
+        
+        Returns tuple (updated, missing) with the list of words marked
+        dirty and the list of words without a file.
+        """
+        changed, missing = PageFileChanges.findChangedFileSignatures(
+                self.getDataDir(), entries, self.getFileSignatureBlockFromStat)
+
+        if missing and not self.getWikiConfig().getboolean("main",
+                "wikiPageFiles_gracefulOutsideAddAndRemove", True):
+            raise WikiFileNotFoundException(
+                    _("Wiki page not found (bad path information) for word: %s") %
+                    missing[0])
+
+        if not changed:
+            return [], missing
+
+        with self.wikiDataTransaction():
+            updated = self.getWikiData().updateChangedFileSignatures(changed)
+
+            for word in updated:
+                wikiPage = self.wikiPageDict.get(word)
+                if wikiPage is not None:
+                    wikiPage.markTextChanged()
+
+        return updated, missing
+
+
+    def _updateReaderCountMax(self):
+        """
+        Set the number of readers for concurrent reads of the WikiData
+        according to the "concurrentReads_connectionCount" option.
+        """
+        wikiData = self.getWikiData()
+        if wikiData.checkCapability("concurrentReads") is not None:
+            wikiData.setReaderCountMax(self.getWikiConfig().getint("main",
+                    "concurrentReads_connectionCount", 0))
+
+
+    def _updatePageFileWatcher(self):
+        """
+        Start or stop watching the data directory according to the
+        "wikiPageFiles_watchDataDir" option.
+        """
+        if not self.isReadOnlyEffect() and \
+                self.getWikiData().checkCapability("bulkFileSignatures") \
+                is not None and self.getWikiConfig().getboolean("main",
+                "wikiPageFiles_watchDataDir", False):
+            self.startPageFileWatcher()
+        else:
+            self.stopPageFileWatcher()
+
+
+    def startPageFileWatcher(self):
+        """
+        Start watching the data directory for page files changed outside of
+        WikidPad. Does nothing if the needed "watchdog" package isn't
+        installed.
+        """
+        if self.pageFileWatcher is not None:
+            return
+
+        watcher = PageFileChanges.PageFileWatcher(self.getDataDir(),
+                self.getWikiConfig().get("main", "db_pagefile_suffix", ".wiki"),
+                self._queueWatchedPageFileUpdate)
+
+        try:
+            if watcher.start():
+                self.pageFileWatcher = watcher
+        except Exception:
+            # E.g. limit of watched directories reached
+            traceback.print_exc()
+
+
+    def stopPageFileWatcher(self):
+        if self.pageFileWatcher is None:
+            return
+
+        self.pageFileWatcher.stop()
+        self.pageFileWatcher = None
+
+
+    def _queueWatchedPageFileUpdate(self, fileNames):
+        """
+        Called by the PageFileWatcher in its own thread.
+        """
+        self.updateExecutor.executeAsync(0, self._runWatchedPageFileUpdate,
+                fileNames)
+
+
+    def _runWatchedPageFileUpdate(self, fileNames):
+        """
+        Called in the update executor for a set of names of page files
+        reported as changed by the PageFileWatcher.
+        """
+        if not self.connected or self.isReadOnlyEffect():
+            return
+
+        wikiData = self.getWikiData()
+        normNames = frozenset(os.path.normcase(name) for name in fileNames)
+        entries = [entry for entry in
+                wikiData.getFileSignaturesForAllWikiPageNames()
+                if os.path.normcase(entry[1]) in normNames]
+
+        updated, missing = self._checkFileSignaturesAndMarkDirty(entries)
+
+        knownNames = frozenset(os.path.normcase(entry[1]) for entry in entries)
+        added = [name for name in fileNames
+                if os.path.normcase(name) not in knownNames and
+                os.path.isfile(StringOps.longPathEnc(os.path.join(self.getDataDir(),
+                name)))]
+
+        if added or missing:
+            wikiData.refreshWikiPageLinkTerms(deleteFully=True)
+            self.linkGraph.invalidate()
+        elif not updated:
+            return
+
+        self.pushDirtyMetaDataUpdate()
+
+
 
     def initiateFullUpdate(self, progresshandler):
         self.updateExecutor.end(hardEnd=True)
+        # Pages still waiting for index are reindexed by the rebuild
+        self.searchIndexBatchWriter.discard()
         self.getWikiData().refreshWikiPageLinkTerms()
+        self.linkGraph.invalidate()
 
         # get all of the wikiWords
         wikiWords = self.getWikiData().getAllDefinedWikiPageNames()
@@ -1382,6 +2058,7 @@ class WikiDocument(MiscEventSourceMixin):
         finally:
             progresshandler.close()
             self.updateExecutor.start()
+            self.searchIndexBatchWriter.requeueFlush()
 
 
     def initiateExtWikiFileUpdate(self):
@@ -1397,10 +2074,12 @@ class WikiDocument(MiscEventSourceMixin):
         self.updateExecutor.end(hardEnd=True)
         try:
             self.getWikiData().refreshWikiPageLinkTerms(deleteFully=True)
+            self.linkGraph.invalidate()
             self.checkFileSignatureForAllWikiPageNamesAndMarkDirty()
             self.pushDirtyMetaDataUpdate()
         finally:
             self.updateExecutor.start()
+            self.searchIndexBatchWriter.requeueFlush()
 
 
     def rebuildWiki(self, progresshandler, onlyDirty):
@@ -1411,7 +2090,10 @@ class WikiDocument(MiscEventSourceMixin):
             PersonalWikiFrame.GuiProgressHandler protocol
         """
         self.updateExecutor.end(hardEnd=True)
+        # Pages still waiting for index are reindexed by the rebuild
+        self.searchIndexBatchWriter.discard()
         self.getWikiData().refreshWikiPageLinkTerms()
+        self.linkGraph.invalidate()
 
         if onlyDirty:
 #             wikiWords = self.getWikiData().getWikiPageNamesForMetaDataState(
@@ -1434,6 +2116,10 @@ class WikiDocument(MiscEventSourceMixin):
 
         self.fireMiscEventKeys(("begin foreground update", "begin update"))
 
+        # Group the database changes of many pages into one commit
+        transaction = self.wikiDataTransaction(REBUILD_PAGES_PER_COMMIT)
+        transaction.begin()
+
         # re-save all of the pages
         try:
             step = 1
@@ -1442,6 +2128,7 @@ class WikiDocument(MiscEventSourceMixin):
                 self.getWikiData().setDbSettingsValue(
                         "syncWikiWordMatchtermsUpToDate", "0")
                 self.getWikiData().clearCacheTables()
+                self.linkGraph.invalidate()
             
             # Step one: update search terms which are generated synchronously.
             #   Some of them are essential to find anything or to follow
@@ -1459,55 +2146,76 @@ class WikiDocument(MiscEventSourceMixin):
                 wikiPage.refreshSyncUpdateMatchTerms()
                 
                 step += 1
+                transaction.checkpoint()
 
             self.getWikiData().setDbSettingsValue(
                     "syncWikiWordMatchtermsUpToDate", "1")
 
-            # Step two: update attributes. There may be attributes which
-            #   define how the rest has to be interpreted, therefore they
-            #   must be processed first.
-            for wikiWord in wikiWords:
-                progresshandler.update(step, _("Update attributes of %s") %
-                        wikiWord)
-                try:
-                    wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
-                    if isinstance(wikiPage, AliasWikiPage):
-                        # This should never be an alias page, so fetch the
-                        # real underlying page
-                        # This can only happen if there is a real page with
-                        # the same name as an alias
-                        wikiPage = WikiPage(self, wikiWord)
+            processCount = ParallelRebuild.getProcessCount()
+            parallelStep = None
 
-                    wikiPage.refreshSyncUpdateMatchTerms()
-                    pageAst = wikiPage.getLivePageAst()
+            if processCount > 1 and \
+                    len(wikiWords) >= ParallelRebuild.MIN_PAGE_COUNT:
+                # Step two and three: parse pages in worker processes,
+                # update attributes and then the rest of the syntax
+                try:
+                    parallelStep = ParallelRebuild.rebuildMetaData(self,
+                            wikiWords, progresshandler, step, processCount,
+                            transaction)
+                except Exception:
+                    # Fall back to parsing in this process
+                    traceback.print_exc()
 
-                    self.getWikiData().refreshFileSignatureForWikiPageName(
+            if parallelStep is not None:
+                step = parallelStep
+            else:
+                # Step two: update attributes. There may be attributes which
+                #   define how the rest has to be interpreted, therefore they
+                #   must be processed first.
+                for wikiWord in wikiWords:
+                    progresshandler.update(step, _("Update attributes of %s") %
                             wikiWord)
-                    wikiPage.refreshAttributesFromPageAst(pageAst)
-                except:
-                    traceback.print_exc()
+                    try:
+                        wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
+                        if isinstance(wikiPage, AliasWikiPage):
+                            # This should never be an alias page, so fetch the
+                            # real underlying page
+                            # This can only happen if there is a real page with
+                            # the same name as an alias
+                            wikiPage = WikiPage(self, wikiWord)
 
-                step += 1
+                        wikiPage.refreshSyncUpdateMatchTerms()
+                        pageAst = wikiPage.getLivePageAst()
 
-            # Step three: update the rest of the syntax (todos, relations)
-            for wikiWord in wikiWords:
-                progresshandler.update(step, _("Update syntax of %s") % wikiWord)
-                try:
-                    wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
-                    if isinstance(wikiPage, AliasWikiPage):
-                        # This should never be an alias page, so fetch the
-                        # real underlying page
-                        # This can only happen if there is a real page with
-                        # the same name as an alias
-                        wikiPage = WikiPage(self, wikiWord)
+                        self.getWikiData().refreshFileSignatureForWikiPageName(
+                                wikiWord)
+                        wikiPage.refreshAttributesFromPageAst(pageAst)
+                    except:
+                        traceback.print_exc()
 
-                    pageAst = wikiPage.getLivePageAst()
+                    step += 1
+                    transaction.checkpoint()
 
-                    wikiPage.refreshMainDbCacheFromPageAst(pageAst)
-                except:
-                    traceback.print_exc()
+                # Step three: update the rest of the syntax (todos, relations)
+                for wikiWord in wikiWords:
+                    progresshandler.update(step, _("Update syntax of %s") % wikiWord)
+                    try:
+                        wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
+                        if isinstance(wikiPage, AliasWikiPage):
+                            # This should never be an alias page, so fetch the
+                            # real underlying page
+                            # This can only happen if there is a real page with
+                            # the same name as an alias
+                            wikiPage = WikiPage(self, wikiWord)
 
-                step += 1
+                        pageAst = wikiPage.getLivePageAst()
+
+                        wikiPage.refreshMainDbCacheFromPageAst(pageAst)
+                    except:
+                        traceback.print_exc()
+
+                    step += 1
+                    transaction.checkpoint()
             
             if self.isSearchIndexEnabled():
                 # Step four: update index
@@ -1545,12 +2253,31 @@ class WikiDocument(MiscEventSourceMixin):
             self.getWikiData().cleanupAfterRebuild(progresshandler)
 
             self.pushDirtyMetaDataUpdate()
-
+            transaction.end()
         finally:
+            # Rolls back the changes since the last commit on error
+            transaction.end(commit=False)
             progresshandler.close()
             self.fireMiscEventKeys(("end foreground update",))
             self.updateExecutor.start()
+            self.searchIndexBatchWriter.requeueFlush()
+
+
+
+    def getWikiPageForRebuild(self, wikiWord):
+        """
+        Return the WikiPage for a page name to rebuild without caching it.
+        This is never an alias page.
+        """
+        wikiPage = self._getWikiPageNoErrorNoCache(wikiWord)
+        if isinstance(wikiPage, AliasWikiPage):
+            # This should never be an alias page, so fetch the
+            # real underlying page
+            # This can only happen if there is a real page with
+            # the same name as an alias
+            wikiPage = WikiPage(self, wikiWord)
 
+        return wikiPage
 
 
     def getWikiWordSubpages(self, wikiWord):
@@ -1826,6 +2553,7 @@ class WikiDocument(MiscEventSourceMixin):
 
         assert not wordPage.getDirty()[0]  # page should already be saved before renaming!
         wikiData.renameWord(word, toWord)
+        self.linkGraph.renameWikiPage(word, toWord)
         wordPage.renameVersionData(toWord)
         wordPage.queueRemoveFromSearchIndex()
         wordPage.informRenamedWikiPage(toWord)
@@ -1985,19 +2713,113 @@ class WikiDocument(MiscEventSourceMixin):
         return ans
 
 
+    def getWikiWordsChangeCount(self):
+        """
+        Returns a counter which changes each time wiki words may have been
+        added, renamed or deleted or the aliases of a page changed. Can be
+        used to detect if information depending on existence of wiki words
+        must be rebuilt.
+        """
+        return self.wikiWordsChangeCount
+
+
+    def findSearchFragment(self, wikiWord, searchFragment, searchCharStartPos=0):
+        """
+        Search for  searchFragment  (as plain text) in the live text of the
+        wiki page  wikiWord  beginning at  searchCharStartPos .
+        Returns tuple (<first char>, <after last char>) of the found text or
+        (None, None) if not found or the page doesn't exist.
+
+        Results are cached so editors and exporters can call this for each
+        link with a search fragment without loading and scanning the target
+        page again. The results of a page are dropped by
+        dropSearchFragmentResults() when its live text changes and when it
+        is deleted or renamed.
+        """
+        wikiPageName = self.getWikiPageNameForLinkTerm(wikiWord)
+        if wikiPageName is None:
+            return (None, None)
+
+        key = (wikiPageName, searchFragment, searchCharStartPos)
+
+        with self.searchFragmentCacheLock:
+            found = self.searchFragmentCache.get(key)
+            if found is not None:
+                self.searchFragmentCache.move_to_end(key)
+                return found
+
+            dropCount = self.searchFragmentCacheDropCount
+
+        try:
+            targetPage = self.getWikiPage(wikiPageName)
+        except WikiWordNotFoundException:
+            return (None, None)
+
+        searchOp = SearchReplaceOperation()
+        searchOp.wildCard = "no"
+        searchOp.searchStr = searchFragment
+
+        found = searchOp.searchDocPageAndText(targetPage,
+                targetPage.getLiveText(), searchCharStartPos)[:2]
+
+        with self.searchFragmentCacheLock:
+            if dropCount != self.searchFragmentCacheDropCount:
+                # Text may have changed while searching
+                return found
+
+            self.searchFragmentCache[key] = found
+            self.searchFragmentCacheKeys.setdefault(wikiPageName, set())\
+                    .add(key)
+
+            while len(self.searchFragmentCache) > SEARCH_FRAGMENT_CACHE_SIZE:
+                oldKey = self.searchFragmentCache.popitem(last=False)[0]
+                oldKeys = self.searchFragmentCacheKeys[oldKey[0]]
+                oldKeys.discard(oldKey)
+                if not oldKeys:
+                    del self.searchFragmentCacheKeys[oldKey[0]]
+
+        return found
+
+
+    def dropSearchFragmentResults(self, wikiPageName):
+        """
+        Drop the results of findSearchFragment() for page  wikiPageName.
+        Called when the live text of the page may have changed.
+        """
+        with self.searchFragmentCacheLock:
+            self.searchFragmentCacheDropCount += 1
+            for key in self.searchFragmentCacheKeys.pop(wikiPageName, ()):
+                del self.searchFragmentCache[key]
+
+
     # TODO threadstop?
     def getAutoLinkRelaxInfo(self):
         """
         Get regular expressions and words used to operate autoLink function in 
         "relax" mode
         """
-        if self.autoLinkRelaxInfo is None:
+        with self.autoLinkRelaxInfoLock:
+            if self.autoLinkRelaxInfo is not None and \
+                    not self.autoLinkRelaxInfoOutdated:
+                return self.autoLinkRelaxInfo
+
             langHelper = GetApp().createWikiLanguageHelper(
                     self.getWikiDefaultWikiLanguage())
 
-            self.autoLinkRelaxInfo = langHelper.buildAutoLinkRelaxInfo(self)
+            self.autoLinkRelaxInfoOutdated = False
+            # Must be taken before reading the wiki words so no change
+            # is lost
+            changedLinkTerms = self.linkGraph.takeChangedLinkTerms()
+            if self.autoLinkRelaxInfo is not None and \
+                    hasattr(langHelper, "updateAutoLinkRelaxInfo"):
+                # Only apply the changes of the wiki words
+                self.autoLinkRelaxInfo = langHelper.updateAutoLinkRelaxInfo(
+                        self, self.autoLinkRelaxInfo, changedLinkTerms)
+            else:
+                self.autoLinkRelaxInfo = langHelper.buildAutoLinkRelaxInfo(
+                        self)
 
-        return self.autoLinkRelaxInfo
+            return self.autoLinkRelaxInfo
 
 
     _TITLE_SPLIT_RE1 = re.compile(r"([" + StringOps.UPPERCASE + r"]+)" + 
@@ -2145,6 +2967,7 @@ class WikiDocument(MiscEventSourceMixin):
         
         p = self.updateExecutor.pause(wait=True)
         self.updateExecutor.clearDeque(self.UEQUEUE_INDEX)
+        self.searchIndexBatchWriter.discard()
         self.updateExecutor.start()
 
         if self.whooshIndex is not None:
@@ -2489,6 +3312,7 @@ class WikiDocument(MiscEventSourceMixin):
         self.wikiData = None
         self.baseWikiData = None
         self.autoLinkRelaxInfo = None
+        self.linkGraph.invalidate()
 
         wikiDataFactory, createWikiDbFunc = DbBackendUtils.getHandler(self.dbtype)
         if wikiDataFactory is None:
@@ -2502,6 +3326,8 @@ class WikiDocument(MiscEventSourceMixin):
         self.wikiData = WikiDataSynchronizedProxy(self.baseWikiData)
         
         self.wikiData.connect()
+        if not self.recoveryMode:
+            self._updateReaderCountMax()
         
         # Reset flag so program automatically tries reconnecting on next error
         self.autoReconnectTriedFlag = False
@@ -2540,6 +3366,25 @@ class WikiDocument(MiscEventSourceMixin):
         if wikiData.checkCapability("filePerPage") is not None:
             wikiData.setEditorTextMode(wikiConfig.getboolean("main",
                     "editor_text_mode", False))
+
+        if not self.recoveryMode:
+            self._updatePageFileWatcher()
+
+        if wikiData.checkCapability("fullTextIndex") is not None:
+            try:
+                wikiData.setFullTextIndexEnabled(wikiConfig.getboolean("main",
+                        "fullTextIndex_enabled", False))
+            except DbWriteAccessError:
+                traceback.print_exc()
+
+        if wikiData.checkCapability("trigramIndex") is not None:
+            try:
+                wikiData.setTrigramIndexEnabled(wikiConfig.getboolean("main",
+                        "trigramIndex_enabled", False))
+            except DbWriteAccessError:
+                traceback.print_exc()
+
+        self._updateReaderCountMax()
         
         wikiData.setResolveCaseNormed(wikiConfig.getboolean("main",
                     "wiki_linkResolve_caseInsensitive", False))
@@ -2557,7 +3402,20 @@ class WikiDocument(MiscEventSourceMixin):
         It calls StringOps.getFileSignatureBlock with the time coarsening
         given in the wiki options.
         """
-        
+        return getFileSignatureBlock(filename,
+                self._getFileSignatureTimeCoarsening())
+
+
+    def getFileSignatureBlockFromStat(self, statinfo):
+        """
+        Returns the file signature block for the result  statinfo  of
+        os.stat() with the time coarsening given in the wiki options.
+        """
+        return getFileSignatureBlockFromStat(statinfo,
+                self._getFileSignatureTimeCoarsening())
+
+
+    def _getFileSignatureTimeCoarsening(self):
         coarseStr = self.getWikiConfig().get("main",
                 "fileSignature_timeCoarsening", "0")
 
@@ -2569,7 +3427,7 @@ class WikiDocument(MiscEventSourceMixin):
         except ValueError:
             coarsening = None
             
-        return getFileSignatureBlock(filename, coarsening)
+        return coarsening
 
 
 
@@ -2598,20 +3456,29 @@ class WikiDocument(MiscEventSourceMixin):
 
             if miscevt.has_key_in(("deleted wiki page", "renamed wiki page",
                     "pseudo-deleted wiki page")):
-                self.autoLinkRelaxInfo = None
+                self.dropSearchFragmentResults(
+                        miscevt.getSource().getWikiWord())
+                if "newWord" in miscevt:
+                    self.dropSearchFragmentResults(miscevt.get("newWord"))
+                self.autoLinkRelaxInfoOutdated = True
+                self.wikiWordsChangeCount += 1
                 attrs = miscevt.getProps().copy()
                 attrs["wikiPage"] = miscevt.getSource()
                 self.fireMiscEventProps(attrs)
                 miscevt.getSource().queueRemoveFromSearchIndex()  # TODO: Check for possible failure!!!
                 # TODO: Add new on rename
             elif "updated wiki page" in miscevt:
-                self.autoLinkRelaxInfo = None
+                if "changed link terms" in miscevt:
+                    # Aliases of the page were added or removed
+                    self.autoLinkRelaxInfoOutdated = True
+                    self.wikiWordsChangeCount += 1
                 attrs = miscevt.getProps().copy()
                 attrs["wikiPage"] = miscevt.getSource()
                 self.fireMiscEventProps(attrs)
 #                 miscevt.getSource().putIntoSearchIndex()
             elif "saving new wiki page" in miscevt:            
-                self.autoLinkRelaxInfo = None
+                self.autoLinkRelaxInfoOutdated = True
+                self.wikiWordsChangeCount += 1
 #                 miscevt.getSource().putIntoSearchIndex()
             elif "reread cc blacklist needed" in miscevt:
                 self._updateCcWordBlacklist()
@@ -75,7 +75,7 @@ __author__ = "Paul McGuire <ptmcg@users.sourceforge.net>"
 
 import string
 from weakref import ref as wkref
-import copy, time
+import copy, time, pickle
 import sys
 import warnings
 import re
@@ -102,7 +102,7 @@ __all__ = [
 'punc8bit', 'pythonStyleComment', 'quotedString', 'removeQuotes', 'replaceHTMLEntity',
 'replaceWith', 'restOfLine', 'sglQuotedString', 'srange', 'stringEnd',
 'stringStart', 'traceParseAction', 'unicodeString', 'upcaseTokens', 'withAttribute',
-'indentedBlock', 'originalTextFor',
+'indentedBlock', 'originalTextFor', 'parseRepetitionFrom', 'cloneShiftedSyntaxNodes',
 ]
 
 
@@ -403,6 +403,15 @@ class NonTerminalNode(SyntaxNode):
         else:
             return "NonTerminalNode" + repr((self.pos, self.strLength, self.name, self.sub))
 
+    # Compact state for pickling (used by the page AST cache)
+    def __getstate__(self):
+        return (self.pos, self.name, self.sub, self.__dict__ or None)
+
+    def __setstate__(self, state):
+        self.pos, self.name, self.sub, attrs = state
+        if attrs:
+            self.__dict__.update(attrs)
+
     def isTerminal(self):
         return False
 
@@ -727,6 +736,16 @@ class TerminalNode(SyntaxNode):
         else:
             return "TerminalNode" + repr((self.pos, self.strLength, self.name, self.text))
 
+    # Compact state for pickling (used by the page AST cache)
+    def __getstate__(self):
+        return (self.pos, self.strLength, self.name, self.text,
+                self.__dict__ or None)
+
+    def __setstate__(self, state):
+        self.pos, self.strLength, self.name, self.text, attrs = state
+        if attrs:
+            self.__dict__.update(attrs)
+
     def isTerminal(self):
         return True
 
@@ -820,6 +839,70 @@ def buildSyntaxNode(sub, pos=-1, name=None):
 
 
 
+def parseRepetitionFrom(itemElement, instring, loc, state, syncLocs=(),
+        itemStarts=None):
+    """
+    Parse  instring  beginning at  loc  with repetitions of  itemElement  like
+    ZeroOrMore(itemElement) would do, but stop at the first location which
+    is in  syncLocs . This allows to reparse only a part of a text which
+    was parsed before.
+    state  is a ParsingState as created by  ParserElement.buildStartState() .
+    If  itemStarts  is a list, the start location of each parsed item is
+    appended to it.
+
+    Returns tuple (loc, tokens, synced) where  tokens  is a list of syntax
+    nodes and  synced  is True if parsing stopped at a location of  syncLocs .
+    """
+    tokens = []
+    while True:
+        if loc in syncLocs:
+            return loc, tokens, True
+
+        state.threadstop.testValidThread()
+        try:
+            tmpLoc, tmpTokens = itemElement._parse(instring, loc, state,
+                    callPreParse=False)
+        except (ParseException, IndexError):
+            break
+
+        if tmpLoc == -1 or tmpLoc == loc:
+            break
+
+        if itemStarts is not None:
+            itemStarts.append(loc)
+        loc = tmpLoc
+        tokens += tmpTokens
+
+    return loc, tokens, False
+
+
+def cloneShiftedSyntaxNodes(nodes, delta):
+    """
+    Return deep copies of the syntax nodes in list  nodes  with the positions
+    of all nodes (and the nodes they refer to by attributes) moved by  delta .
+    """
+    nodes = pickle.loads(pickle.dumps(nodes, pickle.HIGHEST_PROTOCOL))
+
+    seen = set()
+    stack = list(nodes)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, SyntaxNode):
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            item.pos += delta
+            if not item.isTerminal():
+                stack += item.sub
+            stack += item.__dict__.values()
+        elif isinstance(item, (list, tuple)):
+            stack += item
+        elif isinstance(item, dict):
+            stack += item.values()
+
+    return nodes
+
+
 def col (loc,strg):
     """Returns current column within a string, counting newlines as line separators.
    The first column is number 1.
@@ -280,9 +280,11 @@ class WikiWordNode(AbstractNode):
         else:
             ancestors = frozenset()  # Empty
 
-        relations = wikiPage.getChildRelationships(
+        relations = wikiPage.getWikiDocument().getLinkGraph()\
+                .getChildRelationships(
+                wikiPage.getNonAliasPage().getWikiWord(),
                 existingonly=self.treeCtrl.getHideUndefined(),
-                selfreference=False, withFields=())
+                selfreference=False)
 
         if len(relations) > len(ancestors):
             return True
@@ -1170,12 +1172,12 @@ class MainParentlessNode(AbstractNode):
         return style
 
     def isVisible(self):
-        wikiData = self.treeCtrl.pWiki.getWikiData()
-        return len(wikiData.getParentlessWikiWords()) > 0  # TODO Test if root is single element
+        linkGraph = self.treeCtrl.pWiki.getWikiDocument().getLinkGraph()
+        return len(linkGraph.getParentlessWikiWords()) > 0  # TODO Test if root is single element
 
     def listChildren(self):
-        wikiData = self.treeCtrl.pWiki.getWikiData()
-        words = wikiData.getParentlessWikiWords()
+        linkGraph = self.treeCtrl.pWiki.getWikiDocument().getLinkGraph()
+        words = linkGraph.getParentlessWikiWords()
         self.treeCtrl.pWiki.getCollator().sort(words)
         
         return [WikiWordSearchNode(self.treeCtrl, self, w) for w in words
@@ -1208,12 +1210,12 @@ class MainUndefinedNode(AbstractNode):
         return style
 
     def isVisible(self):
-        wikiData = self.treeCtrl.pWiki.getWikiData()
-        return len(wikiData.getUndefinedWords()) > 0
+        linkGraph = self.treeCtrl.pWiki.getWikiDocument().getLinkGraph()
+        return len(linkGraph.getUndefinedWords()) > 0
 
     def listChildren(self):
-        wikiData = self.treeCtrl.pWiki.getWikiData()
-        words = wikiData.getUndefinedWords()
+        linkGraph = self.treeCtrl.pWiki.getWikiDocument().getLinkGraph()
+        words = linkGraph.getUndefinedWords()
         self.treeCtrl.pWiki.getCollator().sort(words)
 
         return [WikiWordSearchNode(self.treeCtrl, self, w) for w in words
@@ -2057,8 +2059,8 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
 #             doexpand = True
 
 
-        wikiData = self.pWiki.getWikiData()
         wikiDoc = self.pWiki.getWikiDocument()
+        linkGraph = wikiDoc.getLinkGraph()
 
         # If parent is defined use that as default node
         if not startFromRoot:
@@ -2084,7 +2086,7 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
             parent_list = []
 
 #             parentWikiWord = canonical_parent[0][2]
-            parents = self.pWiki.getWikiData().getParentRelationships(wikiWord)
+            parents = linkGraph.getParentRelationships(wikiWord)
 
             newWikiWord = wikiWord
 
@@ -2106,8 +2108,7 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
                     parentWikiWord = None
 
                 if parentWikiWord:
-                    parents = self.pWiki.getWikiData()\
-                                .getParentRelationships(newWikiWord)
+                    parents = linkGraph.getParentRelationships(newWikiWord)
                 else:
                     break
 
@@ -2119,7 +2120,7 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
                 if rootNode is not None and rootNode.IsOk() and \
                         self.GetItemData(rootNode).representsFamilyWikiWord():
                     rootWikiWord = self.GetItemData(rootNode).getWikiWord()
-                    crumbs = wikiData.findBestPathFromWordToWord(
+                    crumbs = linkGraph.findBestPathFromWordToWord(
                                         parent_list.pop(), rootWikiWord)
 
                     # If parent path cannot be found resort to default path
@@ -2145,7 +2146,7 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
                 self.GetItemData(currentNode).representsFamilyWikiWord():
             # check for path from wikiWord to currently selected tree node            
             currentWikiWord = self.GetItemData(currentNode).getWikiWord() #self.getNodeValue(currentNode)
-            crumbs = wikiData.findBestPathFromWordToWord(wikiWord, currentWikiWord)
+            crumbs = linkGraph.findBestPathFromWordToWord(wikiWord, currentWikiWord)
            
             if crumbs and self.pWiki.getConfig().getboolean("main",
                     "tree_no_cycles"):
@@ -2164,7 +2165,7 @@ class WikiTreeCtrl(customtreectrl.CustomTreeCtrl):          # wxTreeCtrl):
             if currentNode is not None and currentNode.IsOk() and \
                     self.GetItemData(currentNode).representsFamilyWikiWord():
                 currentWikiWord = self.GetItemData(currentNode).getWikiWord()
-                crumbs = wikiData.findBestPathFromWordToWord(wikiWord,
+                crumbs = linkGraph.findBestPathFromWordToWord(wikiWord,
                         currentWikiWord)
 
 
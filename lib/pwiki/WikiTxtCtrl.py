@@ -35,7 +35,7 @@ from .SystemInfo import isOSX, isLinux, isWindows
 
 from .ParseUtilities import getFootnoteAnchorDict
 
-from .EnhancedScintillaControl import StyleCollector
+from .EnhancedScintillaControl import StyleCollector, ByteOffsetTable
 
 from .SearchableScintillaControl import SearchableScintillaControl
 
@@ -894,6 +894,22 @@ class WikiTxtCtrl(SearchableScintillaControl):
         super(WikiTxtCtrl, self).showSelectionByCharPos(start, end)
 
 
+    def getVisibleCharRange(self):
+        """
+        Returns tuple (start, end) of character positions of the text
+        currently shown in the editor window.
+        """
+        firstVisible = self.GetFirstVisibleLine()
+        firstLine = self.DocLineFromVisible(firstVisible)
+        lastLine = self.DocLineFromVisible(firstVisible + self.LinesOnScreen())
+
+        startBytePos = self.PositionFromLine(firstLine)
+        endBytePos = self.GetLineEndPosition(lastLine)
+
+        start = self.getCharPosBySciPos(startBytePos)
+        return (start, start + len(self.GetTextRange(startBytePos, endBytePos)))
+
+
     def applyBasicSciSettings(self):
         """
         Apply the basic Scintilla settings which are resetted to wrong
@@ -1441,10 +1457,15 @@ class WikiTxtCtrl(SearchableScintillaControl):
         text = docPage.getLiveText()  # self.GetText()
         textlen = len(text)
 
+        if evt is None:
+            # Restyling was requested explicitly, e.g. after options changed
+            # -> styling can't be based on previous one
+            self.stylingBase = None
+
         t = self.stylingThreadHolder.getThread()
         if t is not None:
             self.stylingThreadHolder.setThread(None)
-            self.clearStylingCache()
+            self.clearStylingCache(keepStylingBase=True)
 
 
         if textlen < self.presenter.getConfig().getint(
@@ -1470,7 +1491,8 @@ class WikiTxtCtrl(SearchableScintillaControl):
 
             delay = self.presenter.getConfig().getfloat(
                     "main", "async_highlight_delay")
-            t = threading.Thread(None, self.buildStyling, args = (text, delay, sth))
+            t = threading.Thread(None, self.buildStyling, args = (text, delay, sth,
+                    self.getVisibleCharRange()))
             sth.setThread(t)
             t.setDaemon(True)
             t.start()
@@ -1754,10 +1776,14 @@ class WikiTxtCtrl(SearchableScintillaControl):
         self.SetFocus()
 
 
-    def clearStylingCache(self):
+    def clearStylingCache(self, keepStylingBase=False):
         self.stylebytes = None
         self.foldingseq = None
 #         self.pageAst = None
+        if not keepStylingBase:
+            # Tuple (text, pageAst, stylebytes, wikiWordsChangeCount) of last
+            # completed syntax styling, see processTokensIncremental()
+            self.stylingBase = None
 
 
     def stopStcStyler(self):
@@ -1787,7 +1813,35 @@ class WikiTxtCtrl(SearchableScintillaControl):
 
 
 
-    def buildStyling(self, text, delay, threadstop=DUMBTHREADSTOP):
+    def storeVisibleStyling(self, text, pageAst, visibleCharRange, byteOffsets,
+            threadstop):
+        """
+        Build and apply styling of the visible part of the text only. Used
+        in asynchronous mode to show the user something before styling of
+        the whole text is finished.
+        """
+        startCharPos, endCharPos, stylebytes = self.processTokensInRange(
+                text, pageAst, visibleCharRange[0], visibleCharRange[1],
+                threadstop, byteOffsets)
+
+        threadstop.testValidThread()
+
+        startBytePos = byteOffsets.getBytePos(startCharPos)
+        textByteLen = byteOffsets.byteLength
+
+        def putStyle():
+            self.applyStylingRange(stylebytes, startBytePos, textByteLen,
+                    styleMask=0x1f)
+
+        wx.CallAfter(putStyle)
+
+
+    def buildStyling(self, text, delay, threadstop=DUMBTHREADSTOP,
+            visibleCharRange=None):
+        """
+        visibleCharRange -- If not None, tuple (start, end) of the visible
+            text. In asynchronous mode this part is styled first.
+        """
         try:
             if delay != 0 and not threadstop is DUMBTHREADSTOP:
                 sleep(delay)
@@ -1797,6 +1851,9 @@ class WikiTxtCtrl(SearchableScintillaControl):
             if docPage is None:
                 return
 
+            wikiWordsChangeCount = self.presenter.getWikiDocument()\
+                    .getWikiWordsChangeCount()
+
             for i in range(20):   # "while True" is too dangerous
                 formatDetails = docPage.getFormatDetails()
                 pageAst = docPage.getLivePageAst(threadstop=threadstop)
@@ -1806,10 +1863,26 @@ class WikiTxtCtrl(SearchableScintillaControl):
                 else:
                     break
 
-            stylebytes = self.processTokens(text, pageAst, threadstop)
+            # Used by all conversions from character to byte positions
+            byteOffsets = ByteOffsetTable(text)
+
+            stylebytes = self.processTokensIncremental(text, pageAst,
+                    wikiWordsChangeCount, threadstop, byteOffsets)
+
+            if stylebytes is None:
+                if visibleCharRange is not None and \
+                        not threadstop is DUMBTHREADSTOP:
+                    self.storeVisibleStyling(text, pageAst, visibleCharRange,
+                            byteOffsets, threadstop)
+
+                stylebytes = self.processTokens(text, pageAst, threadstop,
+                        byteOffsets)
 
             threadstop.testValidThread()
 
+            self.stylingBase = (text, pageAst, stylebytes,
+                    wikiWordsChangeCount)
+
             if self.getFoldingActive():
                 foldingseq = self.processFolding(pageAst, threadstop)
             else:
@@ -1830,16 +1903,11 @@ class WikiTxtCtrl(SearchableScintillaControl):
                 threadstop.testValidThread()
 
                 if scTokens.getChildrenCount() > 0:
-                    spellStyleBytes = self.processSpellCheckTokens(text, scTokens,
-                            threadstop)
+                    stylebytes = self.mergeSpellCheckTokens(stylebytes,
+                            scTokens, byteOffsets, threadstop)
 
                     threadstop.testValidThread()
 
-                    # TODO: Faster? How?
-                    stylebytes = "".join([chr(a | b)
-                            for a, b in zip(stylebytes, spellStyleBytes)]
-                            ).encode("raw_unicode_escape")
-
                     self.storeStylingAndAst(stylebytes, None, styleMask=0xff)
                 else:
                     self.storeStylingAndAst(stylebytes, None, styleMask=0xff)
@@ -1873,8 +1941,9 @@ class WikiTxtCtrl(SearchableScintillaControl):
             (None, None) if not present
             (-1, -1) if search is not applicable
         """
-        unaliasedTarget = self.presenter.getWikiDocument()\
-                .getWikiPageNameForLinkTermOrAsIs(linkNode.wikiWord)
+        wikiDocument = self.presenter.getWikiDocument()
+        unaliasedTarget = wikiDocument.getWikiPageNameForLinkTermOrAsIs(
+                linkNode.wikiWord)
 
         docPage = self.getLoadedDocPage()
         if docPage is None:
@@ -1894,16 +1963,9 @@ class WikiTxtCtrl(SearchableScintillaControl):
         if searchfrag is None:
             return (-1, -1)
 
-        searchOp = SearchReplaceOperation()
-        searchOp.wildCard = "no"
-        searchOp.searchStr = searchfrag
-
-        targetPage = self.presenter.getWikiDocument().getWikiPage(
-                linkNode.wikiWord)
+        # Results are cached by the wiki document
+        found = wikiDocument.findSearchFragment(linkNode.wikiWord, searchfrag)
 
-        found = searchOp.searchDocPageAndText(targetPage,
-                targetPage.getLiveText(), 0)
-        
         # Python 2.6, None and int were comparable, in Py 3.4 no more
         if found[0] is None:
             return found
@@ -1911,20 +1973,172 @@ class WikiTxtCtrl(SearchableScintillaControl):
         if found[0] >= forbiddenSearchfragHit[0] and \
                 found[0] < forbiddenSearchfragHit[1]:
             # Searchfrag found its own link -> search after link
-            found = searchOp.searchDocPageAndText(targetPage,
-                    targetPage.getLiveText(), forbiddenSearchfragHit[1])
+            found = wikiDocument.findSearchFragment(linkNode.wikiWord,
+                    searchfrag, forbiddenSearchfragHit[1])
 
         return found
 
 
 
-    def processTokens(self, text, pageAst, threadstop):
+    def processTokens(self, text, pageAst, threadstop, byteOffsets=None):
+        """
+        byteOffsets -- ByteOffsetTable of text or None to build a new one
+        """
+        if byteOffsets is None:
+            byteOffsets = ByteOffsetTable(text)
+
+        return self._processTokenNodes(pageAst.iterFlatNamed(), byteOffsets,
+                0, len(text), threadstop)
+
+
+    def processTokensInRange(self, text, pageAst, startCharPos, endCharPos,
+            threadstop, byteOffsets=None):
+        """
+        Build style bytes only for the top-level AST nodes intersecting the
+        range startCharPos to endCharPos of the text.
+        Returns tuple (start, end, stylebytes) where start and end are the
+        character positions of the styled text, expanded to node boundaries.
+        """
+        nodes = [node for node in pageAst.iterFlatNamed()
+                if node.pos + node.strLength > startCharPos and
+                node.pos < endCharPos]
+
+        if len(nodes) > 0:
+            startCharPos = min(startCharPos, nodes[0].pos)
+            endCharPos = max(endCharPos,
+                    nodes[-1].pos + nodes[-1].strLength)
+
+        endCharPos = min(endCharPos, len(text))
+
+        if byteOffsets is None:
+            byteOffsets = ByteOffsetTable(text)
+
+        return (startCharPos, endCharPos, self._processTokenNodes(nodes,
+                byteOffsets, startCharPos, endCharPos, threadstop))
+
+
+    @staticmethod
+    def _isSameStyledNode(node1, node2, delta):
+        """
+        Returns True if AST node2 (with all its children) gets the same
+        styling as node1 moved by  delta  characters. The text covered by
+        both nodes must be identical.
+        """
+        if delta == 0 and node1 is node2:
+            return True
+
+        stack = [(node1, node2)]
+        while stack:
+            node1, node2 = stack.pop()
+            if node1.name != node2.name or \
+                    node1.pos + delta != node2.pos or \
+                    node1.strLength != node2.strLength or \
+                    node1.isTerminal() != node2.isTerminal():
+                return False
+
+            for attr in ("wikiWord", "searchFragment", "level"):
+                if getattr(node1, attr, None) != getattr(node2, attr, None):
+                    return False
+
+            if not node1.isTerminal():
+                if len(node1.sub) != len(node2.sub):
+                    return False
+                stack += zip(node1.sub, node2.sub)
+
+        return True
+
+
+    def processTokensIncremental(self, text, pageAst, wikiWordsChangeCount,
+            threadstop, byteOffsets=None):
+        """
+        Build style bytes for text by reusing the style bytes of the last
+        completed styling (self.stylingBase) for all top-level AST nodes
+        which didn't change. Only nodes intersecting the changed region of
+        the text are styled again.
+        Returns None if there is no usable previous styling.
+        """
+        stylingBase = self.stylingBase
+        if stylingBase is None or self.optionColorizeSearchFragments:
+            # Result of fragment search depends on content of other pages
+            return None
+
+        oldText, oldPageAst, oldStylebytes, oldChangeCount = stylingBase
+        if oldChangeCount != wikiWordsChangeCount:
+            # Existence of wiki words (their color) may have changed
+            return None
+
+        changeStart = StringOps.commonPrefixLength(oldText, text)
+        suffixLength = StringOps.commonSuffixLength(oldText, text,
+                min(len(oldText), len(text)) - changeStart)
+        newChangeEnd = len(text) - suffixLength
+        delta = len(text) - len(oldText)
+
+        oldNodes = list(oldPageAst.iterFlatNamed())
+        newNodes = list(pageAst.iterFlatNamed())
+        maxSame = min(len(oldNodes), len(newNodes))
+
+        # Number of unchanged nodes at start
+        headCount = 0
+        while headCount < maxSame:
+            node = newNodes[headCount]
+            if node.pos + node.strLength > changeStart or \
+                    not self._isSameStyledNode(oldNodes[headCount], node, 0):
+                break
+            headCount += 1
+
+        threadstop.testValidThread()
+
+        # Number of unchanged (but probably moved) nodes at end
+        tailCount = 0
+        while tailCount < maxSame - headCount:
+            node = newNodes[-1 - tailCount]
+            if node.pos < newChangeEnd or \
+                    not self._isSameStyledNode(oldNodes[-1 - tailCount], node,
+                    delta):
+                break
+            tailCount += 1
+
+        threadstop.testValidThread()
+
+        if headCount == 0:
+            startCharPos = 0
+        else:
+            startCharPos = newNodes[headCount - 1].pos + \
+                    newNodes[headCount - 1].strLength
+
+        if tailCount == 0:
+            endCharPos = len(text)
+        else:
+            endCharPos = newNodes[-tailCount].pos
+
+        if byteOffsets is None:
+            byteOffsets = ByteOffsetTable(text)
+
+        midStylebytes = self._processTokenNodes(
+                newNodes[headCount:len(newNodes) - tailCount], byteOffsets,
+                startCharPos, endCharPos, threadstop)
+
+        headByteLen = byteOffsets.getBytePos(startCharPos)
+        tailByteLen = byteOffsets.byteLength - \
+                byteOffsets.getBytePos(endCharPos)
+
+        return oldStylebytes[:headByteLen] + midStylebytes + \
+                oldStylebytes[len(oldStylebytes) - tailByteLen:]
+
+
+    def _processTokenNodes(self, nodes, byteOffsets, startCharPos, endCharPos,
+            threadstop):
+        """
+        Returns style bytes for text[startCharPos:endCharPos] which is covered
+        by the top-level AST nodes in iterable  nodes . byteOffsets  is the
+        ByteOffsetTable of the text.
+        """
         wikiDoc = self.presenter.getWikiDocument()
-        stylebytes = StyleCollector(FormatTypes.Default,
-                text, self.bytelenSct)
+        stylebytes = StyleCollector(FormatTypes.Default, byteOffsets,
+                startCharPos, endCharPos)
 
-        def process(pageAst, stack):
-            for node in pageAst.iterFlatNamed():
+        def process(nodes, stack):
+            for node in nodes:
                 threadstop.testValidThread()
 
                 styleNo = WikiTxtCtrl._TOKEN_TO_STYLENO.get(node.name)
@@ -1961,12 +2175,12 @@ class WikiTxtCtrl(SearchableScintillaControl):
                     stylebytes.bindStyle(node.pos, node.strLength, styleNo)
 
                 elif node.name == "todoEntry":
-                    process(node, stack + ["todoEntry"])
+                    process(node.iterFlatNamed(), stack + ["todoEntry"])
                 elif node.name == "key" and "todoEntry" in stack:
                     stylebytes.bindStyle(node.pos, node.strLength,
                             FormatTypes.ToDo)
                 elif node.name == "value" and "todoEntry" in stack:
-                    process(node, stack[:])
+                    process(node.iterFlatNamed(), stack[:])
 
                 elif node.name == "heading":
                     if node.level < 5:
@@ -1981,20 +2195,32 @@ class WikiTxtCtrl(SearchableScintillaControl):
                         self.wikiLanguageHelper.getRecursiveStylingNodeNames() or \
                         (getattr(node, "helperRecursive", False) and \
                         not node.isTerminal()):
-                    process(node, stack[:])
+                    process(node.iterFlatNamed(), stack[:])
 
-        process(pageAst, [])
+        process(nodes, [])
         return stylebytes.value()
 
 
-    def processSpellCheckTokens(self, text, scTokens, threadstop):
-        stylebytes = StyleCollector(0, text, self.bytelenSct)
+    # Translation table to set the spell checker indicator in style bytes
+    _SPELL_CHECK_INDIC_TABLE = bytes(b | wx.stc.STC_INDIC2_MASK
+            for b in range(256))
+
+    def mergeSpellCheckTokens(self, stylebytes, scTokens, byteOffsets,
+            threadstop):
+        """
+        Returns copy of  stylebytes  with the indicator for unknown words
+        set at the position of each node in  scTokens .
+        """
+        stylebuffer = bytearray(stylebytes)
+        indicTable = self._SPELL_CHECK_INDIC_TABLE
+
         for node in scTokens:
             threadstop.testValidThread()
-            stylebytes.bindStyle(node.pos, node.strLength,
-                    wx.stc.STC_INDIC2_MASK)
+            start = byteOffsets.getBytePos(node.pos)
+            end = byteOffsets.getBytePos(node.pos + node.strLength)
+            stylebuffer[start:end] = stylebuffer[start:end].translate(indicTable)
 
-        return stylebytes.value()
+        return bytes(stylebuffer)
 
 
     def getFoldingNodeDict(self):
@@ -2109,6 +2335,19 @@ class WikiTxtCtrl(SearchableScintillaControl):
             self.StartStyling(0, styleMask)
             self.SetStyleBytes(len(stylebytes), stylebytes)
 
+    def applyStylingRange(self, stylebytes, startBytePos, textByteLen,
+            styleMask=0xff):
+        """
+        Apply style bytes to part of the text beginning at  startBytePos .
+        textByteLen  is the byte length of the whole text the styling was
+        built for.
+        """
+        if textByteLen == self.GetLength():
+            self.StartStyling(startBytePos, styleMask)
+            self.SetStyleBytes(len(stylebytes), stylebytes)
+            # Styling of the rest follows, so avoid further requests
+            self.stopStcStyler()
+
     def applyFolding(self, foldingseq):
         if foldingseq and self.getFoldingActive() and \
                 len(foldingseq) == self.GetLineCount():
@@ -6,6 +6,7 @@
 import re
 
 from . import SqliteThin3
+from . import DbProfiler
 
 
 # def def_bind_fctfinder(stmt, parno, data)
@@ -95,8 +96,12 @@ class Connection:
         """
         try:
             if self.statementCache.get(sql, None) is None:
+                if DbProfiler.isEnabled():
+                    DbProfiler.profiler.addStmtCacheAccess(False)
                 return [self.thinConn.prepare(sql), None]
             else:
+                if DbProfiler.isEnabled():
+                    DbProfiler.profiler.addStmtCacheAccess(True)
                 st = self.statementCache[sql]
                 self.statementCache[sql] = None
                 return st
@@ -113,7 +118,11 @@ class Connection:
         sql -- SQL-string used to prepare statement
         """
         try:
-            if (self.statementCache.get(sql, None) is None):
+            if sql.lstrip()[:6].lower() == "pragma":
+                # A pragma may change the schema (e.g. the journal mode)
+                # which expires the statement itself
+                stmt[0].close()
+            elif (self.statementCache.get(sql, None) is None):
                 stmt[0].reset()
                 self.statementCache[sql] = stmt
             else:
@@ -181,6 +190,15 @@ class Connection:
         except AttributeError:
             raise Error("Trying to access a closed connection")
 
+    def inTransaction(self):
+        """
+        Return True if a transaction is open (changes may not be committed yet)
+        """
+        try:
+            return not self.thinConn.get_autocommit()
+        except AttributeError:
+            raise Error("Trying to access a closed connection")
+
             
     def cursor(self):
         if self.thinConn is None:
@@ -323,9 +341,9 @@ class Cursor:
                             "create", "drop"):
                         self.conn.begin()
                 else:
-                    if cmd not in ("select", "begin", "commit", "rollback",
-                            "insert", "update", "delete", "replace", "create",
-                            "drop"):
+                    if cmd not in ("select", "with", "begin", "commit",
+                            "rollback", "insert", "update", "delete", "replace",
+                            "create", "drop"):
                         self.conn.commit()
             
             self.stmt = self.conn.prepare(sql)
@@ -385,12 +403,64 @@ class Cursor:
             raise Error("Trying to access a closed cursor")
 
 
-    def executemany(self, sql, seq_of_parameters, *params, **keywords):
+    def executemany(self, sql, seq_of_parameters, bindfct=None, **keywords):
         """
-        Simple implementation
+        Execute a data changing statement once for each parameter sequence
+        in seq_of_parameters. The statement is prepared only once and then
+        rebound and reset for each sequence. If a transaction is needed
+        it is begun once before the first row, so all rows are written
+        in the same transaction. Statements returning rows are not supported.
         """
-        for pars in seq_of_parameters:
-            self.execute(sql, pars, *params, **keywords)
+        self._reset()
+        
+        try:
+            if bindfct is None:
+                bindfct = self.conn.bindfct
+
+            cmd = sql.lstrip().split(" ",1)[0].lower()
+            
+            if not self.conn._autoCommit:
+                if self.conn.thinConn.get_autocommit():
+                    if cmd in ("insert", "update", "delete", "replace",
+                            "create", "drop"):
+                        self.conn.begin()
+                else:
+                    if cmd not in ("select", "with", "begin", "commit",
+                            "rollback", "insert", "update", "delete", "replace",
+                            "create", "drop"):
+                        self.conn.commit()
+
+            stmt = self.conn.prepare(sql)
+            rowcount = 0
+
+            try:
+                for pars in seq_of_parameters:
+                    if pars:
+                        stmt[0].bind_auto_multi(pars, fctfinder=bindfct)
+                    stmt[0].step()
+                    stmt[0].reset()
+                    rowcount += self.conn.thinConn.changes()
+            except Error:
+                # Reset returns the error of the failed step again, after
+                # that the statement is usable
+                try:
+                    stmt[0].reset()
+                except Error:
+                    pass
+                self.conn.putStmtBack(sql, stmt)
+                raise
+
+            self.conn.putStmtBack(sql, stmt)
+
+            # After schema change clear stmt cache            
+            if cmd in ("create", "drop", "vacuum", "pragma"):
+                self.conn.clearStmtCache()
+            elif cmd in ("insert", "update", "delete", "replace"):
+                # Set rowcount to number of affected rows
+                self.rowcount = rowcount
+
+        except AttributeError:
+            raise Error("Trying to access a closed cursor")
             
     def fetchone(self):
         """
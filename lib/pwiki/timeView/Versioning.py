@@ -2,7 +2,7 @@
 Processes versions of wiki pages.
 """
 
-import time, zlib, re
+import time, zlib, re, collections
 from calendar import timegm
 
 from ..rtlibRepl import minidom
@@ -27,6 +27,16 @@ from ..DocPages import AbstractWikiPage
 DAMAGED = object()
 
 
+# Maximum total size in bytes of reconstructed version contents cached
+# by each VersionOverview
+VERSION_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# The previous head version is stored completely instead of as reverse
+# diff if the reverse diffs depending on it would become larger than
+# this factor multiplied with its size
+CHECKPOINT_DIFF_SIZE_FACTOR = 1.0
+
+
 class VersionEntry:
     __slots__ = ("creationTimeStamp", "unifiedBasePageName", "description",
             "versionNumber", "contentDifferencing", "contentEncoding",
@@ -132,6 +142,12 @@ class VersionOverview(MiscEventSourceMixin):
         
         self.xmlNode = None
 
+        # LRU cache of reconstructed contents, maps version number to bytes
+        self.versionContentCache = collections.OrderedDict()
+        self.versionContentCacheSize = 0
+        # Maps version number to size of its reverse diff packet
+        self.revDiffPacketSizes = {}
+
 
     def getUnifiedName(self):
         return "versioning/overview/" + self.unifiedBasePageName
@@ -151,6 +167,8 @@ class VersionOverview(MiscEventSourceMixin):
         Read overview from bytestring content. Needed to handle multi-page text
         imports.
         """
+        self.clearVersionContentCache()
+
         if content is None:
             self.versionEntries = []
             self.maxVersionNumber = 0
@@ -318,6 +336,7 @@ class VersionOverview(MiscEventSourceMixin):
         self.basePage = None
         self.wikiDocument = None
         self.versionEntries = []
+        self.clearVersionContentCache()
 
 
     def isInvalid(self):
@@ -404,9 +423,59 @@ class VersionOverview(MiscEventSourceMixin):
 
         self.versionEntries = versionEntries
         self.maxVersionNumber = maxVersionNumber
+        self.clearVersionContentCache()
+
+
+    def clearVersionContentCache(self):
+        self.versionContentCache = collections.OrderedDict()
+        self.versionContentCacheSize = 0
+        self.revDiffPacketSizes = {}
+
+
+    def _getCachedVersionContent(self, versionNumber):
+        """
+        Return reconstructed content of version from cache or None.
+        """
+        content = self.versionContentCache.get(versionNumber)
+        if content is not None:
+            self.versionContentCache.move_to_end(versionNumber)
+
+        return content
+
+
+    def _cacheVersionContent(self, versionNumber, content):
+        """
+        Put reconstructed content of version into cache, remove least
+        recently used contents if cache becomes too large.
+        """
+        oldContent = self.versionContentCache.pop(versionNumber, None)
+        if oldContent is not None:
+            self.versionContentCacheSize -= len(oldContent)
+
+        if len(content) > VERSION_CACHE_MAX_BYTES:
+            return
+
+        self.versionContentCache[versionNumber] = content
+        self.versionContentCacheSize += len(content)
+
+        while self.versionContentCacheSize > VERSION_CACHE_MAX_BYTES:
+            oldContent = self.versionContentCache.popitem(last=False)[1]
+            self.versionContentCacheSize -= len(oldContent)
+
+
+    def _uncacheVersionContent(self, versionNumber):
+        oldContent = self.versionContentCache.pop(versionNumber, None)
+        if oldContent is not None:
+            self.versionContentCacheSize -= len(oldContent)
 
 
     def getVersionContentRaw(self, versionNumber):
+        """
+        Return content of version as bytes. Starting from the version,
+        newer versions are searched for one which is cached or stored
+        completely, then reverse diffs are applied back to the version.
+        Contents reconstructed on the way are cached.
+        """
         if len(self.versionEntries) == 0:
             raise InternalError("Tried to retrieve non-existing "
                     "version number %s from empty list." % versionNumber)
@@ -414,54 +483,79 @@ class VersionOverview(MiscEventSourceMixin):
         if versionNumber == -1:
             versionNumber = self.versionEntries[-1].versionNumber
 
-        base = None
-        workList = []
-        for i in range(len(self.versionEntries) - 1, -1, -1):
-            entry = self.versionEntries[i]
-            if entry.contentDifferencing == "complete":
-                workList = []
-                base = entry
-            else:
-                workList.append(entry)
+        content = self._getCachedVersionContent(versionNumber)
+        if content is not None:
+            return content
 
-            if entry.versionNumber == versionNumber:
+        for targetIdx in range(len(self.versionEntries) - 1, -1, -1):
+            if self.versionEntries[targetIdx].versionNumber == versionNumber:
                 break
         else:
             raise InternalError("Tried to retrieve non-existing "
                     "version number %s." % versionNumber)
 
-        if base is None:
+        for baseIdx in range(targetIdx, len(self.versionEntries)):
+            entry = self.versionEntries[baseIdx]
+            content = self._getCachedVersionContent(entry.versionNumber)
+            if content is not None:
+                break
+
+            if entry.contentDifferencing == "complete":
+                content = self.wikiDocument.retrieveDataBlock(
+                        entry.getUnifiedPageName(), default=DAMAGED)
+                if content is DAMAGED:
+                    raise VersioningException(_("Versioning data damaged"))
+                elif content is None:
+                    raise InternalError("Tried to retrieve non-existing "
+                            "packet for version number %s" % versionNumber)
+
+                content = self.decodeContent(content, entry.contentEncoding)
+                self._cacheVersionContent(entry.versionNumber, content)
+                break
+        else:
             raise InternalError("No base version found for getVersionContent(%s)" %
                     versionNumber)
 
-        unifName = "versioning/packet/versionNo/%s/%s" % (base.versionNumber,
-                self.unifiedBasePageName)
-
-        content = self.wikiDocument.retrieveDataBlock(unifName, default=DAMAGED)
-        if content is DAMAGED:
-            raise VersioningException(_("Versioning data damaged"))
-        elif content is None:
-            raise InternalError("Tried to retrieve non-existing "
-                    "packet for version number %s" % versionNumber)
-
-        content = self.decodeContent(content, entry.contentEncoding)
-
-        for entry in workList:
-            unifName = "versioning/packet/versionNo/%s/%s" % (entry.versionNumber,
-                    self.unifiedBasePageName)
-            packet = self.wikiDocument.retrieveDataBlock(unifName, default=None)
-            if content is DAMAGED:
+        for i in range(baseIdx - 1, targetIdx - 1, -1):
+            entry = self.versionEntries[i]
+            packet = self.wikiDocument.retrieveDataBlock(
+                    entry.getUnifiedPageName(), default=DAMAGED)
+            if packet is DAMAGED:
                 raise VersioningException(_("Versioning data damaged"))
-            elif content is None:
+            elif packet is None:
                 raise InternalError("Tried to retrieve non-existing "
                         "packet for version number %s" % versionNumber)
 
-
+            self.revDiffPacketSizes[entry.versionNumber] = len(packet)
             content = applyBinCompact(content, packet)
+            self._cacheVersionContent(entry.versionNumber, content)
 
         return content
 
 
+    def _getRevDiffChainSize(self, index):
+        """
+        Return total size of the reverse diff packets of the versions before
+        the version at index in self.versionEntries which depend on it.
+        Packets are only read if their size isn't known yet.
+        """
+        result = 0
+        for entry in reversed(self.versionEntries[:index]):
+            if entry.contentDifferencing == "complete":
+                break
+
+            size = self.revDiffPacketSizes.get(entry.versionNumber)
+            if size is None:
+                packet = self.wikiDocument.retrieveDataBlock(
+                        entry.getUnifiedPageName(), default=None)
+                size = len(packet) if packet is not None else 0
+                self.revDiffPacketSizes[entry.versionNumber] = size
+
+            result += size
+
+        return result
+
+
     def getVersionContent(self, versionNumber):
         return fileContentToUnicode(self.getVersionContentRaw(versionNumber))
 
@@ -476,6 +570,8 @@ class VersionOverview(MiscEventSourceMixin):
 
         completeStep = max(self.wikiDocument.getWikiConfig().getint("main",
                 "versioning_completeSteps", 10), 0)
+        diffEngine = self.wikiDocument.getWikiConfig().get("main",
+                "versioning_diffEngine", "lines")
 
         if completeStep == 0:
             asRevDiff = True
@@ -503,6 +599,7 @@ class VersionOverview(MiscEventSourceMixin):
         entry.contentDifferencing = "complete"
         entry.contentEncoding = None
         self.versionEntries.append(entry)
+        self._cacheVersionContent(newHeadVerNo, content)
 
         if len(self.versionEntries) > 1:
             if asRevDiff:
@@ -511,13 +608,24 @@ class VersionOverview(MiscEventSourceMixin):
 
                 unifName = "versioning/packet/versionNo/%s/%s" % (prevHeadEntry.versionNumber,
                         self.unifiedBasePageName)
-                diffPacket = getBinCompactForDiff(content, prevHeadContent)
-
-                if len(diffPacket) < len(prevHeadContent):
+                diffPacket = getBinCompactForDiff(content, prevHeadContent,
+                        diffEngine)
+
+                maxDiffSize = len(prevHeadContent)
+                if completeStep > 0:
+                    # Store complete version earlier than after completeStep
+                    # versions if the diffs to replay become too large
+                    maxDiffSize = min(maxDiffSize,
+                            len(prevHeadContent) * CHECKPOINT_DIFF_SIZE_FACTOR -
+                            self._getRevDiffChainSize(len(self.versionEntries) - 2))
+
+                if len(diffPacket) < maxDiffSize:
                     prevHeadEntry.contentDifferencing = "revdiff"
                     prevHeadEntry.contentEncoding = None
                     self.wikiDocument.storeDataBlock(unifName, diffPacket,
                             storeHint=self.getStorageHint())
+                    self.revDiffPacketSizes[prevHeadEntry.versionNumber] = \
+                            len(diffPacket)
 
         self.fireMiscEventKeys(("appended version", "changed version overview"))
 
@@ -537,6 +645,8 @@ class VersionOverview(MiscEventSourceMixin):
 
             self.wikiDocument.deleteDataBlock(unifName)
             del self.versionEntries[0]
+            self._uncacheVersionContent(versionNumber)
+            self.revDiffPacketSizes.pop(versionNumber, None)
             self.fireMiscEventKeys(("deleted version", "changed version overview"))
 
             return
@@ -555,11 +665,13 @@ class VersionOverview(MiscEventSourceMixin):
             prevHeadEntry.contentDifferencing = "complete"
             self.wikiDocument.storeDataBlock(unifName, newContent,
                     storeHint=self.getStorageHint())
+            self.revDiffPacketSizes.pop(prevHeadEntry.versionNumber, None)
                 
             unifName = "versioning/packet/versionNo/%s/%s" % (versionNumber,
                     self.unifiedBasePageName)
             self.wikiDocument.deleteDataBlock(unifName)
             del self.versionEntries[-1]
+            self._uncacheVersionContent(versionNumber)
             self.fireMiscEventKeys(("deleted version", "changed version overview"))
 
             return
@@ -3,11 +3,14 @@ Handles the storage of external files (e.g. images, but also other
 data or programs)
 """
 
-import os, os.path, traceback, glob
+import os, os.path, traceback, glob, hashlib, sqlite3
 
 import re
+
+import Consts
 from pwiki.StringOps import createRandomString, pathEnc
 from pwiki.OsAbstract import copyFile, moveFile
+from pwiki.Utilities import TimeoutRLock
 
 
 class FSException(Exception):
@@ -19,6 +22,372 @@ _FILESPLITPAT = re.compile(r"^(?P<name>\.*[^.]+)(?P<suffix>.*)$",
         re.DOTALL | re.UNICODE | re.MULTILINE)
 
 
+# Must be increased if the database structure of the index changes
+_INDEX_FORMAT_NO = 1
+
+
+
+def getFileHash(path):
+    """
+    Return SHA-256 hash of the content of the file denoted by path
+    as hex string.
+    """
+    h = hashlib.sha256()
+    with open(pathEnc(path), "rb") as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                return h.hexdigest()
+            h.update(block)
+
+
+
+class FileStorageIndex:
+    """
+    Persistent index of the files directly in the storage directory. It is
+    an sqlite database mapping size and SHA-256 hash of the content to the
+    file names, so identical files can be found without reading all files
+    of the same size.
+
+    The index is synchronized with the directory only if the modification
+    time of the directory changed (files were added, deleted or renamed).
+    New files are added without hash, it is calculated when a file of the
+    same size is looked up. An entry is checked against the size and
+    modification time of its file when it is used and the hash is
+    calculated again if they don't match.
+    """
+    def __init__(self, storagePath, indexPath):
+        """
+        storagePath -- directory of the file storage
+        indexPath -- path of the index database file
+        """
+        self.storagePath = storagePath
+        self.indexPath = indexPath
+        self.indexLock = TimeoutRLock(Consts.DEADBLOCKTIMEOUT)
+        # Created on first access
+        self.dbConn = None
+
+
+    def close(self):
+        with self.indexLock:
+            if self.dbConn is not None:
+                self.dbConn.close()
+                self.dbConn = None
+
+
+    def _getConnection(self):
+        """
+        Return connection to the index database, create it if necessary.
+        Must be called with indexLock acquired.
+        """
+        if self.dbConn is not None:
+            return self.dbConn
+
+        dbConn = sqlite3.connect(self.indexPath, check_same_thread=False)
+        try:
+            formatNo = dbConn.execute("pragma user_version").fetchone()[0]
+            if formatNo != _INDEX_FORMAT_NO:
+                dbConn.execute("drop table if exists files")
+                dbConn.execute("drop table if exists settings")
+                dbConn.execute("create table files("
+                        "name text primary key not null, "
+                        "size integer not null, "
+                        "mtime integer not null, "  # in nanoseconds
+                        "hash text not null default ''"  # '' if unknown
+                        ")")
+                dbConn.execute("create index files_size_hash on "
+                        "files(size, hash)")
+                dbConn.execute("create table settings("
+                        "key text primary key not null, "
+                        "value text not null"
+                        ")")
+                dbConn.execute("pragma user_version = %i" % _INDEX_FORMAT_NO)
+                dbConn.commit()
+        except:
+            dbConn.close()
+            raise
+
+        self.dbConn = dbConn
+        return dbConn
+
+
+    def _getSetting(self, key, default=None):
+        row = self._getConnection().execute(
+                "select value from settings where key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+
+        return row[0]
+
+
+    def _setSetting(self, key, value):
+        self._getConnection().execute("insert or replace into "
+                "settings(key, value) values (?, ?)", (key, value))
+
+
+    def _getDirMtime(self):
+        return str(os.stat(pathEnc(self.storagePath)).st_mtime_ns)
+
+
+    def _iterStorageFiles(self):
+        """
+        Iterate over tuples (name, stat result) of the files directly in the
+        storage directory.
+        """
+        for dirEntry in os.scandir(self.storagePath):
+            try:
+                if dirEntry.is_file():
+                    yield (dirEntry.name, dirEntry.stat())
+            except OSError:
+                traceback.print_exc()
+
+
+    def _sync(self):
+        """
+        Add and delete entries for files added to or deleted from the
+        storage directory since the last synchronization.
+        Must be called with indexLock acquired.
+        """
+        dirMtime = self._getDirMtime()
+        if self._getSetting("dirMtime") == dirMtime:
+            return
+
+        dbConn = self._getConnection()
+        indexed = set(row[0] for row in dbConn.execute(
+                "select name from files"))
+
+        found = set()
+        for dirEntry in os.scandir(self.storagePath):
+            name = dirEntry.name
+            if name in indexed:
+                # Only new files need a stat call here, changed entries
+                # are detected when used
+                found.add(name)
+                continue
+
+            try:
+                if not dirEntry.is_file():
+                    continue
+                st = dirEntry.stat()
+            except OSError:
+                traceback.print_exc()
+                continue
+
+            found.add(name)
+            dbConn.execute("insert into files(name, size, mtime) "
+                    "values (?, ?, ?)", (name, st.st_size, st.st_mtime_ns))
+
+        dbConn.executemany("delete from files where name = ?",
+                ((name,) for name in indexed - found))
+
+        self._setSetting("dirMtime", dirMtime)
+        dbConn.commit()
+
+
+    def _getValidHash(self, name, size, mtime, hash):
+        """
+        Return hash of file  name  described by an index entry or None if
+        the file doesn't exist anymore. The entry is updated if necessary.
+        Must be called with indexLock acquired.
+        """
+        path = os.path.join(self.storagePath, name)
+        try:
+            st = os.stat(pathEnc(path))
+            if st.st_size != size or st.st_mtime_ns != mtime or not hash:
+                hash = getFileHash(path)
+        except OSError:
+            self._getConnection().execute("delete from files where name = ?",
+                    (name,))
+            return None
+
+        if st.st_size != size or st.st_mtime_ns != mtime:
+            self._getConnection().execute("update files set size = ?, "
+                    "mtime = ?, hash = ? where name = ?",
+                    (st.st_size, st.st_mtime_ns, hash, name))
+        else:
+            self._getConnection().execute("update files set hash = ? "
+                    "where name = ?", (hash, name))
+
+        return hash
+
+
+    def findIdenticalFiles(self, srcPath, srcstat, preTest,
+            modDateIsEnough=False):
+        """
+        Return tuple (paths, srcHash) where paths is a list of paths of files
+        in the storage with the same content as the file at srcPath.
+        srcHash is the hash of the source file or None if it wasn't
+        calculated.
+
+        srcstat -- stat result of the source file
+        preTest -- function called with path of a file of same size,
+                returns False if the file can't be identical
+        modDateIsEnough -- if True and a file has also the same modification
+                time, only files with same modification time are returned
+                and no hashes are compared
+        """
+        with self.indexLock:
+            self._sync()
+            dbConn = self._getConnection()
+
+            try:
+                candidates = []
+                for row in dbConn.execute("select name, size, mtime, hash "
+                        "from files where size = ?", (srcstat.st_size,))\
+                        .fetchall():
+                    path = os.path.join(self.storagePath, row[0])
+                    if preTest(path):
+                        candidates.append((path, row))
+
+                if modDateIsEnough:
+                    result = [path for path, row in candidates
+                            if os.stat(pathEnc(path)).st_mtime ==
+                            srcstat.st_mtime]
+                    if result:
+                        return (result, None)
+
+                if len(candidates) == 0:
+                    return ([], None)
+
+                srcHash = getFileHash(srcPath)
+
+                return ([path for path, row in candidates
+                        if self._getValidHash(*row) == srcHash], srcHash)
+            finally:
+                dbConn.commit()
+
+
+    def addFile(self, path, hash=None, dirWasSynced=True):
+        """
+        Add or update entry for a file the storage has just created.
+
+        hash -- hash of the file content or None if not known
+        dirWasSynced -- True if the index was synchronized with the storage
+                directory before the file was created and no other files
+                were added since. Then the directory needn't be
+                synchronized again on the next lookup.
+        """
+        name = os.path.basename(path)
+        with self.indexLock:
+            st = os.stat(pathEnc(path))
+            if hash is None:
+                # Calculated when needed
+                hash = ""
+
+            dbConn = self._getConnection()
+            dbConn.execute("insert or replace into files(name, size, mtime, "
+                    "hash) values (?, ?, ?, ?)",
+                    (name, st.st_size, st.st_mtime_ns, hash))
+
+            if dirWasSynced:
+                self._setSetting("dirMtime", self._getDirMtime())
+
+            dbConn.commit()
+
+
+    def rebuild(self, progresshandler=None):
+        """
+        Recreate the index from the storage directory, hashing all files.
+        """
+        with self.indexLock:
+            dbConn = self._getConnection()
+            dbConn.execute("delete from files")
+            dbConn.execute("delete from settings")
+            dbConn.commit()
+
+            if not os.path.isdir(pathEnc(self.storagePath)):
+                return
+
+            dirMtime = self._getDirMtime()
+            files = list(self._iterStorageFiles())
+
+            if progresshandler is not None:
+                progresshandler.open(len(files))
+
+            try:
+                for step, (name, st) in enumerate(files):
+                    if progresshandler is not None:
+                        progresshandler.update(step, name)
+                    try:
+                        hash = getFileHash(os.path.join(self.storagePath,
+                                name))
+                    except OSError:
+                        traceback.print_exc()
+                        continue
+
+                    dbConn.execute("insert into files(name, size, mtime, hash) "
+                            "values (?, ?, ?, ?)",
+                            (name, st.st_size, st.st_mtime_ns, hash))
+            finally:
+                if progresshandler is not None:
+                    progresshandler.close()
+
+            self._setSetting("dirMtime", dirMtime)
+            dbConn.commit()
+
+
+    def verify(self, progresshandler=None):
+        """
+        Compare the index with the files in the storage directory, hashing
+        all files. The index isn't changed. Returns list of tuples
+        (file name, problem) where problem is one of:
+            "missing": file is not in the index
+            "deleted": file in index doesn't exist anymore
+            "changed": size or modification time of file differ from index
+            "hash mismatch": file content differs from indexed hash although
+                size and modification time match
+        Missing, deleted and changed entries are corrected automatically on
+        later lookups, hash mismatches need a rebuild.
+        """
+        with self.indexLock:
+            rows = self._getConnection().execute("select name, size, mtime, "
+                    "hash from files").fetchall()
+
+            if os.path.isdir(pathEnc(self.storagePath)):
+                files = list(self._iterStorageFiles())
+            else:
+                files = []
+
+            indexed = dict((row[0], row[1:]) for row in rows)
+            problems = []
+
+            if progresshandler is not None:
+                progresshandler.open(len(files))
+
+            try:
+                for step, (name, st) in enumerate(files):
+                    if progresshandler is not None:
+                        progresshandler.update(step, name)
+
+                    entry = indexed.pop(name, None)
+                    if entry is None:
+                        problems.append((name, "missing"))
+                        continue
+
+                    size, mtime, hash = entry
+                    if st.st_size != size or st.st_mtime_ns != mtime:
+                        problems.append((name, "changed"))
+                        continue
+
+                    if not hash:
+                        continue
+
+                    try:
+                        if getFileHash(os.path.join(self.storagePath,
+                                name)) != hash:
+                            problems.append((name, "hash mismatch"))
+                    except OSError:
+                        traceback.print_exc()
+            finally:
+                if progresshandler is not None:
+                    progresshandler.close()
+
+            problems += [(name, "deleted") for name in indexed]
+            problems.sort()
+
+            return problems
+
+
 
 class FileStorage:
     """
@@ -27,15 +396,22 @@ class FileStorage:
     component, so it must be replaced by a new instance if a new wiki is loaded.
     """
     
-    def __init__(self, wikiDocument, storagePath):
+    def __init__(self, wikiDocument, storagePath, indexPath=None):
         """
         mainControl -- PersonalWikiFrame instance
         wikiDocument -- WikiDocument instance of current wiki
         filePath -- directory path where new files should be stored
                 (doesn't have to exist already)
+        indexPath -- path of the database file of the FileStorageIndex or
+                None to search identical files without index
         """
         self.wikiDocument = wikiDocument
         self.storagePath = storagePath
+
+        if indexPath is not None:
+            self.index = FileStorageIndex(storagePath, indexPath)
+        else:
+            self.index = None
         
         # Conditions for identity test
         self.modDateMustMatch = False  # File is only identical if modification
@@ -65,6 +441,13 @@ class FileStorage:
     def getStoragePath(self):
         return self.storagePath
 
+    def getIndex(self):
+        return self.index
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+
 
     def _storageExists(self):
         """
@@ -164,6 +547,35 @@ class FileStorage:
         return list(ccSameName) + list(ccSameMod) + list(ccElse)
 
 
+    def _findIdenticalIndexed(self, srcPath):
+        """
+        Find a file identical to the one denoted by srcPath using the index.
+        Returns tuple (path, srcHash) where path is None if no identical
+        file was found and srcHash is the hash of the source file or None
+        if it wasn't calculated.
+        """
+        srcfname = os.path.basename(srcPath)
+        srcstat = os.stat(pathEnc(srcPath))
+
+        paths, srcHash = self.index.findIdenticalFiles(srcPath, srcstat,
+                lambda p: self._preTestIdentity(p, srcfname, srcstat),
+                self.modDateIsEnough)
+
+        if len(paths) == 0:
+            return (None, srcHash)
+
+        # Same order of preference as in _getCandidates()
+        samenamepath = os.path.join(self.storagePath, srcfname)
+        if samenamepath in paths:
+            return (samenamepath, srcHash)
+
+        for p in paths:
+            if os.stat(pathEnc(p)).st_mtime == srcstat.st_mtime:
+                return (p, srcHash)
+
+        return (paths[0], srcHash)
+
+
     def _isIdentical(self, path1, path2):
         """
         Checks if the files denoted by path1 and path2 are identical according
@@ -211,22 +623,43 @@ class FileStorage:
         at the destination.
         If path is None, a new filename couldn't be found.
         """
+        return self._findDestPath(srcPath)[:2]
+
 
+    def _findDestPath(self, srcPath):
+        """
+        Like findDestPath(), but returns tuple (path, exists, srcHash).
+        srcHash is False if the index wasn't used, otherwise the hash of
+        the source file or None if it wasn't calculated.
+        """
         if not (os.path.isfile(srcPath) or os.path.isdir(srcPath)):
             raise FSException(_("Path '%s' must point to an existing file") %
                     srcPath)
 
         self._ensureStorage()
-        
-        for c in self._getCandidates(srcPath):
-            if self._isIdentical(srcPath, c):
-                return (c, True)
+
+        srcHash = False
+        if self.index is not None and not self.filenameMustMatch and \
+                os.path.isfile(srcPath):
+            # With filenameMustMatch there is only one candidate anyway
+            try:
+                path, srcHash = self._findIdenticalIndexed(srcPath)
+                if path is not None:
+                    return (path, True, srcHash)
+            except sqlite3.Error:
+                traceback.print_exc()
+                srcHash = False
+
+        if srcHash is False:
+            for c in self._getCandidates(srcPath):
+                if self._isIdentical(srcPath, c):
+                    return (c, True, srcHash)
 
         # No identical file found, so find a not yet used name for the new file.
         fname = os.path.basename(srcPath)
 
         if not os.path.exists(pathEnc(os.path.join(self.storagePath, fname))):
-            return (os.path.join(self.storagePath, fname), False)
+            return (os.path.join(self.storagePath, fname), False, srcHash)
 
         mat = _FILESPLITPAT.match(fname)
         if mat is None:
@@ -240,10 +673,11 @@ class FileStorage:
             
             if not os.path.exists(pathEnc(os.path.join(
                     self.storagePath, newName))):
-                return (os.path.join(self.storagePath, newName), False)
+                return (os.path.join(self.storagePath, newName), False,
+                        srcHash)
 
         # Give up
-        return (None, False)
+        return (None, False, srcHash)
     
     
     def findDestPathNoSource(self, suffix, prefix=""):
@@ -290,7 +724,7 @@ class FileStorage:
         guiProgressListener -- currently not used
         move -- If True, move file instead of copying
         """
-        destpath, ex = self.findDestPath(srcPath)
+        destpath, ex, srcHash = self._findDestPath(srcPath)
         if ex:
             return destpath
             
@@ -303,6 +737,15 @@ class FileStorage:
         else:
             self.copyFile(srcPath, destpath)
 
+        if self.index is not None and os.path.isfile(destpath):
+            try:
+                # If the index was used, it was synchronized with the
+                # directory just before
+                self.index.addFile(destpath, srcHash or None,
+                        dirWasSynced=srcHash is not False)
+            except (sqlite3.Error, OSError):
+                traceback.print_exc()
+
         return destpath
 
     @staticmethod
@@ -17,6 +17,7 @@ from pwiki.StringOps import mbcsDec, utf8Enc, utf8Dec, applyBinCompact, \
 from pwiki.SearchAndReplace import SearchReplaceOperation
 
 import pwiki.sqlite3api as sqlite
+from pwiki import DbProfiler
 
 
 
@@ -50,20 +51,40 @@ class ConnectWrapBase:
 
     def execSql(self, sql, params=None):
         "utility method, executes the sql"
+        profStart = DbProfiler.startTimer()
         if params:
             self.dbCursor.execute(sql, params)
         else:
             self.dbCursor.execute(sql)
 
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart)
+
+
+    def execSqlMany(self, sql, paramsSeq):
+        """
+        utility method, executes the sql once for each parameter tuple
+        of sequence paramsSeq with one prepared statement
+        """
+        profStart = DbProfiler.startTimer()
+        self.dbCursor.executemany(sql, paramsSeq)
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart)
+
 
     def execSqlQuery(self, sql, params=None):
         "utility method, executes the sql, returns query result"
+        profStart = DbProfiler.startTimer()
         if params:
             self.dbCursor.execute(sql, params, typeDetect=sqlite.TYPEDET_FIRST)
         else:
             self.dbCursor.execute(sql, typeDetect=sqlite.TYPEDET_FIRST)
 
-        return self.dbCursor.fetchall()
+        result = self.dbCursor.fetchall()
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart, len(result))
+
+        return result
 
 
     def execSqlQueryIter(self, sql, params=None):
@@ -92,12 +113,16 @@ class ConnectWrapBase:
         one column and returns result. If query results
         to 0 rows, default is returned (defaults to None)
         """
+        profStart = DbProfiler.startTimer()
         if params:
             self.dbCursor.execute(sql, params)
         else:
             self.dbCursor.execute(sql)
 
         row = self.fetchone()
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart, int(row is not None))
+
         if row is None:
             return default
             
@@ -259,6 +284,20 @@ class ConnectWrapAsyncCommit(ConnectWrapBase):
         finally:
             self.accessLock.release()
 
+    def execSqlMany(self, sql, paramsSeq):
+        """
+        utility method, executes the sql once for each parameter tuple
+        of sequence paramsSeq with one prepared statement
+        """
+        self.accessLock.acquire()
+        try:
+            # Commit first before executing something that changes database
+            self._commitIfPending()
+            self.commitNeeded = True
+            return ConnectWrapBase.execSqlMany(self, sql, paramsSeq)
+        finally:
+            self.accessLock.release()
+
     def execSqlQuery(self, sql, params=None):
         "utility method, executes the sql, returns query result"
         self.accessLock.acquire()
@@ -352,8 +391,8 @@ class ConnectWrapAsyncCommit(ConnectWrapBase):
 
 
 
-VERSION_DB = 9
-VERSION_WRITECOMPAT = 9
+VERSION_DB = 10
+VERSION_WRITECOMPAT = 10
 VERSION_READCOMPAT = 9
 
 
@@ -422,7 +461,8 @@ TABLE_DEFINITIONS = {
         ("word", t.t),
         ("relation", t.t),
         ("firstcharpos", t.imo),  # Position of the link from word to relation in chars
-        ("charlength", t.imo)  # Length of the link
+        ("charlength", t.imo),  # Length of the link
+        ("resolvedword", t.t)  # Real page name relation resolves to or ''
         ),
 
 
@@ -475,6 +515,20 @@ TABLE_DEFINITIONS = {
     "datablocks": (
         ("unifiedname", t.t),
         ("data", t.b)
+        ),
+
+
+    "fulltextindexwords": (     # Optional, only if full text index enabled
+        ("id", t.pi),     # Rowid of the page in table "fulltextindex"
+        ("word", t.t),
+        ("modified", t.r)  # Modification date of the indexed content
+        ),
+
+
+    "trigramindexwords": (     # Optional, only if trigram index enabled
+        ("id", t.pi),     # Page id in table "trigramindex"
+        ("word", t.t),
+        ("modified", t.r)  # Modification date of the indexed content
         )
 
 # Not for compact:
@@ -531,11 +585,14 @@ def rebuildIndices(connwrap):
     connwrap.execSqlNoError("drop index wikirelations_pkey")
     connwrap.execSqlNoError("drop index wikirelations_word")
     connwrap.execSqlNoError("drop index wikirelations_relation")    
+    connwrap.execSqlNoError("drop index wikirelations_resolvedword")
     connwrap.execSqlNoError("drop index wikiwordattrs_word")
     connwrap.execSqlNoError("drop index wikiwordattrs_keyvalue")
     connwrap.execSqlNoError("drop index changelog_word")
     connwrap.execSqlNoError("drop index headversion_pkey")
     connwrap.execSqlNoError("drop index datablocks_unifiedname")
+    connwrap.execSqlNoError("drop index fulltextindexwords_word")
+    connwrap.execSqlNoError("drop index trigramindexwords_word")
 
     connwrap.execSqlNoError("create unique index wikiwordcontent_pkey on wikiwordcontent(word)")
     connwrap.execSqlNoError("create index wikiwords_modified on wikiwordcontent(modified)")
@@ -545,13 +602,163 @@ def rebuildIndices(connwrap):
     connwrap.execSqlNoError("create unique index wikirelations_pkey on wikirelations(word, relation)")
     connwrap.execSqlNoError("create index wikirelations_word on wikirelations(word)")
     connwrap.execSqlNoError("create index wikirelations_relation on wikirelations(relation)")
+    connwrap.execSqlNoError("create index wikirelations_resolvedword on wikirelations(resolvedword)")
     connwrap.execSqlNoError("create index wikiwordattrs_word on wikiwordattrs(word)")
     connwrap.execSqlNoError("create index wikiwordattrs_keyvalue on wikiwordattrs(key, value)")
     connwrap.execSqlNoError("create index changelog_word on changelog(word)")
     connwrap.execSqlNoError("create unique index headversion_pkey on headversion(word)")
     connwrap.execSqlNoError("create unique index datablocks_unifiedname on datablocks(unifiedname)")
+    connwrap.execSqlNoError("create unique index fulltextindexwords_word on fulltextindexwords(word)")
+    connwrap.execSqlNoError("create unique index trigramindexwords_word on trigramindexwords(word)")
+
+
+
+# Tokenizer of the full text index. Tokens are runs of letters, digits and
+# combining marks as found by SearchAndReplace.buildFullTextIndexQuery().
+# Without 'M*' unicode61 keeps only some combining marks inside of a token.
+FULLTEXTINDEX_TOKENIZE = \
+        "unicode61 remove_diacritics 0 categories 'L* N* M*'"
 
 
+def isFullTextIndexSupported(connwrap):
+    """
+    Returns True if the sqlite library contains the FTS5 extension
+    needed for the full text index
+    """
+    try:
+        return bool(connwrap.execSqlQuerySingleItem(
+                "select sqlite_compileoption_used('ENABLE_FTS5')", default=0))
+    except sqlite.Error:
+        return False
+
+
+def hasFullTextIndex(connwrap):
+    """
+    Returns True if the tables of the full text index exist
+    """
+    t1 = connwrap.execSqlQuerySingleItem("select name from sqlite_master "
+            "where name='fulltextindex'", default=None)
+    return t1 is not None
+
+
+def hasCurrentFullTextIndexTokenizer(connwrap):
+    """
+    Returns True if the existing full text index was created with the
+    tokenizer FULLTEXTINDEX_TOKENIZE
+    """
+    sql = connwrap.execSqlQuerySingleItem("select sql from sqlite_master "
+            "where name='fulltextindex'", default="")
+    return FULLTEXTINDEX_TOKENIZE in sql
+
+
+def createFullTextIndex(connwrap):
+    """
+    Create the empty tables of the optional full text index. The FTS5 table
+    "fulltextindex" doesn't store the content itself, table
+    "fulltextindexwords" maps its rowids to the wiki words.
+    """
+    changeTableSchema(connwrap, "fulltextindexwords",
+            TABLE_DEFINITIONS["fulltextindexwords"])
+    connwrap.execSql("create unique index fulltextindexwords_word "
+            "on fulltextindexwords(word)")
+    connwrap.execSql("create virtual table fulltextindex using "
+            "fts5(content, content='', tokenize=\"%s\")" %
+            FULLTEXTINDEX_TOKENIZE)
+
+
+def dropFullTextIndex(connwrap):
+    """
+    Delete the tables of the full text index
+    """
+    connwrap.execSqlNoError("drop table fulltextindex")
+    connwrap.execSqlNoError("drop table fulltextindexwords")
+
+
+def isJsonSupported(connwrap):
+    """
+    Returns True if the sqlite library contains the JSON functions
+    """
+    try:
+        connwrap.execSqlQuerySingleItem("select json_valid('[]')")
+        return True
+    except sqlite.Error:
+        return False
+
+
+def isRecursiveCteSupported(connwrap):
+    """
+    Returns True if the sqlite library supports recursive common table
+    expressions ("with recursive", since sqlite 3.8.3)
+    """
+    try:
+        connwrap.execSqlQuerySingleItem(
+                "with recursive t(x) as (select 1) select x from t")
+        return True
+    except sqlite.Error:
+        return False
+
+
+def hasTrigramIndex(connwrap):
+    """
+    Returns True if the tables of the trigram index exist
+    """
+    t1 = connwrap.execSqlQuerySingleItem("select name from sqlite_master "
+            "where name='trigramindex'", default=None)
+    return t1 is not None
+
+
+def createTrigramIndex(connwrap):
+    """
+    Create the empty tables of the optional trigram index. Table
+    "trigramindex" contains a row for each trigram (as integer, see
+    TrigramIndex.trigramToInt()) of each page, table "trigramindexwords"
+    maps the page ids to the wiki words.
+    """
+    changeTableSchema(connwrap, "trigramindexwords",
+            TABLE_DEFINITIONS["trigramindexwords"])
+    connwrap.execSql("create unique index trigramindexwords_word "
+            "on trigramindexwords(word)")
+    connwrap.execSql("create table trigramindex (trigram integer not null, "
+            "id integer not null, primary key (trigram, id)) without rowid")
+
+
+def dropTrigramIndex(connwrap):
+    """
+    Delete the tables of the trigram index
+    """
+    connwrap.execSqlNoError("drop table trigramindex")
+    connwrap.execSqlNoError("drop table trigramindexwords")
+
+
+def getResolvedWordSql(term):
+    """
+    Return SQL expression which resolves the link term given as SQL
+    expression term to the real page name it links to or to '' if it is
+    undefined. The page name is preferred over an alias with the same name,
+    an alias defined by multiple pages resolves to the first page by name.
+    This is the value of column "resolvedword" of "wikirelations".
+    """
+    return ("ifnull((select word from wikiwordcontent "
+            "where wikiwordcontent.word = %s), "
+            "ifnull((select word from wikiwordmatchterms "
+            "where wikiwordmatchterms.matchterm = %s and "
+            "(wikiwordmatchterms.type & 2) != 0 "
+            "order by wikiwordmatchterms.word limit 1), ''))" % (term, term))
+            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+
+
+def updateResolvedWords(connwrap, condition=None, params=None):
+    """
+    Resolve again column "resolvedword" of all rows of "wikirelations"
+    matching the SQL condition (all rows if condition is None).
+    """
+    sql = "update wikirelations set resolvedword = %s" % \
+            getResolvedWordSql("wikirelations.relation")
+    if condition is not None:
+        sql += " where " + condition
+
+    connwrap.execSql(sql, params)
+
 
 def recreateCacheTables(connwrap):
     """
@@ -784,7 +991,7 @@ def sqlite_testMatch(context, values):
     """
     nakedword = utf8Dec(values[0].value_blob(), "replace")[0]
     fileContents = utf8Dec(values[1].value_blob(), "replace")[0]
-    sarOp = sqlite.getTransObject(values[2].value_int())
+    sarOp = sqlite.getTransObject(values[2].value_int64())
     if sarOp.testWikiPage(nakedword, fileContents) == True:
         context.result_int(1)
     else:
@@ -1257,6 +1464,17 @@ def updateDatabase(connwrap, dataDir):
     # --- WikiPad 2.1alpha.1 reached (formatver=9, writecompatver=9,
     #         readcompatver=9) ---
 
+    if formatver == 9:
+        # Add column "resolvedword" to "wikirelations"
+        changeTableSchema(connwrap, "wikirelations",
+                TABLE_DEFINITIONS["wikirelations"])
+        updateResolvedWords(connwrap)
+
+        formatver = 10
+
+    # --- Resolved relations reached (formatver=10, writecompatver=10,
+    #         readcompatver=9) ---
+
 
     # Write format information
 
@@ -1531,5 +1749,14 @@ invalid data.
         charlength: Integer. Length of the selection whose position is given in
             respective firstcharpos. Invalid if firstcharpos is -1.
 
+
+++ 2.1alpha1 to formatver=10:
+
+    Table "wikirelations" modified:
+        "resolvedword" added, unistring. Real page name the relation resolves
+            to (the page itself or the page of an alias) or empty string if
+            the relation is undefined. Must be updated whenever pages or
+            link terms change, so older versions can't write to the database.
+
 """
 
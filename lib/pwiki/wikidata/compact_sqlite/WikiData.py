@@ -18,12 +18,14 @@ import os, os.path
 
 from time import time, localtime
 import datetime
-import glob, traceback
+import glob, traceback, threading, types
 
 from wx import GetApp
 
 from pwiki.WikiExceptions import *   # TODO make normal import
 from pwiki import SearchAndReplace
+from pwiki import TrigramIndex
+from pwiki.LinkTermSnapshot import LinkTermSnapshot
 
 try:
     import pwiki.sqlite3api as sqlite
@@ -52,7 +54,32 @@ class WikiData:
         self.wikiDocument = wikiDocument
         self.dataDir = dataDir
         self.resolveCaseNormed = False
-        self.cachedWikiPageLinkTermDict = None
+        # Snapshot of all link terms, see LinkTermSnapshot.py
+        self.linkTermSnapshot = None
+        # Pages whose link terms changed since the snapshot was updated
+        # or None if it must be built again
+        self.linkTermDirtyWords = None
+        self.linkTermsOfPage = {}
+        # True if sqlite supports "with recursive", see
+        # getSubTreeChildRelationships()
+        self.recursiveCteSupported = False
+        # True if the full text index exists and must be maintained
+        self.fullTextIndexEnabled = False
+        # True if the trigram index exists and must be maintained
+        self.trigramIndexEnabled = False
+        # True if trigrams can be written as JSON array, see _insertTrigrams()
+        self.trigramIndexJson = False
+        # Idle readers for concurrent reads, see acquireReader()
+        self.idleReaders = []
+        # Number of existing readers (idle or in use)
+        self.readerCount = 0
+        # Maximum number of readers, 0 if concurrent reads are disabled
+        self.readerCountMax = 0
+        # Protects the reader fields above
+        self.readerLock = threading.Lock()
+        # Journal mode of the database before it was switched to WAL for
+        # the readers or None if it wasn't switched
+        self.journalModeBeforeReaders = None
 
         dbPath = self.wikiDocument.getWikiConfig().get("wiki_db", "db_filename",
                 "").strip()
@@ -71,6 +98,7 @@ class WikiData:
             raise DbWriteAccessError(e)
 
         dbfile = longPathDec(dbfile)
+        self.dbfile = dbfile
 
         try:
             self.connWrap = DbStructure.ConnectWrapSyncCommit(
@@ -179,9 +207,11 @@ class WikiData:
         try:
             if not recoveryMode:
                 self._createTempTables()
+                self.recursiveCteSupported = \
+                        DbStructure.isRecursiveCteSupported(self.connWrap)
 
             # reset cache
-            self.cachedWikiPageLinkTermDict = None
+            self.linkTermSnapshot = None
             self.cachedGlobalAttrs = None
             
             if not recoveryMode:
@@ -195,6 +225,16 @@ class WikiData:
                 raise DbReadAccessError(e2)
             raise DbReadAccessError(e)
 
+        try:
+            if not recoveryMode:
+                self.setFullTextIndexEnabled(self.wikiDocument.getWikiConfig()
+                        .getboolean("main", "fullTextIndex_enabled", False))
+                self.setTrigramIndexEnabled(self.wikiDocument.getWikiConfig()
+                        .getboolean("main", "trigramIndex_enabled", False))
+        except DbWriteAccessError as e:
+            # Remember but continue
+            lastException = e
+
         if lastException:
             raise lastException
 
@@ -207,7 +247,8 @@ class WikiData:
 
 
     def _createTempTables(self):
-        # Temporary table for findBestPathFromWordToWord
+        # Temporary table for findBestPathFromWordToWord if sqlite doesn't
+        # support recursive queries
         # TODO: Possible for read-only dbs?
 
         # These schema changes are only on a temporary table so they are not
@@ -271,7 +312,7 @@ class WikiData:
     def setContent(self, word, content, moddate = None, creadate = None):
         """
         Sets the content, does not modify the cache information
-        except self.cachedWikiPageLinkTermDict
+        except the link term snapshot
         """
         if not content: content = ""  # ?
         
@@ -280,8 +321,6 @@ class WikiData:
         content = self.contentUniInputToDb(content)
         self.setContentRaw(word, content, moddate, creadate)
 
-        self.cachedWikiPageLinkTermDict = None
-
 
     def setContentRaw(self, word, content, moddate = None, creadate = None):
         """
@@ -302,6 +341,11 @@ class WikiData:
         assert isinstance(content, Consts.BYTETYPES)
 
         try:
+            if self.fullTextIndexEnabled:
+                self._removeFromFullTextIndex(word)
+            if self.trigramIndexEnabled:
+                self._updateTrigramIndex(word, content, moddate)
+
             if self.connWrap.execSqlQuerySingleItem("select word from "+\
                     "wikiwordcontent where word=?", (word,), None) is not None:
     
@@ -321,6 +365,13 @@ class WikiData:
                     "(word, content, modified, created) "
                     "values (?,?,?,?)",
                     (word, sqlite.Binary(content), moddate, creadate))
+                # Links to the new page are no longer undefined
+                DbStructure.updateResolvedWords(self.connWrap,
+                        "relation = ?", (word,))
+                self._invalidateLinkTerms(word)
+
+            if self.fullTextIndexEnabled:
+                self._addToFullTextIndex(word)
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -329,14 +380,23 @@ class WikiData:
     def _renameContent(self, oldWord, newWord):
         """
         The content which was stored under oldWord is stored
-        after the call under newWord. The self.cachedWikiPageLinkTermDict
-        dictionary is updated, other caches won't be updated.
+        after the call under newWord. The link term snapshot
+        is updated, other caches won't be updated.
         """
         try:
             self.connWrap.execSql("update wikiwordcontent set word = ? "
                     "where word = ?", (newWord, oldWord))
+            DbStructure.updateResolvedWords(self.connWrap,
+                    "resolvedword = ? or relation = ?", (oldWord, newWord))
+            if self.fullTextIndexEnabled:
+                self.connWrap.execSql("update fulltextindexwords set word = ? "
+                        "where word = ?", (newWord, oldWord))
+            if self.trigramIndexEnabled:
+                self.connWrap.execSql("update trigramindexwords set word = ? "
+                        "where word = ?", (newWord, oldWord))
     
-            self.cachedWikiPageLinkTermDict = None
+            self._invalidateLinkTerms(oldWord)
+            self._invalidateLinkTerms(newWord)
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -344,8 +404,14 @@ class WikiData:
 
     def _deleteContent(self, word):
         try:
+            if self.fullTextIndexEnabled:
+                self._removeFromFullTextIndex(word)
+            if self.trigramIndexEnabled:
+                self._removeFromTrigramIndex(word)
             self.connWrap.execSql("delete from wikiwordcontent where word = ?", (word,))
-            self.cachedWikiPageLinkTermDict = None
+            DbStructure.updateResolvedWords(self.connWrap,
+                    "resolvedword = ?", (word,))
+            self._invalidateLinkTerms(word)
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -393,6 +459,13 @@ class WikiData:
                 self.connWrap.execSql("update wikiwordcontent set modified = ?, "
                         "created = ?, visited = ? where word = ?",
                         (moddate, creadate, visitdate, word))
+                # Indexes stay valid, see _isIndexOutdated()
+                if self.fullTextIndexEnabled:
+                    self.connWrap.execSql("update fulltextindexwords "
+                            "set modified = ? where word = ?", (moddate, word))
+                if self.trigramIndexEnabled:
+                    self.connWrap.execSql("update trigramindexwords "
+                            "set modified = ? where word = ?", (moddate, word))
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -634,6 +707,31 @@ class WikiData:
 
     # ---------- Handling of relationships cache ----------
 
+    def _getChildRelationshipsFieldsSql(self, withFields):
+        """
+        Return tuple (addFields, converters) for getChildRelationships()
+        and getSubTreeChildRelationships(). addFields is the SQL for the
+        additional columns requested by withFields, converters a list of
+        functions to apply to the columns of a result row (including
+        the relation column).
+        """
+        addFields = ""
+        converters = [lambda s: s]
+        for field in withFields:
+            if field == "firstcharpos":
+                addFields += ", firstcharpos"
+                converters.append(lambda s: s)
+            elif field == "modified":
+                # "modified" isn't a field of wikirelations. We need
+                # some SQL magic to retrieve the modification date
+                addFields += (", ifnull((select modified from wikiwordcontent "
+                        "where wikiwordcontent.word = resolvedword), 0.0)")
+
+                converters.append(float)
+
+        return addFields, converters
+
+
     def getChildRelationships(self, wikiWord, existingonly=False,
             selfreference=True, withFields=()):
         """
@@ -654,23 +752,8 @@ class WikiData:
         if withFields is None:
             withFields = ()
 
-        addFields = ""
-        converters = [lambda s: s]
-        for field in withFields:
-            if field == "firstcharpos":
-                addFields += ", firstcharpos"
-                converters.append(lambda s: s)
-            elif field == "modified":
-                # "modified" isn't a field of wikirelations. We need
-                # some SQL magic to retrieve the modification date
-                addFields += (", ifnull((select modified from wikiwordcontent "
-                        "where wikiwordcontent.word = relation or "
-                        "wikiwordcontent.word = (select word from wikiwordmatchterms "
-                        "where wikiwordmatchterms.matchterm = relation and "
-                        "(wikiwordmatchterms.type & 2) != 0 limit 1)), 0.0)")
-
-                converters.append(float)
-
+        addFields, converters = self._getChildRelationshipsFieldsSql(
+                withFields)
 
         sql = "select relation%s from wikirelations where word = ?" % addFields
 
@@ -679,21 +762,19 @@ class WikiData:
 
         if existingonly:
             # filter to only words in wikiwords or aliases
-#             sql += " and (exists (select word from wikiwordcontent "+\
-#                     "where word = relation) or exists "+\
-#                     "(select value from wikiwordattrs "+\
-#                     "where value = relation and key = 'alias'))"
-            sql += (" and (exists (select 1 from wikiwordcontent "
-                    "where word = relation) or exists "
-                    "(select 1 from wikiwordmatchterms "
-                    "where wikiwordmatchterms.matchterm = relation and "
-                    "(wikiwordmatchterms.type & 2) != 0))")
-            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+            sql += " and resolvedword != ''"
+
+        # Order of insertion if positions are requested, by name otherwise
+        if "firstcharpos" in withFields:
+            sql += " order by rowid"
+        else:
+            sql += " order by relation"
 
 
         try:
             if len(withFields) > 0:
-                return self.connWrap.execSqlQuery(sql, (wikiWord,))
+                return [tuple(c(item) for c, item in zip(converters, row))
+                        for row in self.connWrap.execSqlQuery(sql, (wikiWord,))]
             else:
                 return self.connWrap.execSqlQuerySingleColumn(sql, (wikiWord,))
         except (IOError, OSError, sqlite.Error) as e:
@@ -708,16 +789,16 @@ class WikiData:
         """
         # Parents of the real word
         realWord = self.getWikiPageNameForLinkTerm(wikiWord)
-        if realWord is None:
-            realWord = wikiWord
         try:
-            return self.connWrap.execSqlQuerySingleColumn(
-                    "select word from wikirelations where relation = ? or "
-                    "relation in (select matchterm from wikiwordmatchterms "
-                    "where word = ? and "
-                    "(wikiwordmatchterms.type & 2) != 0)", (realWord, realWord))
-            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+            if realWord is None:
+                # Undefined word
+                return self.connWrap.execSqlQuerySingleColumn(
+                        "select word from wikirelations where relation = ?",
+                        (wikiWord,))
 
+            return self.connWrap.execSqlQuerySingleColumn(
+                    "select word from wikirelations where resolvedword = ?",
+                    (realWord,))
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbReadAccessError(e)
@@ -745,11 +826,8 @@ class WikiData:
 
             return self.connWrap.execSqlQuerySingleColumn(
                     "select word from wikiwordcontent except "
-                    "select wikiwordmatchterms.word from wikiwordmatchterms "
-                    "where exists (select 1 from wikirelations where "
-                    "wikiwordmatchterms.matchterm == wikirelations.relation and "
-                    "wikirelations.word != wikiwordmatchterms.word) and "
-                    "(type & 2) != 0")
+                    "select resolvedword from wikirelations "
+                    "where resolvedword != word")
 
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
@@ -764,35 +842,45 @@ class WikiData:
         """
         try:
             return self.connWrap.execSqlQuerySingleColumn(
-                    "select relation from wikirelations "
-                    "except select word from wikiwordcontent "
-                    "except select matchterm from wikiwordmatchterms "
-                    "where (type & 2) != 0")
-            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+                    "select distinct relation from wikirelations "
+                    "where resolvedword = ''")
 
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbReadAccessError(e)
 
 
-    def _addRelationship(self, word, rel):
+    def getAllRelations(self):
         """
-        Add a relationship from word to rel. rel is a tuple (toWord, pos).
-        A relation from one word to another is unique and can't be added twice.
+        Return all relations as list of tuples (word, relation) ordered
+        by word and relation.
+        Function must work for read-only wiki.
         """
         try:
-            self.connWrap.execSql(
-                    "insert or replace into wikirelations(word, relation, firstcharpos) "
-                    "values (?, ?, ?)", (word, rel[0], rel[1]))
+            return self.connWrap.execSqlQuery(
+                    "select word, relation from wikirelations "
+                    "order by word, relation")
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
-            raise DbWriteAccessError(e)
+            raise DbReadAccessError(e)
+
 
     def updateChildRelations(self, word, childRelations):
+        """
+        Replace relationships from word by childRelations, a sequence of
+        tuples (toWord, pos). A relation from one word to another is unique
+        and can't be added twice.
+        """
         self.deleteChildRelationships(word)
         self.getExistingWikiWordInfo(word)
-        for r in childRelations:
-            self._addRelationship(word, r)
+        try:
+            self.connWrap.execSqlMany(
+                    "insert or replace into wikirelations(word, relation, firstcharpos) "
+                    "values (?, ?, ?)", [(word, r[0], r[1]) for r in childRelations])
+            DbStructure.updateResolvedWords(self.connWrap, "word = ?", (word,))
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
 
     def deleteChildRelationships(self, fromWord):
         try:
@@ -803,7 +891,96 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
-    # TODO Maybe optimize
+    # SQL condition for relations of a subtree, see
+    # getSubTreeChildRelationships(). The relation must be an existing
+    # page or alias which isn't the word itself
+    _SUBTREE_RELATION_CONDITION = (
+            "wikirelations.relation != wikirelations.word and "
+            "wikirelations.resolvedword != ''")
+
+    # SQL expression for the real page name of the relation
+    _SUBTREE_RELATION_PAGE_NAME = "wikirelations.resolvedword"
+
+
+    # Maximum number of start words of getSubTreeChildRelationships()
+    _SUBTREE_MAX_WORDS = 500
+
+
+    def getSubTreeChildRelationships(self, words, level=-1, withFields=()):
+        """
+        Return the child relations of the whole sub-tree below words with
+        a single query as dictionary {pageName: list of tuples
+        (relation, relationPageName, ...)} where relationPageName is the
+        real page name the relation resolves to and ... are the further
+        fields named in withFields (see getChildRelationships()).
+        Only relations to existing pages or aliases are listed, a page
+        never relates to itself.
+
+        Contains all pages reachable from words in less than level steps
+        (-1: no limit) following the resolved relations. words must be
+        real page names. Returns None if sqlite is too old to support
+        recursive queries or if there are too many words,
+        getChildRelationships() must be used then.
+        Function must work for read-only wiki.
+        """
+        if not self.recursiveCteSupported:
+            return None
+
+        if level == 0 or len(words) == 0:
+            return {}
+
+        if len(words) > self._SUBTREE_MAX_WORDS:
+            # Too many query parameters for old sqlite versions
+            return None
+
+        if withFields is None:
+            withFields = ()
+
+        addFields, converters = self._getChildRelationshipsFieldsSql(
+                withFields)
+
+        relationCondition = self._SUBTREE_RELATION_CONDITION
+        relationPageName = self._SUBTREE_RELATION_PAGE_NAME
+
+        # UNION (not UNION ALL) handles cycles in the graph
+        if level < 0:
+            sql = ("with recursive subtree(word) as (values %s union "
+                    "select %s from subtree inner join wikirelations "
+                    "on wikirelations.word = subtree.word where %s) " % (
+                    ", ".join(["(?)"] * len(words)), relationPageName,
+                    relationCondition))
+            params = list(words)
+        else:
+            sql = ("with recursive subtree(word, level) as (values %s union "
+                    "select %s, subtree.level + 1 from subtree "
+                    "inner join wikirelations "
+                    "on wikirelations.word = subtree.word "
+                    "where subtree.level + 1 < ? and %s) " % (
+                    ", ".join(["(?, 0)"] * len(words)), relationPageName,
+                    relationCondition))
+            params = list(words) + [level]
+
+        # Without fields the order matches getChildRelationships()
+        # (ordered by relation), with fields it is the order of insertion
+        sql += ("select wikirelations.word, wikirelations.relation, %s%s "
+                "from wikirelations where wikirelations.word in "
+                "(select word from subtree) and %s "
+                "order by wikirelations.word, %s" % (relationPageName,
+                addFields, relationCondition, "wikirelations.rowid"
+                if withFields else "wikirelations.relation"))
+
+        try:
+            result = {}
+            for row in self.connWrap.execSqlQuery(sql, params):
+                result.setdefault(row[0], []).append(row[1:3] +
+                        tuple(c(item) for c, item in zip(converters[1:], row[3:])))
+
+            return result
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+
     def getAllSubWords(self, words, level=-1):
         """
         Return all words which are children, grandchildren, etc.
@@ -815,7 +992,10 @@ class WikiData:
                 for w in (self.getWikiPageNameForLinkTerm(w) for w in words)
                 if w is not None]
         checkList.reverse()
-        
+
+        subTree = self.getSubTreeChildRelationships([w for w, l in checkList],
+                level)
+
         resultSet = {}
         result = []
 
@@ -830,11 +1010,15 @@ class WikiData:
             if level > -1 and chLevel >= level:
                 continue  # Don't go deeper
             
-            children = self.getChildRelationships(toCheck, existingonly=True,
-                    selfreference=False)
-                    
-            children = [(self.getWikiPageNameForLinkTerm(c), chLevel + 1)
-                    for c in children]
+            if subTree is not None:
+                children = [(r[1], chLevel + 1)
+                        for r in subTree.get(toCheck, ())]
+            else:
+                children = self.getChildRelationships(toCheck,
+                        existingonly=True, selfreference=False)
+
+                children = [(self.getWikiPageNameForLinkTerm(c), chLevel + 1)
+                        for c in children]
             children.reverse()
             checkList += children
 
@@ -848,12 +1032,16 @@ class WikiData:
         it is included only once as the single element of the list.
         If there is no path from word to toWord, [] is returned
         Function must work for read-only wiki (should hold although function
-        writes to temporary table).
+        writes to temporary table if sqlite doesn't support recursive queries).
         """
         # TODO Aliases supported?
         
         if word == toWord:
             return [word]
+
+        if self.recursiveCteSupported:
+            return self._findBestPathFromWordToWordRecursive(word, toWord)
+
         try:
             # Clear temporary table
             self.connWrap.execSql("delete from temppathfindparents")
@@ -904,6 +1092,49 @@ class WikiData:
             raise DbReadAccessError(e)
 
 
+    def _findBestPathFromWordToWordRecursive(self, word, toWord):
+        """
+        Implementation of findBestPathFromWordToWord() with a recursive
+        query which doesn't need the temporary table.
+        """
+        # Without "order by" sqlite processes the recursive query as queue
+        # so rows arrive breadth-first: The first row for a parent
+        # word is on a shortest path. Reading stops as soon as toWord
+        # arrives which also stops the recursion.
+        children = {}
+        try:
+            cursor = self.connWrap.getConnection().cursor()
+            try:
+                cursor.execute("with recursive parents(word, child) as "
+                        "(select ?, null union "
+                        "select wikirelations.word, parents.word from parents "
+                        "inner join wikirelations "
+                        "on wikirelations.relation = parents.word) "
+                        "select word, child from parents", (word,))
+
+                for parent, child in cursor:
+                    if parent not in children:
+                        children[parent] = child
+                        if parent == toWord:
+                            break
+                else:
+                    # No more (grand-)parents
+                    return []
+            finally:
+                cursor.close()
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+        result = [toWord]
+        crumb = toWord
+        while crumb != word:
+            crumb = children[crumb]
+            result.append(crumb)
+
+        return result
+
+
     # ---------- Listing/Searching wiki words (see also "alias handling", "searching pages")----------
 
     def getAllDefinedWikiPageNames(self):
@@ -957,107 +1188,116 @@ class WikiData:
         so it must not rely on the presence of other cache
         information (e.g. relations).
 
-        The self.cachedWikiPageLinkTermDict is invalidated.
+        The link term snapshot is invalidated.
         """
-        self.cachedWikiPageLinkTermDict = None
+        self._invalidateLinkTerms()
 
 
 
-    def _getCachedWikiPageLinkTermDict(self):
+    def getLinkTermSnapshot(self):
         """
-        Function works for read-only wiki.
+        Return the LinkTermSnapshot published last or None. May be called
+        by any thread without holding the lock of the WikiData, the snapshot
+        may miss the latest changes then.
         """
-        class CachedWikiPageLinkTermDict:
-            def __init__(self, outer):
-                self.outer = outer
-                self.cache = {}
-                self.cacheNonExistent = set()
-                self.cacheComplete = False
-                self.resolveCaseNormed = self.outer.resolveCaseNormed
-                    
-
-            def get(self, key, default=None):
-                if self.cacheComplete:
-                    return self.cache.get(key, default)
-
-                if key in self.cache:
-                    return self.cache.get(key, default)
-                    
-                if key in self.cacheNonExistent:
-                    return default
-                
-                value = self._lookup(key)
-                
-                if value is None and self.resolveCaseNormed:
-                    value = self._lookupCaseNormed(key)
-                
-                if value is not None:
-                    self.cache[key] = value
-                    return value
+        return self.linkTermSnapshot
 
-                self.cacheNonExistent.add(key)
-                return default
 
+    def _invalidateLinkTerms(self, word=None):
+        """
+        Mark the link terms of page  word  (or all if word is None) as
+        changed. The link term snapshot is updated on next use or commit.
+        """
+        if word is None:
+            self.linkTermDirtyWords = None
+        elif self.linkTermDirtyWords is not None:
+            self.linkTermDirtyWords.add(word)
 
-            def _lookup(self, key):
-                if self.outer.isDefinedWikiPageName(key):
-                    return key
-                
-                try:
-                    return self.outer.connWrap.execSqlQuerySingleItem(
-                            "select word from wikiwordmatchterms "
-                            "where matchterm = ? and (type & 2) != 0 ", (key,))
-                    # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
-                except (IOError, OSError, sqlite.Error) as e:
-                    traceback.print_exc()
-                    raise DbReadAccessError(e)
-                
-            def _lookupCaseNormed(self, key):
-                try:
-                    return self.outer.connWrap.execSqlQuerySingleItem(
-                            "select word from wikiwordmatchterms "
-                            "where matchtermnormcase = utf8Normcase(?) "
-                            "and (type & 2) != 0 ", (key,))
-                    # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
-                except (IOError, OSError, sqlite.Error) as e:
-                    traceback.print_exc()
-                    raise DbReadAccessError(e)
-
-
-            def keys(self):
-                # This function is not affected by self.resolveCaseNormed
-                # because in theory it would have to return all possible
-                # lowercase-uppercase-combinations of a word to be
-                # accurate
-                if not self.cacheComplete:
-                    cacheDict = dict(self.outer.connWrap.execSqlQuery(
-                            "select word, word from wikiwordcontent union "
-                            "select matchterm, word from wikiwordmatchterms "
-                            "where (type & 2) != 0 and not matchterm in "
-                            "(select word from wikiwordcontent)"))
-                    # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
-
-                    if not self.resolveCaseNormed:
-                        # Cache can't be complete with case normed resolving
-                        # because above
-                        self.cacheComplete = True
-                        self.cache = cacheDict
-
-                else:
-                    cacheDict = self.cache
 
-                return list(cacheDict)
+    def _getCurrentLinkTermSnapshot(self):
+        """
+        Bring the link term snapshot up to date, publish and return it.
+        Function works for read-only wiki.
+        """
+        dirtyWords = self.linkTermDirtyWords
+        if self.linkTermSnapshot is not None and dirtyWords is not None and \
+                len(dirtyWords) == 0:
+            return self.linkTermSnapshot
 
         try:
-            if self.cachedWikiPageLinkTermDict is None:
-                self.cachedWikiPageLinkTermDict = CachedWikiPageLinkTermDict(self)
+            # Building anew is faster than querying many changed pages
+            if self.linkTermSnapshot is None or dirtyWords is None or \
+                    len(dirtyWords) > 1000:
+                self._buildLinkTermSnapshot()
+            else:
+                self._patchLinkTermSnapshot(dirtyWords)
 
-            return self.cachedWikiPageLinkTermDict
+            self.linkTermDirtyWords = set()
+            return self.linkTermSnapshot
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbReadAccessError(e)
 
 
+    def _buildLinkTermSnapshot(self):
+        # An alias defined by multiple pages links to the first page by
+        # name, as in _patchLinkTermSnapshot() and column "resolvedword"
+        linkTerms = {}
+        for term, word in self.connWrap.execSqlQuery(
+                "select matchterm, word from wikiwordmatchterms "
+                "where (type & 2) != 0 order by word"):
+            linkTerms.setdefault(term, word)
+        # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+
+        for word in self.connWrap.execSqlQuerySingleColumn(
+                "select word from wikiwordcontent"):
+            linkTerms[word] = word
+
+        # {page name: set of link terms} for _patchLinkTermSnapshot()
+        self.linkTermsOfPage = {}
+        for term, word in linkTerms.items():
+            self.linkTermsOfPage.setdefault(word, set()).add(term)
+
+        self.linkTermSnapshot = LinkTermSnapshot(linkTerms,
+                self.resolveCaseNormed)
+
+
+    def _patchLinkTermSnapshot(self, dirtyWords):
+        # Terms which linked or now link to a page in dirtyWords
+        terms = set(dirtyWords)
+        for word in dirtyWords:
+            terms.update(self.linkTermsOfPage.get(word, ()))
+            terms.update(self.connWrap.execSqlQuerySingleColumn(
+                    "select matchterm from wikiwordmatchterms "
+                    "where word = ? and (type & 2) != 0", (word,)))
+            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+
+        snapshot = self.linkTermSnapshot
+        changes = {}
+        for term in terms:
+            if self.isDefinedWikiPageName(term):
+                word = term
+            else:
+                word = self.connWrap.execSqlQuerySingleItem(
+                        "select word from wikiwordmatchterms "
+                        "where matchterm = ? and (type & 2) != 0 "
+                        "order by word limit 1", (term,))
+                # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+
+            oldWord = snapshot.getPageNameForTerm(term)
+            if word == oldWord:
+                continue
+
+            changes[term] = word
+            if oldWord is not None:
+                self.linkTermsOfPage[oldWord].discard(term)
+            if word is not None:
+                self.linkTermsOfPage.setdefault(word, set()).add(term)
+
+        if changes:
+            self.linkTermSnapshot = snapshot.patched(changes)
+
+
 #     def _getCachedWikiPageLinkTermDict(self):
 #         """
 #         Function works for read-only wiki.
@@ -1093,7 +1333,7 @@ class WikiData:
         Return all links stored by production (in contrast to resolution)
         Function must work for read-only wiki.
         """
-        return list(self._getCachedWikiPageLinkTermDict().keys())
+        return self._getCurrentLinkTermSnapshot().getAllProducedWikiLinks()
 
 
     def getWikiPageLinkTermsStartingWith(self, thisStr, caseNormed=None):
@@ -1104,41 +1344,8 @@ class WikiData:
                 are taken into account. If None (default) the parameter value
                 is taken from self.resolveCaseNormed
         """
-        if caseNormed is None:
-            caseNormed = self.resolveCaseNormed
-        
-        if caseNormed:
-            thisStr = sqlite.escapeForGlob(thisStr.lower())   # TODO More general normcase function
-
-            try:
-                return self.connWrap.execSqlQuerySingleColumn(
-                        "select matchterm from wikiwordmatchterms "
-                        "where matchtermnormcase glob (? || '*') and "
-                        "(type & 2) != 0", 
-                        (thisStr,))
-                # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
-
-            except (IOError, OSError, sqlite.Error) as e:
-                traceback.print_exc()
-                raise DbReadAccessError(e)
-
-        else:
-            try:
-                thisStr = sqlite.escapeForGlob(thisStr)
-
-                # To ensure that at least all real wikiwords are found,
-                # the wikiwords table is also read
-                return self.connWrap.execSqlQuerySingleColumn(
-                        "select matchterm from wikiwordmatchterms "
-                        "where matchterm glob (? || '*') and "
-                        "(type & 2) != 0 union "
-                        "select word from wikiwordcontent where word glob (? || '*')", 
-                        (thisStr,thisStr))
-                # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
-
-            except (IOError, OSError, sqlite.Error) as e:
-                traceback.print_exc()
-                raise DbReadAccessError(e)
+        return self._getCurrentLinkTermSnapshot()\
+                .getWikiPageLinkTermsStartingWith(thisStr, caseNormed)
 
 
     def getWikiPageNamesModifiedWithin(self, startTime, endTime):
@@ -1489,8 +1696,9 @@ class WikiData:
             return  # Nothing to change
 
         self.resolveCaseNormed = cn
-        # Clear cache which must be rebuilt differently depending on the setting
-        self.cachedWikiPageLinkTermDict = None
+        if self.linkTermSnapshot is not None:
+            self.linkTermSnapshot = \
+                    self.linkTermSnapshot.withResolveCaseNormed(cn)
 
 
     def getWikiPageNameForLinkTerm(self, alias):
@@ -1501,7 +1709,27 @@ class WikiData:
         of unaliasing must be performed in WikiDocument.
         Function must work for read-only wiki.
         """
-        return self._getCachedWikiPageLinkTermDict().get(alias, None)
+        return self._getCurrentLinkTermSnapshot().getWikiPageNameForLinkTerm(
+                alias)
+
+
+    def getAllWikiPageLinkTerms(self):
+        """
+        Return all link terms (page names or aliases) as list of tuples
+        (linkTerm, pageName, syncUpdate) where syncUpdate is True for
+        link terms which are updated synchronously.
+        Function must work for read-only wiki.
+        """
+        try:
+            return [(linkTerm, word, bool(syncUpdate))
+                    for linkTerm, word, syncUpdate in self.connWrap.execSqlQuery(
+                    "select matchterm, word, (type & 16) != 0 "
+                    "from wikiwordmatchterms where (type & 2) != 0")]
+            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+            # Consts.WIKIWORDMATCHTERMS_TYPE_SYNCUPDATE == 16
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
 
 
     # TODO: 2.4: Remove compatibility definitions
@@ -1557,14 +1785,9 @@ class WikiData:
     def updateTodos(self, word, todos):
         self.deleteTodos(word)
         self.getExistingWikiWordInfo(word)
-        for t in todos:
-            self._addTodo(word, t)
-
-
-    def _addTodo(self, word, todo):
         try:
-            self.connWrap.execSql("insert into todos(word, key, value) values (?, ?, ?)",
-                    (word, todo[0], todo[1]))
+            self.connWrap.execSqlMany("insert into todos(word, key, value) values (?, ?, ?)",
+                    [(word, t[0], t[1]) for t in todos])
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -1643,20 +1866,25 @@ class WikiData:
     def updateWikiWordMatchTerms(self, word, wwmTerms, syncUpdate=False):
         self.deleteWikiWordMatchTerms(word, syncUpdate=syncUpdate)
         self.getExistingWikiWordInfo(word)
-        for t in wwmTerms:
-            assert t[2] == word
-            self._addWikiWordMatchTerm(t)
-
-
-    def _addWikiWordMatchTerm(self, wwmTerm):
-        matchterm, typ, word, firstcharpos, charlength = wwmTerm
+        params = []
+        linkTerms = set()
+        for matchterm, typ, tword, firstcharpos, charlength in wwmTerms:
+            assert tword == word
+            params.append((matchterm, typ, word, firstcharpos, charlength,
+                    matchterm.lower()))
+            if typ & Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK:
+                linkTerms.add(matchterm)
         try:
             # TODO Check for name collisions
-            self.connWrap.execSql("insert into wikiwordmatchterms(matchterm, "
+            self.connWrap.execSqlMany("insert into wikiwordmatchterms(matchterm, "
                     "type, word, firstcharpos, charlength, matchtermnormcase) "
-                    "values (?, ?, ?, ?, ?, ?)",
-                    (matchterm, typ, word, firstcharpos, charlength,
-                    matchterm.lower()))
+                    "values (?, ?, ?, ?, ?, ?)", params)
+
+            # Resolve again relations which link to the new terms, they
+            # may be undefined or link to another page with the same alias
+            for linkTerm in linkTerms:
+                DbStructure.updateResolvedWords(self.connWrap,
+                        "relation = ?", (linkTerm,))
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -1672,7 +1900,12 @@ class WikiData:
         try:
             self.connWrap.execSql("delete from wikiwordmatchterms where "
                     "word = ?" + addSql, (word,))
-            self.cachedWikiPageLinkTermDict = None
+            # Relations to the page itself stay resolved if the page exists
+            DbStructure.updateResolvedWords(self.connWrap,
+                    "resolvedword = ? and (relation != resolvedword or "
+                    "not exists (select 1 from wikiwordcontent "
+                    "where wikiwordcontent.word = resolvedword))", (word,))
+            self._invalidateLinkTerms(word)
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -1804,44 +2037,482 @@ class WikiData:
         return set of all page names that match the search criteria.
         sarOp.beginWikiSearch() must be called before calling this function,
         sarOp.endWikiSearch() must be called after calling this function.
-        This version uses sqlite user-defined functions.
+        This version uses sqlite user-defined functions. If the full text
+        index or the trigram index is enabled, only the pages found by them
+        for sarOp.getFullTextIndexQuery() or sarOp.getTrigramQuery()
+        are tested.
         
         exclusionSet -- set of wiki words for which their pages shouldn't be
         searched here and which must not be part of the result set
         """
-
         if sarOp.isTextNeededForTest():
+            contentSql = "content"
+        else:
+            contentSql = "''"
+
+        conditions = []
+        params = []
+
+        if self.fullTextIndexEnabled:
+            ftsQuery = sarOp.getFullTextIndexQuery()
+            if ftsQuery is not None:
+                conditions.append("word in (select word from "
+                        "fulltextindexwords where id in (select rowid from "
+                        "fulltextindex where fulltextindex match ?))")
+                params.append(ftsQuery)
+
+        if self.trigramIndexEnabled:
+            trigramQuery = sarOp.getTrigramQuery()
+            if trigramQuery is not None:
+                conditions.append("word in (select word from "
+                        "trigramindexwords where id in (%s))" %
+                        self._buildTrigramQuerySql(trigramQuery, params))
+
+        try:
+            conditions.append("testMatch(word, %s, ?)" % contentSql)
+            params.append(sqlite.addTransObject(sarOp))
+
+            result = self.connWrap.execSqlQuerySingleColumn(
+                    "select word from wikiwordcontent where " +
+                    " and ".join(conditions), params)
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+        finally:
+            sqlite.delTransObject(sarOp)
+
+        result = set(result)
+        result -= exclusionSet
+
+        return result
+
+
+    # ---------- Full text index ----------
+
+    def setFullTextIndexEnabled(self, enabled):
+        """
+        Create and fill or delete the optional FTS5 full text index which
+        is used by search() to find candidate pages. It is updated in the same
+        transaction as the content. If the sqlite library doesn't support it,
+        it stays disabled.
+        """
+        if enabled == self.fullTextIndexEnabled:
+            return
+
+        try:
+            if enabled:
+                if not DbStructure.isFullTextIndexSupported(self.connWrap):
+                    return
+
+                if DbStructure.hasFullTextIndex(self.connWrap) and not \
+                        DbStructure.hasCurrentFullTextIndexTokenizer(
+                        self.connWrap):
+                    # Tokens of an older version may not match the queries
+                    DbStructure.dropFullTextIndex(self.connWrap)
+
+                if not DbStructure.hasFullTextIndex(self.connWrap):
+                    DbStructure.createFullTextIndex(self.connWrap)
+                    self._fillFullTextIndex()
+                elif self._isIndexOutdated("fulltextindexwords"):
+                    self._fillFullTextIndex()
+            else:
+                if DbStructure.hasFullTextIndex(self.connWrap):
+                    # An index which isn't maintained would become outdated
+                    DbStructure.dropFullTextIndex(self.connWrap)
+
+            self.connWrap.commit()
+            self.fullTextIndexEnabled = enabled
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
+    def isFullTextIndexEnabled(self):
+        return self.fullTextIndexEnabled
+
+
+    def _isIndexOutdated(self, wordsTable):
+        """
+        Returns True if pages were modified without updating the index
+        with the page table wordsTable, e.g. by an older WikidPad version.
+        """
+        return bool(self.connWrap.execSqlQuerySingleItem(
+                "select exists (select 1 from wikiwordcontent left outer join "
+                "{0} on wikiwordcontent.word = {0}.word where "
+                "{0}.modified is null or "
+                "{0}.modified != wikiwordcontent.modified) or "
+                "(select count(*) from {0}) != "
+                "(select count(*) from wikiwordcontent)".format(wordsTable)))
+
+
+    def _fillFullTextIndex(self):
+        """
+        Clear the full text index and add the content of all pages
+        """
+        self.connWrap.execSql("insert into fulltextindex(fulltextindex) "
+                "values ('delete-all')")
+        self.connWrap.execSql("delete from fulltextindexwords")
+        self.connWrap.execSql("insert into fulltextindexwords(word, modified) "
+                "select word, modified from wikiwordcontent")
+        self.connWrap.execSql("insert into fulltextindex(rowid, content) "
+                "select fulltextindexwords.id, wikiwordcontent.content "
+                "from fulltextindexwords inner join wikiwordcontent on "
+                "fulltextindexwords.word = wikiwordcontent.word")
+
+
+    def _removeFromFullTextIndex(self, word):
+        """
+        Remove page word from the full text index. Must be called before
+        its content in the database is changed because the index doesn't
+        store the content but needs it to remove its tokens.
+        """
+        self.connWrap.execSql("insert into fulltextindex(fulltextindex, "
+                "rowid, content) select 'delete', fulltextindexwords.id, "
+                "wikiwordcontent.content from fulltextindexwords "
+                "inner join wikiwordcontent on "
+                "fulltextindexwords.word = wikiwordcontent.word "
+                "where fulltextindexwords.word = ?", (word,))
+        self.connWrap.execSql("delete from fulltextindexwords where word = ?",
+                (word,))
+
+
+    def _addToFullTextIndex(self, word):
+        """
+        Add the current content of page word to the full text index
+        """
+        self.connWrap.execSql("insert into fulltextindexwords(word, modified) "
+                "select word, modified from wikiwordcontent where word = ?",
+                (word,))
+        self.connWrap.execSql("insert into fulltextindex(rowid, content) "
+                "select fulltextindexwords.id, wikiwordcontent.content "
+                "from fulltextindexwords inner join wikiwordcontent on "
+                "fulltextindexwords.word = wikiwordcontent.word "
+                "where fulltextindexwords.word = ?", (word,))
+
+
+    # ---------- Trigram index ----------
+
+    def setTrigramIndexEnabled(self, enabled):
+        """
+        Create and fill or delete the optional trigram index which is used
+        by search() to find candidate pages for regular expression and
+        substring searches. It is updated in the same transaction
+        as the content.
+        """
+        if enabled == self.trigramIndexEnabled:
+            return
+
+        try:
+            if enabled:
+                self.trigramIndexJson = DbStructure.isJsonSupported(
+                        self.connWrap)
+                if not DbStructure.hasTrigramIndex(self.connWrap):
+                    DbStructure.createTrigramIndex(self.connWrap)
+                    self._fillTrigramIndex()
+                elif self._isIndexOutdated("trigramindexwords"):
+                    self._fillTrigramIndex()
+            else:
+                if DbStructure.hasTrigramIndex(self.connWrap):
+                    DbStructure.dropTrigramIndex(self.connWrap)
+
+            self.connWrap.commit()
+            self.trigramIndexEnabled = enabled
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
+    def isTrigramIndexEnabled(self):
+        return self.trigramIndexEnabled
+
+
+    def _fillTrigramIndex(self):
+        """
+        Clear the trigram index and add the content of all pages
+        """
+        self.connWrap.execSql("delete from trigramindex")
+        self.connWrap.execSql("delete from trigramindexwords")
+
+        # Inserting the trigrams ordered is much faster than page by page
+        self.connWrap.execSqlNoError("drop table temp.trigramfill")
+        self.connWrap.execSql("create temp table trigramfill "
+                "(trigram integer, id integer)")
+
+        for word in self.connWrap.execSqlQuerySingleColumn(
+                "select word from wikiwordcontent"):
+            content, moddate = self.connWrap.execSqlQuery(
+                    "select content, modified from wikiwordcontent "
+                    "where word = ?", (word,))[0]
+            self.connWrap.execSql("insert into trigramindexwords"
+                    "(word, modified) values (?, ?)", (word, moddate))
+            pageId = self.connWrap.getLastRowid()
+            self._insertTrigrams(pageId,
+                    TrigramIndex.getTrigramInts(self.contentDbToOutput(content)),
+                    "trigramfill")
+
+        self.connWrap.execSql("insert into trigramindex(trigram, id) "
+                "select trigram, id from trigramfill order by trigram, id")
+        self.connWrap.execSql("drop table temp.trigramfill")
+
+
+    def _getIndexedTrigrams(self, word):
+        """
+        Returns tuple (id, trigrams) with the page id of word in the trigram
+        index and the set of integer trigrams of its current content in the
+        database or (None, set()) if the page isn't indexed.
+        """
+        data = self.connWrap.execSqlQuery("select trigramindexwords.id, "
+                "wikiwordcontent.content from trigramindexwords "
+                "left outer join wikiwordcontent on "
+                "trigramindexwords.word = wikiwordcontent.word "
+                "where trigramindexwords.word = ?", (word,))
+
+        if len(data) == 0:
+            return (None, set())
+
+        pageId, content = data[0]
+        if content is None:
+            return (pageId, set())
+
+        return (pageId,
+                TrigramIndex.getTrigramInts(self.contentDbToOutput(content)))
+
+
+    def _updateTrigramIndex(self, word, content, moddate):
+        """
+        Update the trigram index for the new content of page word. Must be
+        called before the content in the database is changed because only
+        the trigrams which differ from the old content are written.
+
+        content -- New content as stored in database
+        moddate -- New modification date
+        """
+        pageId, oldTrigrams = self._getIndexedTrigrams(word)
+        newTrigrams = TrigramIndex.getTrigramInts(
+                self.contentDbToOutput(content))
+
+        if pageId is None:
+            self.connWrap.execSql("insert into trigramindexwords"
+                    "(word, modified) values (?, ?)", (word, moddate))
+            pageId = self.connWrap.getLastRowid()
+        else:
+            self.connWrap.execSql("update trigramindexwords set modified = ? "
+                    "where id = ?", (moddate, pageId))
+
+        self._deleteTrigrams(pageId, oldTrigrams - newTrigrams)
+        self._insertTrigrams(pageId, newTrigrams - oldTrigrams)
+
+
+    def _removeFromTrigramIndex(self, word):
+        """
+        Remove page word from the trigram index. Must be called before
+        its content in the database is deleted.
+        """
+        pageId, oldTrigrams = self._getIndexedTrigrams(word)
+        if pageId is None:
+            return
+
+        self._deleteTrigrams(pageId, oldTrigrams)
+        self.connWrap.execSql("delete from trigramindexwords where id = ?",
+                (pageId,))
+
+
+    def _insertTrigrams(self, pageId, trigrams, table="trigramindex"):
+        """
+        Add the collection of integer trigrams for page id pageId to the
+        trigram index (or another table with same columns). Thousands of
+        trigrams per page are common, so they are passed as a single
+        JSON array if sqlite supports it.
+        """
+        if len(trigrams) == 0:
+            return
+
+        if self.trigramIndexJson:
+            self.connWrap.execSql("insert into %s(trigram, id) "
+                    "select value, ? from json_each(?)" % table,
+                    (pageId, "[%s]" % ",".join([str(t) for t in trigrams])))
+        else:
+            self.connWrap.execSqlMany("insert into %s(trigram, id) "
+                    "values (?, ?)" % table, [(t, pageId) for t in trigrams])
+
+
+    def _deleteTrigrams(self, pageId, trigrams):
+        """
+        Remove the collection of integer trigrams for page id pageId from
+        the trigram index.
+        """
+        if len(trigrams) == 0:
+            return
+
+        if self.trigramIndexJson:
+            self.connWrap.execSql("delete from trigramindex where id = ? and "
+                    "trigram in (select value from json_each(?))",
+                    (pageId, "[%s]" % ",".join([str(t) for t in trigrams])))
+        else:
+            self.connWrap.execSqlMany("delete from trigramindex "
+                    "where trigram = ? and id = ?",
+                    [(t, pageId) for t in trigrams])
+
+
+    def _buildTrigramQuerySql(self, query, params):
+        """
+        Return SQL select statement for the page ids of the trigram index
+        matching the trigram query (see TrigramIndex) and append
+        the needed parameters to list params.
+        """
+        if not isinstance(query, tuple):
+            params.append(TrigramIndex.trigramToInt(query))
+            return "select id from trigramindex where trigram = ?"
+
+        op, subQueries = query
+        if op == "and":
+            compoundOp = " intersect "
+        else:
+            compoundOp = " union "
+
+        return compoundOp.join(["select id from (%s)" %
+                self._buildTrigramQuerySql(q, params) for q in subQueries])
+
+
+    # ---------- Concurrent reads ----------
+
+    # Methods which only read from the database and don't use or fill
+    # caches of the WikiData, they can be called on a reader
+    READER_METHODS = frozenset((
+            "getContent", "getTimestamps", "getWikiWordReadOnly",
+            "getExistingWikiWordInfo", "getMetaDataState",
+            "getWikiPageNamesForMetaDataState", "getChildRelationships",
+            "getSubTreeChildRelationships", "getParentlessWikiWords",
+            "getUndefinedWords", "getAllRelations", "getAllWikiPageLinkTerms",
+            "getAllDefinedWikiPageNames",
+            "getDefinedWikiPageNamesStartingWith", "isDefinedWikiPageName",
+            "getWikiPageNamesModifiedWithin",
+            "getTimeMinMax", "getWikiPageNamesBefore", "getWikiPageNamesAfter",
+            "getFirstWikiPageName", "getNextWikiPageName",
+            "getAttributeNames", "getAttributeNamesStartingWith",
+            "getDistinctAttributeValues", "getAttributeTriples",
+            "getWordsForAttributeName", "getAttributesForWord", "getTodos",
+            "getWikiWordMatchTermsWith", "getDataBlockUnifNamesStartingWith",
+            "retrieveDataBlock", "retrieveDataBlockAsText",
+            "getPresentationBlock", "search"))
+
+    # Methods which can be answered by the link term snapshot published last
+    # (see getLinkTermSnapshot()) while another thread holds the lock
+    SNAPSHOT_METHODS = frozenset((
+            "getWikiPageNameForLinkTerm", "isDefinedWikiLinkTerm",
+            "getWikiPageLinkTermsStartingWith", "getAllProducedWikiLinks"))
+
+    def setReaderCountMax(self, count):
+        """
+        Set the maximum number of readers, each with an own read-only
+        connection to the database. Readers need the WAL journal mode
+        of the database (which allows reading while another connection
+        writes), the database is switched to it if count > 0.
+        If this isn't possible, no readers are used. If count is 0
+        (also when the WikiData is closed), the previous journal mode is
+        restored so the database file stays usable for sqlite versions
+        without WAL support.
+        """
+        count = max(count, 0)
+        if count > 0 and self.journalModeBeforeReaders is None:
             try:
-                result = self.connWrap.execSqlQuerySingleColumn(
-                        "select word from wikiwordcontent where "
-                        "testMatch(word, content, ?)",
-                        (sqlite.addTransObject(sarOp),))
+                previousMode = self.connWrap.execSqlQuerySingleItem(
+                        "pragma journal_mode")
+                mode = self.connWrap.execSqlQuerySingleItem(
+                        "pragma journal_mode = wal")
             except (IOError, OSError, sqlite.Error) as e:
                 traceback.print_exc()
-                raise DbReadAccessError(e)
-            finally:
-                sqlite.delTransObject(sarOp)
-    
-            result = set(result)
-            result -= exclusionSet
-    
-            return result
-        else:
+                mode = None
+
+            if mode is None or mode.lower() != "wal":
+                count = 0
+            else:
+                self.journalModeBeforeReaders = previousMode
+
+        with self.readerLock:
+            self.readerCountMax = count
+            surplus = self.idleReaders[count:]
+            del self.idleReaders[count:]
+            self.readerCount -= len(surplus)
+            readersInUse = self.readerCount > 0
+
+        for reader in surplus:
+            reader.close()
+
+        if count == 0 and self.journalModeBeforeReaders is not None and \
+                not readersInUse:
             try:
-                result = self.connWrap.execSqlQuerySingleColumn(
-                        "select word from wikiwordcontent where "
-                        "testMatch(word, '', ?)",
-                        (sqlite.addTransObject(sarOp),))
+                self.connWrap.execSqlQuerySingleItem("pragma journal_mode = "
+                        + self.journalModeBeforeReaders)
+                self.journalModeBeforeReaders = None
             except (IOError, OSError, sqlite.Error) as e:
+                # Tried again on next call, e.g. when closing
                 traceback.print_exc()
-                raise DbReadAccessError(e)
-            finally:
-                sqlite.delTransObject(sarOp)
-    
-            result = set(result)
-            result -= exclusionSet
-    
-            return result
+
+
+    def acquireReader(self):
+        """
+        Return a reader on which the methods in READER_METHODS can be called
+        or None if no reader is available. A reader has its own read-only
+        connection and sees only committed data.
+        The reader must be given back by releaseReader() after use.
+        May be called from any thread.
+        """
+        with self.readerLock:
+            if len(self.idleReaders) > 0:
+                return self.idleReaders.pop()
+
+            if self.readerCount >= self.readerCountMax:
+                return None
+
+            self.readerCount += 1
+
+        try:
+            connWrap = DbStructure.ConnectWrapSyncCommit(
+                    sqlite.connect(self.dbfile))
+            try:
+                DbStructure.registerSqliteFunctions(connWrap)
+                DbStructure.registerUtf8Support(connWrap)
+                connWrap.execSql("pragma query_only = 1")
+            except:
+                connWrap.close()
+                raise
+
+            return _WikiDataReader(self, connWrap)
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            with self.readerLock:
+                self.readerCount -= 1
+                # Don't try again
+                self.readerCountMax = 0
+            return None
+
+
+    def releaseReader(self, reader, discard=False):
+        """
+        Give back reader acquired by acquireReader().
+        discard -- True to close the reader instead of reusing it (e.g.
+            after an error)
+        """
+        with self.readerLock:
+            if not discard and self.readerCount <= self.readerCountMax:
+                self.idleReaders.append(reader)
+                return
+
+            self.readerCount -= 1
+
+        reader.close()
+
+
+    def hasUncommittedChanges(self):
+        """
+        Return True if changes on the main connection may not be committed
+        yet, readers don't see them.
+        """
+        if self.connWrap is None:
+            return False
+
+        return self.connWrap.getConnection().inTransaction()
 
 
 # explain select distinct type from wikiwordmatchterms where type & 2
@@ -1856,6 +2527,9 @@ class WikiData:
         "compactify": 1,     # = sqlite vacuum
         "plain text import": 1,
         "recovery mode": 1,
+        "fullTextIndex": 1,  # If supported by sqlite library
+        "trigramIndex": 1,
+        "concurrentReads": 1,  # Readers, see acquireReader()
 #         "asynchronous commit":1  # Commit can be done in separate thread, but
 #                 # calling any other function during running commit is not allowed
         }
@@ -1880,7 +2554,7 @@ class WikiData:
         DbStructure.recreateCacheTables(self.connWrap)
         self.connWrap.syncCommit()
 
-        self.cachedWikiPageLinkTermDict = None
+        self._invalidateLinkTerms()
         self.cachedGlobalAttrs = None
 
 
@@ -1931,6 +2605,7 @@ class WikiData:
 
 
     def close(self):
+        self.setReaderCountMax(0)
         self.connWrap.syncCommit()
         self.connWrap.close()
 
@@ -1953,7 +2628,12 @@ class WikiData:
         try:
             self.connWrap.execSql("update wikiwordmatchterms "
                     "set matchtermnormcase=utf8Normcase(matchterm)")
+            DbStructure.updateResolvedWords(self.connWrap)
             DbStructure.rebuildIndices(self.connWrap)
+            if self.fullTextIndexEnabled:
+                self._fillFullTextIndex()
+            if self.trigramIndexEnabled:
+                self._fillTrigramIndex()
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -2015,6 +2695,10 @@ class WikiData:
             traceback.print_exc()
             raise DbWriteAccessError(e)
 
+        if self.linkTermSnapshot is not None:
+            # Publish the changes to threads using the snapshot without lock
+            self._getCurrentLinkTermSnapshot()
+
 
     def rollback(self):
         """
@@ -2025,6 +2709,8 @@ class WikiData:
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
+        finally:
+            self._invalidateLinkTerms()
 
 
     def vacuum(self):
@@ -2069,6 +2755,34 @@ class WikiData:
         self.connWrap.commit()
 
 
+class _WikiDataReader:
+    """
+    Reader returned by WikiData.acquireReader(). The methods of the WikiData
+    are executed with the reader as "self" so they use the read-only
+    connection of the reader, other attributes are taken from the WikiData.
+    """
+    def __init__(self, wikiData, connWrap):
+        self.wikiData = wikiData
+        self.connWrap = connWrap
+
+
+    def __getattr__(self, attr):
+        value = getattr(self.wikiData, attr)
+        if isinstance(value, types.MethodType) and \
+                value.__self__ is self.wikiData:
+            return types.MethodType(value.__func__, self)
+
+        return value
+
+
+    def close(self):
+        try:
+            self.connWrap.close()
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+
+
+
 def listAvailableWikiDataHandlers():
     """
     Returns a list with the names of available handlers from this module.
@@ -18,6 +18,7 @@ from pwiki.StringOps import mbcsDec, utf8Enc, utf8Dec, applyBinCompact, \
 from pwiki.SearchAndReplace import SearchReplaceOperation
 
 import pwiki.sqlite3api as sqlite
+from pwiki import DbProfiler
 
 
 
@@ -51,20 +52,40 @@ class ConnectWrapBase:
 
     def execSql(self, sql, params=None):
         "utility method, executes the sql"
+        profStart = DbProfiler.startTimer()
         if params:
             self.dbCursor.execute(sql, params)
         else:
             self.dbCursor.execute(sql)
 
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart)
+
+
+    def execSqlMany(self, sql, paramsSeq):
+        """
+        utility method, executes the sql once for each parameter tuple
+        of sequence paramsSeq with one prepared statement
+        """
+        profStart = DbProfiler.startTimer()
+        self.dbCursor.executemany(sql, paramsSeq)
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart)
+
 
     def execSqlQuery(self, sql, params=None):
         "utility method, executes the sql, returns query result"
+        profStart = DbProfiler.startTimer()
         if params:
             self.dbCursor.execute(sql, params, typeDetect=sqlite.TYPEDET_FIRST)
         else:
             self.dbCursor.execute(sql, typeDetect=sqlite.TYPEDET_FIRST)
 
-        return self.dbCursor.fetchall()
+        result = self.dbCursor.fetchall()
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart, len(result))
+
+        return result
 
 
 #     def execSqlQueryIter(self, sql, params=None):
@@ -93,12 +114,16 @@ class ConnectWrapBase:
         one column and returns result. If query results
         to 0 rows, default is returned (defaults to None)
         """
+        profStart = DbProfiler.startTimer()
         if params:
             self.dbCursor.execute(sql, params)
         else:
             self.dbCursor.execute(sql)
 
         row = self.fetchone()
+        if profStart is not None:
+            DbProfiler.profiler.addSql(sql, profStart, int(row is not None))
+
         if row is None:
             return default
             
@@ -260,6 +285,20 @@ class ConnectWrapAsyncCommit(ConnectWrapBase):
         finally:
             self.accessLock.release()
 
+    def execSqlMany(self, sql, paramsSeq):
+        """
+        utility method, executes the sql once for each parameter tuple
+        of sequence paramsSeq with one prepared statement
+        """
+        self.accessLock.acquire()
+        try:
+            # Commit first before executing something that changes database
+            self._commitIfPending()
+            self.commitNeeded = True
+            return ConnectWrapBase.execSqlMany(self, sql, paramsSeq)
+        finally:
+            self.accessLock.release()
+
     def execSqlQuery(self, sql, params=None):
         "utility method, executes the sql, returns query result"
         self.accessLock.acquire()
@@ -512,6 +551,19 @@ def rebuildIndices(connwrap):
 
 
 
+def isRecursiveCteSupported(connwrap):
+    """
+    Returns True if the sqlite library supports recursive common table
+    expressions ("with recursive", since sqlite 3.8.3)
+    """
+    try:
+        connwrap.execSqlQuerySingleItem(
+                "with recursive t(x) as (select 1) select x from t")
+        return True
+    except sqlite.Error:
+        return False
+
+
 def recreateCacheTables(connwrap):
     """
     Delete and create again all tables with cache information and
@@ -53,6 +53,9 @@ class WikiData:
         self.dataDir = dataDir
         self.resolveCaseNormed = False
         self.cachedWikiPageLinkTermDict = None
+        # True if sqlite supports "with recursive", see
+        # getSubTreeChildRelationships()
+        self.recursiveCteSupported = False
         
         dbPath = self.wikiDocument.getWikiConfig().get("wiki_db", "db_filename",
                 "").strip()
@@ -189,6 +192,8 @@ class WikiData:
 
         try:
             self._createTempTables()
+            self.recursiveCteSupported = \
+                    DbStructure.isRecursiveCteSupported(self.connWrap)
 
             # reset cache
             self.cachedWikiPageLinkTermDict = None
@@ -215,7 +220,8 @@ class WikiData:
 
 
     def _createTempTables(self):
-        # Temporary table for findBestPathFromWordToWord
+        # Temporary table for findBestPathFromWordToWord if sqlite doesn't
+        # support recursive queries
         # TODO: Possible for read-only dbs?
 
         # These schema changes are only on a temporary table so they are not
@@ -692,6 +698,49 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
+    def getFileSignaturesForAllWikiPageNames(self):
+        """
+        Returns a list of tuples (word, filepath, filesignature) for all
+        wiki pages. filepath is relative to the data directory, filesignature
+        is the block stored when the file was written or checked last.
+        Used to check all files at once, see
+        PageFileChanges.findChangedFileSignatures().
+        Function must work for read-only wiki.
+        """
+        try:
+            return self.connWrap.execSqlQuery("select word, filepath, "
+                    "filesignature from wikiwords")
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+
+    def updateChangedFileSignatures(self, changes):
+        """
+        Stores new file signatures and sets meta-data state of the pages
+        to dirty.  changes  is a sequence of tuples (word, old signature,
+        new signature). A page is skipped if its stored signature isn't the
+        old one anymore because the page was saved meanwhile.
+        
+        Returns list of words which were updated.
+        """
+        result = []
+        try:
+            for word, oldSig, newSig in changes:
+                self.connWrap.execSql("update wikiwords set filesignature = ?, "
+                        "metadataprocessed = ? where word = ? and "
+                        "filesignature is ?", (sqlite.Binary(newSig),
+                        Consts.WIKIWORDMETADATA_STATE_DIRTY, word,
+                        None if oldSig is None else sqlite.Binary(oldSig)))
+                if self.connWrap.rowcount > 0:
+                    result.append(word)
+
+            return result
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
+
+
 
 #             self.execSql("update wikiwords set filesignature = ?, "
 #                     "metadataprocessed = ? where word = ?", (fileSig, 0, word))
@@ -702,26 +751,14 @@ class WikiData:
 
     # ---------- Handling of relationships cache ----------
 
-    def getChildRelationships(self, wikiWord, existingonly=False,
-            selfreference=True, withFields=()):
+    def _getChildRelationshipsFieldsSql(self, withFields):
         """
-        get the child relations of this word
-        Function must work for read-only wiki.
-        existingonly -- List only existing wiki words
-        selfreference -- List also wikiWord if it references itself
-        withFields -- Seq. of names of fields which should be included in
-            the output. If this is not empty, tuples are returned
-            (relation, ...) with ... as further fields in the order mentioned
-            in withfields.
-
-            Possible field names:
-                "firstcharpos": position of link in page (may be -1 to represent
-                    unknown)
-                "modified": Modification date of child
+        Return tuple (addFields, converters) for getChildRelationships()
+        and getSubTreeChildRelationships(). addFields is the SQL for the
+        additional columns requested by withFields, converters a list of
+        functions to apply to the columns of a result row (including
+        the relation column).
         """
-        if withFields is None:
-            withFields = ()
-
         addFields = ""
         converters = [lambda s: s]
         for field in withFields:
@@ -747,6 +784,31 @@ class WikiData:
 
                 converters.append(float)
 
+        return addFields, converters
+
+
+    def getChildRelationships(self, wikiWord, existingonly=False,
+            selfreference=True, withFields=()):
+        """
+        get the child relations of this word
+        Function must work for read-only wiki.
+        existingonly -- List only existing wiki words
+        selfreference -- List also wikiWord if it references itself
+        withFields -- Seq. of names of fields which should be included in
+            the output. If this is not empty, tuples are returned
+            (relation, ...) with ... as further fields in the order mentioned
+            in withfields.
+
+            Possible field names:
+                "firstcharpos": position of link in page (may be -1 to represent
+                    unknown)
+                "modified": Modification date of child
+        """
+        if withFields is None:
+            withFields = ()
+
+        addFields, converters = self._getChildRelationshipsFieldsSql(
+                withFields)
 
         sql = "select relation%s from wikirelations where word = ?" % addFields
 
@@ -924,24 +986,36 @@ class WikiData:
             raise DbReadAccessError(e)
 
 
-    def _addRelationship(self, word, rel):
+    def getAllRelations(self):
         """
-        Add a relationship from word to rel. rel is a tuple (toWord, pos).
-        A relation from one word to another is unique and can't be added twice.
+        Return all relations as list of tuples (word, relation) ordered
+        by word and relation.
+        Function must work for read-only wiki.
         """
         try:
-            self.connWrap.execSql(
-                    "insert or replace into wikirelations(word, relation, firstcharpos) "
-                    "values (?, ?, ?)", (word, rel[0], rel[1]))
+            return self.connWrap.execSqlQuery(
+                    "select word, relation from wikirelations "
+                    "order by word, relation")
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
-            raise DbWriteAccessError(e)
+            raise DbReadAccessError(e)
+
 
     def updateChildRelations(self, word, childRelations):
+        """
+        Replace relationships from word by childRelations, a sequence of
+        tuples (toWord, pos). A relation from one word to another is unique
+        and can't be added twice.
+        """
         self.deleteChildRelationships(word)
         self.getExistingWikiWordInfo(word)
-        for r in childRelations:
-            self._addRelationship(word, r)
+        try:
+            self.connWrap.execSqlMany(
+                    "insert or replace into wikirelations(word, relation, firstcharpos) "
+                    "values (?, ?, ?)", [(word, r[0], r[1]) for r in childRelations])
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbWriteAccessError(e)
 
     def deleteChildRelationships(self, fromWord):
         try:
@@ -952,7 +1026,107 @@ class WikiData:
             raise DbWriteAccessError(e)
 
 
-    # TODO Maybe optimize
+    # SQL condition for relations of a subtree, see
+    # getSubTreeChildRelationships(). The relation must be an existing
+    # page or alias which isn't the word itself
+    _SUBTREE_RELATION_CONDITION = (
+            "wikirelations.relation != wikirelations.word and "
+            "(exists (select 1 from wikiwords "
+            "where wikiwords.word = wikirelations.relation) or "
+            "exists (select 1 from wikiwordmatchterms "
+            "where wikiwordmatchterms.matchterm = wikirelations.relation and "
+            "(wikiwordmatchterms.type & 2) != 0))")
+            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+
+    # SQL expression resolving the relation to the real page name the same
+    # way as getWikiPageNameForLinkTerm()
+    _SUBTREE_RELATION_PAGE_NAME = (
+            "ifnull((select word from wikiwords "
+            "where wikiwords.word = wikirelations.relation), "
+            "(select word from wikiwordmatchterms "
+            "where wikiwordmatchterms.matchterm = wikirelations.relation and "
+            "(wikiwordmatchterms.type & 2) != 0))")
+
+
+    # Maximum number of start words of getSubTreeChildRelationships()
+    _SUBTREE_MAX_WORDS = 500
+
+
+    def getSubTreeChildRelationships(self, words, level=-1, withFields=()):
+        """
+        Return the child relations of the whole sub-tree below words with
+        a single query as dictionary {pageName: list of tuples
+        (relation, relationPageName, ...)} where relationPageName is the
+        real page name the relation resolves to and ... are the further
+        fields named in withFields (see getChildRelationships()).
+        Only relations to existing pages or aliases are listed, a page
+        never relates to itself.
+
+        Contains all pages reachable from words in less than level steps
+        (-1: no limit) following the resolved relations. words must be
+        real page names. Returns None if sqlite is too old to support
+        recursive queries or if there are too many words,
+        getChildRelationships() must be used then.
+        Function must work for read-only wiki.
+        """
+        if not self.recursiveCteSupported:
+            return None
+
+        if level == 0 or len(words) == 0:
+            return {}
+
+        if len(words) > self._SUBTREE_MAX_WORDS:
+            # Too many query parameters for old sqlite versions
+            return None
+
+        if withFields is None:
+            withFields = ()
+
+        addFields, converters = self._getChildRelationshipsFieldsSql(
+                withFields)
+
+        relationCondition = self._SUBTREE_RELATION_CONDITION
+        relationPageName = self._SUBTREE_RELATION_PAGE_NAME
+
+        # UNION (not UNION ALL) handles cycles in the graph
+        if level < 0:
+            sql = ("with recursive subtree(word) as (values %s union "
+                    "select %s from subtree inner join wikirelations "
+                    "on wikirelations.word = subtree.word where %s) " % (
+                    ", ".join(["(?)"] * len(words)), relationPageName,
+                    relationCondition))
+            params = list(words)
+        else:
+            sql = ("with recursive subtree(word, level) as (values %s union "
+                    "select %s, subtree.level + 1 from subtree "
+                    "inner join wikirelations "
+                    "on wikirelations.word = subtree.word "
+                    "where subtree.level + 1 < ? and %s) " % (
+                    ", ".join(["(?, 0)"] * len(words)), relationPageName,
+                    relationCondition))
+            params = list(words) + [level]
+
+        # Without fields the order matches getChildRelationships()
+        # (ordered by relation), with fields it is the order of insertion
+        sql += ("select wikirelations.word, wikirelations.relation, %s%s "
+                "from wikirelations where wikirelations.word in "
+                "(select word from subtree) and %s "
+                "order by wikirelations.word, %s" % (relationPageName,
+                addFields, relationCondition, "wikirelations.rowid"
+                if withFields else "wikirelations.relation"))
+
+        try:
+            result = {}
+            for row in self.connWrap.execSqlQuery(sql, params):
+                result.setdefault(row[0], []).append(row[1:3] +
+                        tuple(c(item) for c, item in zip(converters[1:], row[3:])))
+
+            return result
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+
     def getAllSubWords(self, words, level=-1):
         """
         Return all words which are children, grandchildren, etc.
@@ -964,7 +1138,10 @@ class WikiData:
                 for w in (self.getWikiPageNameForLinkTerm(w) for w in words)
                 if w is not None]
         checkList.reverse()
-        
+
+        subTree = self.getSubTreeChildRelationships([w for w, l in checkList],
+                level)
+
         resultSet = {}
         result = []
 
@@ -979,11 +1156,15 @@ class WikiData:
             if level > -1 and chLevel >= level:
                 continue  # Don't go deeper
             
-            children = self.getChildRelationships(toCheck, existingonly=True,
-                    selfreference=False)
-                    
-            children = [(self.getWikiPageNameForLinkTerm(c), chLevel + 1)
-                    for c in children]
+            if subTree is not None:
+                children = [(r[1], chLevel + 1)
+                        for r in subTree.get(toCheck, ())]
+            else:
+                children = self.getChildRelationships(toCheck,
+                        existingonly=True, selfreference=False)
+
+                children = [(self.getWikiPageNameForLinkTerm(c), chLevel + 1)
+                        for c in children]
             children.reverse()
             checkList += children
 
@@ -997,12 +1178,16 @@ class WikiData:
         it is included only once as the single element of the list.
         If there is no path from word to toWord, [] is returned
         Function must work for read-only wiki (should hold although function
-        writes to temporary table.
+        writes to temporary table if sqlite doesn't support recursive queries.
         """
         # TODO Aliases supported?
         
         if word == toWord:
             return [word]
+
+        if self.recursiveCteSupported:
+            return self._findBestPathFromWordToWordRecursive(word, toWord)
+
         try:
             # Clear temporary table
             self.connWrap.execSql("delete from temppathfindparents")
@@ -1053,6 +1238,49 @@ class WikiData:
             raise DbReadAccessError(e)
 
 
+    def _findBestPathFromWordToWordRecursive(self, word, toWord):
+        """
+        Implementation of findBestPathFromWordToWord() with a recursive
+        query which doesn't need the temporary table.
+        """
+        # Without "order by" sqlite processes the recursive query as queue
+        # so rows arrive breadth-first: The first row for a parent
+        # word is on a shortest path. Reading stops as soon as toWord
+        # arrives which also stops the recursion.
+        children = {}
+        try:
+            cursor = self.connWrap.getConnection().cursor()
+            try:
+                cursor.execute("with recursive parents(word, child) as "
+                        "(select ?, null union "
+                        "select wikirelations.word, parents.word from parents "
+                        "inner join wikirelations "
+                        "on wikirelations.relation = parents.word) "
+                        "select word, child from parents", (word,))
+
+                for parent, child in cursor:
+                    if parent not in children:
+                        children[parent] = child
+                        if parent == toWord:
+                            break
+                else:
+                    # No more (grand-)parents
+                    return []
+            finally:
+                cursor.close()
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+        result = [toWord]
+        crumb = toWord
+        while crumb != word:
+            crumb = children[crumb]
+            result.append(crumb)
+
+        return result
+
+
     def _findNewWordForFile(self, path):
         wikiWord = StringOps.guessBaseNameByFilename(path, self.pagefileSuffix)
         try:
@@ -1898,6 +2126,25 @@ class WikiData:
         return self._getCachedWikiPageLinkTermDict().get(alias, None)
 
 
+    def getAllWikiPageLinkTerms(self):
+        """
+        Return all link terms (page names or aliases) as list of tuples
+        (linkTerm, pageName, syncUpdate) where syncUpdate is True for
+        link terms which are updated synchronously.
+        Function must work for read-only wiki.
+        """
+        try:
+            return [(linkTerm, word, bool(syncUpdate))
+                    for linkTerm, word, syncUpdate in self.connWrap.execSqlQuery(
+                    "select matchterm, word, (type & 16) != 0 "
+                    "from wikiwordmatchterms where (type & 2) != 0")]
+            # Consts.WIKIWORDMATCHTERMS_TYPE_ASLINK == 2
+            # Consts.WIKIWORDMATCHTERMS_TYPE_SYNCUPDATE == 16
+        except (IOError, OSError, sqlite.Error) as e:
+            traceback.print_exc()
+            raise DbReadAccessError(e)
+
+
     # TODO: 2.4: Remove compatibility definitions
     getAllDefinedContentNames = getAllDefinedWikiPageNames
     isDefinedWikiPage = isDefinedWikiPageName
@@ -1952,14 +2199,9 @@ class WikiData:
     def updateTodos(self, word, todos):
         self.deleteTodos(word)
         self.getExistingWikiWordInfo(word)
-        for t in todos:
-            self._addTodo(word, t)
-
-
-    def _addTodo(self, word, todo):
         try:
-            self.connWrap.execSql("insert into todos(word, key, value) values (?, ?, ?)",
-                    (word, todo[0], todo[1]))
+            self.connWrap.execSqlMany("insert into todos(word, key, value) values (?, ?, ?)",
+                    [(word, t[0], t[1]) for t in todos])
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -2035,20 +2277,16 @@ class WikiData:
     def updateWikiWordMatchTerms(self, word, wwmTerms, syncUpdate=False):
         self.deleteWikiWordMatchTerms(word, syncUpdate=syncUpdate)
         self.getExistingWikiWordInfo(word)
-        for t in wwmTerms:
-            assert t[2] == word
-            self._addWikiWordMatchTerm(t)
-
-
-    def _addWikiWordMatchTerm(self, wwmTerm):
-        matchterm, typ, word, firstcharpos, charlength = wwmTerm
+        params = []
+        for matchterm, typ, tword, firstcharpos, charlength in wwmTerms:
+            assert tword == word
+            params.append((matchterm, typ, word, firstcharpos, charlength,
+                    matchterm.lower()))
         try:
             # TODO Check for name collisions
-            self.connWrap.execSql("insert into wikiwordmatchterms(matchterm, "
+            self.connWrap.execSqlMany("insert into wikiwordmatchterms(matchterm, "
                     "type, word, firstcharpos, charlength, matchtermnormcase) "
-                    "values (?, ?, ?, ?, ?, ?)",
-                    (matchterm, typ, word, firstcharpos, charlength,
-                    matchterm.lower()))
+                    "values (?, ?, ?, ?, ?, ?)", params)
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
@@ -2368,6 +2606,7 @@ class WikiData:
         "rebuild": 1,
         "compactify": 1,     # = sqlite vacuum
         "filePerPage": 1,   # Uses a single file per page
+        "bulkFileSignatures": 1,  # Checks file signatures of all pages at once
 #         "versioning": 1,     # (old versioning)
 #         "plain text import":1   # Is already plain text      
         }
@@ -2570,6 +2809,8 @@ class WikiData:
         except (IOError, OSError, sqlite.Error) as e:
             traceback.print_exc()
             raise DbWriteAccessError(e)
+        finally:
+            self.cachedWikiPageLinkTermDict = None
 
 
     def vacuum(self):
@@ -0,0 +1,121 @@
+# coding: utf-8
+"""Benchmark auto-link matching in "relax" mode.
+
+Compares the matcher used by the parsers (AutoLinkRelaxMatcher) with
+searching one regular expression per wiki word (the former implementation)
+for growing numbers of wiki words. Also compares updating the matcher
+after a few wiki words changed with comparing it to all wiki words.
+
+Run from the main WikidPad directory::
+
+   ..\\WikidPad> python tests/benchmark_AutoLinkRelax.py
+
+"""
+import glob
+import os
+import random
+import sys
+import time
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(wikidpad_dir)
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+
+from tests.helper import get_text, auto_link_relax_re
+
+from pwiki.ParseUtilities import AutoLinkRelaxMatcher
+
+
+WIKIDPADHELP_DATA_DIR = os.path.abspath('WikidPadHelp/data')
+WORD_COUNTS = (100, 1000, 5000, 20000)
+# Regexes are only tried up to this number of words, it gets too slow above
+MAX_REGEX_WORD_COUNT = 5000
+# Number of words renamed before updating the matcher
+CHANGED_WORD_COUNT = 10
+
+
+def build_words(count, rnd):
+    """Return page names of the help wiki plus random ones up to count."""
+    names = [os.path.splitext(os.path.basename(p))[0] for p in
+             glob.glob(os.path.join(WIKIDPADHELP_DATA_DIR, '*.wiki'))]
+    words = set(names[:count])
+    while len(words) < count:
+        words.add(' '.join(''.join(rnd.choice('abcdefghijklmnop')
+                                   for _ in range(rnd.randint(3, 8)))
+                           for _ in range(rnd.randint(1, 3))).title())
+    return words
+
+
+def find_with_regexes(relaxList, text):
+    count = 0
+    while text != '':
+        foundPos = len(text)
+        foundWordText = None
+        for regex, word in relaxList:
+            match = regex.search(text)
+            if match and match.start(0) < foundPos:
+                foundPos = match.start(0)
+                foundWordText = match.group(0)
+                if foundPos == 0:
+                    break
+        text = text[foundPos:]
+        if foundWordText is not None:
+            count += 1
+            text = text[max(len(foundWordText), 1):]
+    return count
+
+
+def main():
+    rnd = random.Random(0)
+    text = ''.join(get_text(p) for p in sorted(
+        glob.glob(os.path.join(WIKIDPADHELP_DATA_DIR, '*.wiki')))[:20])
+    print('Text length: %d characters' % len(text))
+    print('%8s %12s %12s %12s %12s %12s %8s' % (
+        'words', 'build trie', 'set words', 'update words', 'match trie',
+        'match regex', 'links'))
+
+    for count in WORD_COUNTS:
+        words = build_words(count, rnd)
+
+        start = time.perf_counter()
+        matcher = AutoLinkRelaxMatcher(words)
+        buildTime = time.perf_counter() - start
+
+        renamed = dict((w, w + ' Renamed') for w in
+                       rnd.sample(sorted(words), CHANGED_WORD_COUNT))
+        newWords = (words - set(renamed)) | set(renamed.values())
+
+        # Former update: compare with all words
+        start = time.perf_counter()
+        matcher.setWords(newWords)
+        setTime = time.perf_counter() - start
+
+        # Current update: only check the changed words
+        changed = set(renamed) | set(renamed.values())
+        start = time.perf_counter()
+        matcher.updateWords(changed, words.__contains__)
+        updateTime = time.perf_counter() - start
+        assert matcher.getWords() == words
+
+        start = time.perf_counter()
+        links = sum(1 for _ in matcher.iterMatches(text))
+        matchTime = time.perf_counter() - start
+
+        if count <= MAX_REGEX_WORD_COUNT:
+            relaxList = [(auto_link_relax_re(w), w)
+                         for w in sorted(words, key=len, reverse=True)]
+            start = time.perf_counter()
+            regexLinks = find_with_regexes(relaxList, text)
+            regexTime = '%12.3f' % (time.perf_counter() - start)
+            assert regexLinks == links
+        else:
+            regexTime = '%12s' % '-'
+
+        print('%8d %12.3f %12.3f %12.5f %12.3f %s %8d' % (
+            count, buildTime, setTime, updateTime, matchTime, regexTime,
+            links))
+
+
+if __name__ == '__main__':
+    main()
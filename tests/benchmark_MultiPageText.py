@@ -0,0 +1,128 @@
+# coding: utf-8
+"""Benchmark writing and reading datablocks in multipage text format.
+
+Writes binary datablocks of different sizes base64 encoded to a temporary
+multipage text file the same way MultiPageTextExporter does and reads them
+back with the decoding of MultiPageTextImporter. Prints throughput and the
+peak memory allocated by Python (measured by tracemalloc in a separate
+run) for export and import. The peak should only depend on the size of
+one datablock, not on the number of datablocks in the file.
+
+The peak resident set size of the process is printed at the end if the
+platform supports it.
+
+Run from the main WikidPad directory::
+
+   ..\\WikidPad> python tests/benchmark_MultiPageText.py
+
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from codecs import BOM_UTF8
+from io import TextIOWrapper
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(wikidpad_dir)
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+
+import tests.helper  # installs _() and N_() used by the pwiki modules
+
+from pwiki.Exporters import _SeparatorWatchUtf8Writer
+from pwiki.Importers import MultiPageTextImporter
+
+
+SEPARATOR = '-----benchmarkSeparator-----'
+# Tuples (size of one datablock in bytes, number of datablocks)
+CASES = ((1024 * 1024, 4), (1024 * 1024, 32),
+         (16 * 1024 * 1024, 2), (16 * 1024 * 1024, 8))
+MB = 1024 * 1024
+
+
+def export_file(path, block, count):
+    with open(path, 'wb') as rawFile:
+        rawFile.write(BOM_UTF8)
+        exportFile = _SeparatorWatchUtf8Writer(rawFile, SEPARATOR)
+        exportFile.write('Multipage text format 1\n')
+        exportFile.write('Separator: %s\n' % SEPARATOR)
+
+        for i in range(count):
+            exportFile.writeSeparator()
+            exportFile.write('versioning/packet/versionNo/%i/wikipage/Page\n'
+                             % i)
+            exportFile.write('important/encoding/base64  storeHint/intern\n')
+            exportFile.writeBase64Block(block)
+            exportFile.checkAndClearBuffer()
+
+
+def import_file(path, count):
+    importer = MultiPageTextImporter(None)
+    importer.separator = SEPARATOR + '\n'
+    with open(path, 'rb') as rawFile:
+        rawFile.read(len(BOM_UTF8))
+        importer.importFile = TextIOWrapper(rawFile, 'utf-8', 'replace')
+        # Skip header
+        importer.importFile.readline()
+        importer.importFile.readline()
+
+        for i in range(count):
+            importer.importFile.readline()  # tag
+            importer.importFile.readline()  # hints
+            datablock = importer._collectB64Content()
+            assert datablock is not None
+            del datablock
+
+
+def measure(function, *args):
+    """Return tuple (time, peak memory) of calling function(*args)."""
+    start = time.perf_counter()
+    function(*args)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return duration, peak
+
+
+def main():
+    print('%10s %6s %10s | %10s %10s | %10s %10s' % (
+        'block MB', 'count', 'file MB', 'exp MB/s', 'exp peak',
+        'imp MB/s', 'imp peak'))
+
+    fd, path = tempfile.mkstemp(suffix='.mpt')
+    os.close(fd)
+    try:
+        for size, count in CASES:
+            block = os.urandom(size)
+            total = size * count / MB
+
+            expTime, expPeak = measure(export_file, path, block, count)
+            fileSize = os.path.getsize(path) / MB
+            impTime, impPeak = measure(import_file, path, count)
+
+            print('%10.1f %6d %10.1f | %10.1f %10.1f | %10.1f %10.1f' % (
+                size / MB, count, fileSize, total / expTime, expPeak / MB,
+                total / impTime, impPeak / MB))
+    finally:
+        os.remove(path)
+
+    try:
+        import resource
+    except ImportError:
+        return
+
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux gives kilobytes, macOS bytes
+        maxRss *= 1024
+    print('Peak RSS of process: %.1f MB' % (maxRss / MB))
+
+
+if __name__ == '__main__':
+    main()
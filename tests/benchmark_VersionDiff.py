@@ -0,0 +1,118 @@
+# coding: utf-8
+"""Benchmark the diff engines used for page versions.
+
+Creates synthetic page histories of growing page size and compares time
+and size of the reverse diff packets (as stored by
+VersionOverview.addVersion()) of the diff engines in
+StringOps.DIFF_ENGINES.
+
+Run from the main WikidPad directory::
+
+   ..\\WikidPad> python tests/benchmark_VersionDiff.py
+
+"""
+import os
+import random
+import sys
+import time
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(wikidpad_dir)
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+
+from pwiki.StringOps import DIFF_ENGINES, applyBinCompact, \
+    getBinCompactForDiff
+
+
+PAGE_SIZES = (3000, 10000, 100000, 500000)  # in bytes
+VERSION_COUNT = 20
+# The difflib engine is only tried up to this page size, it gets too slow
+MAX_DIFFLIB_PAGE_SIZE = 10000
+
+
+def random_line(rnd):
+    words = (''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz')
+                     for _ in range(rnd.randint(2, 9)))
+             for _ in range(rnd.randint(0, 14)))
+    line = ' '.join(words)
+    if rnd.random() < 0.2:
+        line = '* ' + line
+    return line + '\n'
+
+
+def build_page(size, rnd):
+    lines = []
+    length = 0
+    while length < size:
+        line = random_line(rnd)
+        lines.append(line)
+        length += len(line)
+    return lines
+
+
+def edit_page(lines, rnd):
+    """Return a copy of lines with some typical edits applied."""
+    lines = list(lines)
+    for _ in range(rnd.randint(1, 5)):
+        kind = rnd.random()
+        pos = rnd.randrange(len(lines))
+        if kind < 0.4:
+            # Typing inside a line
+            line = lines[pos]
+            cut = rnd.randint(0, len(line) - 1)
+            lines[pos] = line[:cut] + random_line(rnd)[:-1] + line[cut:]
+        elif kind < 0.6:
+            lines[pos:pos] = [random_line(rnd)
+                              for _ in range(rnd.randint(1, 20))]
+        elif kind < 0.75:
+            del lines[pos:pos + rnd.randint(1, 10)]
+        elif kind < 0.9:
+            # Move a block
+            block = lines[pos:pos + rnd.randint(1, 30)]
+            del lines[pos:pos + len(block)]
+            target = rnd.randint(0, len(lines))
+            lines[target:target] = block
+        else:
+            lines.append(random_line(rnd))
+    return lines
+
+
+def build_history(size, rnd):
+    lines = build_page(size, rnd)
+    history = [''.join(lines).encode('utf-8')]
+    for _ in range(VERSION_COUNT - 1):
+        lines = edit_page(lines, rnd)
+        history.append(''.join(lines).encode('utf-8'))
+    return history
+
+
+def main():
+    rnd = random.Random(0)
+    print('%10s %10s %12s %14s' % ('page size', 'engine', 'time', 'packet bytes'))
+
+    for size in PAGE_SIZES:
+        history = build_history(size, rnd)
+
+        for engine in sorted(DIFF_ENGINES):
+            if engine == 'difflib' and size > MAX_DIFFLIB_PAGE_SIZE:
+                print('%10d %10s %12s %14s' % (size, engine, '-', '-'))
+                continue
+
+            packets = []
+            start = time.perf_counter()
+            for prev, new in zip(history, history[1:]):
+                # Reverse diff from new head to previous head
+                packets.append(getBinCompactForDiff(new, prev, engine))
+            diffTime = time.perf_counter() - start
+
+            for prev, new, packet in zip(history, history[1:], packets):
+                assert applyBinCompact(new, packet) == prev
+            packetSize = sum(len(packet) for packet in packets)
+
+            print('%10d %10s %12.3f %14d' % (size, engine, diffTime,
+                                             packetSize))
+
+
+if __name__ == '__main__':
+    main()
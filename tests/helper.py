@@ -562,6 +562,73 @@ def ast_eq(ast, ast_):
     return True
 
 
+def auto_link_relax_re(word):
+    """Return the regular expression matching wiki word  word  in auto-link
+    "relax" mode the way the parsers did before AutoLinkRelaxMatcher.
+    Used as reference to check the matcher."""
+    # Arbitrary non-alphanumeric characters instead of the original ones
+    parts = [p for p in re.split(r'\W+', word) if p != '']
+    return re.compile(r'\b' + r'\W+'.join(parts) + r'\b',
+                      re.IGNORECASE | re.UNICODE)
+
+
+
+def open_headless_wiki(tmp_path, monkeypatch, dbType='compact_sqlite'):
+    """Create and open a small wiki of database type  dbType  with a headless
+    application. Return tuple (app, wikiDocument), the caller must release
+    the wiki document."""
+    import Consts
+    import ExceptionLogger
+    from pwiki import Headless, WikiDocument
+
+    # Global configuration of the application goes to tmp_path
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(sys, 'argv', [os.path.join(wikidpad_dir,
+            'WikidPad.py')])
+    # Logger is needed by the application, but keep the streams of pytest
+    streams = sys.stdout, sys.stderr, sys.excepthook
+    ExceptionLogger.startLogger(Consts.VERSION_STRING)
+    sys.stdout, sys.stderr, sys.excepthook = streams
+
+    app = Headless.HeadlessApp()
+    Headless._installApp(app)
+
+    wikiDir = str(tmp_path / 'wiki')
+    os.mkdir(wikiDir)
+    WikiDocument.createWikiDb(None, dbType, 'TestWiki',
+            os.path.join(wikiDir, 'data'))
+
+    configPath = os.path.join(wikiDir, 'TestWiki.wiki')
+    wikiConfig = app.createWikiConfiguration()
+    wikiConfig.createEmptyConfig(configPath)
+    wikiConfig.fillWithDefaults()
+    wikiConfig.set('main', 'wiki_name', 'TestWiki')
+    wikiConfig.set('main', 'last_wiki_word', 'TestWiki')
+    wikiConfig.set('main', 'wiki_database_type', dbType)
+    wikiConfig.set('main', 'wiki_wikiLanguage', 'wikidpad_default_2_0')
+    wikiConfig.set('wiki_db', 'data_dir', 'data')
+    wikiConfig.save()
+
+    wikiDocument = WikiDocument.openWikiDocument(configPath)
+    wikiDocument.connect()
+    # Pages are updated by the test itself, not in the background
+    wikiDocument.getUpdateExecutor().pause(wait=True)
+    return app, wikiDocument
+
+
+def set_page_text(wikiDocument, word, text):
+    if wikiDocument.isDefinedWikiPageName(word):
+        page = wikiDocument.getWikiPage(word)
+    else:
+        page = wikiDocument.createWikiPage(word)
+    page.replaceLiveText(text, fireEvent=False)
+    # Like the background updater, fires the "updated wiki page" event
+    page.runDatabaseUpdate()
+    # Drop the update job queued for the paused background updater, it
+    # would keep the page object alive
+    wikiDocument.getUpdateExecutor().clearDeque(0)
+
+
 if __name__ == '__main__':
     text = """+ Heading
 
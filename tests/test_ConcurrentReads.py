@@ -0,0 +1,202 @@
+# coding: utf-8
+"""Test the concurrent reads of the compact_sqlite WikiData.
+
+* Concurrent reads are opt-in. The WAL journal mode is only used while
+  readers are enabled, the previous mode is restored afterwards.
+* Methods called on a reader are bound to the reader and use its
+  connection.
+* While another thread holds the lock of the WikiData proxy, methods in
+  READER_METHODS are called on a reader, other methods wait.
+* Without usable readers (uncommitted changes) reads wait for the lock.
+* A reader reads the committed data while another thread holds a write
+  transaction.
+
+
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki, set_page_text
+
+
+OLD_TEXT = 'ReadPage\nold text\n'
+NEW_TEXT = 'ReadPage\nnew text\n'
+
+
+@pytest.fixture
+def wiki(tmp_path, monkeypatch):
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    set_page_text(wikiDocument, 'ReadPage', OLD_TEXT)
+    yield wikiDocument.getWikiData(), wikiDocument
+    wikiDocument.release()
+
+
+@pytest.fixture
+def readers(wiki, monkeypatch):
+    """
+    Enable readers and return list of the readers acquired
+    """
+    proxy, wikiDocument = wiki
+    wikiData = proxy.wikiData
+    wikiData.setReaderCountMax(1)
+    with proxy.proxyAccessLock:
+        proxy.updateReadersUsable()
+
+    acquired = []
+    acquireReader = wikiData.acquireReader
+
+    def recordingAcquireReader():
+        reader = acquireReader()
+        acquired.append(reader)
+        return reader
+
+    monkeypatch.setattr(wikiData, 'acquireReader', recordingAcquireReader)
+    return acquired
+
+
+def journal_mode(wikiData):
+    return wikiData.connWrap.execSqlQuerySingleItem('pragma journal_mode')
+
+
+class Holder(threading.Thread):
+    """
+    Thread calling function  hold  and waiting until release() is called
+    before it returns.
+    """
+    def __init__(self, hold):
+        threading.Thread.__init__(self)
+        self.hold = hold
+        self.holding = threading.Event()
+        self.released = threading.Event()
+
+    def run(self):
+        with self.hold():
+            self.holding.set()
+            self.released.wait(10)
+
+    def __enter__(self):
+        self.start()
+        assert self.holding.wait(10)
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.released.set()
+        self.join(10)
+
+
+def call_in_thread(function, *args):
+    """
+    Start thread calling function and return list which will contain the
+    result and the thread.
+    """
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function(*args)))
+    thread.start()
+    return result, thread
+
+
+def test_journal_mode(wiki):
+    proxy, wikiDocument = wiki
+    wikiData = proxy.wikiData
+
+    # Opt-in
+    assert wikiData.readerCountMax == 0
+    previousMode = journal_mode(wikiData)
+    assert previousMode != 'wal'
+
+    wikiData.setReaderCountMax(2)
+    assert journal_mode(wikiData) == 'wal'
+    assert wikiData.readerCountMax == 2
+
+    wikiData.setReaderCountMax(0)
+    assert journal_mode(wikiData) == previousMode
+    assert wikiData.acquireReader() is None
+
+
+def test_reader_rebinding(wiki):
+    proxy, wikiDocument = wiki
+    wikiData = proxy.wikiData
+    wikiData.setReaderCountMax(1)
+
+    reader = wikiData.acquireReader()
+    try:
+        assert reader.getContent.__self__ is reader
+        assert reader.connWrap is not wikiData.connWrap
+        # Other attributes are the ones of the WikiData
+        assert reader.dbfile == wikiData.dbfile
+        assert reader.getContent('ReadPage') == OLD_TEXT
+        # Only one reader allowed
+        assert wikiData.acquireReader() is None
+    finally:
+        wikiData.releaseReader(reader)
+
+    # Idle reader is reused
+    assert wikiData.acquireReader() is reader
+    wikiData.releaseReader(reader)
+
+
+def test_reader_methods_routing(wiki, readers):
+    proxy, wikiDocument = wiki
+    assert proxy.readersUsable
+
+    with Holder(lambda: proxy.proxyAccessLock):
+        # Doesn't wait for the lock
+        assert proxy.getContent('ReadPage') == OLD_TEXT
+        assert len(readers) == 1
+
+        # Not in READER_METHODS, waits for the lock
+        result, thread = call_in_thread(proxy.getDbSettingsValue,
+                'syncWikiWordMatchtermsUpToDate')
+        thread.join(0.2)
+        assert thread.is_alive()
+
+    thread.join(10)
+    assert result == ['1']
+    assert len(readers) == 1
+
+    # Without other thread holding the lock no reader is used
+    assert proxy.getContent('ReadPage') == OLD_TEXT
+    assert len(readers) == 1
+
+
+def test_no_readers_with_uncommitted_changes(wiki, readers):
+    proxy, wikiDocument = wiki
+    proxy.setContent('ReadPage', NEW_TEXT)
+    assert not proxy.readersUsable
+
+    with Holder(lambda: proxy.proxyAccessLock):
+        result, thread = call_in_thread(proxy.getContent, 'ReadPage')
+        thread.join(0.2)
+        assert thread.is_alive()
+
+    thread.join(10)
+    # Uncommitted change is seen through the main connection
+    assert result == [NEW_TEXT]
+    assert readers == []
+
+
+def test_read_during_write_transaction(wiki, readers):
+    proxy, wikiDocument = wiki
+
+    class WriteTransaction:
+        def __enter__(self):
+            self.transaction = wikiDocument.wikiDataTransaction()
+            self.transaction.begin()
+            proxy.setContent('ReadPage', NEW_TEXT)
+
+        def __exit__(self, excType, excValue, tb):
+            self.transaction.end()
+
+    with Holder(WriteTransaction):
+        assert proxy.getContent('ReadPage') == OLD_TEXT
+        assert len(readers) == 1
+
+    assert proxy.getContent('ReadPage') == NEW_TEXT
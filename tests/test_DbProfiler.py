@@ -0,0 +1,54 @@
+# coding: utf-8
+"""Test DbProfiler.
+
+* SQL statements differing only in formatting share one entry.
+* Nothing is recorded while profiling is disabled.
+
+
+"""
+import os
+import sys
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from pwiki import DbProfiler
+
+
+def test_sql_template():
+    assert DbProfiler.getSqlTemplate(
+            "select word\n  from wikiwords where word in (?, ?,?)") == \
+            "select word from wikiwords where word in (?, ...)"
+    assert DbProfiler.getSqlTemplate("select 1 where a = ?") == \
+            "select 1 where a = ?"
+
+
+def test_profiler():
+    assert DbProfiler.startTimer() is None
+    DbProfiler.enable()
+    try:
+        profiler = DbProfiler.profiler
+        for i in range(200):
+            profiler.addSql("select * from t where a in (%s)" %
+                    ", ".join(["?"] * (i % 3 + 2)), DbProfiler.startTimer(),
+                    rows=2)
+        start = DbProfiler.startTimer()
+        profiler.addWikiDataCall("getContent", start, start)
+        profiler.addWikiDataCall("getContent", DbProfiler.startTimer())
+        profiler.addStmtCacheAccess(True)
+        profiler.addStmtCacheAccess(False)
+
+        entry = profiler.sqlEntries["select * from t where a in (?, ...)"]
+        assert (entry.count, entry.rows) == (200, 400)
+        assert entry.getP99() <= max(entry.samples)
+        assert profiler.callEntries["getContent"].readerCalls == 1
+        assert "(1 of 2)" in profiler.getReportLines()[0]
+    finally:
+        DbProfiler.disable()
+
+    assert DbProfiler.startTimer() is None
+    DbProfiler.enable()
+    assert DbProfiler.profiler.sqlEntries == {}
+    DbProfiler.disable()
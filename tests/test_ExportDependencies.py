@@ -0,0 +1,251 @@
+# coding: utf-8
+"""Test ExportDependencies.
+
+* Outputs are affected by the keys they recorded.
+* Outputs are affected by queries only if the result changed.
+* Queries which can't be affected by a change aren't evaluated again.
+* Continuous HTML export renders again the pages depending on a changed
+  page by insertion, search, relatives, search fragment links or the table
+  of contents. A change of an unrelated page doesn't run the searches or
+  build the tree again.
+
+
+"""
+import os
+import sys
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki, set_page_text
+from pwiki.ExportDependencies import DependencyRecorder, \
+        ExportDependencyGraph, ANY_CHANGE, WORD_SET, TEMP_FILES
+
+
+def record(graph, output, keys, queries=()):
+    recorder = DependencyRecorder()
+    for key in keys:
+        recorder.add(key)
+    for key, result in queries:
+        recorder.addQuery(key, result)
+    graph.setDependencies(output, recorder)
+    return recorder
+
+
+def test_keys():
+    graph = ExportDependencyGraph(None)
+    record(graph, 'A', [('page', 'A'), ('page', 'B')])
+    record(graph, 'B', [('page', 'B')])
+    record(graph, 'C', [('page', 'C'), ANY_CHANGE])
+
+    assert graph.getAffectedOutputs([('page', 'A')]) == {'A'}
+    assert graph.getAffectedOutputs([('page', 'B')]) == {'A', 'B'}
+    assert graph.getAffectedOutputs([('page', 'X'), ANY_CHANGE]) == {'C'}
+
+    # Rendering again replaces the dependencies
+    record(graph, 'A', [('page', 'A')])
+    assert graph.getAffectedOutputs([('page', 'B')]) == {'B'}
+
+    graph.removeOutput('B')
+    assert graph.getAffectedOutputs([('page', 'B')]) == set()
+    assert graph.getOutputs() == {'A', 'C'}
+
+
+def test_queries():
+    results = {('search', 'foo'): {'A', 'B'}}
+    graph = ExportDependencyGraph(lambda key: set(results[key]))
+    query = (('search', 'foo'), {'A', 'B'})
+    record(graph, 'A', [('page', 'A')], [query])
+    record(graph, 'B', [('page', 'B')], [query])
+
+    assert graph.getAffectedOutputs([]) == set()
+
+    results[('search', 'foo')] = {'A'}
+    assert graph.getAffectedOutputs([]) == {'A', 'B'}
+    # New result is stored
+    assert graph.getAffectedOutputs([]) == set()
+
+    # Query is dropped with its last dependent
+    graph.removeOutput('A')
+    graph.removeOutput('B')
+    assert graph.queries == {}
+
+
+def test_queries_affected():
+    results = {('search', 'foo'): {'A'}, ('exported', 'B'): True}
+    evaluated = []
+
+    def evaluateQuery(key):
+        evaluated.append(key)
+        return results[key]
+
+    def isQueryAffected(key, result, changeKeys):
+        return key[0] != 'exported' or WORD_SET in changeKeys
+
+    graph = ExportDependencyGraph(evaluateQuery, isQueryAffected)
+    record(graph, 'A', [], [(('search', 'foo'), {'A'})])
+    record(graph, 'B', [], [(('exported', 'B'), True)])
+
+    results[('exported', 'B')] = False
+    assert graph.getAffectedOutputs([('page', 'B')]) == set()
+    assert evaluated == [('search', 'foo')]
+
+    del evaluated[:]
+    assert graph.getAffectedOutputs([WORD_SET]) == {'B'}
+    assert sorted(evaluated) == [('exported', 'B'), ('search', 'foo')]
+
+    # Without change keys all queries are evaluated
+    del evaluated[:]
+    assert graph.evaluateQueries() == set()
+    assert len(evaluated) == 2
+
+
+def test_isReusable():
+    graph = ExportDependencyGraph(None)
+    assert record(graph, 'A', [('page', 'A')]).isReusable()
+    assert not record(graph, 'B', [('page', 'B'), ANY_CHANGE]).isReusable()
+    assert not record(graph, 'C', [TEMP_FILES]).isReusable()
+
+
+# Exporter level: continuous HTML export of a small wiki
+
+@pytest.fixture
+def wiki(tmp_path, monkeypatch):
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    yield app, wikiDocument
+    wikiDocument.release()
+
+
+def read_outputs(exportDir):
+    result = {}
+    for fileName in os.listdir(exportDir):
+        if fileName.endswith('.html'):
+            with open(os.path.join(exportDir, fileName), 'rb') as f:
+                result[fileName] = sorted(f.read().splitlines())
+    return result
+
+
+PAGES = {
+    'TestWiki': 'TestWiki\nChildPage\nIncludingPage\nSearchingPage\n'
+            'RelativesPage\n',
+    'ChildPage': 'ChildPage\n',
+    'GrandChild': 'GrandChild\n',
+    'IncludingPage': 'IncludingPage\n[:page:IncludedPage]\n',
+    'IncludedPage': 'IncludedPage\nold text\n',
+    'SearchingPage': 'SearchingPage\n[:search:NeedleText]\n',
+    'RelativesPage': 'RelativesPage\n[:rel:parents]\n',
+    'OtherPage': 'OtherPage\n',
+    'FragmentLinkPage': 'FragmentLinkPage\n[TargetPage#NeedleText]\n',
+    'TargetPage': 'TargetPage\n\n++ Section\n\nNeedleText\n',
+}
+
+
+@pytest.mark.parametrize('output, word, text', [
+    # Inserted page changed
+    ('IncludingPage.html', 'IncludedPage', 'IncludedPage\nnew text\n'),
+    # Search result changed
+    ('SearchingPage.html', 'OtherPage', 'OtherPage\nNeedleText\n'),
+    # Parents changed
+    ('RelativesPage.html', 'OtherPage', 'OtherPage\nRelativesPage\n'),
+    # Tree of the table of contents changed
+    ('index.html', 'ChildPage', 'ChildPage\nGrandChild\n'),
+    # Heading in front of the search fragment target moved
+    ('FragmentLinkPage.html', 'TargetPage',
+     'TargetPage\nmore text\n\n++ Section\n\nNeedleText\n'),
+])
+def test_continuous_html_export(wiki, tmp_path, output, word, text):
+    from pwiki import Headless, PluginManager
+    from pwiki.SearchAndReplace import SearchReplaceOperation, \
+            ListWikiPagesOperation, AllWikiPagesNode
+
+    app, wikiDocument = wiki
+    for pageWord, pageText in sorted(PAGES.items()):
+        set_page_text(wikiDocument, pageWord, pageText)
+
+    mainControl = Headless.HeadlessMainControl(app, wikiDocument)
+    exporter = PluginManager.getSupportedExportTypes(mainControl,
+            None, continuousExport=True)['html_single'][0]
+    addOpt = list(exporter.getAddOpt(None))
+    addOpt[exporter.ADDOPT_IDX_TABLE_OF_CONTENTS] = 1
+
+    lpOp = ListWikiPagesOperation()
+    lpOp.setSearchOpTree(AllWikiPagesNode(lpOp))
+    sarOp = SearchReplaceOperation()
+    sarOp.listWikiPagesOp = lpOp
+
+    continuousDir = str(tmp_path / 'continuous')
+    os.mkdir(continuousDir)
+    exporter.startContinuousExport(wikiDocument, sarOp, 'html_single',
+            continuousDir, False, tuple(addOpt), None)
+    try:
+        before = read_outputs(continuousDir)
+        set_page_text(wikiDocument, word, text)
+        after = read_outputs(continuousDir)
+    finally:
+        exporter.stopContinuousExport()
+
+    assert after[output] != before[output]
+
+    # Same result as a new export
+    fullDir = str(tmp_path / 'full')
+    os.mkdir(fullDir)
+    fullExporter = exporter.__class__(mainControl)
+    # Like continuous export
+    fullExporter.avoidDeadWikiLinks = False
+    fullExporter.export(wikiDocument, list(exporter.wordList), 'html_single',
+            fullDir, False, tuple(addOpt), None)
+    assert read_outputs(fullDir) == after
+
+
+def test_continuous_html_export_unrelated_change(wiki, tmp_path):
+    from pwiki import Headless, PluginManager
+    from pwiki.SearchAndReplace import SearchReplaceOperation, \
+            ListWikiPagesOperation, AllWikiPagesNode
+
+    app, wikiDocument = wiki
+    for pageWord, pageText in sorted(PAGES.items()):
+        set_page_text(wikiDocument, pageWord, pageText)
+    # Keep page object so its link terms are known on the next update
+    otherPage = wikiDocument.getWikiPage('OtherPage')
+    set_page_text(wikiDocument, 'OtherPage', 'OtherPage\nfirst\n')
+
+    mainControl = Headless.HeadlessMainControl(app, wikiDocument)
+    exporter = PluginManager.getSupportedExportTypes(mainControl,
+            None, continuousExport=True)['html_single'][0]
+    addOpt = list(exporter.getAddOpt(None))
+    addOpt[exporter.ADDOPT_IDX_TABLE_OF_CONTENTS] = 1
+
+    lpOp = ListWikiPagesOperation()
+    lpOp.setSearchOpTree(AllWikiPagesNode(lpOp))
+    sarOp = SearchReplaceOperation()
+    sarOp.listWikiPagesOp = lpOp
+
+    continuousDir = str(tmp_path / 'continuous')
+    os.mkdir(continuousDir)
+    exporter.startContinuousExport(wikiDocument, sarOp, 'html_single',
+            continuousDir, False, tuple(addOpt), None)
+    try:
+        graph = exporter.exportDependencies
+        evaluated = []
+
+        def evaluateQuery(key):
+            evaluated.append(key[0])
+            return exporter.evaluateExportQuery(key)
+
+        graph.evaluateQuery = evaluateQuery
+        assert {key[0] for key in graph.queries} >= {'search', 'flat tree'}
+
+        before = read_outputs(continuousDir)
+        set_page_text(wikiDocument, 'OtherPage', 'OtherPage\nsecond\n')
+        after = read_outputs(continuousDir)
+    finally:
+        exporter.stopContinuousExport()
+
+    assert 'search' not in evaluated
+    assert 'flat tree' not in evaluated
+    assert after['SearchingPage.html'] == before['SearchingPage.html']
+    assert after['OtherPage.html'] != before['OtherPage.html']
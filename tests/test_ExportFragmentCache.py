@@ -0,0 +1,133 @@
+# coding: utf-8
+"""Test ExportFragmentCache and its base FileCache.
+
+* Entries survive reopening the cache and the least recently used ones are
+  deleted if the cache grows too large.
+* Entries containing classes are refused.
+* The options digest of the HTML exporter changes with the code of the
+  wiki language parser and language helper.
+
+
+"""
+import os
+import sys
+import pickle
+import zlib
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki
+from pwiki.ExportFragmentCache import ExportFragmentCache
+
+
+class FakeConfig:
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+
+    def getboolean(self, section, option, default=None):
+        return True
+
+    def getint(self, section, option, default=None):
+        return self.maxSize
+
+
+class FakeWikiDocument:
+    def __init__(self, wikiPath, maxSize=50):
+        self.wikiPath = wikiPath
+        self.config = FakeConfig(maxSize)
+
+    def getWikiPath(self):
+        return self.wikiPath
+
+    def getWikiConfig(self):
+        return self.config
+
+    def isReadOnlyEffect(self):
+        return False
+
+
+def test_put_get(tmp_path):
+    cache = ExportFragmentCache(FakeWikiDocument(str(tmp_path)))
+    key = ExportFragmentCache.buildKey("PageA", "astkey", "options")
+    assert key != ExportFragmentCache.buildKey("PageB", "astkey", "options")
+    assert ExportFragmentCache.buildKey("PageA", None, "options") is None
+
+    fingerprints = {("page", "PageA"): "abc", ("word set",): None}
+    queries = {("search", b"packed"): {"PageB"}, ("term", "Undefined"): None}
+    cache.put(key, "<p>html</p>", fingerprints, queries)
+
+    assert cache.contains(key)
+    assert cache.get(key) == ("<p>html</p>", fingerprints, queries)
+
+    # Reopened cache finds the entry on disk
+    cache = ExportFragmentCache(FakeWikiDocument(str(tmp_path)))
+    assert cache.get(key) == ("<p>html</p>", fingerprints, queries)
+    assert cache.get(ExportFragmentCache.buildKey("PageB", "astkey",
+            "options")) is None
+
+
+def test_lru_eviction(tmp_path):
+    # Maximum size is given in megabytes
+    cache = ExportFragmentCache(FakeWikiDocument(str(tmp_path), maxSize=1))
+    # Random characters don't compress, so each entry takes about 400 kB
+    fragment = os.urandom(400 * 1024).decode("latin-1")
+
+    keys = ["%040i" % i for i in range(3)]
+    cache.put(keys[0], fragment, {}, {})
+    cache.put(keys[1], fragment, {}, {})
+    # Use first entry so the second one is the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], fragment, {}, {})
+
+    assert cache.totalSize <= 1024 * 1024
+    assert not cache.contains(keys[1])
+    assert cache.contains(keys[0])
+    assert cache.contains(keys[2])
+    assert len(os.listdir(cache.getCacheDir())) == len(cache.entries)
+
+
+class Dangerous:
+    pass
+
+
+def test_classes_refused(tmp_path):
+    cache = ExportFragmentCache(FakeWikiDocument(str(tmp_path)))
+    key = "%040i" % 1
+    cache.putData(key, zlib.compress(pickle.dumps((Dangerous(), {}, {}))))
+
+    assert cache.get(key) is None
+    # Broken entry is deleted
+    assert not cache.contains(key)
+
+
+def test_options_digest_of_code(tmp_path, monkeypatch):
+    from pwiki import Headless, PluginManager
+
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    try:
+        mainControl = Headless.HeadlessMainControl(app, wikiDocument)
+        exporter = PluginManager.getSupportedExportTypes(mainControl,
+                None)['html_multi'][0]
+        exporter.setWikiDocument(wikiDocument)
+        exporter.exportType = 'html_multi'
+        exporter.addOpt = exporter.getAddOpt(None)
+
+        def digest():
+            exporter.fragmentCacheOptionsDigest = None
+            return exporter._getFragmentCacheOptionsDigest()
+
+        langHelper = app.createWikiLanguageHelper(
+                wikiDocument.getWikiDefaultWikiLanguage())
+        parserFile = sys.modules[type(langHelper).__module__].__file__
+        first = digest()
+        assert digest() == first
+
+        getmtime = os.path.getmtime
+        monkeypatch.setattr(os.path, 'getmtime', lambda path:
+                getmtime(path) + (path == parserFile))
+        assert digest() != first
+    finally:
+        wikiDocument.release()
@@ -0,0 +1,106 @@
+# coding: utf-8
+"""Test finding identical files in the FileStorage with its index.
+
+* Identical files are found by size and hash, also if they were added to
+  the storage directory by other means than the FileStorage.
+* Files changed or deleted after indexing are noticed.
+* Verification reports differences between index and files, rebuilding
+  removes them.
+
+
+"""
+import os
+import sys
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from pwiki.wikidata.FileStorage import FileStorage
+
+
+def write(path, content, mtime=None):
+    with open(path, 'wb') as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def make_storage(tmp_path):
+    storage = tmp_path / 'files'
+    storage.mkdir()
+    write(str(storage / 'a.txt'), b'first content', 1000000)
+    write(str(storage / 'b.txt'), b'other content', 1000000)
+    write(str(storage / 'c.png'), b'first content', 1000000)
+    return FileStorage(None, str(storage), str(tmp_path / 'index.sli'))
+
+
+def test_find_identical(tmp_path):
+    fs = make_storage(tmp_path)
+    storage = fs.getStoragePath()
+    src = str(tmp_path / 'new.txt')
+
+    write(src, b'first content')
+    assert fs.findDestPath(src) == (os.path.join(storage, 'a.txt'), True)
+    write(src, b'other content')
+    assert fs.findDestPath(src) == (os.path.join(storage, 'b.txt'), True)
+    # File suffix must match
+    pngSrc = str(tmp_path / 'new.png')
+    write(pngSrc, b'other content')
+    assert fs.findDestPath(pngSrc) == (os.path.join(storage, 'new.png'),
+                                       False)
+
+    write(src, b'third content')
+    assert fs.createDestPath(src) == os.path.join(storage, 'new.txt')
+    assert fs.findDestPath(src) == (os.path.join(storage, 'new.txt'), True)
+    assert fs.getIndex().verify() == []
+
+    # Files copied into storage directory by someone else
+    write(os.path.join(storage, 'd.txt'), b'fourth content')
+    write(src, b'fourth content')
+    assert fs.findDestPath(src) == (os.path.join(storage, 'd.txt'), True)
+
+    # Changed and deleted files
+    write(os.path.join(storage, 'a.txt'), b'fifth content', 2000000)
+    os.remove(os.path.join(storage, 'b.txt'))
+    write(src, b'first content')
+    assert not fs.findDestPath(src)[1]
+    write(src, b'fifth content')
+    assert fs.findDestPath(src) == (os.path.join(storage, 'a.txt'), True)
+    fs.close()
+
+
+def test_index_persists(tmp_path):
+    fs = make_storage(tmp_path)
+    src = str(tmp_path / 'new.txt')
+    write(src, b'other content')
+    assert fs.findDestPath(src)[1]
+    fs.close()
+
+    fs = FileStorage(None, fs.getStoragePath(), str(tmp_path / 'index.sli'))
+    assert fs.findDestPath(src) == (
+        os.path.join(fs.getStoragePath(), 'b.txt'), True)
+    fs.close()
+
+
+def test_verify_and_rebuild(tmp_path):
+    fs = make_storage(tmp_path)
+    storage = fs.getStoragePath()
+    index = fs.getIndex()
+    index.rebuild()
+    assert index.verify() == []
+
+    # Content changed without changing size and modification time
+    write(os.path.join(storage, 'a.txt'), b'FIRST content', 1000000)
+    write(os.path.join(storage, 'e.txt'), b'new')
+    os.remove(os.path.join(storage, 'b.txt'))
+    assert index.verify() == [('a.txt', 'hash mismatch'),
+                              ('b.txt', 'deleted'), ('e.txt', 'missing')]
+
+    index.rebuild()
+    assert index.verify() == []
+    src = str(tmp_path / 'new.txt')
+    write(src, b'FIRST content')
+    assert fs.findDestPath(src) == (os.path.join(storage, 'a.txt'), True)
+    fs.close()
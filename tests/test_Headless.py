@@ -0,0 +1,177 @@
+# coding: utf-8
+"""Test the headless engine of Headless.py.
+
+* HeadlessCmdLine parses the options into its attributes and reports
+  invalid command lines.
+* main() opens a wiki, rebuilds it, verifies and rebuilds the file index,
+  searches and exports with the progress written by StreamProgressHandler
+  to stderr.
+
+
+"""
+import os
+import sys
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import getApp, open_headless_wiki, set_page_text
+
+
+@pytest.fixture
+def Headless():
+    # Installs the translation function "_"
+    getApp()
+    from pwiki import Headless
+    return Headless
+
+
+@pytest.mark.parametrize('args,expected', [
+    (['-w', 'my.wiki'], {'wikiToOpen': 'my.wiki'}),
+    (['--wiki', 'my.wiki', '-p', 'PageOne', '--page', 'PageTwo'],
+     {'wikiToOpen': 'my.wiki', 'wikiWordsToOpen': ['PageOne', 'PageTwo']}),
+    (['-w', 'my.wiki', '--update-db', '--rebuild'],
+     {'updateDb': True, 'rebuild': 'full'}),
+    (['-w', 'my.wiki', '--rebuild-dirty'], {'rebuild': 'dirty'}),
+    (['-w', 'my.wiki', '--update-ext'], {'rebuild': 'ext'}),
+    (['-w', 'my.wiki', '--verify-file-index'], {'fileIndex': 'verify'}),
+    (['-w', 'my.wiki', '--rebuild-file-index'], {'fileIndex': 'rebuild'}),
+    (['-w', 'my.wiki', '--export-what', 'subtree', '--export-type',
+      'html_multi', '--export-dest', 'out', '--export-compfn', '-p', 'Root'],
+     {'exportWhat': 'subtree', 'exportType': 'html_multi',
+      'exportDest': 'out', 'exportCompFn': True,
+      'wikiWordsToOpen': ['Root']}),
+    (['-w', 'my.wiki', '--list-export-types', '--profile-db'],
+     {'listExportTypes': True, 'profileDb': True}),
+    (['-w', 'my.wiki', '--search', 'needle', '--search-regex',
+      '--search-boolean', '--search-case', '--search-whole-word',
+      '--search-index'],
+     {'searchStr': 'needle', 'searchRegex': True, 'searchBoolean': True,
+      'searchCase': True, 'searchWholeWord': True, 'searchIndex': True}),
+    (['--help'], {'showHelp': True, 'wikiToOpen': None}),
+])
+def test_cmdline(Headless, args, expected):
+    cmdLine = Headless.HeadlessCmdLine(args)
+    assert cmdLine.cmdLineError is None
+    for attr, value in expected.items():
+        assert getattr(cmdLine, attr) == value, attr
+
+    # Options not given keep their defaults
+    default = Headless.HeadlessCmdLine([])
+    for attr, value in vars(cmdLine).items():
+        if attr not in expected and attr not in ('wikiToOpen',
+                'cmdLineError'):
+            assert value == getattr(default, attr), attr
+
+
+@pytest.mark.parametrize('args', [
+    [],
+    ['-p', 'PageOne'],
+    ['-w', 'my.wiki', '--unknown'],
+    ['-w', 'my.wiki', '--search'],
+    ['-w', 'my.wiki', 'extra'],
+    ['-w', 'my.wiki', '--export-type', 'html_multi'],
+    ['-w', 'my.wiki', '--export-what', 'pages', '--export-type',
+     'html_multi', '--export-dest', 'out'],
+])
+def test_cmdline_error(Headless, args):
+    assert Headless.HeadlessCmdLine(args).cmdLineError
+
+
+@pytest.fixture
+def wikiPath(tmp_path, monkeypatch):
+    """
+    Create wiki with some pages and a file in the file storage, return
+    path of the wiki configuration file
+    """
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    try:
+        set_page_text(wikiDocument, 'TestWiki', 'TestWiki\nNeedlePage\n')
+        set_page_text(wikiDocument, 'NeedlePage', 'NeedlePage\nNeedle\n')
+        set_page_text(wikiDocument, 'OtherPage', 'OtherPage\nHaystack\n')
+
+        fileStorage = wikiDocument.getFileStorage()
+        storagePath = fileStorage.getStoragePath()
+        os.makedirs(storagePath)
+        write_file(os.path.join(storagePath, 'a.txt'), b'first content')
+        fileStorage.getIndex().rebuild()
+        return wikiDocument.getWikiConfigPath()
+    finally:
+        wikiDocument.release()
+
+
+def write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    os.utime(path, (1000000, 1000000))
+
+
+def run_main(Headless, capsys, *args):
+    result = Headless.main(list(args))
+    out, err = capsys.readouterr()
+    return result, out, err
+
+
+def test_main(Headless, wikiPath, tmp_path, capsys):
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--rebuild', '--search', 'Needle')
+    assert result == 0
+    assert out.splitlines() == ['NeedlePage', 'TestWiki']
+    # Progress of StreamProgressHandler
+    assert ' 90% Update syntax of TestWiki\n' in err
+
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--verify-file-index')
+    assert (result, out) == (0, '')
+
+    # Content changed without changing size and modification time
+    storagePath = os.path.join(os.path.dirname(wikiPath), 'files')
+    write_file(os.path.join(storagePath, 'a.txt'), b'FIRST content')
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--verify-file-index')
+    assert (result, out) == (1, 'hash mismatch\ta.txt\n')
+
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--rebuild-file-index')
+    assert result == 0
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--verify-file-index')
+    assert (result, out) == (0, '')
+
+    exportDir = str(tmp_path / 'export')
+    os.mkdir(exportDir)
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--export-what', 'page', '-p', 'NeedlePage', '--export-type',
+            'html_multi', '--export-dest', exportDir)
+    assert result == 0
+    # Named after the wiki
+    with open(os.path.join(exportDir, 'TestWiki.html'),
+            encoding='utf-8') as f:
+        text = f.read()
+    assert 'Needle' in text
+    assert 'Haystack' not in text
+
+
+def test_main_errors(Headless, wikiPath, tmp_path, capsys):
+    result, out, err = run_main(Headless, capsys, '--help')
+    assert (result, out) == (0, '')
+    assert 'Usage:' in err
+
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--export-what', 'wiki')
+    assert result == 2
+    assert 'Usage:' in err
+
+    result, out, err = run_main(Headless, capsys, '-w', wikiPath,
+            '--export-what', 'wiki', '--export-type', 'no_such_type',
+            '--export-dest', str(tmp_path))
+    assert result == 1
+    assert 'no_such_type' in err
+
+    result, out, err = run_main(Headless, capsys, '-w',
+            str(tmp_path / 'missing.wiki'))
+    assert result == 1
@@ -0,0 +1,123 @@
+# coding: utf-8
+"""Test LinkGraph.
+
+* Patched graphs must answer like a graph loaded from the same data.
+* The changed link terms reported by a patched graph are enough to keep
+  an AutoLinkRelaxMatcher up to date.
+
+
+"""
+import os
+import sys
+import random
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from pwiki import LinkGraph
+from pwiki.ParseUtilities import AutoLinkRelaxMatcher
+
+
+PAGES = ['Page%d' % i for i in range(12)]
+TERMS = PAGES + ['Alias%d' % i for i in range(4)] + ['Undefined']
+
+
+def new_graph(pages, linkTerms, relations):
+    graph = LinkGraph.LinkGraph(None)
+    graph._load(pages, linkTerms, sorted(relations))
+    return graph
+
+
+def answers(graph):
+    result = [sorted(graph.getAllDefinedWikiPageNames()),
+              graph.getParentlessWikiWords(), graph.getUndefinedWords()]
+    for term in TERMS:
+        result.append(graph.getChildRelationships(term))
+        result.append(graph.getChildRelationships(term, existingonly=True,
+                                                  selfreference=False))
+        result.append(sorted(graph.getParentRelationships(term)))
+        result.append(graph.getWikiPageNameForLinkTerm(term))
+        result.append(len(graph.findBestPathFromWordToWord(term, 'Page0')))
+    return result
+
+
+def test_queries():
+    graph = new_graph(['A', 'B', 'C'],
+                      [('A', 'A', True), ('B', 'B', True), ('C', 'C', True),
+                       ('AliasOfC', 'C', False)],
+                      [('A', 'B'), ('A', 'AliasOfC'), ('A', 'D'), ('B', 'B')])
+    assert graph.getChildRelationships('A') == ['AliasOfC', 'B', 'D']
+    assert graph.getChildRelationships('A', existingonly=True) == \
+        ['AliasOfC', 'B']
+    assert graph.getChildRelationships('B', selfreference=False) == []
+    assert sorted(graph.getParentRelationships('C')) == ['A']
+    assert sorted(graph.getParentRelationships('B')) == ['A', 'B']
+    assert graph.getParentlessWikiWords() == ['A']
+    assert graph.getUndefinedWords() == ['D']
+    assert graph.getWikiPageNameForLinkTerm('AliasOfC') == 'C'
+    assert graph.getAllSubWords(['A']) == ['A', 'C', 'B']
+    assert graph.findBestPathFromWordToWord('B', 'A') == ['A', 'B']
+
+
+def test_patches_match_reload(monkeypatch):
+    rnd = random.Random(0)
+    monkeypatch.setattr(LinkGraph, '_MIN_PATCHES_FOR_COMPACTION', 8)
+    pages = set(PAGES[:8])
+    linkTerms = {}  # {(page, syncUpdate): [link terms]}
+    relations = {}  # {page: set of relations}
+    graph = new_graph(pages, [], [])
+
+    # Changes before the first call are unknown
+    assert graph.takeChangedLinkTerms() is None
+    matcher = AutoLinkRelaxMatcher(pages)
+
+    for step in range(500):
+        kind = rnd.random()
+        page = rnd.choice(PAGES)
+        if kind < 0.4 and page in pages:
+            rels = set(rnd.sample(TERMS, rnd.randint(0, 4)))
+            relations[page] = rels
+            graph.updateChildRelations(page, [(r, 0) for r in rels])
+        elif kind < 0.6 and page in pages:
+            syncUpdate = rnd.random() < 0.5
+            terms = [t for t in rnd.sample(TERMS[12:16], rnd.randint(0, 2))
+                     if not any(t in v for k, v in linkTerms.items()
+                                if k[0] != page)]
+            linkTerms[(page, syncUpdate)] = terms
+            graph.updateWikiPageLinkTerms(page, [(t, 2, page, 0, 0)
+                                                 for t in terms], syncUpdate)
+        elif kind < 0.7 and page in pages:
+            pages.discard(page)
+            relations.pop(page, None)
+            linkTerms.pop((page, False), None)
+            linkTerms.pop((page, True), None)
+            graph.deleteWikiPage(page)
+        elif kind < 0.8 and page in pages:
+            toPage = rnd.choice([p for p in PAGES if p not in pages] or [page])
+            if toPage == page:
+                continue
+            pages.discard(page)
+            pages.add(toPage)
+            relations[toPage] = relations.pop(page, set())
+            for syncUpdate in (False, True):
+                linkTerms[(toPage, syncUpdate)] = \
+                    linkTerms.pop((page, syncUpdate), [])
+            graph.renameWikiPage(page, toPage)
+        elif page not in pages:
+            pages.add(page)
+            graph.addWikiPage(page)
+
+        if step % 50 == 0:
+            loaded = new_graph(
+                pages,
+                [(t, k[0], k[1]) for k, v in linkTerms.items() for t in v],
+                [(p, r) for p, rels in relations.items() for r in rels])
+            assert answers(graph) == answers(loaded)
+
+            matcher.updateWords(graph.takeChangedLinkTerms(),
+                                graph.isLinkTerm)
+            assert matcher.getWords() == \
+                frozenset(loaded.getAllDefinedWikiPageNames()) | \
+                frozenset(t for v in linkTerms.values() for t in v)
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""Test LinkTermSnapshot.
+
+* Patched snapshots must answer like a snapshot built from the same terms.
+
+
+"""
+import os
+import sys
+import random
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from pwiki import LinkTermSnapshot
+
+
+TERMS = ['Page', 'page', 'PageTwo', 'Pagination', 'Other', 'other', 'Alias',
+         'ALIAS', 'Ä', 'ä']
+
+
+def answers(snapshot):
+    result = [sorted(snapshot.getAllProducedWikiLinks())]
+    for term in TERMS + ['Undefined', 'pAGE']:
+        word = snapshot.getWikiPageNameForLinkTerm(term)
+        if snapshot.resolveCaseNormed and term not in TERMS:
+            # Any of the terms differing only in case may be chosen
+            word = word is not None
+        result.append(word)
+    for prefix in ['', 'P', 'p', 'Pag', 'a', 'Ä', 'x']:
+        result.append(snapshot.getWikiPageLinkTermsStartingWith(prefix))
+        result.append(snapshot.getWikiPageLinkTermsStartingWith(prefix,
+                                                                 True))
+    return result
+
+
+def test_queries():
+    snapshot = LinkTermSnapshot.LinkTermSnapshot(
+        {'Page': 'Page', 'PageTwo': 'PageTwo', 'Alias': 'PageTwo'})
+    assert snapshot.getWikiPageNameForLinkTerm('Alias') == 'PageTwo'
+    assert snapshot.getWikiPageNameForLinkTerm('alias') is None
+    assert snapshot.getWikiPageLinkTermsStartingWith('Pa') == \
+        ['Page', 'PageTwo']
+    assert snapshot.getWikiPageLinkTermsStartingWith('pa', True) == \
+        ['Page', 'PageTwo']
+
+    snapshot = snapshot.withResolveCaseNormed(True)
+    assert snapshot.getWikiPageNameForLinkTerm('alias') == 'PageTwo'
+    assert snapshot.getWikiPageLinkTermsStartingWith('pa') == \
+        ['Page', 'PageTwo']
+
+    snapshot = snapshot.patched({'Alias': None, 'page': 'PageTwo'})
+    assert snapshot.getWikiPageNameForLinkTerm('alias') is None
+    assert snapshot.getWikiPageNameForLinkTerm('PAGE') == 'Page'
+    assert snapshot.getWikiPageNameForLinkTerm('page') == 'PageTwo'
+
+
+def test_patches_match_rebuild(monkeypatch):
+    rnd = random.Random(0)
+    monkeypatch.setattr(LinkTermSnapshot, '_MAX_OVERLAY_SIZE', 4)
+    linkTerms = {}
+    snapshot = LinkTermSnapshot.LinkTermSnapshot({})
+
+    for step in range(300):
+        changes = {}
+        for term in rnd.sample(TERMS, rnd.randint(1, 3)):
+            changes[term] = rnd.choice([None, term, 'Page', 'Other'])
+        for term, word in changes.items():
+            if word is None:
+                linkTerms.pop(term, None)
+            else:
+                linkTerms[term] = word
+        snapshot = snapshot.patched(changes)
+
+        resolveCaseNormed = rnd.random() < 0.5
+        snapshot = snapshot.withResolveCaseNormed(resolveCaseNormed)
+        built = LinkTermSnapshot.LinkTermSnapshot(dict(linkTerms),
+                                                  resolveCaseNormed)
+        assert answers(snapshot) == answers(built)
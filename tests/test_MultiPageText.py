@@ -0,0 +1,199 @@
+# coding: utf-8
+"""Test the streamed base64 blocks of the multipage text format.
+
+* iterBase64BlockEncode() gives the same text as encoding the data at
+  once, Base64BlockDecoder decodes it in any pieces.
+* _SeparatorWatchUtf8Writer finds a separator line in the written content
+  also if it is split between write() calls.
+* Base64 blocks written by _SeparatorWatchUtf8Writer are read back by
+  MultiPageTextImporter._collectB64Content() up to the separator.
+* The import commits after each IMPORT_ENTRIES_PER_COMMIT entries.
+
+
+"""
+import base64
+import os
+import sys
+from io import BytesIO, TextIOWrapper
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import getApp, open_headless_wiki
+
+from pwiki import StringOps
+from pwiki.StringOps import iterBase64BlockEncode, base64BlockEncode, \
+        Base64BlockDecoder
+
+
+SEPARATOR = '-----TestSeparator-----'
+
+# Data lengths around the chunk boundaries of a chunk size of 105 bytes
+# and all three kinds of padding
+SIZES = [0, 1, 2, 3, 52, 104, 105, 106, 209, 210, 211, 212, 315, 316, 317]
+
+
+@pytest.fixture
+def smallChunks(monkeypatch):
+    # Installs the translation function "_"
+    getApp()
+    monkeypatch.setattr(StringOps, '_BASE64_BLOCK_CHUNK_SIZE', 105)
+    monkeypatch.setattr(Base64BlockDecoder, '_DECODE_SIZE', 10)
+
+
+def make_data(size):
+    return bytes((i * 7 + 3) % 256 for i in range(size))
+
+
+def lines_of_70(data):
+    b64 = base64.b64encode(data).decode('ascii')
+    return '\n'.join(b64[i:i + 70] for i in range(0, len(b64), 70))
+
+
+def decode(pieces):
+    stream = BytesIO()
+    decoder = Base64BlockDecoder(stream)
+    for piece in pieces:
+        decoder.feed(piece)
+    decoder.close()
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_base64_block(smallChunks, size):
+    data = make_data(size)
+    parts = list(iterBase64BlockEncode(data))
+    text = ''.join(parts)
+    assert text == lines_of_70(data) == base64BlockEncode(data)
+    assert len(parts) == max(0, 2 * ((size + 104) // 105) - 1)
+
+    assert decode(parts) == data
+    assert decode(text.splitlines(True)) == data
+    # Split at every position
+    for pos in range(len(text) + 1):
+        assert decode([text[:pos], text[pos:]]) == data, pos
+
+
+def test_base64_block_malformed(smallChunks):
+    with pytest.raises(ValueError):
+        decode(['QUJD', 'R'])
+
+
+def write_and_check(writer, pieces):
+    """
+    Write pieces and return True if a separator line was found
+    """
+    writer.clearBuffer()
+    for piece in pieces:
+        writer.write(piece)
+    return writer.separatorFound
+
+
+def test_separator_watch():
+    from pwiki.Exporters import _SeparatorWatchUtf8Writer, \
+            _SeparatorFoundException
+
+    writer = _SeparatorWatchUtf8Writer(BytesIO(), SEPARATOR)
+    separatorLine = '\n%s\n' % SEPARATOR
+    text = 'before' + separatorLine + 'after'
+    for pos in range(len(text) + 1):
+        assert write_and_check(writer, [text[:pos], text[pos:]]), pos
+    for pos in range(1, len(text)):
+        pieces = [text[i:i + pos] for i in range(0, len(text), pos)]
+        assert write_and_check(writer, pieces), pos
+    assert write_and_check(writer, list(text))
+
+    # Not a separator line
+    for other in ['before\n%s after' % SEPARATOR,
+            'before %s\nafter' % SEPARATOR, SEPARATOR,
+            'before\n-' + SEPARATOR + '\n']:
+        for pos in range(len(other) + 1):
+            assert not write_and_check(writer, [other[:pos], other[pos:]])
+
+    # Line after the tag line of an entry
+    writer.writeSeparator()
+    writer.write('wikipage/SomePage\n')
+    writer.write(SEPARATOR + '\ncontent')
+    with pytest.raises(_SeparatorFoundException):
+        writer.writeSeparator()
+
+
+def read_importer(value):
+    from pwiki.Importers import MultiPageTextImporter
+
+    importer = MultiPageTextImporter(None)
+    importer.importFile = TextIOWrapper(BytesIO(value), 'utf-8')
+    importer.separator = SEPARATOR + '\n'
+    return importer
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_base64_round_trip(smallChunks, size):
+    from pwiki.Exporters import _SeparatorWatchUtf8Writer
+
+    data = make_data(size)
+    stream = BytesIO()
+    writer = _SeparatorWatchUtf8Writer(stream, SEPARATOR)
+    writer.writeSeparator()
+    writer.write('versioning/packet/versionNo/1/SomePage\n')
+    writer.writeBase64Block(data)
+    writer.writeSeparator()
+    writer.write('next entry\n')
+    writer.checkAndClearBuffer()
+
+    importer = read_importer(stream.getvalue())
+    assert importer.importFile.readline() == \
+            'versioning/packet/versionNo/1/SomePage\n'
+    assert importer._collectB64Content() == data
+    assert importer.importFile.readline() == 'next entry\n'
+
+
+def test_collect_b64_content_malformed(smallChunks):
+    importer = read_importer(('QUJD\nR!\n%s\nnext entry\n' %
+            SEPARATOR).encode('utf-8'))
+    assert importer._collectB64Content() is None
+    # Rest of the content was skipped
+    assert importer.importFile.readline() == 'next entry\n'
+
+
+def test_import_commits(tmp_path, monkeypatch):
+    from pwiki import Importers
+
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    try:
+        words = ['ImportPage%i' % i for i in range(7)]
+        text = 'Multipage text format 1\nSeparator: %s\n' % SEPARATOR
+        text += ('\n%s\n' % SEPARATOR).join(
+                'wikipage/%s\n2020-01-01/00:00:00  2020-01-01/00:00:00  '
+                '2020-01-01/00:00:00\n%s\ntext\n' % (word, word)
+                for word in words)
+
+        wikiData = wikiDocument.getWikiData().wikiData
+        committed = []
+        commit = wikiData.commit
+
+        def recordingCommit():
+            commit()
+            committed.append(len(set(words) &
+                    set(wikiData.getAllDefinedWikiPageNames())))
+
+        monkeypatch.setattr(wikiData, 'commit', recordingCommit)
+        monkeypatch.setattr(Importers, 'IMPORT_ENTRIES_PER_COMMIT', 3)
+
+        importer = Importers.MultiPageTextImporter(None)
+        assert importer.doImport(wikiDocument, 'multipage_text', None,
+                False, (0,), importData=text.encode('utf-8'))
+
+        assert set(words) <= set(wikiDocument.getAllDefinedWikiPageNames())
+        for word in words:
+            assert wikiDocument.getWikiPage(word).getLiveText() == \
+                    '%s\ntext\n' % word
+        # Committed after each three entries and at the end
+        imported = [count for count in committed if count > 0]
+        assert imported == [3, 6, 7]
+    finally:
+        wikiDocument.release()
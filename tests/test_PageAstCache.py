@@ -0,0 +1,195 @@
+# coding: utf-8
+"""Test PageAstCache.
+
+* Stored ASTs are found again, also after reopening the cache, and the
+  least recently used ones are deleted if the cache grows too large.
+* Keys depend on page name, text and format details.
+* Only syntax node classes and the few other classes of an AST can be
+  loaded, a manipulated cache file can't call arbitrary functions.
+
+
+"""
+import os
+import sys
+import pickle
+import types
+import zlib
+
+import pytest
+import wx
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import MockApp, MockWikiDocument, ast_eq
+
+from pwiki import WikiPyparsing
+from pwiki.PageAstCache import PageAstCache
+
+
+LANGUAGE_NAME = 'wikidpad_default_2_0'
+
+TEXT = """+ Heading
+
+Link to WikiWord and [Other Page], [:page: IncludedPage]
+
+* bullet
+"""
+
+# Lists are stored with StringOps.HtmlStartTag, ... in the AST
+MEDIAWIKI_TEXT = """== Heading ==
+
+Link to [[Other Page]]
+* one
+** two
+# three
+"""
+
+
+class FakeApp(MockApp):
+    def freeWikiParser(self, parser):
+        pass
+
+
+class FakeWikiDocument(MockWikiDocument):
+    def __init__(self, wikiPath, maxSize=50, text=TEXT,
+            languageName=LANGUAGE_NAME):
+        MockWikiDocument.__init__(self, {'TestPage': text}, languageName)
+        self.wikiPath = wikiPath
+        self.getWikiConfig().set('main', 'pageAstCache_maxSize', maxSize)
+
+    def getWikiPath(self):
+        return self.wikiPath
+
+    def isReadOnlyEffect(self):
+        return False
+
+    def getCcWordBlacklist(self):
+        return set()
+
+    def getNccWordBlacklist(self):
+        return set()
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = FakeApp()
+    monkeypatch.setattr(wx, 'GetApp', lambda: app)
+    return app
+
+
+def build_key(cache, wikidoc, text=TEXT, pageName='TestPage'):
+    formatDetails = wikidoc.getWikiPage('TestPage').getFormatDetails()
+    return cache.buildKey(pageName, text, formatDetails)
+
+
+@pytest.mark.parametrize('text, languageName', [
+    (TEXT, LANGUAGE_NAME),
+    (MEDIAWIKI_TEXT, 'mediawiki_1'),
+])
+def test_put_get(app, tmp_path, text, languageName):
+    wikidoc = FakeWikiDocument(str(tmp_path), text=text,
+            languageName=languageName)
+    cache = PageAstCache(wikidoc)
+    key = build_key(cache, wikidoc, text=text)
+    assert key != build_key(cache, wikidoc, text=text + 'more')
+    assert key != build_key(cache, wikidoc, text=text, pageName='OtherPage')
+
+    pageAst = wikidoc.getWikiPage('TestPage').getLivePageAst()
+    assert cache.get(key) is None
+    cache.put(key, pageAst)
+
+    assert ast_eq(cache.get(key), pageAst)
+
+    # Reopened cache finds the entry on disk
+    cache = PageAstCache(FakeWikiDocument(str(tmp_path), text=text,
+            languageName=languageName))
+    assert ast_eq(cache.get(key), pageAst)
+
+
+def test_lru_eviction(app, tmp_path):
+    # Maximum size is given in megabytes
+    wikidoc = FakeWikiDocument(str(tmp_path), maxSize=1)
+    cache = PageAstCache(wikidoc)
+    pageAst = wikidoc.getWikiPage('TestPage').getLivePageAst()
+    # Random characters don't compress, so each entry takes about 400 kB
+    pageAst.filler = os.urandom(400 * 1024)
+
+    keys = ['%040i' % i for i in range(3)]
+    cache.put(keys[0], pageAst)
+    cache.put(keys[1], pageAst)
+    # Use first entry so the second one is the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], pageAst)
+
+    assert cache.totalSize <= 1024 * 1024
+    assert not cache.contains(keys[1])
+    assert cache.contains(keys[0])
+    assert cache.contains(keys[2])
+
+
+class Dangerous:
+    pass
+
+
+def dump_global(module, name):
+    # Pickles a call of the global module.name without arguments
+    return (b'\x80\x04\x8c' + bytes([len(module)]) + module.encode() +
+            b'\x8c' + bytes([len(name)]) + name.encode() +
+            b'\x93)R.')
+
+
+@pytest.mark.parametrize('module, name', [
+    # Dotted name reaching a function through imported modules
+    ('pwiki.WikiPyparsing', 'traceback.linecache.os.getcwd'),
+    ('wikidPadParser.WikidPadParser', 're.os.getcwd'),
+    # Function and class of allowed modules which aren't syntax nodes
+    ('pwiki.WikiPyparsing', 'buildSyntaxNode'),
+    ('pwiki.WikiPyparsing', 'ParserElement'),
+    # Module not allowed
+    ('os', 'getcwd'),
+    ('pwiki.StringOps', 'pathDec'),
+])
+def test_restricted_loading(app, tmp_path, module, name):
+    wikidoc = FakeWikiDocument(str(tmp_path))
+    cache = PageAstCache(wikidoc)
+    # Make sure the modules exist
+    build_key(cache, wikidoc)
+
+    key = '%040i' % 1
+    cache.putData(key, zlib.compress(dump_global(module, name)))
+
+    assert cache.get(key) is None
+    # Broken entry is deleted
+    assert not cache.contains(key)
+
+
+def test_classes_refused(app, tmp_path):
+    wikidoc = FakeWikiDocument(str(tmp_path))
+    cache = PageAstCache(wikidoc)
+    key = '%040i' % 1
+    cache.putData(key, zlib.compress(pickle.dumps(Dangerous())))
+
+    assert cache.get(key) is None
+    assert not cache.contains(key)
+
+
+def test_malicious_pickle_not_executed(app, tmp_path, monkeypatch):
+    calls = []
+    # Function reachable by attributes of an allowed module like os.system
+    monkeypatch.setattr(WikiPyparsing, 'testTarget',
+            types.SimpleNamespace(run=lambda: calls.append(1)),
+            raising=False)
+
+    wikidoc = FakeWikiDocument(str(tmp_path))
+    cache = PageAstCache(wikidoc)
+    build_key(cache, wikidoc)
+
+    key = '%040i' % 1
+    cache.putData(key, zlib.compress(dump_global('pwiki.WikiPyparsing',
+            'testTarget.run')))
+
+    assert cache.get(key) is None
+    assert calls == []
@@ -0,0 +1,90 @@
+# coding: utf-8
+"""Test detection of wiki page files changed outside of WikidPad.
+
+* findChangedFileSignatures() finds changed and missing files, also when
+  the files are stat'ed by multiple threads.
+* PageFileWatcher reports changed page files (only if the optional
+  "watchdog" package is installed).
+
+
+"""
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from pwiki import PageFileChanges
+from pwiki.PageFileChanges import findChangedFileSignatures
+from pwiki.StringOps import getFileSignatureBlock, \
+        getFileSignatureBlockFromStat
+
+
+def make_pages(dataDir, count):
+    entries = []
+    for i in range(count):
+        name = 'Page%04d.wiki' % i
+        path = os.path.join(str(dataDir), name)
+        with open(path, 'w') as f:
+            f.write('Page %i' % i)
+        entries.append(('Page%04d' % i, name, getFileSignatureBlock(path)))
+    return entries
+
+
+@pytest.mark.parametrize('count', [10, 1000])
+def test_find_changed(tmp_path, count):
+    entries = make_pages(tmp_path, count)
+    entries.append(('Missing', 'Missing.wiki', b'signature'))
+
+    changed, missing = findChangedFileSignatures(str(tmp_path), entries,
+            getFileSignatureBlockFromStat)
+    assert changed == []
+    assert missing == ['Missing']
+
+    path = str(tmp_path / 'Page0005.wiki')
+    with open(path, 'w') as f:
+        f.write('Changed text')
+    os.utime(path, (1000000, 1000000))
+    os.remove(str(tmp_path / 'Page0007.wiki'))
+
+    changed, missing = findChangedFileSignatures(str(tmp_path), entries,
+            getFileSignatureBlockFromStat)
+    assert changed == [('Page0005', entries[5][2],
+            getFileSignatureBlock(path))]
+    assert missing == ['Page0007', 'Missing']
+
+
+def test_watcher(tmp_path):
+    pytest.importorskip('watchdog')
+    reported = []
+    event = threading.Event()
+
+    def callback(names):
+        reported.append(names)
+        event.set()
+
+    make_pages(tmp_path, 3)
+    watcher = PageFileChanges.PageFileWatcher(str(tmp_path), '.wiki',
+            callback)
+    assert watcher.start()
+    try:
+        with open(str(tmp_path / 'Page0001.wiki'), 'a') as f:
+            f.write('more')
+        with open(str(tmp_path / 'New.wiki'), 'w') as f:
+            f.write('New')
+        with open(str(tmp_path / 'Other.txt'), 'w') as f:
+            f.write('Not a page')
+
+        assert event.wait(PageFileChanges.WATCH_DELAY + 10)
+        # Wait for events coming late
+        time.sleep(0.5)
+    finally:
+        watcher.stop()
+
+    assert reported[0] == {'Page0001.wiki', 'New.wiki'}
@@ -0,0 +1,82 @@
+# coding: utf-8
+"""Test the rebuild with worker processes of ParallelRebuild.
+
+* Rebuilding with worker processes stores the same attributes, todos,
+  relations and match terms as the rebuild in the main process.
+
+
+"""
+import io
+import os
+import sys
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki, set_page_text
+
+
+PAGES = {
+    'MainPage': '+ MainPage\n\nChildPage [AliasedPage] MissingPage\n'
+            '[global.auto_link: relax]\n',
+    'ChildPage': '+ ChildPage\n\n++ Sub heading\n\ntodo: write more\n'
+            '[key: value] [key: other value]\nMainPage\n',
+    'AliasedPage': '+ AliasedPage\n\n[alias: SomeAlias]\n'
+            'done: nothing\nchild page\n',
+    'CamelCasePage': '+ CamelCasePage\n\n[camelCaseWordsEnabled: false]\n'
+            'ChildPage [SomeAlias] main page\n',
+}
+
+
+def meta_data(wikiDocument):
+    wikiData = wikiDocument.getWikiData()
+    return (sorted(wikiData.getAllRelations()),
+            sorted(wikiData.getTodos()),
+            sorted(wikiData.getAttributeTriples(None, None, None)),
+            sorted(wikiData.getAllWikiPageLinkTerms()),
+            sorted(wikiData.getWikiWordMatchTermsWith(''), key=repr),
+            sorted(wikiData.getWikiPageNamesForMetaDataState(
+                wikiDocument.getFinalMetaDataState(), '>')))
+
+
+def rebuild(wikiDocument):
+    stream = io.StringIO()
+    from pwiki.Headless import StreamProgressHandler
+    wikiDocument.rebuildWiki(StreamProgressHandler(stream), False)
+    wikiDocument.getUpdateExecutor().pause(wait=True)
+
+
+def test_parallel_rebuild_matches_serial(tmp_path, monkeypatch):
+    from pwiki import ParallelRebuild
+
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    try:
+        for word, text in sorted(PAGES.items()):
+            set_page_text(wikiDocument, word, text)
+
+        monkeypatch.setattr(ParallelRebuild, 'getProcessCount', lambda: 1)
+        rebuild(wikiDocument)
+        expected = meta_data(wikiDocument)
+
+        # Use the worker processes also for this small wiki
+        calls = []
+        rebuildMetaData = ParallelRebuild.rebuildMetaData
+
+        def recordingRebuildMetaData(*args, **kwargs):
+            step = rebuildMetaData(*args, **kwargs)
+            calls.append(step)
+            return step
+
+        monkeypatch.setattr(ParallelRebuild, 'MIN_PAGE_COUNT', 1)
+        monkeypatch.setattr(ParallelRebuild, 'getProcessCount', lambda: 2)
+        monkeypatch.setattr(ParallelRebuild, 'rebuildMetaData',
+                recordingRebuildMetaData)
+        rebuild(wikiDocument)
+
+        # Parallel rebuild finished without falling back
+        assert len(calls) == 1
+        assert meta_data(wikiDocument) == expected
+    finally:
+        wikiDocument.release()
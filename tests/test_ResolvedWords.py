@@ -0,0 +1,143 @@
+# coding: utf-8
+"""Test the column "resolvedword" of the wikirelations of compact_sqlite.
+
+* The real page name a relation resolves to is updated when an alias is
+  changed, a page is renamed or deleted and when a page is added which a
+  dangling link points to.
+* getChildRelationships(existingonly=True) and getParentRelationships()
+  use the resolved page names.
+* An alias defined by multiple pages links to the first page by name, in
+  the patched and in the newly built link term snapshot.
+
+
+"""
+import os
+import sys
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki, set_page_text
+
+
+LINKING_TEXT = 'LinkingPage\nTargetPage [OldAlias] [NewAlias] RenamedPage ' \
+        'FuturePage\n'
+
+
+@pytest.fixture
+def wiki(tmp_path, monkeypatch):
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    set_page_text(wikiDocument, 'TargetPage',
+            'TargetPage\n[alias: OldAlias]\n')
+    set_page_text(wikiDocument, 'LinkingPage', LINKING_TEXT)
+    yield wikiDocument.getWikiData().wikiData, wikiDocument
+    wikiDocument.release()
+
+
+def resolved_words(wikiData):
+    """
+    Return dictionary from the relations of LinkingPage to the resolved
+    page names
+    """
+    return dict(wikiData.connWrap.execSqlQuery(
+            "select relation, resolvedword from wikirelations "
+            "where word = 'LinkingPage' and relation != word"))
+
+
+def existing_children(wikiData):
+    return set(wikiData.getChildRelationships('LinkingPage',
+            existingonly=True, selfreference=False))
+
+
+def parents(wikiData, word):
+    """
+    Return parents of the page word links to without the self link of the
+    page
+    """
+    pageName = wikiData.getWikiPageNameForLinkTerm(word) or word
+    return set(wikiData.getParentRelationships(word)) - {pageName}
+
+
+def assert_resolved(wikiData, expected):
+    """
+    expected -- Dictionary from relation to resolved page name for the
+        relations of LinkingPage resolving to an existing page
+    """
+    assert resolved_words(wikiData) == dict((relation,
+            expected.get(relation, '')) for relation in ('TargetPage',
+            'OldAlias', 'NewAlias', 'RenamedPage', 'FuturePage'))
+    assert existing_children(wikiData) == set(expected)
+
+    for word in set(expected.values()):
+        assert parents(wikiData, word) == {'LinkingPage'}
+    for relation, word in expected.items():
+        assert parents(wikiData, relation) == {'LinkingPage'}
+    for relation in resolved_words(wikiData):
+        if relation not in expected:
+            # Dangling link
+            assert 'LinkingPage' in parents(wikiData, relation)
+            assert wikiData.getWikiPageNameForLinkTerm(relation) is None
+
+
+def test_resolved_words(wiki):
+    wikiData, wikiDocument = wiki
+    assert_resolved(wikiData, {'TargetPage': 'TargetPage',
+            'OldAlias': 'TargetPage'})
+
+    # Change alias
+    set_page_text(wikiDocument, 'TargetPage',
+            'TargetPage\n[alias: NewAlias]\n')
+    assert_resolved(wikiData, {'TargetPage': 'TargetPage',
+            'NewAlias': 'TargetPage'})
+    assert parents(wikiData, 'OldAlias') == {'LinkingPage'}
+
+    # Rename page, the alias is moved with the page
+    wikiDocument.renameWikiWord('TargetPage', 'RenamedPage')
+    wikiDocument.getWikiPage('RenamedPage').runDatabaseUpdate()
+    assert_resolved(wikiData, {'RenamedPage': 'RenamedPage',
+            'NewAlias': 'RenamedPage'})
+    # The text of the renamed page still starts with the old name
+    assert parents(wikiData, 'TargetPage') == {'LinkingPage', 'RenamedPage'}
+
+    # Delete page
+    wikiDocument.getWikiPage('RenamedPage').deletePage()
+    wikiDocument.getUpdateExecutor().clearDeque(0)
+    assert_resolved(wikiData, {})
+
+    # Add page a dangling link points to and page with an alias
+    set_page_text(wikiDocument, 'FuturePage', 'FuturePage\n')
+    set_page_text(wikiDocument, 'AliasPage', 'AliasPage\n[alias: OldAlias]\n')
+    assert_resolved(wikiData, {'FuturePage': 'FuturePage',
+            'OldAlias': 'AliasPage'})
+
+
+def link_target(wikiData, term, rebuild):
+    """
+    Return page name term links to by the patched link term snapshot or
+    by one built anew if rebuild is True
+    """
+    if rebuild:
+        wikiData.linkTermSnapshot = None
+    return wikiData.getWikiPageNameForLinkTerm(term)
+
+
+def test_duplicate_alias(wiki):
+    wikiData, wikiDocument = wiki
+    set_page_text(wikiDocument, 'LinkingPage', 'LinkingPage\n[SharedAlias]\n')
+
+    # The first page by name wins, not the first or last one stored
+    for word, expected in [('ZPage', 'ZPage'), ('APage', 'APage'),
+            ('MPage', 'APage')]:
+        set_page_text(wikiDocument, word, '%s\n[alias: SharedAlias]\n' % word)
+        assert link_target(wikiData, 'SharedAlias', False) == expected
+        assert link_target(wikiData, 'SharedAlias', True) == expected
+        assert resolved_words(wikiData) == {'SharedAlias': expected}
+
+    set_page_text(wikiDocument, 'APage', 'APage\n')
+    assert link_target(wikiData, 'SharedAlias', False) == 'MPage'
+    assert link_target(wikiData, 'SharedAlias', True) == 'MPage'
+    assert resolved_words(wikiData) == {'SharedAlias': 'MPage'}
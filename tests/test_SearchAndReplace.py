@@ -0,0 +1,161 @@
+# coding: utf-8
+"""Test the full text index queries of SearchAndReplace.
+
+* A query built for a literal must match all pages the literal is found in
+  by a normal search, also for text in NFD normalization form.
+* A whole word search for a single word is prefiltered by the full text
+  index of a wiki.
+
+
+"""
+import os
+import sys
+import re
+import unicodedata
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+import sqlite3
+from tests.helper import open_headless_wiki, set_page_text
+from pwiki.SearchAndReplace import buildFullTextIndexQuery, \
+        SearchReplaceOperation
+from pwiki.wikidata.compact_sqlite.DbStructure import FULLTEXTINDEX_TOKENIZE
+
+
+TEXTS = [
+    u'Ein Café in der École, naïve Grüße',
+    u'word_with_underscores and CamelCase x̴y',
+    u'Straße 12b',
+]
+
+LITERALS = [
+    u'Café', u'café in', u'in der École', u'École', u'cole', u'cole,',
+    u'der Éc', u'naïve Gr', u'ïve', u'Grüße', u'ße', u'Caf', u'e in',
+    u'with_underscores', u'x̴y', u'x y', u'Straße 12', u'12b', u'Caf\u0301',
+    u'x\u0334', u'Cafe\u0301 in',
+]
+
+
+@pytest.fixture
+def index():
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('create virtual table fulltextindex using fts5('
+                'content, content="", tokenize="%s")' % FULLTEXTINDEX_TOKENIZE)
+    except sqlite3.Error:
+        pytest.skip('sqlite without FTS5')
+
+    pages = []
+    for form in ('NFC', 'NFD'):
+        for text in TEXTS:
+            pages.append(unicodedata.normalize(form, text))
+    for rowid, text in enumerate(pages):
+        conn.execute('insert into fulltextindex(rowid, content) '
+                'values (?, ?)', (rowid, text))
+    return conn, pages
+
+
+def found_rowids(conn, query):
+    return set(row[0] for row in conn.execute('select rowid from '
+            'fulltextindex where fulltextindex match ?', (query,)))
+
+
+@pytest.mark.parametrize('form', ['NFC', 'NFD'])
+@pytest.mark.parametrize('wholeWord', [False, True])
+def test_query_finds_all_pages(index, form, wholeWord):
+    conn, pages = index
+    for literal in LITERALS:
+        literal = unicodedata.normalize(form, literal)
+
+        sarOp = SearchReplaceOperation()
+        sarOp.searchStr = literal
+        sarOp.booleanOp = False
+        sarOp.caseSensitive = False
+        sarOp.wholeWord = wholeWord
+        sarOp.wildCard = 'no'
+        sarOp.rebuildSearchOpTree()
+        searchNode = sarOp.searchOpTree
+        query = searchNode.getFullTextIndexQuery()
+        if query is None:
+            continue
+
+        found = found_rowids(conn, query)
+        for rowid, text in enumerate(pages):
+            if searchNode.testWikiPage(None, text):
+                assert rowid in found, (literal, text, query)
+
+
+def test_query_terms():
+    assert buildFullTextIndexQuery(u'in der Éc') == u'"der" AND "Éc"*'
+    assert buildFullTextIndexQuery(u'Café') is None
+    nfd = unicodedata.normalize('NFD', u'in der Éc')
+    assert buildFullTextIndexQuery(nfd) == u'"der" AND "%s"*' % nfd[-3:]
+
+    # Combining marks are part of the tokens
+    assert buildFullTextIndexQuery(u'a x\u0334y b') == u'"x\u0334y" AND "b"*'
+
+    assert buildFullTextIndexQuery(u'Café', True) == u'"Café"*'
+    assert buildFullTextIndexQuery(u'der École', True) == \
+            u'"der" AND "École"*'
+    assert buildFullTextIndexQuery(u'-', True) is None
+
+
+def test_whole_word_boundaries():
+    sarOp = SearchReplaceOperation()
+    sarOp.booleanOp = False
+    sarOp.wholeWord = True
+    sarOp.wildCard = 'no'
+
+    nfd = unicodedata.normalize('NFD', u'École naïve')
+    for searchStr, found in [(u'cole', False), (u've', False),
+            (nfd[:6], True), (nfd[7:], True), (u'na', False)]:
+        sarOp.searchStr = searchStr
+        sarOp.rebuildSearchOpTree()
+        assert sarOp.searchOpTree.testWikiPage(None, nfd) == found, \
+                searchStr
+
+
+def test_whole_word_search_uses_index(tmp_path, monkeypatch):
+    from pwiki.SearchAndReplace import RegexTextNode
+
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    try:
+        wikiData = wikiDocument.getWikiData()
+        wikiData.setFullTextIndexEnabled(True)
+        if not wikiData.isFullTextIndexEnabled():
+            pytest.skip('sqlite without FTS5')
+
+        set_page_text(wikiDocument, 'WordPage', u'WordPage\nsome Needle\n')
+        set_page_text(wikiDocument, 'NfdPage', u'NfdPage\nNeedle\u0301\n')
+        set_page_text(wikiDocument, 'LongerPage', u'LongerPage\nNeedles\n')
+        set_page_text(wikiDocument, 'OtherPage', u'OtherPage\nnothing\n')
+
+        tested = []
+        testWikiPage = RegexTextNode.testWikiPage
+
+        def recordingTestWikiPage(self, word, text):
+            tested.append(word)
+            return testWikiPage(self, word, text)
+
+        monkeypatch.setattr(RegexTextNode, 'testWikiPage',
+                recordingTestWikiPage)
+
+        sarOp = SearchReplaceOperation()
+        sarOp.searchStr = u'needle'
+        sarOp.booleanOp = False
+        sarOp.caseSensitive = False
+        sarOp.wholeWord = True
+        sarOp.wildCard = 'no'
+
+        assert sarOp.getFullTextIndexQuery() == u'"needle"*'
+        # A combining mark continues the word
+        assert set(wikiDocument.searchWiki(sarOp)) == {'WordPage'}
+        # Only the pages with a token beginning with the word were tested
+        assert set(tested) == {'LongerPage', 'NfdPage', 'WordPage'}
+    finally:
+        wikiDocument.release()
@@ -0,0 +1,173 @@
+# coding: utf-8
+"""Test WikiDocument.findSearchFragment().
+
+* Results are cached for unchanged pages, also if the page object is
+  created again, without reading the page again.
+* Results are dropped when the page is modified, renamed or deleted.
+* The number of cached results is bounded.
+* The HTML exporter links to the heading in front of the found text.
+
+
+"""
+import gc
+import os
+import sys
+import weakref
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki, set_page_text
+
+
+@pytest.fixture
+def wiki(tmp_path, monkeypatch):
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch)
+    yield app, wikiDocument
+    wikiDocument.release()
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """
+    List of the texts searched for fragments
+    """
+    from pwiki.SearchAndReplace import SearchReplaceOperation
+
+    searched = []
+    origSearch = SearchReplaceOperation.searchDocPageAndText
+
+    def searchDocPageAndText(self, docPage, text, searchCharStartPos=0):
+        searched.append(text)
+        return origSearch(self, docPage, text, searchCharStartPos)
+
+    monkeypatch.setattr(SearchReplaceOperation, 'searchDocPageAndText',
+            searchDocPageAndText)
+    return searched
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """
+    List of the wiki words of the pages whose live text was read
+    """
+    from pwiki.DocPages import DataCarryingPage
+
+    read = []
+    origGetLiveText = DataCarryingPage.getLiveText
+
+    def getLiveText(self):
+        read.append(self.getWikiWord())
+        return origGetLiveText(self)
+
+    monkeypatch.setattr(DataCarryingPage, 'getLiveText', getLiveText)
+    return read
+
+
+def test_cache(wiki, searches, reads):
+    app, wikiDocument = wiki
+    set_page_text(wikiDocument, 'TargetPage', 'TargetPage\nfind Needle\n')
+
+    del reads[:]
+    assert wikiDocument.findSearchFragment('TargetPage', 'Needle') == \
+            (16, 22)
+    assert len(searches) == 1
+
+    # Page isn't open in an editor, so a new page object is created
+    page = weakref.ref(wikiDocument.getWikiPage('TargetPage'))
+    gc.collect()
+    assert page() is None
+    assert wikiDocument.findSearchFragment('TargetPage', 'Needle') == \
+            (16, 22)
+    assert len(searches) == 1
+    assert reads == ['TargetPage']
+
+    assert wikiDocument.findSearchFragment('TargetPage', 'Needle', 17) == \
+            (None, None)
+    assert len(searches) == 2
+
+    set_page_text(wikiDocument, 'TargetPage', 'TargetPage\nNeedle\n')
+    assert wikiDocument.findSearchFragment('TargetPage', 'Needle') == \
+            (11, 17)
+    assert len(searches) == 3
+
+    assert wikiDocument.findSearchFragment('MissingPage', 'Needle') == \
+            (None, None)
+
+
+def test_rename_and_delete(wiki, searches):
+    app, wikiDocument = wiki
+    set_page_text(wikiDocument, 'TargetPage', 'TargetPage\nfind Needle\n')
+    set_page_text(wikiDocument, 'OtherPage', 'OtherPage\nNeedle\n')
+
+    assert wikiDocument.findSearchFragment('TargetPage', 'Needle') == \
+            (16, 22)
+    assert wikiDocument.findSearchFragment('OtherPage', 'Needle') == \
+            (10, 16)
+
+    wikiDocument.renameWikiWord('TargetPage', 'RenamedPage')
+    assert not any(key[0] == 'TargetPage'
+            for key in wikiDocument.searchFragmentCache)
+    assert wikiDocument.findSearchFragment('TargetPage', 'Needle') == \
+            (None, None)
+    assert wikiDocument.findSearchFragment('RenamedPage', 'Needle') == \
+            (16, 22)
+    assert len(searches) == 3
+
+    wikiDocument.getWikiPage('RenamedPage').deletePage()
+    assert wikiDocument.findSearchFragment('RenamedPage', 'Needle') == \
+            (None, None)
+    assert list(wikiDocument.searchFragmentCache) == \
+            [('OtherPage', 'Needle', 0)]
+
+    # Results of other pages were kept
+    del searches[:]
+    assert wikiDocument.findSearchFragment('OtherPage', 'Needle') == \
+            (10, 16)
+    assert searches == []
+
+
+def test_html_export_anchor(wiki, searches):
+    from pwiki import Headless, PluginManager
+
+    app, wikiDocument = wiki
+    set_page_text(wikiDocument, 'TargetPage',
+            'TargetPage\n\n++ Section\n\nNeedle\n')
+
+    mainControl = Headless.HeadlessMainControl(app, wikiDocument)
+    exporter = PluginManager.getSupportedExportTypes(mainControl,
+            None)['html_single'][0]
+    exporter.wikiDocument = wikiDocument
+
+    key = ('search fragment', 'TargetPage', 'Needle', (0, 0))
+    assert exporter.evaluateExportQuery(key) == '.h12'
+    assert wikiDocument.findSearchFragment('TargetPage', 'Needle') == \
+            (24, 30)
+    # Exporter and editors share the results
+    assert len(searches) == 1
+
+    # Found text in front of the first heading
+    key = ('search fragment', 'TargetPage', 'TargetPage', (0, 0))
+    assert exporter.evaluateExportQuery(key) is None
+
+
+def test_size_bounded(wiki, searches, monkeypatch):
+    from pwiki import WikiDocument
+
+    app, wikiDocument = wiki
+    monkeypatch.setattr(WikiDocument, 'SEARCH_FRAGMENT_CACHE_SIZE', 2)
+    set_page_text(wikiDocument, 'TargetPage', 'TargetPage\nabc\n')
+
+    for fragment in ('a', 'b', 'c'):
+        wikiDocument.findSearchFragment('TargetPage', fragment)
+    assert len(wikiDocument.searchFragmentCache) == 2
+
+    # Least recently used result was dropped
+    wikiDocument.findSearchFragment('TargetPage', 'c')
+    assert len(searches) == 3
+    wikiDocument.findSearchFragment('TargetPage', 'a')
+    assert len(searches) == 4
@@ -0,0 +1,191 @@
+# coding: utf-8
+"""Test SearchIndexBatchWriter.
+
+* Pending documents are written with one writer and one commit by a
+  flush job queued into the index queue of the update executor, or
+  directly if the budget is exceeded.
+* If the queued flush job is dropped (index queue cleared, executor ended
+  or pending documents discarded), a new one is queued again.
+
+
+"""
+import os
+import sys
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+import tests.helper  # Installs _() and extends sys.path
+
+from pwiki.Utilities import SingleThreadExecutor
+from pwiki.WikiDocument import SearchIndexBatchWriter
+
+
+class FakeConfig:
+    def __init__(self, docCount):
+        self.docCount = docCount
+
+    def getint(self, section, option, default=None):
+        return self.docCount
+
+    def getfloat(self, section, option, default=None):
+        return 1000.0
+
+
+class FakeWriter:
+    def __init__(self, index):
+        self.index = index
+        self.docs = []
+        self.deletes = []
+
+    def delete_by_term(self, field, value):
+        self.deletes.append(value)
+
+    def commit(self):
+        self.index.commits.append((sorted(self.docs), sorted(self.deletes)))
+
+    def cancel(self):
+        pass
+
+
+class FakeIndex:
+    def __init__(self):
+        self.commits = []
+
+    def writer(self, timeout=None):
+        return FakeWriter(self)
+
+
+class FakeWikiDocument:
+    UEQUEUE_INDEX = 2
+
+    def __init__(self, docCount=200):
+        self.config = FakeConfig(docCount)
+        self.searchIndex = FakeIndex()
+        # Not started, jobs are run by run_jobs()
+        self.updateExecutor = SingleThreadExecutor(4)
+        self.updateExecutor.prepare()
+
+    def getWikiConfig(self):
+        return self.config
+
+    def getSearchIndex(self):
+        return self.searchIndex
+
+    def getUpdateExecutor(self):
+        return self.updateExecutor
+
+
+class FakePage:
+    def __init__(self, name):
+        self.name = name
+
+    def getUnifiedPageName(self):
+        return 'wikipage/' + self.name
+
+    def writeIntoSearchIndexWriter(self, writer, liveTextPlaceHold, content,
+            modTimestamp):
+        writer.docs.append(self.name)
+        return True
+
+    def markSearchIndexCommitted(self, liveTextPlaceHold):
+        return True
+
+
+def index_jobs(wikidoc):
+    deque = wikidoc.updateExecutor.getDeque(wikidoc.UEQUEUE_INDEX)
+    return [] if deque is None else list(deque)
+
+
+def run_jobs(wikidoc):
+    deque = wikidoc.updateExecutor.getDeque(wikidoc.UEQUEUE_INDEX)
+    while deque:
+        fct, args, kwargs = deque.pop()[:3]
+        fct(*args, **kwargs)
+
+
+def add(writer, name):
+    writer.addDocument(FakePage(name), object(), 'content', 0)
+
+
+def test_batch():
+    wikidoc = FakeWikiDocument()
+    writer = SearchIndexBatchWriter(wikidoc)
+    add(writer, 'PageA')
+    add(writer, 'PageB')
+    writer.removeDocument('wikipage/PageC')
+
+    # One flush job for all documents
+    assert len(index_jobs(wikidoc)) == 1
+    assert wikidoc.searchIndex.commits == []
+
+    run_jobs(wikidoc)
+    assert wikidoc.searchIndex.commits == [(['PageA', 'PageB'],
+            ['wikipage/PageC'])]
+    assert writer.getPendingCount() == 0
+
+    # Next document queues a new job
+    add(writer, 'PageD')
+    assert len(index_jobs(wikidoc)) == 1
+
+
+def test_budget_exceeded():
+    wikidoc = FakeWikiDocument(docCount=2)
+    writer = SearchIndexBatchWriter(wikidoc)
+    add(writer, 'PageA')
+    assert wikidoc.searchIndex.commits == []
+    add(writer, 'PageB')
+    assert wikidoc.searchIndex.commits == [(['PageA', 'PageB'], [])]
+
+    # Queued job finds nothing to do
+    run_jobs(wikidoc)
+    assert len(wikidoc.searchIndex.commits) == 1
+
+
+def test_queue_cleared():
+    wikidoc = FakeWikiDocument()
+    writer = SearchIndexBatchWriter(wikidoc)
+    add(writer, 'PageA')
+
+    wikidoc.updateExecutor.clearDeque(wikidoc.UEQUEUE_INDEX)
+    writer.requeueFlush()
+    assert len(index_jobs(wikidoc)) == 1
+
+    add(writer, 'PageB')
+    assert len(index_jobs(wikidoc)) == 1
+    run_jobs(wikidoc)
+    assert wikidoc.searchIndex.commits == [(['PageA', 'PageB'], [])]
+
+
+def test_executor_ended():
+    wikidoc = FakeWikiDocument()
+    writer = SearchIndexBatchWriter(wikidoc)
+    add(writer, 'PageA')
+
+    # Like SingleThreadExecutor.end(hardEnd=True), drops all queues
+    wikidoc.updateExecutor.deques = None
+    # Added while the executor doesn't run (e.g. during a rebuild)
+    add(writer, 'PageB')
+
+    wikidoc.updateExecutor.prepare()
+    writer.requeueFlush()
+    assert len(index_jobs(wikidoc)) == 1
+    run_jobs(wikidoc)
+    assert wikidoc.searchIndex.commits == [(['PageA', 'PageB'], [])]
+
+
+def test_discard():
+    wikidoc = FakeWikiDocument()
+    writer = SearchIndexBatchWriter(wikidoc)
+    add(writer, 'PageA')
+
+    wikidoc.updateExecutor.clearDeque(wikidoc.UEQUEUE_INDEX)
+    writer.discard()
+    assert writer.getPendingCount() == 0
+
+    add(writer, 'PageB')
+    assert len(index_jobs(wikidoc)) == 1
+    run_jobs(wikidoc)
+    assert wikidoc.searchIndex.commits == [(['PageB'], [])]
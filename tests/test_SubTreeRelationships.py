@@ -0,0 +1,129 @@
+# coding: utf-8
+"""Test the recursive queries of the sqlite backends.
+
+* getSubTreeChildRelationships() returns the same relations and fields as
+  getChildRelationships() called for each page of the sub-tree.
+* getAllSubWords() and findBestPathFromWordToWord() give the same results
+  with and without recursive queries, also for cycles and aliases.
+
+
+"""
+import os
+import sys
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki, set_page_text
+
+
+# Cycles RootPage -> ChildA -> GrandChild -> RootPage and ChildA <-> ChildB,
+# RootPage links itself and a missing page, ChildB links an alias,
+# UnreachablePage isn't below RootPage
+PAGES = {
+    'RootPage': 'RootPage\nChildA ChildB MissingPage RootPage\n',
+    'ChildA': 'ChildA\nChildB GrandChild\n',
+    'ChildB': 'ChildB\nChildA DAlias\n',
+    'GrandChild': 'GrandChild\nRootPage\n',
+    'PageD': 'PageD\n[alias: DAlias]\nPageE\n',
+    'PageE': 'PageE\n',
+    'UnreachablePage': 'UnreachablePage\nRootPage PageE\n',
+}
+
+WITH_FIELDS = [(), ('firstcharpos',), ('modified',),
+        ('firstcharpos', 'modified')]
+
+
+@pytest.fixture(params=['compact_sqlite', 'original_sqlite'])
+def wikiData(request, tmp_path, monkeypatch):
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch,
+            request.param)
+    for word, text in sorted(PAGES.items()):
+        set_page_text(wikiDocument, word, text)
+
+    wikiData = wikiDocument.getWikiData().wikiData
+    if not wikiData.recursiveCteSupported:
+        wikiDocument.release()
+        pytest.skip('sqlite library without recursive queries')
+
+    yield wikiData
+    wikiDocument.release()
+
+
+def iterative_sub_tree(wikiData, words, level, withFields):
+    """
+    Build result of getSubTreeChildRelationships() page by page
+    """
+    result = {}
+    checkList = [(word, 0) for word in words]
+    seen = set(words)
+    while checkList:
+        word, depth = checkList.pop(0)
+        if level > -1 and depth >= level:
+            continue
+        rows = []
+        for row in wikiData.getChildRelationships(word, existingonly=True,
+                selfreference=False, withFields=withFields):
+            relation = row[0] if withFields else row
+            pageName = wikiData.getWikiPageNameForLinkTerm(relation)
+            rows.append((relation, pageName) +
+                    (tuple(row[1:]) if withFields else ()))
+            if pageName not in seen:
+                seen.add(pageName)
+                checkList.append((pageName, depth + 1))
+        if rows:
+            result[word] = rows
+    return result
+
+
+@pytest.mark.parametrize('level', [-1, 1, 2, 3])
+def test_sub_tree(wikiData, level):
+    for withFields in WITH_FIELDS:
+        result = wikiData.getSubTreeChildRelationships(['RootPage'], level,
+                withFields)
+        expected = iterative_sub_tree(wikiData, ['RootPage'], level,
+                withFields)
+        if withFields:
+            # Order of insertion instead of order by relation
+            result = {word: sorted(rows) for word, rows in result.items()}
+            expected = {word: sorted(rows)
+                    for word, rows in expected.items()}
+        assert result == expected, withFields
+
+    result = wikiData.getSubTreeChildRelationships(['RootPage'], -1,
+            ('modified',))
+    assert isinstance(result['RootPage'][0][2], float)
+
+
+@pytest.mark.parametrize('level', [-1, 0, 1, 2, 3])
+def test_all_sub_words(wikiData, monkeypatch, level):
+    words = ['RootPage', 'DAlias']
+    result = wikiData.getAllSubWords(words, level)
+    monkeypatch.setattr(wikiData, 'recursiveCteSupported', False)
+    assert result == wikiData.getAllSubWords(words, level)
+
+
+def test_best_path(wikiData, monkeypatch):
+    words = sorted(PAGES)
+    paths = {(word, toWord): wikiData.findBestPathFromWordToWord(word,
+            toWord) for word in words for toWord in words}
+    monkeypatch.setattr(wikiData, 'recursiveCteSupported', False)
+
+    for (word, toWord), path in paths.items():
+        expected = wikiData.findBestPathFromWordToWord(word, toWord)
+        # Paths of equal length may be chosen differently
+        assert len(path) == len(expected), (word, toWord)
+        if path:
+            assert path[0] == toWord and path[-1] == word
+        for parent, child in zip(path, path[1:]):
+            assert child in wikiData.getChildRelationships(parent)
+
+    assert paths[('GrandChild', 'RootPage')] == ['RootPage', 'ChildA',
+            'GrandChild']
+    assert paths[('RootPage', 'GrandChild')] == ['GrandChild', 'RootPage']
+    # Links to aliases aren't followed
+    assert paths[('PageE', 'RootPage')] == []
@@ -0,0 +1,82 @@
+# coding: utf-8
+"""Test TrigramIndex.
+
+* Queries built for a regex must match all texts the regex is found in.
+
+
+"""
+import os
+import sys
+import re
+import random
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from pwiki import TrigramIndex
+
+
+def matches_query(query, trigrams):
+    if query is None:
+        return True
+    if not isinstance(query, tuple):
+        return query in trigrams
+    op, sub_queries = query
+    if op == 'and':
+        return all(matches_query(q, trigrams) for q in sub_queries)
+    return any(matches_query(q, trigrams) for q in sub_queries)
+
+
+def test_literal_query():
+    assert TrigramIndex.buildLiteralTrigramQuery('ab') is None
+    assert TrigramIndex.buildLiteralTrigramQuery('Abc') == 'abc'
+    assert TrigramIndex.buildLiteralTrigramQuery('abcd') == \
+            ('and', ('abc', 'bcd'))
+
+
+def test_regex_query():
+    patterns = [  # (pattern, query)
+        (r'hello.*world', ('and', ('hel', 'ell', 'llo', 'wor', 'orl', 'rld'))),
+        (r'ab(c|d)', ('or', ('abc', 'abd'))),
+        (r'(foo|b)+', None),
+        (r'x*abc', 'abc'),
+        (r'[a-z]+', None),
+        (r'\bWord\b', ('and', ('wor', 'ord'))),
+    ]
+    for pattern, query in patterns:
+        result = TrigramIndex.buildRegexTrigramQuery(re.compile(pattern))
+        assert result == query, pattern
+
+
+def test_case_folding():
+    texts = ['STRASSE', u'ſtraße', u'ΣΟΦΟΣ', u'σοφος', u'İstanbul', u'KELVIN']
+    for text in texts:
+        for flags in (0, re.IGNORECASE):
+            pattern = re.compile(re.escape(text.lower()), flags | re.UNICODE)
+            query = TrigramIndex.buildRegexTrigramQuery(pattern)
+            for other in texts:
+                if pattern.search(other):
+                    trigrams = TrigramIndex.getTrigrams(other)
+                    assert matches_query(query, trigrams), (text, other)
+
+
+def test_regex_query_random():
+    rnd = random.Random(1)
+    atoms = ['a', 'b', 'ab', 'abc', '[ab]', '[^a]', '.', r'\w', r'\bab',
+             '(?:ab|bc)', '(ab|c)+', 'a*', 'b?', '(?i:AbC)', 'x{2,3}',
+             '(abc){2}', '(?=ab)']
+    alphabet = 'abcxAB .'
+    for i in range(2000):
+        pattern = ''.join(rnd.choice(atoms) for _ in range(rnd.randint(1, 4)))
+        if rnd.random() < 0.3:
+            pattern += '|' + rnd.choice(atoms)
+        regex = re.compile(pattern, rnd.choice([0, re.IGNORECASE]))
+        query = TrigramIndex.buildRegexTrigramQuery(regex)
+        for j in range(10):
+            text = ''.join(rnd.choice(alphabet)
+                           for _ in range(rnd.randint(0, 12)))
+            if regex.search(text):
+                assert matches_query(query, TrigramIndex.getTrigrams(text)), \
+                    (pattern, text)
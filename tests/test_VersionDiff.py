@@ -0,0 +1,61 @@
+# coding: utf-8
+"""Test the diff engines for page versions.
+
+* Applying the packet of any engine to the first text must return the
+  second text.
+
+
+"""
+import os
+import sys
+import random
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from pwiki.StringOps import DIFF_ENGINES, applyBinCompact, \
+    getBinCompactForDiff
+
+
+LINES = [b'line %d\n' % i for i in range(20)] + [b'\n', b'\r\n', b'\r', b'x']
+
+
+def random_text(rnd):
+    return b''.join(rnd.choice(LINES) for _ in range(rnd.randint(0, 30)))
+
+
+def edit_text(text, rnd):
+    lines = text.splitlines(True)
+    for _ in range(rnd.randint(0, 4)):
+        pos = rnd.randint(0, len(lines))
+        kind = rnd.random()
+        if kind < 0.3:
+            lines.insert(pos, rnd.choice(LINES))
+        elif kind < 0.6 and lines:
+            del lines[min(pos, len(lines) - 1)]
+        elif lines:
+            lines[min(pos, len(lines) - 1)] = bytes(
+                rnd.choice(b'ab\n') for _ in range(5))
+    return b''.join(lines)
+
+
+def test_round_trip():
+    rnd = random.Random(0)
+    for i in range(1000):
+        a = random_text(rnd)
+        if rnd.random() < 0.7:
+            b = edit_text(a, rnd)
+        else:
+            b = random_text(rnd)
+        for engine in DIFF_ENGINES:
+            assert applyBinCompact(a, getBinCompactForDiff(a, b, engine)) == b
+
+
+def test_lines_engine_refines_changed_line():
+    a = b''.join(b'line number %d\n' % i for i in range(1000))
+    b = a.replace(b'number 500\n', b'numbers 500\n')
+    packet = getBinCompactForDiff(a, b, 'lines')
+    assert applyBinCompact(a, packet) == b
+    assert len(packet) < 20
@@ -0,0 +1,131 @@
+# coding: utf-8
+"""Test VersionOverview of timeView.Versioning.
+
+* All versions can be reconstructed after adding and deleting versions,
+  with and without checkpoints (complete versions in between).
+* Adding a version doesn't read the packets of the diff chain again.
+
+
+"""
+import os
+import random
+
+import pytest
+
+import tests.helper  # Installs _() and fixes sys.path
+
+from pwiki.timeView.Versioning import VersionOverview, VersionEntry
+
+
+class MockConfig:
+    def __init__(self, options):
+        self.options = options
+
+    def get(self, section, option, default=None):
+        return self.options.get(option, default)
+
+    def getint(self, section, option, default=None):
+        return int(self.options.get(option, default))
+
+
+class MockWikiDocument:
+    """
+    Stores data blocks in a dictionary and counts the read accesses.
+    Like the sqlite backends, retrieveDataBlock() returns None for missing
+    blocks.
+    """
+    def __init__(self, options):
+        self.config = MockConfig(options)
+        self.dataBlocks = {}
+        self.readCount = 0
+
+    def getWikiConfig(self):
+        return self.config
+
+    def retrieveDataBlock(self, unifName, default=""):
+        self.readCount += 1
+        return self.dataBlocks.get(unifName)
+
+    def storeDataBlock(self, unifName, newdata, storeHint=None):
+        self.dataBlocks[unifName] = newdata
+
+    def deleteDataBlock(self, unifName):
+        self.dataBlocks.pop(unifName, None)
+
+
+LINES = [b'line %d\n' % i for i in range(40)]
+
+
+def edit_text(text, rnd):
+    if rnd.random() < 0.2:
+        # Rewrite heavily so the diff chain grows fast
+        return b''.join(rnd.choice(LINES) for _ in range(rnd.randint(5, 60)))
+
+    lines = text.splitlines(True)
+    for _ in range(rnd.randint(1, 3)):
+        pos = rnd.randint(0, len(lines))
+        if rnd.random() < 0.5 or not lines:
+            lines.insert(pos, rnd.choice(LINES))
+        else:
+            del lines[min(pos, len(lines) - 1)]
+    return b''.join(lines)
+
+
+def check_versions(overview, contents):
+    assert [e.versionNumber for e in overview.getVersionEntries()] == \
+            sorted(contents)
+    for versionNumber in sorted(contents, reverse=True):
+        assert overview.getVersionContentRaw(versionNumber) == \
+                contents[versionNumber]
+
+
+@pytest.mark.parametrize('completeSteps', [0, 1, 3, 10])
+def test_reconstruction(completeSteps):
+    rnd = random.Random(completeSteps)
+    wikiDocument = MockWikiDocument({'versioning_completeSteps':
+            completeSteps, 'versioning_diffEngine': 'lines'})
+    overview = VersionOverview(wikiDocument, unifiedBasePageName='wikipage/A')
+    overview.readOverview()
+
+    contents = {}
+    text = b''.join(rnd.choice(LINES) for _ in range(30))
+    for step in range(120):
+        if rnd.random() < 0.15 and len(contents) > 1:
+            # Delete oldest or newest version
+            versionNumber = rnd.choice((min(contents), max(contents)))
+            overview.deleteVersion(versionNumber)
+            del contents[versionNumber]
+        else:
+            text = edit_text(text, rnd)
+            overview.addVersion(text, VersionEntry('wikipage/A'))
+            contents[overview.getVersionEntries()[-1].versionNumber] = text
+
+        overview.writeOverview()
+        check_versions(overview, contents)
+
+        # Without caches
+        newOverview = VersionOverview(wikiDocument,
+                unifiedBasePageName='wikipage/A')
+        newOverview.readOverview()
+        check_versions(newOverview, contents)
+
+    kinds = set(e.contentDifferencing for e in overview.getVersionEntries())
+    if completeSteps == 1:
+        assert kinds == {'complete'}
+    else:
+        assert 'revdiff' in kinds
+
+
+def test_no_packet_reads_on_add():
+    rnd = random.Random(0)
+    wikiDocument = MockWikiDocument({'versioning_completeSteps': 1000,
+            'versioning_diffEngine': 'lines'})
+    overview = VersionOverview(wikiDocument, unifiedBasePageName='wikipage/A')
+    overview.readOverview()
+
+    text = b''.join(rnd.choice(LINES) for _ in range(30))
+    for step in range(50):
+        text = edit_text(text, rnd)
+        wikiDocument.readCount = 0
+        overview.addVersion(text, VersionEntry('wikipage/A'))
+        assert wikiDocument.readCount == 0
@@ -0,0 +1,130 @@
+# coding: utf-8
+"""Test WikiDocument.wikiDataTransaction().
+
+* A failure in the middle of a batch of page updates rolls back the pages
+  updated since the last commit. Their meta data in the database and the
+  link graph are unchanged and the pages stay dirty.
+
+
+"""
+import io
+import os
+import sys
+
+import pytest
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import open_headless_wiki, set_page_text
+
+
+WORDS = ['FirstPage', 'SecondPage', 'ThirdPage']
+
+
+def old_text(word):
+    return '%s\ntodo: old\nOldChild\n' % word
+
+
+def new_text(word):
+    return '%s\ntodo: new\nNewChild\n' % word
+
+
+@pytest.fixture(params=['compact_sqlite', 'original_sqlite'])
+def wiki(request, tmp_path, monkeypatch):
+    app, wikiDocument = open_headless_wiki(tmp_path, monkeypatch,
+            request.param)
+    for word in WORDS:
+        set_page_text(wikiDocument, word, old_text(word))
+    yield app, wikiDocument
+    wikiDocument.release()
+
+
+def edit_pages(wikiDocument):
+    """
+    Save new texts without updating the meta data. Return the pages, they
+    must be kept alive.
+    """
+    pages = []
+    for word in WORDS:
+        page = wikiDocument.getWikiPage(word)
+        page.replaceLiveText(new_text(word), fireEvent=False)
+        page.markMetaDataDirty()
+        pages.append(page)
+    wikiDocument.getUpdateExecutor().clearDeque(0)
+    return pages
+
+
+def dirty_words(wikiDocument):
+    return set(wikiDocument.getWikiData().getWikiPageNamesForMetaDataState(
+            wikiDocument.getFinalMetaDataState(), '>'))
+
+
+def todos(wikiDocument):
+    return sorted(wikiDocument.getWikiData().getTodos())
+
+
+def assert_unchanged(wikiDocument, word):
+    assert (word, 'todo', ' old') in todos(wikiDocument)
+    assert (word, 'todo', ' new') not in todos(wikiDocument)
+    assert set(wikiDocument.getWikiData().getChildRelationships(word)) == \
+            {word, 'OldChild'}
+    assert set(wikiDocument.getLinkGraph().getChildRelationships(word)) == \
+            {word, 'OldChild'}
+
+
+def test_failure_rolls_back_batch(wiki):
+    app, wikiDocument = wiki
+    pages = edit_pages(wikiDocument)
+    assert dirty_words(wikiDocument) == set(WORDS)
+
+    with pytest.raises(RuntimeError):
+        with wikiDocument.wikiDataTransaction(2) as transaction:
+            for page in pages:
+                page.runDatabaseUpdate()
+                transaction.checkpoint()
+            raise RuntimeError('failure after the last page')
+
+    # First two pages were committed by the checkpoint
+    assert dirty_words(wikiDocument) == {'ThirdPage'}
+    assert ('SecondPage', 'todo', ' new') in todos(wikiDocument)
+    assert set(wikiDocument.getLinkGraph().getChildRelationships(
+            'SecondPage')) == {'SecondPage', 'NewChild'}
+
+    assert_unchanged(wikiDocument, 'ThirdPage')
+    assert pages[2].getDirty()[1]
+    assert not pages[1].getDirty()[1]
+
+    # The update writes the rolled back changes again
+    pages[2].runDatabaseUpdate()
+    assert dirty_words(wikiDocument) == set()
+    assert ('ThirdPage', 'todo', ' new') in todos(wikiDocument)
+
+
+def test_failure_rolls_back_rebuild(wiki, monkeypatch):
+    from pwiki import ParallelRebuild, WikiDocument
+    from pwiki.Headless import StreamProgressHandler
+
+    app, wikiDocument = wiki
+    pages = edit_pages(wikiDocument)
+
+    class FailingProgressHandler(StreamProgressHandler):
+        def update(self, step, msg):
+            if msg.endswith('ThirdPage') and msg.startswith('Update syntax'):
+                raise RuntimeError('failure in the last page')
+            return StreamProgressHandler.update(self, step, msg)
+
+    monkeypatch.setattr(ParallelRebuild, 'getProcessCount', lambda: 1)
+    monkeypatch.setattr(WikiDocument, 'REBUILD_PAGES_PER_COMMIT', 1000)
+    with pytest.raises(RuntimeError):
+        wikiDocument.rebuildWiki(FailingProgressHandler(io.StringIO()),
+                True)
+    wikiDocument.getUpdateExecutor().pause(wait=True)
+
+    # Nothing of the rebuild was committed
+    assert dirty_words(wikiDocument) == set(WORDS)
+    for word in WORDS:
+        assert_unchanged(wikiDocument, word)
+    assert all(page.getDirty()[1] for page in pages)
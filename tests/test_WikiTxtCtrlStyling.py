@@ -0,0 +1,149 @@
+# coding: utf-8
+"""Test the syntax styling of WikiTxtCtrl without a window.
+
+* Styling only the changed top-level AST nodes gives the same style bytes
+  as styling the whole text.
+* ByteOffsetTable maps character positions to the UTF-8 byte positions
+  used by Scintilla, also for non-ASCII text.
+
+
+"""
+import os
+import sys
+import random
+
+# run from WikidPad directory
+wikidpad_dir = os.path.abspath('.')
+sys.path.append(os.path.join(wikidpad_dir, 'lib'))
+sys.path.append(wikidpad_dir)
+
+from tests.helper import getApp, parse, DEFAULT_WIKI_LANGUAGE
+
+from pwiki.Utilities import DUMBTHREADSTOP
+from pwiki.EnhancedScintillaControl import ByteOffsetTable
+from pwiki.WikiTxtCtrl import WikiTxtCtrl
+
+
+PAGE_NAME = 'StyledPage'
+EXISTING_WORDS = {PAGE_NAME, 'ExistingPage', 'ÄnderungsSeite'}
+
+TEXT = """+ Heading One
+
+Some text with ExistingPage and MissingPage, *bold* and _italic_.
+
+++ Heading Two – ünïcödé
+
+todo: write a test for ÄnderungsSeite
+[key: value] [ExistingPage#fragment]
+
+    indented text with MissingPage
+* bullet ExistingPage
+* bullet two
+
+<<|
+cell ExistingPage | cell two
+>>
+
++++ Heading Three 日本語
+
+Last line ExistingPage
+"""
+
+INSERTIONS = ['x', '\n', 'ExistingPage ', 'MissingPage', '*', '+ ', '日本',
+              '[', ']', ' ', 'todo: ', '\n\n', '|']
+
+
+class StylingStandIn(object):
+    """
+    Provides what the styling methods of WikiTxtCtrl need from the editor.
+    """
+    processTokens = WikiTxtCtrl.processTokens
+    processTokensIncremental = WikiTxtCtrl.processTokensIncremental
+    _processTokenNodes = WikiTxtCtrl._processTokenNodes
+    _isSameStyledNode = staticmethod(WikiTxtCtrl._isSameStyledNode)
+
+    def __init__(self):
+        self.stylingBase = None
+        self.optionColorizeSearchFragments = False
+        self.presenter = self
+        self.wikiLanguageHelper = getApp().createWikiLanguageHelper(
+            DEFAULT_WIKI_LANGUAGE)
+
+    def getWikiDocument(self):
+        return self
+
+    def isCreatableWikiWord(self, word):
+        return word not in EXISTING_WORDS
+
+
+def edited_texts(rnd, count):
+    text = TEXT
+    for _ in range(count):
+        pos = rnd.randint(0, len(text))
+        if rnd.random() < 0.5:
+            text = text[:pos] + rnd.choice(INSERTIONS) + text[pos:]
+        else:
+            text = text[:pos] + text[pos + rnd.randint(1, 5):]
+        yield text
+
+
+def test_incremental_styling_matches_full_styling():
+    ctrl = StylingStandIn()
+    processed = []
+    processTokenNodes = ctrl._processTokenNodes
+
+    def recordingProcessTokenNodes(nodes, *args):
+        nodes = list(nodes)
+        processed.append(len(nodes))
+        return processTokenNodes(nodes, *args)
+
+    text = TEXT
+    pageAst = parse(text, PAGE_NAME)
+    ctrl.stylingBase = (text, pageAst, ctrl.processTokens(text, pageAst,
+            DUMBTHREADSTOP), 0)
+
+    reused = 0
+    for text in edited_texts(random.Random(0), 200):
+        pageAst = parse(text, PAGE_NAME)
+        full = ctrl.processTokens(text, pageAst, DUMBTHREADSTOP)
+
+        ctrl._processTokenNodes = recordingProcessTokenNodes
+        del processed[:]
+        incremental = ctrl.processTokensIncremental(text, pageAst, 0,
+                DUMBTHREADSTOP)
+        del ctrl._processTokenNodes
+
+        assert incremental == full, text
+        if processed[0] < len(list(pageAst.iterFlatNamed())):
+            reused += 1
+
+        ctrl.stylingBase = (text, pageAst, full, 0)
+
+    # Most single edits leave some nodes unchanged
+    assert reused > 100
+
+
+def test_incremental_styling_needs_same_wiki_words():
+    ctrl = StylingStandIn()
+    pageAst = parse(TEXT, PAGE_NAME)
+    ctrl.stylingBase = (TEXT, pageAst, ctrl.processTokens(TEXT, pageAst,
+            DUMBTHREADSTOP), 0)
+
+    assert ctrl.processTokensIncremental(TEXT, pageAst, 1,
+            DUMBTHREADSTOP) is None
+
+    ctrl.optionColorizeSearchFragments = True
+    assert ctrl.processTokensIncremental(TEXT, pageAst, 0,
+            DUMBTHREADSTOP) is None
+
+
+def test_byte_offset_table():
+    for text in ['', 'plain ASCII text', TEXT, 'ä', '日本語 text ü',
+                 '\U0001F600 emoji \U0001F600', 'a\u0308 combining']:
+        table = ByteOffsetTable(text)
+        assert table.byteLength == len(text.encode('utf-8'))
+        for charPos in range(len(text) + 1):
+            assert table.getBytePos(charPos) == \
+                len(text[:charPos].encode('utf-8')), (text, charPos)
+        # Positions behind the end are mapped to the end
+        assert table.getBytePos(len(text) + 3) == table.byteLength
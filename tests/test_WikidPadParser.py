@@ -40,7 +40,8 @@ sys.path.append(os.path.join(wikidpad_dir, 'lib'))
 
 from tests.helper import (
     TESTS_DIR, get_text, parse, MockWikiDocument, getApp,
-    WikiWordNotFoundException, NodeFinder, ast_eq)
+    WikiWordNotFoundException, NodeFinder, ast_eq, auto_link_relax_re)
+from pwiki.Utilities import DUMBTHREADSTOP
 
 from wikidPadParser.WikidPadParser import count_max_number_of_consecutive_quotes
 
@@ -1111,6 +1112,98 @@ plot [-pi/2:pi] cos(x),-(sin(x) > sin(x+1) ? sin(x) : sin(x+1))
             nr, text, pageName, result, formatted_text)
 
 
+def test_parse_incremental():
+    """
+    Reparsing a page after an edit (which reuses the previous AST) must give
+    the same AST as parsing the new text from scratch.
+    """
+    import random
+    rnd = random.Random(4)
+    snippets = ['x', '\n', '\n\n', '*', '_', '[', ']', 'WikiWord ', '+ H\n',
+                '<<pre\n', '\n>>', '[key: v]', '\t* item\n', '#', '|']
+    paths = sorted(glob.glob(os.path.join(WIKIDPADHELP_DATA_DIR, '*.wiki')))
+    assert paths
+    pageName = 'PageName'
+    wikidoc = MockWikiDocument({pageName: ''}, LANGUAGE_NAME)
+    formatDetails = wikidoc.getWikiPage(pageName).getFormatDetails()
+    parser = getApp().createWikiParser(LANGUAGE_NAME)
+    for path in rnd.sample(paths, min(20, len(paths))):
+        text = get_text(path)
+        ast = parse(text, pageName, LANGUAGE_NAME)
+        for _ in range(10):
+            start = rnd.randint(0, len(text))
+            end = min(len(text), start + rnd.choice((0, 0, 1, 5, 40)))
+            oldText = text
+            text = text[:start] + rnd.choice(snippets + ['']) + text[end:]
+            ast = parser.parseIncremental(LANGUAGE_NAME, text, formatDetails,
+                                          DUMBTHREADSTOP, oldText, ast)
+            ast_ = parse(text, pageName, LANGUAGE_NAME)
+            assert len(list(ast.iterDeep())) == len(list(ast_.iterDeep()))
+            assert ast_eq(ast, ast_), '%s: %r' % (path, text[start - 20:end + 20])
+
+
+@pytest.mark.parametrize('old_text,removed', [
+    ('Text\n\n<<\n[global.x: y]\n>>\n\nmore text\n', '<<\n'),
+    ('Text\n\n<<\n[global.x: y]\n>>\n\nmore text\n', '>>\n'),
+    ('Text\n<<\nA\n\nB\n>>\nend\n', '<<\n'),
+    ('Text\n<<pre\nA\n\n* B\n>>\nend\n', '<<pre\n'),
+    ('Text\n<<pre\nA\n\n* B\n>>\nend\n', '>>\n'),
+])
+def test_parse_incremental_block_removed(old_text, removed):
+    """
+    Nodes which were inside of a block before the opener or closer of the
+    block was deleted must not be reused by incremental parsing.
+    """
+    pageName = 'PageName'
+    wikidoc = MockWikiDocument({pageName: ''}, LANGUAGE_NAME)
+    formatDetails = wikidoc.getWikiPage(pageName).getFormatDetails()
+    parser = getApp().createWikiParser(LANGUAGE_NAME)
+
+    text = old_text.replace(removed, '', 1)
+    ast = parser.parseIncremental(LANGUAGE_NAME, text, formatDetails,
+                                  DUMBTHREADSTOP, old_text,
+                                  parse(old_text, pageName, LANGUAGE_NAME))
+    ast_ = parse(text, pageName, LANGUAGE_NAME)
+    assert ast_eq(ast, ast_)
+    assert ast.itemStarts == ast_.itemStarts
+
+
+def test_auto_link_relax_matcher():
+    """
+    AutoLinkRelaxMatcher must find the same links as applying the regular
+    expression of each wiki word (earliest match, longest word first).
+    """
+    from pwiki.ParseUtilities import AutoLinkRelaxMatcher
+
+    def find_with_regexes(words, text):
+        relaxList = [(auto_link_relax_re(w), w)
+                     for w in sorted(words, key=len, reverse=True)]
+        result = []
+        pos = 0
+        while True:
+            matches = [(m.start(), -len(w), m.end(), w)
+                       for m, w in ((rx.search(text, pos), w)
+                                    for rx, w in relaxList) if m]
+            if not matches:
+                return result
+            start, _, end, word = min(matches)
+            result.append((start, end, word))
+            pos = end
+
+    words = ['Foo', 'Foo Bar', 'foo-bar-baz', 'Qux', 'Quux Corge', '2.0']
+    text = 'a foo  bar, FOO-bar-baz foo\nQuux\tcorge xQux qux_ 2,0 Foo.'
+    matcher = AutoLinkRelaxMatcher(words)
+    assert list(matcher.iterMatches(text)) == find_with_regexes(words, text)
+    assert [w for s, e, w in matcher.iterMatches(text)] == [
+        'Foo Bar', 'foo-bar-baz', 'Foo', 'Quux Corge', '2.0', 'Foo']
+
+    # Incremental update gives same trie as building from scratch
+    matcher.setWords(words[1:] + ['Grault'])
+    assert matcher.root == AutoLinkRelaxMatcher(words[1:] + ['Grault']).root
+    matcher.removeWord('Grault')
+    assert matcher.getWords() == frozenset(words[1:])
+
+
 def test_count_max_number_of_consecutive_quotes():
     f = count_max_number_of_consecutive_quotes
     assert f('abc') == 0